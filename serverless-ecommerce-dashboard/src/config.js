@@ -1,4 +1,6 @@
 const config = {
-apiUrl: 'https://ssowmx2oq6.execute-api.us-west-1.amazonaws.com/prod'
+apiUrl: 'https://ssowmx2oq6.execute-api.us-west-1.amazonaws.com/prod',
+// Terraform's dashboard_live_url output; leave empty to poll the summary instead
+liveUrl: ''
 };
 export default config;
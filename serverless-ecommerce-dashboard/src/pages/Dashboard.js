@@ -19,7 +19,7 @@ import {
   ListItemIcon,
   Divider
 } from '@mui/material';
-import { fetchDashboardSummary } from '../services/api';
+import { applyChanges, fetchDashboardSummary, subscribeToChanges } from '../services/api';
 import MetricCard from '../components/widgets/MetricCard';
 import SalesChart from '../components/charts/SalesChart';
 import AlertWidget from '../components/widgets/AlertWidget';
@@ -32,6 +32,11 @@ import InventoryIcon from '@mui/icons-material/Inventory';
 import AttachMoneyIcon from '@mui/icons-material/AttachMoney';
 import WarningIcon from '@mui/icons-material/Warning';
 
+// With live updates the summary is only reloaded now and then, for alerts
+// and to catch up on any changes missed; without them it is polled
+const SNAPSHOT_REFRESH_MS = 10 * 60 * 1000;
+const POLL_INTERVAL_MS = 30000;
+
 const Dashboard = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -94,13 +99,23 @@ const Dashboard = () => {
 
     loadDashboardData();
     
-    // Set up auto-refresh every 30 seconds
+    // Apply pushed metric changes to the loaded summary
+    const unsubscribe = subscribeToChanges(
+      changes => setDashboardData(current => applyChanges(current, changes)),
+      loadDashboardData
+    );
+    
     const refreshInterval = setInterval(() => {
       loadDashboardData();
-    }, 30000);
+    }, unsubscribe ? SNAPSHOT_REFRESH_MS : POLL_INTERVAL_MS);
     
-    // Clear interval on component unmount
-    return () => clearInterval(refreshInterval);
+    // Clear interval and close the live connection on component unmount
+    return () => {
+      clearInterval(refreshInterval);
+      if (unsubscribe) {
+        unsubscribe();
+      }
+    };
   }, []);
 
   // Calculate summary metrics
@@ -17,7 +17,8 @@ import {
   TableContainer,
   TableHead,
   TableRow,
-  Chip
+  Chip,
+  Button
 } from '@mui/material';
 import { fetchInventoryData } from '../services/api';
 import InventoryIcon from '@mui/icons-material/Inventory';
@@ -26,80 +27,52 @@ import LocalShippingIcon from '@mui/icons-material/LocalShipping';
 import CategoryIcon from '@mui/icons-material/Category';
 import MetricCard from '../components/widgets/MetricCard';
 
+const PAGE_SIZE = 50;
+
 const Inventory = () => {
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
   const [inventoryData, setInventoryData] = useState([]);
+  const [nextToken, setNextToken] = useState(null);
   const [statusFilter, setStatusFilter] = useState('');
   const [categoryFilter, setCategoryFilter] = useState('');
   const [categories, setCategories] = useState([]);
   const [summaryMetrics, setSummaryMetrics] = useState({
     totalItems: 0,
     lowStockItems: 0,
-    outOfStockItems: 0,
-    categoriesCount: 0
+    categoriesCount: 0,
+    matchingItems: 0
   });
 
+  // Summary cards and the category list come from the API's counters, not
+  // from the rows loaded so far
+  const applyCounts = (data) => {
+    const statusCounts = data.statusCounts || {};
+    const countsInView = categoryFilter ? { [categoryFilter]: statusCounts[categoryFilter] || {} } : statusCounts;
+    let totalItems = 0;
+    let lowStockItems = 0;
+    Object.values(countsInView).forEach(statuses => {
+      Object.values(statuses).forEach(count => { totalItems += count; });
+      lowStockItems += statuses.low || 0;
+    });
+    setCategories(Object.keys(statusCounts).sort());
+    setSummaryMetrics({
+      totalItems,
+      lowStockItems,
+      categoriesCount: Object.keys(statusCounts).length,
+      matchingItems: data.totalItems || 0
+    });
+  };
+
   useEffect(() => {
     const loadInventoryData = async () => {
       try {
         setLoading(true);
-        console.log('🔍 About to fetch inventory data...');
-        const data = await fetchInventoryData(statusFilter || null, categoryFilter || null);
-        console.log('📊 Inventory data received:', data);
-        console.log('📊 Inventory data type:', typeof data);
-        console.log('📊 Is array?', Array.isArray(data));
-        console.log('Full response structure:', JSON.stringify(data, null, 2));
-        
-        // Extract the array from the data object
-        let processedData = [];
-        // First check for common data structures
-        if (data && data.categories) {
-          // If data is organized by categories
-          const allItems = [];
-          for (const category in data.categories) {
-            if (Array.isArray(data.categories[category])) {
-              allItems.push(...data.categories[category]);
-            }
-          }
-          processedData = allItems;
-        } else if (data && Array.isArray(data)) {
-          processedData = data;
-        } else if (data && typeof data === 'object' && Object.keys(data).length > 0) {
-          // If there's a different structure, try to find any array in the object
-          for (const key in data) {
-            if (Array.isArray(data[key])) {
-              processedData = data[key];
-              break;
-            }
-          }
-        }
-        
-        console.log('Processed inventory data:', processedData);
-        setInventoryData(processedData || []);
-        
-        // Extract categories for the dropdown
-        if (processedData && processedData.length > 0) {
-          const uniqueCategories = [...new Set(processedData.map(item => item.category))].filter(Boolean);
-          setCategories(uniqueCategories);
-          
-          // Calculate summary metrics
-          const totalItems = processedData.length;
-          const lowStockItems = processedData.filter(item => 
-            (item.inventory_status === 'low' || item.stock_level <= 20)
-          ).length;
-          const outOfStockItems = processedData.filter(item => 
-            (item.inventory_status === 'out_of_stock' || item.stock_level <= 0)
-          ).length;
-          
-          setSummaryMetrics({
-            totalItems,
-            lowStockItems,
-            outOfStockItems,
-            categoriesCount: uniqueCategories.length
-          });
-        }
-        
+        const data = await fetchInventoryData(statusFilter || null, categoryFilter || null, PAGE_SIZE);
+        setInventoryData(data.items || []);
+        setNextToken(data.nextToken || null);
+        applyCounts(data);
         setError(null);
       } catch (err) {
         console.error('❌ Inventory data loading error:', err);
@@ -110,8 +83,25 @@ const Inventory = () => {
     };
   
     loadInventoryData();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [statusFilter, categoryFilter]);
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const data = await fetchInventoryData(statusFilter || null, categoryFilter || null, PAGE_SIZE, nextToken);
+      setInventoryData(previous => [...previous, ...(data.items || [])]);
+      setNextToken(data.nextToken || null);
+    } catch (err) {
+      console.error('❌ Inventory page loading error:', err);
+      setError('Failed to load more inventory data. Please try again later.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const outOfStockItems = inventoryData.filter(item => item.stock_level <= 0).length;
+
   const getStatusColor = (status, stockLevel) => {
     if (status === 'out_of_stock' || stockLevel <= 0) return 'error';
     if (status === 'low' || stockLevel <= 20) return 'warning';
@@ -166,9 +156,8 @@ const Inventory = () => {
                   }}
               >
                 <MenuItem value="">All Statuses</MenuItem>
-                <MenuItem value="in_stock">In Stock</MenuItem>
-                <MenuItem value="low_stock">Low Stock</MenuItem>
-                <MenuItem value="out_of_stock">Out of Stock</MenuItem>
+                <MenuItem value="normal">In Stock</MenuItem>
+                <MenuItem value="low">Low Stock</MenuItem>
               </Select>
             </FormControl>
           </Grid>
@@ -233,8 +222,8 @@ const Inventory = () => {
         </Grid>
         <Grid item xs={12} md={3}>
           <MetricCard
-            title="Out of Stock"
-            value={summaryMetrics.outOfStockItems}
+            title="Out of Stock (loaded)"
+            value={outOfStockItems}
             icon={<InventoryIcon />}
             color="#f44336"
           />
@@ -287,6 +276,13 @@ const Inventory = () => {
                 ))}
               </TableBody>
             </Table>
+            {nextToken && (
+              <Box display="flex" justifyContent="center" sx={{ mt: 2 }}>
+                <Button variant="outlined" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : `Load more (${inventoryData.length} of ${summaryMetrics.matchingItems})`}
+                </Button>
+              </Box>
+            )}
           </TableContainer>
         ) : (
           <Box sx={{ minHeight: 200, display: 'flex', alignItems: 'center', justifyContent: 'center' }}>
@@ -211,11 +211,15 @@ const Sales = () => {
                   }
                 }}
                 renderValue={(selected) => {
-                  return selected === "day" ? "Daily" :
+                  return selected === "minute" ? "Last 60 Minutes" :
+                    selected === "hour" ? "Today by Hour" :
+                    selected === "day" ? "Daily" :
                     selected === "week" ? "Weekly" :
                     selected === "month" ? "Monthly" : selected;
                 }}
               >
+                <MenuItem value="minute">Last 60 Minutes</MenuItem>
+                <MenuItem value="hour">Today by Hour</MenuItem>
                 <MenuItem value="day">Daily</MenuItem>
                 <MenuItem value="week">Weekly</MenuItem>
                 <MenuItem value="month">Monthly</MenuItem>
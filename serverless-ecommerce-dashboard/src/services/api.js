@@ -47,6 +47,19 @@ export const fetchSalesData = async (timeUnit = 'day', period = 'last7') => {
   }
 };
 
+export const fetchTopSellers = async (by = 'product', period = 'today', limit = 10) => {
+  try {
+    const url = `/api/sales/top?by=${by}&period=${period}&limit=${limit}`;
+    console.log('🌐 Making API request to:', `${config.apiUrl}${url}`);
+    const response = await api.get(url);
+    console.log('🌐 Raw API top sellers response:', response);
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching top sellers:', error);
+    throw error;
+  }
+};
+
 export const fetchCustomerData = async (cohort = null) => {
   try {
     const url = cohort ? `/api/customers?cohort=${cohort}` : '/api/customers';
@@ -60,12 +73,14 @@ export const fetchCustomerData = async (cohort = null) => {
   }
 };
 
-export const fetchInventoryData = async (status = null, category = null) => {
+export const fetchInventoryData = async (status = null, category = null, limit = null, nextToken = null) => {
   try {
     let url = '/api/inventory';
     const params = [];
     if (status) params.push(`status=${status}`);
-    if (category) params.push(`category=${category}`);
+    if (category) params.push(`category=${encodeURIComponent(category)}`);
+    if (limit) params.push(`limit=${limit}`);
+    if (nextToken) params.push(`nextToken=${encodeURIComponent(nextToken)}`);
     if (params.length > 0) url += `?${params.join('&')}`;
     
     console.log('🌐 Making API request to:', `${config.apiUrl}${url}`);
@@ -112,11 +127,87 @@ export const generateReport = async (reportType, format, period) => {
   }
 };
 
+// Metric changes are pushed over the live updates WebSocket API. onChanges is
+// called with the changes of each message. A dropped connection is reopened
+// after RECONNECT_DELAY_MS, and onReconnect is called so the caller can reload
+// its snapshot. Returns a function that closes the connection, or null when
+// no live URL is configured.
+const RECONNECT_DELAY_MS = 5000;
+
+export const subscribeToChanges = (onChanges, onReconnect = () => {}) => {
+  if (!config.liveUrl) {
+    return null;
+  }
+  let socket = null;
+  let closed = false;
+  let reconnectTimer = null;
+
+  const connect = (reconnecting) => {
+    socket = new WebSocket(config.liveUrl);
+    socket.onopen = () => {
+      console.log('🔌 Live updates connected:', config.liveUrl);
+      if (reconnecting) {
+        onReconnect();
+      }
+    };
+    socket.onmessage = (event) => {
+      try {
+        const message = JSON.parse(event.data);
+        if (message.type === 'changes') {
+          onChanges(message.changes || []);
+        }
+      } catch (error) {
+        console.error('Error reading live update:', error);
+      }
+    };
+    socket.onclose = () => {
+      if (!closed) {
+        reconnectTimer = setTimeout(() => connect(true), RECONNECT_DELAY_MS);
+      }
+    };
+  };
+
+  connect(false);
+  return () => {
+    closed = true;
+    clearTimeout(reconnectTimer);
+    socket.close();
+  };
+};
+
+// Applies metric changes to a dashboard summary and returns the new summary.
+// date#YYYY-MM-DD changes update that day's sales and cohort#YYYY-MM changes
+// that cohort. A change with a value sets the field; one without adds its delta.
+export const applyChanges = (summary, changes) => {
+  const recentSales = summary.recentSales.map(day => ({ ...day }));
+  const customerCohorts = summary.customerCohorts.map(cohort => ({ ...cohort }));
+  changes.forEach(({ key, field, delta, value }) => {
+    const [kind, name] = key.split('#');
+    const [rows, keyField] =
+      kind === 'date' ? [recentSales, 'time_value'] :
+      kind === 'cohort' ? [customerCohorts, 'cohort'] : [null, null];
+    if (!rows) {
+      return;
+    }
+    let row = rows.find(existing => existing[keyField] === name);
+    if (!row) {
+      row = { [keyField]: name };
+      rows.push(row);
+    }
+    row[field] = value !== undefined ? value : (Number(row[field]) || 0) + delta;
+  });
+  recentSales.sort((a, b) => a.time_value.localeCompare(b.time_value));
+  return { ...summary, recentSales, customerCohorts };
+};
+
 export default {
   fetchDashboardSummary,
   fetchSalesData,
+  fetchTopSellers,
   fetchCustomerData,
   fetchInventoryData,
   fetchNotifications,
-  generateReport
+  generateReport,
+  subscribeToChanges,
+  applyChanges
 };
\ No newline at end of file
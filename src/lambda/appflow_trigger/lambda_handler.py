@@ -1,10 +1,15 @@
 import json
 import boto3
+import gzip
 import os
+import uuid
 from datetime import datetime
+from common.segmentation import SegmentationEngine, marketing_record
+from common.sqs_batch import PoisonMessage, SqsBatchRunner, batch_envelope, eventbridge_message
 
 # Initialize clients
 s3 = boto3.client('s3')
+sqs = boto3.client('sqs')
 events = boto3.client('events')
 appflow = boto3.client('appflow')
 
@@ -12,126 +17,171 @@ appflow = boto3.client('appflow')
 APPFLOW_FLOW_NAME = "EcommerceMarketingIntegration"
 S3_BUCKET = "lukebowm-appflow-data"
 SOURCE_PREFIX = "source-data/"
+MANIFEST_PREFIX = "manifests/"
+
+# Segment, recommendation and campaign rules (common/segmentation_rules.json)
+segmentation = SegmentationEngine()
+
+# Bounds for a single part file (uncompressed)
+MAX_PART_RECORDS = int(os.environ.get('MAX_PART_RECORDS', '50000'))
+MAX_PART_BYTES = int(os.environ.get('MAX_PART_BYTES', str(64 * 1024 * 1024)))
+
+# Malformed events go to the dead-letter queue with the reason
+DEAD_LETTER_QUEUE_URL = os.environ.get('DEAD_LETTER_QUEUE_URL')
+runner = SqsBatchRunner('appflow_trigger', sqs, DEAD_LETTER_QUEUE_URL, decode=eventbridge_message)
 
 def lambda_handler(event, context):
     """
-    This function is triggered by EventBridge and:
-    1. Generates a sample customer data file
-    2. Uploads it to S3
-    3. Triggers the AppFlow flow
+    This function receives customer_analyzed events and:
+    1. Generates customer marketing data for each customer
+    2. Deduplicates it by customer (last writer wins)
+    3. Uploads it to S3 as a few gzip-compressed JSON Lines part files plus a manifest
+    4. Triggers the AppFlow flow
+    
+    Events normally arrive in batches from the marketing export SQS queue,
+    whose batching window bounds how long records are buffered. A malformed
+    event is dead-lettered on its own instead of failing its whole batch. A
+    single EventBridge event is still accepted and handled as a batch of one.
     """
     try:
-        # Get event details
-        event_source = event.get('source', 'unknown')
-        detail_type = event.get('detail-type', 'unknown')
+        batch = batch_envelope(event)
+        if batch is not None:
+            # A retried batch gets the same id, so its part files are overwritten
+            records = batch['Records']
+            export = MarketingExport(f"{records[0]['messageId']}-{records[-1]['messageId']}")
+            return runner.run(batch, export.add, flush=export.flush)
         
-        # Only process customer events
-        if event_source == 'com.ecommerce.customers' and detail_type == 'customer_analyzed':
-            detail = event['detail']
-            
-            # Generate sample customer marketing data
-            customer_data = generate_customer_marketing_data(detail)
-            
-            # Create a unique filename
-            filename = f"customer_{detail.get('customer_id')}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
-            
-            # Upload to S3
-            upload_to_s3(customer_data, filename)
-            
-            # Trigger AppFlow (in a real scenario)
-            # In this demo, we'll just log that we would trigger it
-            print(f"Would trigger AppFlow flow: {APPFLOW_FLOW_NAME}")
-            # Uncomment to actually trigger AppFlow
-            # start_appflow_flow()
-            
-            return {
-                "statusCode": 200,
-                "body": json.dumps({
-                    "message": f"Successfully processed customer data and uploaded to S3: {filename}"
-                })
-            }
-        else:
-            print(f"Ignoring non-customer event: {event_source} - {detail_type}")
-            return {
-                "statusCode": 200,
-                "body": json.dumps({
-                    "message": "Event ignored - not a customer event"
-                })
-            }
+        export = MarketingExport(event.get('id', str(uuid.uuid4())))
+        export.add((event.get('id'), event))
+        export.flush()
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "message": f"Exported {len(export.records)} customers"
+            })
+        }
             
     except Exception as e:
         print(f"Error processing event: {str(e)}")
         raise e
 
+class MarketingExport:
+    """The latest marketing record per customer in a batch, exported together by flush()"""
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self.records = {}  # customer_id -> (updated_at, marketing record)
+
+    def add(self, message):
+        _, event = message
+        event_source = event.get('source', 'unknown')
+        detail_type = event.get('detail-type', 'unknown')
+        
+        # Only process customer events
+        if event_source != 'com.ecommerce.customers' or detail_type != 'customer_analyzed':
+            print(f"Ignoring non-customer event: {event_source} - {detail_type}")
+            return
+        
+        detail = event['detail']
+        customer_id = detail.get('customer_id')
+        if not customer_id:
+            raise PoisonMessage("customer_analyzed event without a customer_id")
+        updated_at = detail.get('last_updated') or event.get('time', '')
+        
+        # Keep only the most recent analysis of each customer
+        current = self.records.get(customer_id)
+        if current is not None and current[0] > updated_at:
+            return
+        # Segmented here rather than in flush(), so a customer the rules
+        # cannot evaluate fails on its own
+        self.records[customer_id] = (updated_at, generate_customer_marketing_data(detail))
+
+    def flush(self):
+        """Upload the batch's records; a failure retries the whole batch"""
+        if not self.records:
+            print(f"Ignoring batch {self.batch_id} - no customer events")
+            return []
+        
+        manifest = export_marketing_records({customer_id: record for customer_id, (_, record) in self.records.items()},
+                                            self.batch_id)
+        print(f"Exported {manifest['record_count']} customers in {len(manifest['parts'])} part files "
+              f"({manifest['manifest_key']})")
+        
+        # Trigger AppFlow (in a real scenario)
+        # In this demo, we'll just log that we would trigger it
+        print(f"Would trigger AppFlow flow: {APPFLOW_FLOW_NAME}")
+        # Uncomment to actually trigger AppFlow
+        # start_appflow_flow()
+        return []
+
 def generate_customer_marketing_data(customer_detail):
     """Generate sample marketing data based on customer details"""
-    customer_id = customer_detail.get('customer_id', 'unknown')
-    customer_type = customer_detail.get('customer_type', 'unknown')
-    total_spent = customer_detail.get('total_spent', 0)
-    purchase_categories = customer_detail.get('purchase_categories', [])
-    total_purchases = customer_detail.get('total_purchases', 0)
+    return generate_marketing_records([customer_detail])[0]
+
+def generate_marketing_records(customer_details):
+    """Generate marketing data for many customers with the shared segmentation rules"""
+    results = segmentation.evaluate_records(customer_details)
+    now = datetime.now().isoformat()
     
-    # Determine customer segment
-    if total_spent > 500:
-        segment = "VIP"
-    elif total_spent > 200:
-        segment = "Frequent"
-    elif customer_type == 'repeat':
-        segment = "Loyal"
-    else:
-        segment = "New"
+    return [marketing_record(detail, result, now) for detail, result in zip(customer_details, results)]
+
+def export_marketing_records(records, batch_id):
+    """Write records as size-bounded gzip JSON Lines parts under the AppFlow prefix, plus a manifest
+
+    The keys depend only on batch_id and the part number, so exporting the
+    same batch again replaces its files rather than adding new ones.
+    """
+    parts = []
+    lines = []
+    line_bytes = 0
     
-    # Determine recommended products
-    recommended_products = []
-    if 'clothing' in purchase_categories:
-        recommended_products.extend(['p1001', 'p1002', 'p1007'])
-    if 'footwear' in purchase_categories:
-        recommended_products.extend(['p1003'])
-    if 'accessories' in purchase_categories:
-        recommended_products.extend(['p1004', 'p1005', 'p1006'])
-    if 'electronics' in purchase_categories:
-        recommended_products.extend(['p1008'])
+    for record in records.values():
+        line = json.dumps(record, default=str) + "\n"
+        lines.append(line)
+        line_bytes += len(line)
+        
+        # Roll to a new part once either bound is reached
+        if len(lines) >= MAX_PART_RECORDS or line_bytes >= MAX_PART_BYTES:
+            parts.append(upload_part(lines, f"part-{batch_id}-{len(parts):04d}"))
+            lines = []
+            line_bytes = 0
     
-    # Determine campaign eligibility
-    campaigns = []
-    if segment == "VIP":
-        campaigns.append("premium_member_discount")
-    if total_purchases > 5:
-        campaigns.append("loyalty_rewards")
-    if 'electronics' in purchase_categories:
-        campaigns.append("tech_upgrade")
-    if segment == "New":
-        campaigns.append("welcome_discount")
+    if lines:
+        parts.append(upload_part(lines, f"part-{batch_id}-{len(parts):04d}"))
     
-    # Create the marketing data
-    marketing_data = {
-        "customer_id": customer_id,
-        "customer_type": customer_type,
-        "segment": segment,
-        "total_spent": total_spent,
-        "total_purchases": total_purchases,
-        "purchase_categories": purchase_categories,
-        "recommended_products": recommended_products,
-        "eligible_campaigns": campaigns,
-        "last_updated": datetime.now().isoformat()
+    # The manifest lives outside the AppFlow source prefix so it is not imported
+    manifest = {
+        "batch_id": batch_id,
+        "created_at": datetime.now().isoformat(),
+        "record_count": len(records),
+        "parts": parts,
+        "manifest_key": f"{MANIFEST_PREFIX}part-{batch_id}.manifest.json"
     }
+    s3.put_object(
+        Bucket=S3_BUCKET,
+        Key=manifest['manifest_key'],
+        Body=json.dumps(manifest),
+        ContentType='application/json'
+    )
     
-    return marketing_data
+    return manifest
 
-def upload_to_s3(data, filename):
-    """Upload data to S3 bucket"""
+def upload_part(lines, part_name):
+    """Upload one gzip-compressed JSON Lines part file to S3"""
     try:
-        s3_key = f"{SOURCE_PREFIX}{filename}"
+        s3_key = f"{SOURCE_PREFIX}{part_name}.jsonl.gz"
+        body = gzip.compress("".join(lines).encode('utf-8'))
         
         s3.put_object(
             Bucket=S3_BUCKET,
             Key=s3_key,
-            Body=json.dumps(data),
-            ContentType='application/json'
+            Body=body,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip'
         )
         
-        print(f"Successfully uploaded to s3://{S3_BUCKET}/{s3_key}")
-        return True
+        print(f"Successfully uploaded {len(lines)} records to s3://{S3_BUCKET}/{s3_key}")
+        return {"key": s3_key, "records": len(lines), "bytes": len(body)}
     except Exception as e:
         print(f"Error uploading to S3: {str(e)}")
         raise e
@@ -0,0 +1,206 @@
+"""/api/query (dashboard_query) slices over a synthetic data lake, on the local AWS stand-in.
+
+Writes --orders synthetic orders spread over --days, with their line items,
+in the data lake layout (common.data_lake), one compacted file per table and
+hour as order_exporter leaves them. Then runs typical dashboard slices
+through the handler: the first run reads the lake, a repeat is served from
+the container's result cache, and a repeat in a fresh container from the
+cache shared through the bucket. Two slices are checked against totals kept
+while generating.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_dashboard_query --orders 10000000 --days 365
+"""
+import argparse
+import io
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.data_lake import LINE_ITEMS_SCHEMA, MONEY, ORDERS_SCHEMA, partition_prefix
+from common.transaction_stages import assign_fulfillment_center
+
+DATA_LAKE_BUCKET = 'local-data-lake'
+FIRST_DAY = datetime(2024, 1, 1)
+PRODUCTS = [
+    ('p1001', 'T-Shirt', 1999, 'clothing'), ('p1002', 'Jeans', 4999, 'clothing'),
+    ('p1003', 'Sneakers', 7999, 'footwear'), ('p1004', 'Backpack', 3999, 'accessories'),
+    ('p1005', 'Hat', 1499, 'accessories'), ('p1006', 'Watch', 9999, 'accessories'),
+    ('p1007', 'Socks', 999, 'clothing'), ('p1008', 'Headphones', 2999, 'electronics')
+]
+STATES = ['NY', 'CA', 'IL', 'WA', 'TX', 'CO', 'MA', 'FL', 'GA', 'AZ', 'OH', 'NJ']
+PAYMENT_METHODS = ['credit_card', 'paypal', 'apple_pay']
+
+def day_value(day):
+    return (FIRST_DAY + timedelta(days=day)).strftime('%Y-%m-%d')
+
+def dictionary(values, indices):
+    """Strings picked by index, built without a Python string per row"""
+    return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), values).cast(pa.string())
+
+def cents(values):
+    return pa.array(values / 100).cast(MONEY)
+
+def parquet(table):
+    sink = io.BytesIO()
+    pq.write_table(table, sink, compression='zstd')
+    return sink.getvalue()
+
+def hour_tables(rng, hour, count, customer_ids, expected, args):
+    """One hour of orders and line items, as numpy columns turned into Arrow tables"""
+    ids = rng.bytes(16 * count).hex()
+    transaction_ids = pa.array([ids[32 * n:32 * n + 32] for n in range(count)])
+    timestamps = pa.array(np.datetime64(hour, 'us') + np.sort(rng.integers(0, 3600 * 10 ** 6, count)),
+                          pa.timestamp('us'))
+    states = rng.integers(0, len(STATES), count)
+    payments = rng.integers(0, len(PAYMENT_METHODS), count)
+    centers = [assign_fulfillment_center(state) for state in STATES]
+
+    lines_per_order = rng.integers(1, 6, count)
+    line_count = int(lines_per_order.sum())
+    order_of_line = np.repeat(np.arange(count), lines_per_order)
+    starts = np.concatenate(([0], np.cumsum(lines_per_order)[:-1]))
+    products = rng.integers(0, len(PRODUCTS), line_count)
+    quantities = rng.integers(1, 4, line_count)
+    prices = np.array([product[2] for product in PRODUCTS])[products]
+    amounts = prices * quantities
+    totals = np.add.reduceat(amounts, starts)
+    item_counts = np.add.reduceat(quantities, starts)
+
+    orders = pa.table({
+        'transaction_id': transaction_ids,
+        'order_timestamp': timestamps,
+        'customer_id': dictionary(customer_ids, rng.integers(0, len(customer_ids), count)),
+        'payment_method': dictionary(PAYMENT_METHODS, payments),
+        'shipping_state': dictionary(STATES, states),
+        'fulfillment_center': dictionary(centers, states),
+        'status': dictionary(['processed'], np.zeros(count, dtype=np.int32)),
+        'item_count': pa.array(item_counts, pa.int32()),
+        'total_amount': cents(totals)
+    }, schema=ORDERS_SCHEMA)
+    line_items = pa.table({
+        'transaction_id': transaction_ids.take(pa.array(order_of_line)),
+        'line_number': pa.array(np.arange(line_count) - starts[order_of_line], pa.int16()),
+        'order_timestamp': timestamps.take(pa.array(order_of_line)),
+        'product_id': dictionary([product[0] for product in PRODUCTS], products),
+        'product_name': dictionary([product[1] for product in PRODUCTS], products),
+        'category': dictionary([product[3] for product in PRODUCTS], products),
+        'quantity': pa.array(quantities, pa.int32()),
+        'price': cents(prices),
+        'amount': cents(amounts)
+    }, schema=LINE_ITEMS_SCHEMA)
+
+    # Totals for the checked slices
+    if hour >= FIRST_DAY + timedelta(days=args.days - 30):
+        for state, revenue in zip(STATES, np.bincount(states, weights=totals, minlength=len(STATES))):
+            expected['revenue by state'][state] += int(revenue)
+    if hour < FIRST_DAY + timedelta(days=90):
+        categories = np.array([product[3] for product in PRODUCTS])[products]
+        for category in set(categories):
+            expected['category units'][category] += int(quantities[categories == category].sum())
+    return orders, line_items
+
+def generate(aws, args):
+    rng = np.random.default_rng(args.seed)
+    hours = args.days * 24
+    per_hour = np.full(hours, args.orders // hours)
+    per_hour[:args.orders % hours] += 1
+    expected = {'revenue by state': Counter(), 'category units': Counter()}
+    customer_ids = pa.array([f"cust_{n}" for n in range(args.customers)])
+    for n in range(hours):
+        hour = FIRST_DAY + timedelta(hours=n)
+        orders, line_items = hour_tables(rng, hour, int(per_hour[n]), customer_ids, expected, args)
+        for table_name, table in (('orders', orders), ('line_items', line_items)):
+            key = f"{partition_prefix(table_name, hour)}compacted-0-0000.parquet"
+            aws.s3.put_object(Bucket=DATA_LAKE_BUCKET, Key=key, Body=parquet(table))
+    return expected
+
+def slices(args):
+    last = day_value(args.days - 1)
+    return [
+        ('revenue by state, 30 days', {
+            'from': day_value(args.days - 30), 'to': last, 'groupBy': ['shipping_state'],
+            'aggregates': [{'fn': 'sum', 'column': 'total_amount', 'as': 'revenue'}, {'fn': 'count', 'as': 'orders'}],
+            'orderBy': [{'column': 'revenue', 'desc': True}]}),
+        ('daily revenue and AOV, 90 days', {
+            'from': day_value(args.days - 90), 'to': last, 'groupBy': ['date'],
+            'aggregates': [{'fn': 'sum', 'column': 'total_amount', 'as': 'revenue'},
+                           {'fn': 'avg', 'column': 'total_amount', 'as': 'aov'}], 'limit': 1000}),
+        ('payment mix, whole range', {
+            'from': day_value(0), 'to': last, 'groupBy': ['payment_method'], 'aggregates': [{'fn': 'count'}]}),
+        ('FC units by hour of day, 7 days', {
+            'from': day_value(args.days - 7), 'to': last, 'groupBy': ['fulfillment_center', 'hour'],
+            'aggregates': [{'fn': 'sum', 'column': 'item_count', 'as': 'units'}], 'limit': 1000}),
+        ('large orders by state, 30 days', {
+            'from': day_value(args.days - 30), 'to': last,
+            'filters': [{'column': 'total_amount', 'op': '>=', 'value': 300}],
+            'groupBy': ['shipping_state'], 'aggregates': [{'fn': 'count', 'as': 'orders'}]}),
+        ('distinct customers by month, whole range', {
+            'from': day_value(0), 'to': last, 'groupBy': ['month'],
+            'aggregates': [{'fn': 'count_distinct', 'column': 'customer_id', 'as': 'customers'}]}),
+        ('category units, first 90 days', {
+            'table': 'line_items', 'from': day_value(0), 'to': day_value(89), 'groupBy': ['category'],
+            'aggregates': [{'fn': 'sum', 'column': 'quantity', 'as': 'units'},
+                           {'fn': 'sum', 'column': 'amount', 'as': 'revenue'}]}),
+        ('top 5 products, two categories, 30 days', {
+            'table': 'line_items', 'from': day_value(args.days - 30), 'to': last,
+            'filters': [{'column': 'category', 'op': 'in', 'value': ['electronics', 'accessories']}],
+            'groupBy': ['product_name'], 'aggregates': [{'fn': 'sum', 'column': 'quantity', 'as': 'units'}],
+            'orderBy': [{'column': 'units', 'desc': True}], 'limit': 5})
+    ]
+
+def query(handler, spec):
+    event = {'httpMethod': 'POST', 'path': '/api/query', 'body': json.dumps(spec)}
+    start = time.perf_counter()
+    response = handler.lambda_handler(event, LocalContext('dashboard_query'))
+    seconds = time.perf_counter() - start
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'], parse_float=Decimal), seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=10000000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--customers', type=int, default=200000)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="simulated round trip per S3 call")
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['DATA_LAKE_BUCKET'] = DATA_LAKE_BUCKET
+    aws = LocalAws()
+    aws.install()
+    start = time.perf_counter()
+    expected = generate(aws, args)
+    objects = aws.s3.objects(DATA_LAKE_BUCKET)
+    print(f"{args.orders:,} orders over {args.days} days: {len(objects):,} files, "
+          f"{sum(len(data) for data in objects.values()) / 2 ** 20:,.0f} MiB, generated in "
+          f"{time.perf_counter() - start:.0f}s")
+
+    aws.latency = args.latency_ms / 1000.0
+    handler = load_handler('dashboard_query')
+    fresh = load_handler('dashboard_query')
+    print(f"{'slice':<42} {'files':>6} {'rows':>11} {'groups':>6} {'first':>8} {'cached':>8} {'shared':>8}")
+    results = {}
+    for name, spec in slices(args):
+        first, first_seconds = query(handler, spec)
+        cached, cached_seconds = query(handler, spec)
+        shared, shared_seconds = query(fresh, spec)
+        assert cached['cached'] and shared['cached']
+        assert cached['data'] == first['data'] and shared['data'] == first['data']
+        results[name] = first
+        print(f"{name:<42} {first['filesScanned']:>6,} {first['rowsScanned']:>11,} {first['groups']:>6} "
+              f"{first_seconds:>7.2f}s {cached_seconds * 1000:>6.1f}ms {shared_seconds * 1000:>6.1f}ms")
+
+    revenue = {row['shipping_state']: int(row['revenue'] * 100) for row in results['revenue by state, 30 days']['data']}
+    units = {row['category']: int(row['units']) for row in results['category units, first 90 days']['data']}
+    print(f"revenue by state matches: {revenue == dict(expected['revenue by state'])}; "
+          f"category units match: {units == dict(expected['category units'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Data lake export (order_exporter) over the local AWS stand-in.
+
+The transactions, spread at --orders-per-hour, go through TransactionPipeline.
+Its order_processed events are delivered to the exporter as SQS batches of
+--batch-size, with every tenth batch delivered twice, and the resulting hours
+are compacted. Reports the files and bytes before and after compaction and
+next to the same orders as gzip JSON lines. Then answers revenue by state,
+payment method mix, fulfillment center load and category revenue from the
+Parquet files, and checks the answers against the transactions themselves.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_data_lake_export --transactions 20000 --orders-per-hour 2000
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pyarrow.dataset as ds
+from benchmarks.bench_event_batching import sqs_event_batches
+from benchmarks.bench_order_log_aggregation import eventbridge_event
+from benchmarks.bench_transaction_pipeline import sqs_batches, synthetic_transactions
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.transaction_stages import assign_fulfillment_center
+
+DATA_LAKE_BUCKET = 'local-data-lake'
+
+def expected_answers(transactions):
+    """The report answers computed straight from the transactions"""
+    revenue_by_state, payment_mix, fc_orders, category_revenue = Counter(), Counter(), Counter(), Counter()
+    for transaction in transactions:
+        state = transaction['shipping_address']['state']
+        revenue_by_state[state] += Decimal(str(transaction['total_amount']))
+        payment_mix[transaction['payment_method']] += 1
+        fc_orders[assign_fulfillment_center(state)] += 1
+        for item in transaction['items']:
+            category_revenue[item['category']] += Decimal(str(item['price'])) * item['quantity']
+    return {'revenue by state': revenue_by_state, 'payment mix': payment_mix,
+            'fulfillment center orders': fc_orders, 'category revenue': category_revenue}
+
+def grouped(table, key, column, aggregation):
+    result = table.group_by(key).aggregate([(column, aggregation)])
+    return Counter(dict(zip(result.column(key).to_pylist(), result.column(f"{column}_{aggregation}").to_pylist())))
+
+def lake_answers(root):
+    """The report answers from the Parquet files, reading only the columns each one needs"""
+    orders = ds.dataset(os.path.join(root, 'orders'), format='parquet', partitioning='hive')
+    line_items = ds.dataset(os.path.join(root, 'line_items'), format='parquet', partitioning='hive')
+    order_columns = orders.to_table(columns=['shipping_state', 'payment_method', 'fulfillment_center',
+                                             'total_amount'])
+    return {
+        'revenue by state': grouped(order_columns, 'shipping_state', 'total_amount', 'sum'),
+        'payment mix': grouped(order_columns, 'payment_method', 'total_amount', 'count'),
+        'fulfillment center orders': grouped(order_columns, 'fulfillment_center', 'total_amount', 'count'),
+        'category revenue': grouped(line_items.to_table(columns=['category', 'amount']), 'category', 'amount', 'sum')
+    }
+
+def json_answer(data):
+    """Revenue by state from gzip JSON lines, which have to be parsed whole"""
+    revenue = Counter()
+    for line in gzip.decompress(data).splitlines():
+        order = json.loads(line, parse_float=Decimal)
+        revenue[order['shipping_state']] += order['total_amount']
+    return revenue
+
+def lake_stats(aws):
+    objects = aws.s3.objects(DATA_LAKE_BUCKET)
+    return len(objects), sum(len(data) for data in objects.values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--orders-per-hour', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500, help="order_processed events per SQS batch")
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ['DATA_LAKE_BUCKET'] = DATA_LAKE_BUCKET
+    aws = LocalAws()
+    aws.install()
+    transactions = synthetic_transactions(args.transactions, args.customers, args.seed)
+    start = datetime(2024, 1, 1)
+    for n, transaction in enumerate(transactions):
+        transaction['timestamp'] = (start + timedelta(seconds=n * 3600 / args.orders_per_hour)).isoformat()
+    pipeline = load_handler('transaction_pipeline')
+    exporter = load_handler('order_exporter')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in sqs_batches(transactions):
+            pipeline.lambda_handler(event, LocalContext('transaction_pipeline'))
+    events = [eventbridge_event(entry) for entry in aws.events.entries if entry['DetailType'] == 'order_processed']
+    hours = sorted({exporter.order_time(event['detail']['timestamp']).replace(minute=0, second=0, microsecond=0)
+                    for event in events})
+    print(f"{len(events):,} orders over {len(hours)} hours, SQS batches of {args.batch_size}")
+
+    aws.calls.clear()
+    start_time = time.perf_counter()
+    invocations = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n, batch in enumerate(sqs_event_batches(events, args.batch_size)):
+            # Every tenth batch is delivered again, as an at-least-once queue may
+            for _ in range(2 if n % 10 == 0 else 1):
+                failures = exporter.lambda_handler(batch, LocalContext('order_exporter'))['batchItemFailures']
+                assert not failures, failures
+                invocations += 1
+    files, size = lake_stats(aws)
+    print(f"export:  {invocations} invocations, {files:,} files, {size / 2 ** 10:,.0f} KiB "
+          f"in {time.perf_counter() - start_time:.2f}s; {sum(aws.calls.values()):,} S3 calls")
+
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        merged = exporter.compact_hours(hours)
+    files, size = lake_stats(aws)
+    print(f"compact: {merged:,} files into {files:,}, {size / 2 ** 10:,.0f} KiB in {time.perf_counter() - start_time:.2f}s")
+
+    archived = gzip.compress('\n'.join(json.dumps(event['detail'], separators=(',', ':')) for event in events)
+                             .encode('utf-8'))
+    print(f"gzip JSON lines of the same orders: {len(archived) / 2 ** 10:,.0f} KiB")
+
+    with tempfile.TemporaryDirectory() as root:
+        for key, data in aws.s3.objects(DATA_LAKE_BUCKET).items():
+            os.makedirs(os.path.dirname(os.path.join(root, key)), exist_ok=True)
+            with open(os.path.join(root, key), 'wb') as f:
+                f.write(data)
+        start_time = time.perf_counter()
+        answers = lake_answers(root)
+        lake_seconds = time.perf_counter() - start_time
+        rows = ds.dataset(os.path.join(root, 'orders'), format='parquet', partitioning='hive').count_rows()
+
+    start_time = time.perf_counter()
+    json_revenue = json_answer(archived)
+    json_seconds = time.perf_counter() - start_time
+    print(f"queries: 4 answers from Parquet in {lake_seconds * 1000:.0f}ms; "
+          f"revenue by state alone from JSON lines in {json_seconds * 1000:.0f}ms")
+
+    expected = expected_answers(transactions)
+    for name, answer in answers.items():
+        top = ', '.join(f"{key} {value}" for key, value in answer.most_common(3))
+        print(f"    {name:<26} {top}")
+    print(f"orders rows {rows:,} (one per transaction: {rows == len(transactions)}); "
+          f"answers match the transactions: {answers == expected}; "
+          f"JSON revenue matches: {json_revenue == expected['revenue by state']}")
+
+if __name__ == '__main__':
+    main()
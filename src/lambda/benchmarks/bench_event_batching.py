@@ -0,0 +1,103 @@
+"""Direct versus SQS-batched event delivery to business_logic and notification_service.
+
+The transactions go through TransactionPipeline, and the events it publishes
+are delivered to the two consumers the way their EventBridge rules route
+them: in direct mode one invocation per event, in batched mode as SQS batches
+of --batch-size records. Reports invocations and AWS calls per consumer, and
+checks that both modes leave the same daily SalesMetrics buckets and
+CustomerInsights cohorts behind.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_event_batching --transactions 5000 --latency-ms 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import time
+from benchmarks.bench_order_log_aggregation import eventbridge_event, final_state
+from benchmarks.bench_transaction_pipeline import sqs_batches, synthetic_transactions
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+
+CONSUMER_RULES = {
+    'business_logic': {'order_processed', 'customer_analyzed', 'inventory_updated', 'inventory_alert'},
+    'notification_service': {'order_processed', 'inventory_alert', 'customer_analyzed'}
+}
+
+def sqs_event_batches(events, batch_size):
+    """SQS events carrying EventBridge events, as a rule's queue target delivers them"""
+    for start in range(0, len(events), batch_size):
+        yield {
+            'Records': [
+                {
+                    'messageId': event['id'],
+                    'eventSource': 'aws:sqs',
+                    'body': json.dumps(event),
+                    'attributes': {'ApproximateReceiveCount': '1'}
+                }
+                for event in events[start:start + batch_size]
+            ]
+        }
+
+def deliver(mode, name, module, events, batch_size):
+    """Invoke one consumer with its routed events; returns (invocations, failures)"""
+    context = LocalContext(name)
+    if mode == 'direct':
+        for event in events:
+            module.lambda_handler(event, context)
+        return len(events), 0
+    invocations = failures = 0
+    for batch in sqs_event_batches(events, batch_size):
+        failures += len(module.lambda_handler(batch, context)['batchItemFailures'])
+        invocations += 1
+    return invocations, failures
+
+def run_mode(mode, transactions, args):
+    aws = LocalAws(latency_ms=args.latency_ms)
+    aws.install()
+    pipeline = load_handler('transaction_pipeline')
+    consumers = {name: load_handler(name) for name in CONSUMER_RULES}
+
+    # Handler logging is part of the work, but not worth printing
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in sqs_batches(transactions):
+            pipeline.lambda_handler(event, LocalContext('transaction_pipeline'))
+    events = [eventbridge_event(entry) for entry in aws.events.entries]
+
+    for name, module in consumers.items():
+        routed = [event for event in events if event['detail-type'] in CONSUMER_RULES[name]]
+        aws.calls.clear()  # count this consumer only
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            invocations, failures = deliver(mode, name, module, routed, args.batch_size)
+        seconds = time.perf_counter() - start
+        print(f"{mode:<8} {name:<21} {len(routed):>8,} {invocations:>11,} {sum(aws.calls.values()):>10,} "
+              f"{seconds:>8.2f}s  failures {failures}")
+        for operation, count in sorted(aws.calls.items()):
+            print(f"    {operation:<26} {count:>9,}")
+
+    print(f"    {'notification records':<26} {len(aws.dynamodb.Table('Notifications').items):>9,}")
+    return aws
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=1.0, help="simulated round trip per AWS call")
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    # mock_data_generator creates an SNS client when imported
+    LocalAws().install()
+    transactions = synthetic_transactions(args.transactions, args.customers, args.seed)
+    print(f"{args.transactions:,} transactions, {args.customers:,} customers, "
+          f"{args.latency_ms}ms per AWS call")
+    print(f"{'mode':<8} {'consumer':<21} {'events':>8} {'invocations':>11} {'AWS calls':>10} {'time':>9}")
+
+    direct = run_mode('direct', transactions, args)
+    batched = run_mode('batched', transactions, args)
+    print(f"final state identical: {final_state(direct) == final_state(batched)}")
+
+if __name__ == '__main__':
+    main()
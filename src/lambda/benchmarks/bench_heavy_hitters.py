@@ -0,0 +1,77 @@
+"""Accuracy and throughput of the Space-Saving leaderboard against exact counting.
+
+Generates a Zipf-distributed stream of product sales, splits it across a
+number of simulated containers, and compares the merged Space-Saving top-N
+with an exact Counter.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_heavy_hitters --events 500000 --products 20000
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from common.heavy_hitters import SpaceSaving
+
+def zipf_stream(events, products, exponent, seed):
+    """Product ids drawn from a Zipf distribution, with 1-3 units per sale"""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** exponent) for rank in range(1, products + 1)]
+    keys = rng.choices(range(products), weights=weights, k=events)
+    return [(f"p{key:06d}", rng.randint(1, 3)) for key in keys]
+
+def run_exact(stream):
+    start = time.perf_counter()
+    counts = Counter()
+    for key, weight in stream:
+        counts[key] += weight
+    return counts, time.perf_counter() - start
+
+def run_sketch(stream, capacity, containers):
+    """Feed each container a slice of the stream, then merge like the flush does"""
+    start = time.perf_counter()
+    summaries = [SpaceSaving(capacity) for _ in range(containers)]
+    for position, (key, weight) in enumerate(stream):
+        summaries[position % containers].offer(key, weight)
+    merged = SpaceSaving(capacity)
+    for summary in summaries:
+        merged.merge(summary)
+    return merged, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=500000)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--exponent', type=float, default=1.1)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--containers', type=int, default=8)
+    parser.add_argument('--capacities', default='32,64,128,256')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    stream = zipf_stream(args.events, args.products, args.exponent, args.seed)
+    exact, exact_seconds = run_exact(stream)
+    true_top = [key for key, _ in exact.most_common(args.top)]
+
+    print(f"{args.events} events, {args.products} products, zipf s={args.exponent}, "
+          f"{args.containers} containers, top {args.top}")
+    print(f"exact Counter: {args.events / exact_seconds:,.0f} events/s, {len(exact)} counters")
+    print(f"{'capacity':>8} {'events/s':>12} {'recall':>7} {'max rel err':>12} "
+          f"{'bound':>8} {'bound held':>10}")
+
+    for capacity in (int(value) for value in args.capacities.split(',')):
+        merged, seconds = run_sketch(stream, capacity, args.containers)
+        reported = merged.top(args.top)
+        recall = len(set(true_top) & {entry['key'] for entry in reported}) / args.top
+        max_relative_error = max(
+            (entry['count'] - exact[entry['key']]) / exact[entry['key']] for entry in reported
+        )
+        # Every reported count must bracket the true count
+        bound_held = all(
+            entry['guaranteed'] <= exact[entry['key']] <= entry['count'] for entry in reported
+        )
+        print(f"{capacity:>8} {args.events / seconds:>12,.0f} {recall:>7.0%} "
+              f"{max_relative_error:>12.2%} {merged.error_bound():>8.0f} {str(bound_held):>10}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""/api/inventory pages from the CategoryIndex versus the full catalogue scan, on the local AWS stand-in.
+
+Builds a catalogue of --products products over --categories categories
+through InventoryPool, as orders would: every product sells one line, some
+enough to run low, and a few hot products are pooled and rebalanced. Then
+compares the scan the endpoint used to make (every product, grouped by
+category in one response) with the first page of a category, and pages
+through a few categories with and without a status filter, checking that
+every product comes back exactly once and that the counters item agrees
+with the items. Also checks that an inventory report (POST /api/reports)
+has a row for every product.
+
+Sizes are JSON sizes of the items, a close stand-in for DynamoDB's item
+size, as the stand-in counts them for read capacity; read units assume
+eventually consistent reads (4 KB per half unit).
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_inventory_browse --products 100000 --categories 40
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import random
+import time
+from collections import Counter
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.inventory_pool import PRODUCTS_FILTER, InventoryPool, convert_to_pool, read_status_counts, rebalance
+from common.table_scan import ScanStats, scan_items
+from common.transaction_model import LineItem
+
+TABLE = 'InventoryStatus'
+
+def item_bytes(items):
+    return sum(len(json.dumps(item, default=str)) for item in items)
+
+def read_units(size):
+    return math.ceil(size / 4096) / 2
+
+def build_catalogue(aws, args):
+    rng = random.Random(args.seed)
+    table = aws.dynamodb.Table(TABLE)
+    pool = InventoryPool(table, rng=rng)
+    categories = [f"category-{n:03d}" for n in range(args.categories)]
+    weights = [1 / (rank + 1) for rank in range(args.categories)]  # a few large categories, a long tail
+    products = {}
+    for n in range(args.products):
+        category = rng.choices(categories, weights)[0]
+        product_id = f"p{n:06d}"
+        products[product_id] = category
+        quantity = 85 if rng.random() < args.low_share else rng.randint(1, 3)
+        pool.reserve(LineItem(product_id, f"Product {n}", category, 19, quantity))
+
+    # Pooled products keep their counts through the rebalancer
+    for product_id in list(products)[:args.hot_products]:
+        convert_to_pool(table, product_id)
+        rebalance(aws.dynamodb, TABLE, product_id, 8)
+    return products
+
+def fetch(handler, params):
+    event = {'httpMethod': 'GET', 'path': '/api/inventory', 'queryStringParameters': params}
+    start = time.perf_counter()
+    response = handler.lambda_handler(event, LocalContext('dashboard_api'))
+    seconds = time.perf_counter() - start
+    assert response['statusCode'] == 200, response['body']
+    return response['body'], seconds
+
+def walk(aws, handler, params):
+    """Every page of a listing; returns the product ids, pages and reads"""
+    product_ids, pages = [], 0
+    aws.calls.clear()
+    token = None
+    while True:
+        body, _ = fetch(handler, dict(params, **({'nextToken': token} if token else {})))
+        page = json.loads(body)
+        product_ids.extend(item['product_id'] for item in page['items'])
+        pages += 1
+        token = page['nextToken']
+        if not token:
+            return product_ids, pages, aws.calls['dynamodb.Query'] + aws.calls['dynamodb.Scan'], page['totalItems']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=40)
+    parser.add_argument('--low-share', type=float, default=0.05, help="share of products that run low")
+    parser.add_argument('--hot-products', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    aws = LocalAws()
+    aws.install()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        products = build_catalogue(aws, args)
+    table = aws.dynamodb.Table(TABLE)
+    by_category = Counter(products.values())
+    print(f"{len(products):,} products in {len(by_category)} categories, "
+          f"{len(table.items):,} items with pool shards, built in {time.perf_counter() - start:.0f}s")
+
+    # What /api/inventory used to do: scan everything, group it, return it all
+    start = time.perf_counter()
+    stats = ScanStats()
+    items = list(scan_items(table, stats=stats, FilterExpression=PRODUCTS_FILTER))
+    grouped = {}
+    for item in items:
+        grouped.setdefault(item.get('category', 'unknown'), []).append(item)
+    body = json.dumps({'categories': grouped, 'totalItems': len(items)}, default=str)
+    scan_seconds = time.perf_counter() - start
+    scanned = item_bytes(table.items.values())
+    print(f"full scan:      {stats.pages} Scan pages, {scanned / 2 ** 20:.1f} MiB read "
+          f"({stats.capacity_units:,.0f} RCU), {len(body) / 2 ** 20:.1f} MiB response, {scan_seconds:.2f}s")
+
+    handler = load_handler('dashboard_api')
+    category = by_category.most_common(1)[0][0]
+    aws.calls.clear()
+    body, seconds = fetch(handler, {'category': category, 'limit': str(args.page_size)})
+    page = json.loads(body)
+    counts_item = table.get_item(Key={'product_id': 'inventory#counts'})['Item']
+    read = item_bytes(page['items'])
+    print(f"first page:     {aws.calls['dynamodb.Query']} Query ({page['count']} of {page['totalItems']:,} products "
+          f"in {category}, {read / 1024:.0f} KiB, {read_units(read)} RCU) + 1 GetItem for the counts "
+          f"({item_bytes([counts_item]) / 1024:.1f} KiB), {len(body) / 1024:.0f} KiB response, {seconds * 1000:.1f}ms")
+
+    ok = True
+    for category, _ in by_category.most_common(3):
+        expected = sorted(product_id for product_id, item_category in products.items() if item_category == category)
+        product_ids, pages, reads, total = walk(aws, handler, {'category': category, 'limit': str(args.page_size)})
+        complete = product_ids == expected and total == len(expected)
+        low = sorted(key for key in expected if table.items[key].get('inventory_status') == 'low')
+        low_ids, low_pages, low_reads, low_total = walk(aws, handler, {'category': category, 'status': 'low',
+                                                                       'limit': str(args.page_size)})
+        complete = complete and low_ids == low and low_total == len(low)
+        ok = ok and complete
+        print(f"    {category}: {len(product_ids):,} products in {pages} pages / {reads} reads, "
+              f"{len(low_ids)} low in {low_pages} pages / {low_reads} reads; complete: {complete}")
+
+    exact = {}
+    for item in items:
+        statuses = exact.setdefault(item['category'], {})
+        statuses[item['inventory_status']] = statuses.get(item['inventory_status'], 0) + 1
+    counts = read_status_counts(table)
+    print(f"pages complete: {ok}; counters match the items: {counts == exact}")
+
+    event = {'httpMethod': 'POST', 'path': '/api/reports', 'body': json.dumps({'reportType': 'inventory'})}
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = handler.lambda_handler(event, LocalContext('dashboard_api'))
+    report = json.loads(response['body'])['data']
+    rows = [item['product_id'] for item in report['items']]
+    print(f"inventory report: {len(rows):,} rows for {len(products):,} products; "
+          f"complete: {rows == sorted(products) and report['count'] == len(products)}")
+
+if __name__ == '__main__':
+    main()
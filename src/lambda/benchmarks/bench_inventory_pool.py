@@ -0,0 +1,141 @@
+"""Load test of a hot SKU's stock: one InventoryStatus item versus a reservation pool.
+
+Concurrent writers (one InventoryPool each, like separate Lambda containers)
+take order lines for a single product while the local stand-in caps every
+item key at --partition-limit writes per second, like a DynamoDB partition,
+and a rebalancer thread evens the pool out every --rebalance-every seconds.
+Throttled lines back off and retry, as the SDK would. Runs once on the single
+item, once per pre-pooled shard count, and once adaptively (converted on the
+first throttled write). Stock is sized so the faster runs sell out; each run
+then checks that sold plus remaining units equal the starting stock, that no
+counter went negative, and that every committed line was either sold or
+backordered.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_inventory_pool --seconds 3 --partition-limit 100 --stock 5000
+"""
+import argparse
+import contextlib
+import io
+import random
+import threading
+import time
+from unittest import mock
+from benchmarks.local_aws import LocalAws
+from common import inventory_pool
+from common.inventory_pool import InventoryPool, convert_to_pool, pool_key, rebalance
+from common.sharded_counters import is_throttle
+from common.transaction_model import LineItem
+
+TABLE = 'InventoryStatus'
+PRODUCT_ID = 'p1001'
+MAX_ATTEMPTS = 8
+
+def writer(table, pool_shards, deadline, seed, stats, lock):
+    rng = random.Random(seed)
+    pool = InventoryPool(table, pool_shards=pool_shards, rng=rng)
+    committed = units = throttled = dropped = 0
+    while time.monotonic() < deadline:
+        item = LineItem(PRODUCT_ID, 'Trail Runner', 'footwear', 89, rng.randint(1, 3))
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                pool.reserve(item)
+                committed += 1
+                units += item.quantity
+                break
+            except Exception as e:
+                if not is_throttle(e):
+                    raise e
+                throttled += 1
+                # Exponential backoff with full jitter
+                time.sleep(rng.uniform(0, 0.005 * 2 ** attempt))
+        else:
+            dropped += 1
+    with lock:
+        stats['committed'] += committed
+        stats['units'] += units
+        stats['throttled'] += throttled
+        stats['dropped'] += dropped
+
+def rebalancer(aws, deadline, every):
+    while time.monotonic() < deadline:
+        time.sleep(every)
+        base = aws.dynamodb.Table(TABLE).items.get(PRODUCT_ID, {})
+        if 'pool_shards' not in base:
+            continue
+        try:
+            rebalance(aws.dynamodb, TABLE, PRODUCT_ID, int(base['pool_shards']))
+        except Exception as e:
+            if not is_throttle(e):
+                raise e
+
+def audit(table, stock, demanded):
+    """Units sold, backordered, remaining, and whether they add up"""
+    base = table.items[PRODUCT_ID]
+    shards = [table.items.get(pool_key(PRODUCT_ID, shard), {}) for shard in range(int(base.get('pool_shards', 0)))]
+    if shards:
+        counters = [base.get('reserve_units', 0)] + [shard.get('available', 0) for shard in shards]
+        sold = base['base_units_sold'] + sum(shard.get('units_sold', 0) for shard in shards)
+        backordered = base.get('backordered_units', 0) + sum(shard.get('backordered_units', 0) for shard in shards)
+    else:
+        counters = [base['stock_level']]
+        sold = base['units_sold_total']
+        backordered = base.get('backordered_units', 0)
+    remaining = sum(counters)
+    ok = min(counters) >= 0 and sold + remaining == stock and sold + backordered == demanded
+    return int(sold), int(backordered), int(remaining), ok
+
+def run(label, pool_shards, converted, args):
+    aws = LocalAws(latency_ms=args.latency_ms, partition_write_limit=args.partition_limit)
+    aws.install()
+    table = aws.dynamodb.Table(TABLE)
+    table.items[PRODUCT_ID] = {'product_id': PRODUCT_ID, 'stock_level': args.stock, 'units_sold_total': 0}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if converted:
+            convert_to_pool(table, PRODUCT_ID, pool_shards)
+
+    stats = {'committed': 0, 'units': 0, 'throttled': 0, 'dropped': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [
+        threading.Thread(target=writer, args=(table, pool_shards, deadline, args.seed + n, stats, lock))
+        for n in range(args.writers)
+    ]
+    threads.append(threading.Thread(target=rebalancer, args=(aws, deadline, args.rebalance_every)))
+    start = time.perf_counter()
+    # The single-item run must never convert
+    single = mock.patch.object(inventory_pool, 'convert_to_pool', lambda *args: False)
+    with contextlib.redirect_stdout(io.StringIO()), single if pool_shards == 0 else contextlib.nullcontext():
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    seconds = time.perf_counter() - start
+
+    sold, backordered, remaining, ok = audit(table, args.stock, stats['units'])
+    print(f"{label:<10} {pool_shards or '-':>6} {stats['committed'] / seconds:>10,.0f} {stats['throttled']:>10,} "
+          f"{stats['dropped']:>8,} {sold:>7,} {backordered:>11,} {remaining:>9,} {'ok' if ok else 'MISMATCH':>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--partition-limit', type=int, default=100, help="writes per second per item key")
+    parser.add_argument('--latency-ms', type=float, default=2.0, help="simulated round trip per AWS call")
+    parser.add_argument('--stock', type=int, default=5000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--rebalance-every', type=float, default=0.25, help="seconds between rebalancer runs")
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.partition_limit} writes/s per key, {args.stock:,} units, "
+          f"{args.seconds}s per run")
+    print(f"{'mode':<10} {'shards':>6} {'lines/s':>10} {'throttled':>10} {'dropped':>8} {'sold':>7} "
+          f"{'backordered':>11} {'remaining':>9} {'stock':>9}")
+    run("single", 0, False, args)
+    for shards in args.shards:
+        run("pooled", shards, True, args)
+    run("adaptive", max(args.shards), False, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Projected dashboard and report reads versus whole items, on the local AWS stand-in.
+
+Builds --days of sharded daily sales buckets as the order path leaves them
+(sketches on the base item; counters and an appended categories list on
+--shards shard items for --orders-per-day orders), their compacted month
+rollups, two years of customer cohorts, and --products products sold through
+InventoryPool with low-stock alerts on their items. Then calls each endpoint
+three ways: reading whole items as before (projections and trimming switched
+off), with its default projection, and with a fields= selection where one
+fits. For each it reports the bytes DynamoDB returned, the response size
+and the time taken, and checks that the projected responses carry the same
+values as the whole-item ones.
+
+Sizes are JSON sizes of the items. DynamoDB charges read capacity for whole
+items whatever the projection, so every mode is charged for what the
+whole-item reads return; a projection saves transfer, decoding and response
+size.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_lean_reads --days 90 --orders-per-day 2000 --products 5000
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from benchmarks.local_aws import LocalAws, LocalContext, LocalDynamoDB, LocalTable, item_size, load_handler
+from common import rollups
+from common.bucket_sketches import CUSTOMER_HLL, ORDER_VALUE_SKETCH, VERSION_ATTRIBUTE
+from common.ddsketch import DDSketch
+from common.hyperloglog import HyperLogLog
+from common.inventory_pool import InventoryPool
+from common.rollups import compact_rollup, date_value, metric_key, month_value
+from common.sharded_counters import SHARD_COUNT_ATTRIBUTE, SHARD_OF_ATTRIBUTE, shard_key
+from common.transaction_model import LineItem
+
+CATEGORIES = ['clothing', 'footwear', 'accessories', 'electronics', 'home', 'beauty', 'sports', 'toys']
+
+class ReadMeter:
+    """Bytes of the items the stand-in's reads return"""
+
+    def __init__(self):
+        self.returned = 0
+
+    def patches(self):
+        meter = self
+
+        def measured(read, items_of):
+            def call(self, *args, **kwargs):
+                response = read(self, *args, **kwargs)
+                meter.returned += sum(item_size(item) for item in items_of(response))
+                return response
+            return call
+
+        return [
+            mock.patch.object(LocalTable, 'get_item', measured(LocalTable.get_item,
+                                                               lambda r: [r['Item']] if 'Item' in r else [])),
+            mock.patch.object(LocalTable, 'scan', measured(LocalTable.scan, lambda r: r['Items'])),
+            mock.patch.object(LocalTable, 'query', measured(LocalTable.query, lambda r: r['Items'])),
+            mock.patch.object(LocalDynamoDB, 'batch_get_item', measured(
+                LocalDynamoDB.batch_get_item, lambda r: [item for items in r['Responses'].values() for item in items]))
+        ]
+
+def build_sales(aws, args, today):
+    rng = random.Random(args.seed)
+    table = aws.dynamodb.Table('SalesMetrics')
+    months = set()
+    with table.batch_writer() as batch:
+        for offset in range(args.days):
+            day = today - timedelta(days=offset)
+            key = metric_key('date', date_value(day))
+            months.add(month_value(day))
+            customers, order_values = HyperLogLog(), DDSketch()
+            shards = [{'total_sales': Decimal('0'), 'item_count': 0, 'transaction_count': 0, 'categories': []}
+                      for _ in range(args.shards)]
+            for _ in range(args.orders_per_day):
+                amount = rng.randint(1000, 40000)
+                customers.add(f"cust_{rng.randrange(args.orders_per_day * 20)}")
+                order_values.add(amount / 100)
+                shard = rng.choice(shards)
+                shard['total_sales'] += Decimal(amount) / 100
+                shard['item_count'] += rng.randint(1, 5)
+                shard['transaction_count'] += 1
+                shard['categories'].extend(rng.sample(CATEGORIES, rng.randint(1, 3)))
+            now = day.isoformat()
+            batch.put_item(Item={
+                'metric_key': key, 'time_unit': 'date', 'time_value': date_value(day),
+                SHARD_COUNT_ATTRIBUTE: args.shards, CUSTOMER_HLL: customers.to_bytes(),
+                ORDER_VALUE_SKETCH: order_values.to_bytes(), VERSION_ATTRIBUTE: args.orders_per_day // 100,
+                'created_at': now, 'last_updated': now
+            })
+            for n, shard in enumerate(shards):
+                batch.put_item(Item=dict(shard, metric_key=shard_key(key, n), time_unit='date',
+                                         time_value=date_value(day), created_at=now, last_updated=now,
+                                         **{SHARD_OF_ATTRIBUTE: key}))
+    for month in months:
+        compact_rollup(aws.dynamodb, 'SalesMetrics', 'month', month)
+
+def build_cohorts(aws, today):
+    table = aws.dynamodb.Table('CustomerInsights')
+    rng = random.Random(1)
+    for months_back in range(24):
+        cohort = month_value(today - timedelta(days=31 * months_back))
+        customers = rng.randint(500, 5000)
+        table.put_item(Item={
+            'insight_key': f"cohort#{cohort}", 'insight_type': 'cohort', 'cohort': cohort,
+            'customer_count': customers, 'total_revenue': Decimal(customers * rng.randint(50, 400)),
+            'new_customers': customers // 3, 'repeat_customers': customers - customers // 3,
+            'created_at': today.isoformat(), 'last_updated': today.isoformat()
+        })
+
+def build_inventory(aws, args):
+    rng = random.Random(args.seed)
+    table = aws.dynamodb.Table('InventoryStatus')
+    pool = InventoryPool(table, rng=rng)
+    for n in range(args.products):
+        product_id = f"p{n:06d}"
+        quantity = 85 if rng.random() < 0.05 else rng.randint(1, 3)
+        pool.reserve(LineItem(product_id, f"Product {n}", rng.choice(CATEGORIES), 19, quantity))
+    for item in list(table.items.values()):
+        if item.get('inventory_status') == 'low':
+            table.update_item(
+                Key={'product_id': item['product_id']},
+                UpdateExpression="SET alert_id = :alert_id, alert_type = :alert_type, "
+                                 "alert_stock_level = :stock_level, alert_status = :status, "
+                                 "alert_created_at = :created_at",
+                ExpressionAttributeValues={
+                    ':alert_id': f"alert_{item['product_id']}_20240101000000", ':alert_type': 'low_inventory',
+                    ':stock_level': item['stock_level'], ':status': 'open', ':created_at': '2024-01-01T00:00:00'
+                }
+            )
+
+def whole_items(handler):
+    """Switch a handler's lean reads off: no projections, no trimming"""
+    patches = [
+        mock.patch.object(handler, 'projection', lambda attributes: {}),
+        mock.patch.object(rollups, 'projection', lambda attributes: {})
+    ]
+    if hasattr(handler, 'sparse'):
+        patches.append(mock.patch.object(handler, 'sparse', lambda items, fields: items))
+    return patches
+
+def measure(patches, function, *args):
+    """Run function with patches; returns its result, the meter and the seconds taken"""
+    meter = ReadMeter()
+    with contextlib.ExitStack() as stack:
+        for patch in patches + meter.patches():
+            stack.enter_context(patch)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function(*args)
+            seconds = time.perf_counter() - start
+    return result, meter, seconds
+
+def call(handler, path, params, patches):
+    event = {'httpMethod': 'GET', 'path': path, 'queryStringParameters': params}
+    response, meter, seconds = measure(patches, handler.lambda_handler, event, LocalContext('dashboard_api'))
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body']), len(response['body']), meter, seconds
+
+def values_agree(lean, whole):
+    """Every value in the lean response equals the same value in the whole-item one
+
+    A sparse sales response leaves the period summary null unless it asks
+    for the summary fields, so nulls are not compared.
+    """
+    if lean is None:
+        return True
+    if isinstance(lean, dict):
+        return isinstance(whole, dict) and all(key in whole and values_agree(value, whole[key])
+                                               for key, value in lean.items())
+    if isinstance(lean, list):
+        return isinstance(whole, list) and len(lean) == len(whole) and all(map(values_agree, lean, whole))
+    return lean == whole
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--orders-per-day', type=int, default=2000)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    aws = LocalAws()
+    aws.install()
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_sales(aws, args, today)
+        build_cohorts(aws, today)
+        build_inventory(aws, args)
+    sizes = Counter()
+    for name, table in aws.dynamodb.tables.items():
+        sizes[name] = sum(item_size(item) for item in table.items.values())
+    print(', '.join(f"{name} {len(aws.dynamodb.tables[name].items):,} items / {size / 2 ** 20:.1f} MiB"
+                    for name, size in sizes.items()) + f"; built in {time.perf_counter() - start:.0f}s")
+
+    dashboard = load_handler('dashboard_api')
+    category = CATEGORIES[0]
+    requests = [
+        ('/api', {}, None),
+        ('/api/sales', {'timeUnit': 'day', 'period': 'last30'}, 'time_value,total_sales,transaction_count'),
+        ('/api/sales', {'timeUnit': 'month', 'period': 'last12'}, 'time_value,total_sales'),
+        ('/api/customers', {}, 'cohort,customer_count'),
+        ('/api/inventory', {'category': category, 'limit': '500'}, 'product_id,stock_level'),
+        ('/api/notifications', {'limit': '1000'}, None)
+    ]
+    print(f"    {'mode':<48} {'DynamoDB':>10} {'response':>10} {'time':>8}  same")
+    for path, params, fields in requests:
+        print(path + ('?' + '&'.join(f"{key}={value}" for key, value in params.items()) if params else ''))
+        whole, whole_size, meter, seconds = call(dashboard, path, params, whole_items(dashboard))
+        modes = [('whole items', whole, whole_size, meter, seconds, None)]
+        modes.append(('projected',) + call(dashboard, path, params, []) + (True,))
+        if fields:
+            modes.append((f"fields={fields}",) + call(dashboard, path, dict(params, fields=fields), []) + (True,))
+        for mode, body, size, meter, seconds, check in modes:
+            same = '' if check is None else values_agree(body, whole)
+            print(f"    {mode:<48} {meter.returned / 1024:>8.1f}Ki {size / 1024:>8.1f}Ki "
+                  f"{seconds * 1000:>6.1f}ms  {same}")
+
+    reports = load_handler('report_generator')
+    for name, report in (('sales', lambda: reports.generate_sales_report('last30')),
+                         ('customers', reports.generate_customer_report),
+                         ('inventory', reports.generate_inventory_report)):
+        whole, whole_meter, whole_seconds = measure(whole_items(reports), report)
+        lean, meter, seconds = measure([], report)
+        print(f"{name} report: {whole_meter.returned / 1024:,.0f} KiB read as whole items in {whole_seconds:.2f}s, "
+              f"{meter.returned / 1024:,.0f} KiB projected in {seconds:.2f}s; "
+              f"same summary: {lean['summary'] == whole['summary']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Live dashboard updates pushed to WebSocket connections versus polling the summary, on the local AWS stand-in.
+
+Runs a minute of trading before the dashboards open and --minutes after:
+--orders-per-minute order_processed events and a customer_analyzed event for
+every --orders-per-customer orders, delivered to business_logic in SQS
+batches of 10 as batched event delivery does. Each metrics_changed event
+business_logic publishes goes to dashboard_api, which posts it to every
+connected dashboard. The session is repeated with 1 up to --dashboards
+dashboards open.
+
+When polling, every dashboard loads the summary every --poll-seconds. The
+reads of one summary are measured once a minute and multiplied out. With
+live updates, every dashboard loads the summary once (one snapshot is
+measured and multiplied out) and is then sent the changes; the only reads
+are each broadcast's scan of the connections table, which grows by a few
+dozen bytes per open dashboard.
+
+Reports per dashboard count the DynamoDB reads and bytes read per minute on
+the dashboard side in each mode, and the messages and bytes sent to each
+dashboard. It checks that every dashboard was sent every change and that the
+first snapshot with the changes applied matches a fresh summary at the end.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_live_updates --minutes 10 --orders-per-minute 200 --dashboards 1000
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from benchmarks.bench_event_batching import sqs_event_batches
+from benchmarks.bench_lean_reads import CATEGORIES, ReadMeter
+from benchmarks.bench_order_log_aggregation import eventbridge_event
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.live_updates import LIVE_SOURCE
+from common.rollups import month_value
+from common.transaction_stages import event_entry
+
+READ_OPERATIONS = ('dynamodb.GetItem', 'dynamodb.Query', 'dynamodb.Scan', 'dynamodb.BatchGetItem')
+SQS_BATCH_SIZE = 10
+SALES_FIELDS = ('total_sales', 'transaction_count', 'item_count')
+COHORT_FIELDS = ('customer_count', 'total_revenue', 'new_customers', 'repeat_customers')
+
+class Reads:
+    """Dashboard-side DynamoDB read calls and bytes read"""
+
+    def __init__(self, calls=0, returned=0):
+        self.calls = calls
+        self.returned = returned
+
+    @contextlib.contextmanager
+    def measure(self, aws):
+        meter = ReadMeter()
+        before = sum(aws.calls[operation] for operation in READ_OPERATIONS)
+        with contextlib.ExitStack() as stack:
+            for patch in meter.patches():
+                stack.enter_context(patch)
+            yield
+        self.calls += sum(aws.calls[operation] for operation in READ_OPERATIONS) - before
+        self.returned += meter.returned
+
+    def times(self, factor):
+        return Reads(self.calls * factor, self.returned * factor)
+
+    def add(self, other):
+        self.calls += other.calls
+        self.returned += other.returned
+
+def trading_minute(rng, moment, args):
+    """The events business_logic is sent in a minute of trading starting at moment"""
+    events = []
+    for n in range(args.orders_per_minute):
+        at = moment + timedelta(seconds=rng.uniform(0, 60))
+        customer_id = f"cust_{rng.randrange(100000)}"
+        items = [{'product_id': f"p{rng.randrange(1000):04d}", 'product_name': f"Product {n}",
+                  'category': rng.choice(CATEGORIES), 'quantity': rng.randint(1, 3), 'price': rng.randint(5, 200)}
+                 for _ in range(rng.randint(1, 4))]
+        transaction_id = f"t{rng.getrandbits(64):016x}"
+        events.append(eventbridge_event(event_entry('com.ecommerce.orders', 'order_processed', {
+            'transaction_id': transaction_id, 'timestamp': at.isoformat(), 'customer_id': customer_id,
+            'items': items, 'total_amount': round(sum(item['price'] * item['quantity'] for item in items), 2)
+        })))
+        if n % args.orders_per_customer == 0:
+            events.append(eventbridge_event(event_entry('com.ecommerce.customers', 'customer_analyzed', {
+                'customer_id': customer_id, 'last_transaction_id': transaction_id,
+                'customer_type': rng.choice(['new', 'repeat']), 'total_spent': rng.randint(20, 2000),
+                'year_month_cohort': month_value(at - timedelta(days=rng.randrange(730)))
+            })))
+    return events
+
+def load_summary(aws, dashboard, reads):
+    with reads.measure(aws):
+        response = dashboard.lambda_handler({'httpMethod': 'GET', 'path': '/api'}, LocalContext('dashboard_api'))
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])
+
+def apply_changes(summary, message):
+    """Apply a live update message to a dashboard summary, as the dashboard does"""
+    sales = {day['time_value']: day for day in summary['recentSales']}
+    cohorts = {cohort['cohort']: cohort for cohort in summary['customerCohorts']}
+    for change in message['changes']:
+        kind, _, name = change['key'].partition('#')
+        if kind == 'date':
+            if name not in sales:
+                sales[name] = {'time_value': name}
+                summary['recentSales'].append(sales[name])
+            target = sales[name]
+        elif kind == 'cohort':
+            if name not in cohorts:
+                cohorts[name] = {'cohort': name}
+                summary['customerCohorts'].append(cohorts[name])
+            target = cohorts[name]
+        else:
+            continue
+        field = change['field']
+        target[field] = change['value'] if 'value' in change else target.get(field, 0) + change['delta']
+
+def summaries_agree(live, fresh):
+    """The live summary's sales and cohort counters equal a freshly loaded summary's"""
+    def counters(rows, key, fields):
+        return {row[key]: [row.get(field, 0) for field in fields] for row in rows}
+
+    for section, key, fields in (('recentSales', 'time_value', SALES_FIELDS),
+                                 ('customerCohorts', 'cohort', COHORT_FIELDS)):
+        left, right = counters(live[section], key, fields), counters(fresh[section], key, fields)
+        if left.keys() != right.keys():
+            return False
+        for name, values in left.items():
+            if not all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) for a, b in zip(values, right[name])):
+                return False
+    return True
+
+def run_session(args, dashboards):
+    aws = LocalAws()
+    aws.install()
+    business_logic = load_handler('business_logic')
+    dashboard = load_handler('dashboard_api')
+    rng = random.Random(args.seed)
+    start = datetime.now() - timedelta(minutes=args.minutes)
+
+    def trade(minute):
+        aws.events.entries.clear()
+        for batch in sqs_event_batches(trading_minute(rng, start + timedelta(minutes=minute), args), SQS_BATCH_SIZE):
+            business_logic.lambda_handler(batch, LocalContext('business_logic'))
+        return [eventbridge_event(entry) for entry in aws.events.entries if entry['Source'] == LIVE_SOURCE]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # A minute of trading before the dashboards open, for their snapshot to show
+        trade(-1)
+        for n in range(dashboards):
+            aws.connections.open(f"connection-{n}")
+            dashboard.lambda_handler({'requestContext': {'connectionId': f"connection-{n}", 'routeKey': '$connect'}},
+                                     LocalContext('dashboard_api'))
+        snapshot_reads = Reads()
+        snapshot = load_summary(aws, dashboard, snapshot_reads)
+
+        polling, broadcasts = Reads(), Reads()
+        broadcast_count = 0
+        seconds = 0.0
+        for minute in range(args.minutes):
+            changes = trade(minute)
+            began = time.perf_counter()
+            with broadcasts.measure(aws):
+                for event in changes:
+                    dashboard.lambda_handler(event, LocalContext('dashboard_api'))
+            seconds += time.perf_counter() - began
+            broadcast_count += len(changes)
+
+            summary_reads = Reads()
+            load_summary(aws, dashboard, summary_reads)
+            polling.add(summary_reads.times(dashboards * 60 / args.poll_seconds))
+        fresh = load_summary(aws, dashboard, Reads())
+
+    messages = aws.connections.messages
+    first = messages['connection-0']
+    live = copy.deepcopy(snapshot)
+    for message in first:
+        apply_changes(live, json.loads(message))
+    return {
+        'polling': polling, 'snapshots': snapshot_reads.times(dashboards), 'live': broadcasts,
+        'broadcasts': broadcast_count, 'seconds': seconds,
+        'messages': len(first), 'pushed': sum(len(message) for message in first),
+        'delivered': all(len(sent) == len(first) for sent in messages.values()),
+        'agree': summaries_agree(live, fresh)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=int, default=10)
+    parser.add_argument('--orders-per-minute', type=int, default=200)
+    parser.add_argument('--orders-per-customer', type=int, default=4, help="orders per customer_analyzed event")
+    parser.add_argument('--dashboards', type=int, default=1000, help="most dashboards open at once")
+    parser.add_argument('--poll-seconds', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    counts = [count for count in (1, 10, 100, 1000, 10000) if count < args.dashboards] + [args.dashboards]
+    print("Dashboard-side DynamoDB reads: polling and live updates per minute, and the live snapshots, loaded once")
+    print(f"{'dashboards':>10} {'polling':>18} {'snapshots':>18} {'live':>18} {'broadcast':>10} "
+          f"{'sent to each dashboard':>28}  delivered, summary matches")
+    for dashboards in counts:
+        result = run_session(args, dashboards)
+        reads = [f"{reads.calls / minutes:>8,.0f} {reads.returned / minutes / 1024:>7,.1f}Ki"
+                 for reads, minutes in ((result['polling'], args.minutes), (result['snapshots'], 1),
+                                        (result['live'], args.minutes))]
+        print(f"{dashboards:>10,} {' '.join(reads)} {result['seconds'] / max(1, result['broadcasts']) * 1000:>8.1f}ms "
+              f"{result['messages'] / args.minutes:>6,.0f} msgs {result['pushed'] / args.minutes / 1024:>7,.1f}Ki "
+              f"{result['pushed'] / max(1, result['messages']):>5,.0f}B/msg  {result['delivered']}, {result['agree']}")
+    print("Reads are calls and bytes; broadcast is the time to send one change event to every dashboard, and "
+          "what each dashboard is sent is per minute")
+
+if __name__ == '__main__':
+    main()
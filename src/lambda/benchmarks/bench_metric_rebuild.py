@@ -0,0 +1,133 @@
+"""Order archive and metric rebuild (tools.rebuild_metrics) over the local AWS stand-in.
+
+First a repair check. The transactions go through TransactionPipeline with the
+order archive in a local directory, and business_logic aggregates their
+events. A few daily buckets are then double counted, as a lost ledger claim
+would, and the rebuild must restore the buckets business_logic produced.
+
+Then a scale run. --days of --orders-per-day synthetic orders are archived in
+SQS-batch sized files, compacted, and rebuilt with --processes workers.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_metric_rebuild --days 365 --orders-per-day 2000 --processes 8
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from benchmarks.bench_event_batching import sqs_event_batches
+from benchmarks.bench_order_log_aggregation import eventbridge_event, final_state
+from benchmarks.bench_transaction_pipeline import SQS_BATCH_SIZE, sqs_batches, synthetic_transactions
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.order_archive import DirectoryStore, OrderArchive
+from tools.rebuild_metrics import compact, rebuild, select_dates
+
+BUSINESS_LOGIC_EVENTS = {'order_processed', 'customer_analyzed', 'inventory_updated', 'inventory_alert'}
+PRODUCTS = [
+    ('p1001', 'T-Shirt', '19.99', 'clothing'), ('p1002', 'Jeans', '49.99', 'clothing'),
+    ('p1003', 'Sneakers', '79.99', 'footwear'), ('p1004', 'Backpack', '39.99', 'accessories'),
+    ('p1005', 'Hat', '14.99', 'accessories'), ('p1006', 'Watch', '99.99', 'accessories'),
+    ('p1007', 'Socks', '9.99', 'clothing'), ('p1008', 'Headphones', '29.99', 'electronics')
+]
+
+def repair_check(args, root):
+    aws = LocalAws()
+    aws.install()
+    pipeline = load_handler('transaction_pipeline')
+    pipeline.stages[0].archive = OrderArchive(DirectoryStore(root))
+    business_logic = load_handler('business_logic')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in sqs_batches(synthetic_transactions(args.transactions, args.customers, args.seed)):
+            pipeline.lambda_handler(event, LocalContext('transaction_pipeline'))
+        events = [eventbridge_event(entry) for entry in aws.events.entries
+                  if entry['DetailType'] in BUSINESS_LOGIC_EVENTS]
+        for batch in sqs_event_batches(events, SQS_BATCH_SIZE):
+            business_logic.lambda_handler(batch, LocalContext('business_logic'))
+        business_logic.flush_sketches()
+    expected = final_state(aws)
+
+    # Count some orders of each day a second time
+    rng = random.Random(args.seed)
+    for date in expected[0]:
+        business_logic.add_to_bucket('date', date, str(uuid.uuid4()), Decimal('123.45'), rng.randint(1, 9),
+                                     rng.randint(1, 9), {'clothing'})
+    corrupted = final_state(aws) != expected
+
+    archive = OrderArchive(DirectoryStore(root))
+    with contextlib.redirect_stdout(io.StringIO()):
+        rebuild(root, select_dates(archive, None, '9999-12-31'), args.processes, aws.dynamodb)
+    print(f"repair: {len(expected[0])} days, corrupted {corrupted}, "
+          f"restored {final_state(aws) == expected}")
+
+def synthetic_order(rng, moment):
+    lines = []
+    for product_id, name, price, category in rng.sample(PRODUCTS, rng.randint(1, 5)):
+        lines.append({'product_id': product_id, 'product_name': name, 'category': category,
+                      'price': Decimal(price), 'quantity': rng.randint(1, 3)})
+    return {
+        'transaction_id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'timestamp': moment.isoformat(),
+        'customer_id': f"cust_{rng.randint(0, 99999)}",
+        'items': lines,
+        'total_amount': sum(line['price'] * line['quantity'] for line in lines),
+        'payment_method': rng.choice(['credit_card', 'paypal', 'apple_pay']),
+        'status': 'processed',
+        'shipping_state': rng.choice(['CA', 'NY', 'TX', 'WA', 'FL'])
+    }
+
+def scale_run(args, root):
+    rng = random.Random(args.seed)
+    archive = OrderArchive(DirectoryStore(root))
+    start = time.perf_counter()
+    first = datetime(2024, 1, 1)
+    for day in range(args.days):
+        orders = [synthetic_order(rng, first + timedelta(days=day, seconds=rng.randrange(86400)))
+                  for _ in range(args.orders_per_day)]
+        for offset in range(0, len(orders), SQS_BATCH_SIZE):
+            archive.append(orders[offset:offset + SQS_BATCH_SIZE])
+    files = len(archive.store.keys(''))
+    size = sum(os.path.getsize(os.path.join(root, key)) for key in archive.store.keys(''))
+    print(f"archive: {args.days * args.orders_per_day:,} orders in {files:,} files, "
+          f"{size / 2 ** 20:.1f} MiB, written in {time.perf_counter() - start:.1f}s")
+
+    dates = select_dates(archive, None, '9999-12-31')
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        compact(root, dates, args.processes)
+    print(f"compact: {files:,} files into {len(archive.store.keys('')):,} in {time.perf_counter() - start:.1f}s")
+
+    aws = LocalAws()
+    aws.install()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        days = rebuild(root, dates, args.processes, aws.dynamodb)
+    orders = sum(day['totals']['orders'] for day in days.values())
+    print(f"rebuild: {orders:,} orders over {len(days)} days in {time.perf_counter() - start:.1f}s "
+          f"with {args.processes} processes; {sum(aws.calls.values()):,} AWS calls")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000, help="for the repair check")
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--orders-per-day', type=int, default=2000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    # mock_data_generator creates an SNS client when imported
+    LocalAws().install()
+    with tempfile.TemporaryDirectory() as root:
+        repair_check(args, root)
+    with tempfile.TemporaryDirectory() as root:
+        scale_run(args, root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Per-event versus OrderLog stream aggregation in business_logic, over the local AWS stand-in.
+
+Both modes run the transactions through TransactionPipeline. In events mode,
+business_logic is then invoked once per order_processed, customer_analyzed
+and inventory event, as the EventBridge rules deliver them. In stream mode,
+the pipeline also appends to OrderLog, and business_logic is invoked with the
+table's stream records in batches of --stream-batch-size (plus once per
+inventory_alert, which still arrives as an event). Reports the aggregation's
+invocations and AWS calls, and checks that both modes leave the same daily
+SalesMetrics buckets and CustomerInsights cohorts behind.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_order_log_aggregation --transactions 5000 --latency-ms 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+import uuid
+from benchmarks.bench_transaction_pipeline import sqs_batches, synthetic_transactions
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.order_log import ORDER_LOG_TABLE
+from common.rollups import fan_in_shards
+
+EVENT_RULES = {
+    'events': {'order_processed', 'customer_analyzed', 'inventory_updated', 'inventory_alert'},
+    'stream': {'inventory_alert'}
+}
+
+def eventbridge_event(entry):
+    """A PutEvents entry as a rule target receives it"""
+    return {
+        'id': str(uuid.uuid4()),
+        'source': entry['Source'],
+        'detail-type': entry['DetailType'],
+        'detail': json.loads(entry['Detail'])
+    }
+
+def run_mode(mode, transactions, args):
+    os.environ['AGGREGATION_MODE'] = mode
+    aws = LocalAws(latency_ms=args.latency_ms, streams=[ORDER_LOG_TABLE])
+    aws.install()
+    pipeline = load_handler('transaction_pipeline')
+    business_logic = load_handler('business_logic')
+    context = LocalContext('business_logic')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in sqs_batches(transactions):
+            pipeline.lambda_handler(event, LocalContext('transaction_pipeline'))
+
+        aws.calls.clear()  # count the aggregation only
+        events = batches = 0
+        start = time.perf_counter()
+        for entry in aws.events.entries:
+            if entry['DetailType'] in EVENT_RULES[mode]:
+                business_logic.lambda_handler(eventbridge_event(entry), context)
+                events += 1
+        stream = aws.dynamodb.Table(ORDER_LOG_TABLE).stream
+        for offset in range(0, len(stream), args.stream_batch_size):
+            business_logic.lambda_handler({'Records': stream[offset:offset + args.stream_batch_size]}, context)
+            batches += 1
+        business_logic.flush_sketches()
+        seconds = time.perf_counter() - start
+
+    writes = sum(count for operation, count in aws.calls.items()
+                 if operation.split('.')[-1] in ('PutItem', 'UpdateItem', 'DeleteItem'))
+    print(f"{mode:<8} {events:>8,} {batches:>8,} {sum(aws.calls.values()):>10,} {writes:>8,} {seconds:>8.2f}s")
+    for operation, count in sorted(aws.calls.items()):
+        print(f"    {operation:<26} {count:>9,}")
+    return aws
+
+def final_state(aws):
+    sales = aws.dynamodb.Table('SalesMetrics')
+    buckets = [item for key, item in sales.items.items()
+               if key.startswith('date#') and 'shard_of' not in item]
+    fan_in_shards(aws.dynamodb, 'SalesMetrics', buckets)
+    cohorts = [item for key, item in aws.dynamodb.Table('CustomerInsights').items.items()
+               if key.startswith('cohort#')]
+    return (
+        {item['time_value']: (item['total_sales'], item['item_count'], item['transaction_count'],
+                              sorted(item.get('categories', [])))
+         for item in buckets},
+        {item['cohort']: (item['customer_count'], item['total_revenue'], item['new_customers'],
+                          item['repeat_customers'])
+         for item in cohorts}
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--stream-batch-size', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=1.0, help="simulated round trip per AWS call")
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    # mock_data_generator creates an SNS client when imported
+    LocalAws().install()
+    transactions = synthetic_transactions(args.transactions, args.customers, args.seed)
+    print(f"{args.transactions:,} transactions, {args.customers:,} customers, "
+          f"{args.latency_ms}ms per AWS call")
+    print(f"{'mode':<8} {'events':>8} {'batches':>8} {'AWS calls':>10} {'writes':>8} {'time':>9}")
+
+    events = run_mode('events', transactions, args)
+    stream = run_mode('stream', transactions, args)
+    print(f"final state identical: {final_state(events) == final_state(stream)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Dashboard API payload bytes and latency by content coding and series shape, on the local AWS stand-in.
+
+Builds --days of daily sales buckets carrying the categories list the order
+path appends to (one entry per category an order touches, for
+--orders-per-day orders) and --products products over 8 categories. Then makes each request with no Accept-Encoding, with gzip and
+with br (when the brotli package is installed), and the sales series both as
+rows and as columns (format=columnar).
+
+For each it reports the bytes on the wire, the bytes the function returns to
+API Gateway (base64 for a compressed body), the time to route the request
+and to encode its response, and an end-to-end estimate: the function's time
+plus the body's transfer over a --bandwidth-mbps link. It checks that every
+compressed body decodes to the uncompressed one and that the columns hold
+the rows' values.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_response_encoding --days 90 --orders-per-day 2000 --products 5000
+"""
+import argparse
+import base64
+import contextlib
+import gzip
+import io
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from benchmarks.local_aws import LocalAws, load_handler
+from common import wire_format
+from common.rollups import date_value, metric_key
+
+CATEGORIES = ['clothing', 'footwear', 'accessories', 'electronics', 'home', 'beauty', 'sports', 'toys']
+DECODERS = {'gzip': gzip.decompress}
+if wire_format.brotli is not None:
+    DECODERS['br'] = wire_format.brotli.decompress
+
+def build_sales(aws, args, today):
+    rng = random.Random(args.seed)
+    with aws.dynamodb.Table('SalesMetrics').batch_writer() as batch:
+        for offset in range(args.days):
+            day = today - timedelta(days=offset)
+            categories = []
+            for _ in range(args.orders_per_day):
+                categories.extend(rng.sample(CATEGORIES, rng.randint(1, 3)))
+            orders = args.orders_per_day
+            batch.put_item(Item={
+                'metric_key': metric_key('date', date_value(day)), 'time_unit': 'date', 'time_value': date_value(day),
+                'total_sales': Decimal(rng.randint(orders * 10, orders * 400)) + Decimal('0.25'),
+                'transaction_count': orders, 'item_count': orders * 3, 'categories': categories,
+                'created_at': day.isoformat(), 'last_updated': day.isoformat()
+            })
+
+def build_inventory(aws, args):
+    rng = random.Random(args.seed)
+    with aws.dynamodb.Table('InventoryStatus').batch_writer() as batch:
+        for n in range(args.products):
+            stock = rng.randint(0, 500)
+            batch.put_item(Item={
+                'product_id': f"p{n:06d}", 'product_name': f"Product {n}", 'category': rng.choice(CATEGORIES),
+                'stock_level': stock, 'initial_stock': 500, 'units_sold_total': 500 - stock,
+                'inventory_status': 'low' if stock < 10 else 'normal', 'last_updated': '2024-01-01T00:00:00'
+            })
+
+def decoded(response):
+    """A response's body as text, undoing its content coding"""
+    if not response.get('isBase64Encoded'):
+        return response['body']
+    return DECODERS[response['headers']['Content-Encoding']](base64.b64decode(response['body'])).decode('utf-8')
+
+def median_seconds(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times)
+
+def rows_match(columns, rows):
+    """The columnar series holds the same values as the rows"""
+    return columns == wire_format.columnar(rows) and all(
+        {field: values[n] for field, values in columns.items() if values[n] is not None} == row
+        for n, row in enumerate(rows))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--orders-per-day', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--bandwidth-mbps', type=float, default=10.0, help="client link for the end-to-end estimate")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    aws = LocalAws()
+    aws.install()
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_sales(aws, args, today)
+        build_inventory(aws, args)
+    dashboard = load_handler('dashboard_api')
+    codings = [None] + [coding for coding in wire_format.PREFERENCE if coding in wire_format.ENCODERS]
+    if wire_format.brotli is None:
+        print("brotli is not installed: br is not offered, so only gzip is compared")
+
+    requests = [
+        ('/api', {}),
+        ('/api/sales', {'timeUnit': 'day', 'period': 'last30'}),
+        ('/api/sales', {'timeUnit': 'day', 'period': 'last30', 'format': 'columnar'}),
+        ('/api/sales', {'timeUnit': 'day', 'period': 'last30', 'fields': 'time_value,total_sales,transaction_count'}),
+        ('/api/sales', {'timeUnit': 'day', 'period': 'last30', 'fields': 'time_value,total_sales,transaction_count',
+                        'format': 'columnar'}),
+        ('/api/inventory', {'category': CATEGORIES[0], 'limit': '500'})
+    ]
+    bytes_per_second = args.bandwidth_mbps * 1e6 / 8
+    print(f"    {'Accept-Encoding':<16} {'wire':>10} {'returned':>10} {'route':>8} {'encode':>8} "
+          f"{'end-to-end':>11}  same")
+    rows = {}
+    for path, params in requests:
+        print(path + ('?' + '&'.join(f"{key}={value}" for key, value in params.items()) if params else ''))
+        event = {'httpMethod': 'GET', 'path': path, 'queryStringParameters': params}
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain, route_seconds = median_seconds(lambda: dashboard.route_request(event), args.repeat)
+        assert plain['statusCode'] == 200, plain['body']
+        # Compare each columnar series with the same request as rows
+        same_shape = ''
+        if path == '/api/sales':
+            data = json.loads(plain['body'])['data']
+            key = (params['timeUnit'], params['period'], params.get('fields'))
+            if params.get('format') == 'columnar':
+                same_shape = f", columns match rows: {rows_match(data, rows[key])}"
+            else:
+                rows[key] = data
+        for coding in codings:
+            headers = {'Accept-Encoding': coding} if coding else {}
+            response, encode_seconds = median_seconds(
+                lambda: wire_format.encode_response(plain, headers), args.repeat)
+            wire = len(base64.b64decode(response['body'])) if response.get('isBase64Encoded') else \
+                len(response['body'].encode('utf-8'))
+            returned = len(response['body'])
+            end_to_end = route_seconds + encode_seconds + wire / bytes_per_second
+            same = decoded(response) == plain['body']
+            print(f"    {coding or 'none':<16} {wire / 1024:>8.1f}Ki {returned / 1024:>8.1f}Ki "
+                  f"{route_seconds * 1000:>6.1f}ms {encode_seconds * 1000:>6.1f}ms {end_to_end * 1000:>9.1f}ms  "
+                  f"{same}{same_shape}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Load test of sharded daily SalesMetrics counters against a throttling local stand-in.
+
+Concurrent writers push orders for one day through business_logic's
+update_time_based_metrics while the stand-in caps every item key at
+--partition-limit writes per second, like a DynamoDB partition. Throttled
+writes back off and retry, as the SDK would. Runs once per fixed shard count
+and once adaptively (starting from one shard), then checks that fanning in
+the shards accounts for every committed order.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_sharded_counters --seconds 3 --partition-limit 100
+"""
+import argparse
+import contextlib
+import io
+import random
+import threading
+import time
+import uuid
+from benchmarks.local_aws import LocalAws, load_handler
+from common.rollups import fan_in_shards, metric_key
+from common.sharded_counters import ShardedCounters, is_throttle
+
+DAY = '2024-11-29'
+MAX_ATTEMPTS = 8
+
+def order(rng):
+    quantity = rng.randint(1, 3)
+    return {
+        'transaction_id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'customer_id': f"cust_{rng.randint(0, 9999)}",
+        'items': [{'product_id': 'p1001', 'category': 'clothing', 'quantity': quantity}]
+    }
+
+def writer(module, deadline, seed, stats, lock):
+    rng = random.Random(seed)
+    committed = throttled = dropped = 0
+    while time.monotonic() < deadline:
+        detail = order(rng)
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                module.update_time_based_metrics(module.SALES_METRICS_TABLE, 'date', DAY, 19.99, detail)
+                committed += 1
+                break
+            except Exception as e:
+                if not is_throttle(e):
+                    raise e
+                throttled += 1
+                # Exponential backoff with full jitter
+                time.sleep(rng.uniform(0, 0.005 * 2 ** attempt))
+        else:
+            dropped += 1
+    with lock:
+        stats['committed'] += committed
+        stats['throttled'] += throttled
+        stats['dropped'] += dropped
+
+def run(label, shards, max_shards, args):
+    aws = LocalAws(latency_ms=args.latency_ms, partition_write_limit=args.partition_limit)
+    aws.install()
+    module = load_handler('business_logic')
+    module.counters = ShardedCounters(aws.dynamodb.Table(module.SALES_METRICS_TABLE), default_shards=shards,
+                                      max_shards=max_shards, ttl_seconds=1)
+
+    stats = {'committed': 0, 'throttled': 0, 'dropped': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [
+        threading.Thread(target=writer, args=(module, deadline, args.seed + n, stats, lock))
+        for n in range(args.writers)
+    ]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    seconds = time.perf_counter() - start
+
+    bucket = aws.dynamodb.Table(module.SALES_METRICS_TABLE).items[metric_key('date', DAY)]
+    fan_in_shards(aws.dynamodb, module.SALES_METRICS_TABLE, [bucket])
+    print(f"{label:<12} {int(bucket['shard_count']):>6} {stats['committed'] / seconds:>12,.0f} "
+          f"{stats['throttled']:>10,} {stats['dropped']:>8,} "
+          f"{'ok' if int(bucket['transaction_count']) == stats['committed'] else 'MISMATCH':>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--partition-limit', type=int, default=100, help="writes per second per item key")
+    parser.add_argument('--latency-ms', type=float, default=2.0, help="simulated round trip per AWS call")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.partition_limit} writes/s per key, {args.seconds}s per run")
+    print(f"{'mode':<12} {'shards':>6} {'orders/s':>12} {'throttled':>10} {'dropped':>8} {'fan-in':>8}")
+    for shards in args.shards:
+        run("fixed", shards, shards, args)
+    run("adaptive", 1, max(args.shards) * 2, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Full-table scans through common.table_scan versus one Scan call, on the local AWS stand-in.
+
+Fills InventoryStatus with --products products (a few of them pooled, plus
+the counters item) and SalesMetrics with --days of daily buckets and their
+month rollups. The stand-in stops every Scan page after 1 MB, as DynamoDB
+does, and --latency-ms stands in for each call's round trip (a 1 MB Scan
+page takes on the order of 100 ms). The stand-in serves calls one at a time,
+so only those round trips overlap across segments and its own processing
+time does not shrink: the parallel speed-up shown is a lower bound.
+
+Compares a single Scan call, which is what the dashboard and reports used to
+make, with scan_items over 1 to 16 parallel segments, and with a projection;
+checks that the inventory report and the notifications see every product;
+and compares the sales endpoints' key lookups with scanning SalesMetrics.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_table_scan --products 200000 --latency-ms 100
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from benchmarks.local_aws import LocalAws, item_size, load_handler
+from common.inventory_pool import PRODUCTS_FILTER, convert_to_pool, save_status_counts
+from common.rollups import date_value, metric_key, month_value
+from common.table_scan import ScanStats, scan_items
+
+SEGMENT_COUNTS = (1, 2, 4, 8, 16)
+
+def build_inventory(aws, args):
+    """Product items as the order path leaves them; returns product id -> status"""
+    rng = random.Random(args.seed)
+    table = aws.dynamodb.Table('InventoryStatus')
+    statuses = {}
+    counts = {}
+    with table.batch_writer() as batch:
+        for n in range(args.products):
+            product_id = f"p{n:07d}"
+            category = f"category-{rng.randrange(args.categories):03d}"
+            stock = rng.randint(0, 9) if rng.random() < args.low_share else rng.randint(10, 500)
+            status = 'low' if stock < 10 else 'normal'
+            statuses[product_id] = status
+            category_counts = counts.setdefault(category, {})
+            category_counts[status] = category_counts.get(status, 0) + 1
+            batch.put_item(Item={
+                'product_id': product_id,
+                'product_name': f"Product {n}",
+                'category': category,
+                'stock_level': stock,
+                'initial_stock': 500,
+                'units_sold_total': 500 - stock,
+                'inventory_status': status,
+                'last_updated': (datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(10 ** 7))).isoformat()
+            })
+    for product_id in list(statuses)[:args.hot_products]:
+        convert_to_pool(table, product_id)
+    save_status_counts(table, counts)
+    return statuses
+
+def build_sales(aws, args, today):
+    """Daily buckets for the last --days days and their month rollups"""
+    table = aws.dynamodb.Table('SalesMetrics')
+    rng = random.Random(args.seed)
+    months = {}
+    with table.batch_writer() as batch:
+        for offset in range(args.days):
+            day = today - timedelta(days=offset)
+            sales = Decimal(rng.randint(1000, 100000))
+            orders = rng.randint(10, 1000)
+            batch.put_item(Item={
+                'metric_key': metric_key('date', date_value(day)), 'time_unit': 'date',
+                'time_value': date_value(day), 'total_sales': sales, 'transaction_count': orders,
+                'item_count': orders * 2
+            })
+            month = months.setdefault(month_value(day), [0, 0])
+            month[0] += sales
+            month[1] += orders
+        for value, (sales, orders) in months.items():
+            batch.put_item(Item={
+                'metric_key': metric_key('month', value), 'time_unit': 'month', 'time_value': value,
+                'total_sales': sales, 'transaction_count': orders, 'item_count': orders * 2
+            })
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def body(response):
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--categories', type=int, default=40)
+    parser.add_argument('--low-share', type=float, default=0.05, help="share of products with low stock")
+    parser.add_argument('--hot-products', type=int, default=5)
+    parser.add_argument('--days', type=int, default=1095, help="days of daily sales buckets")
+    parser.add_argument('--latency-ms', type=float, default=100.0, help="simulated round trip per call")
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    aws = LocalAws()
+    aws.install()
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        statuses = build_inventory(aws, args)
+        build_sales(aws, args, today)
+    inventory = aws.dynamodb.Table('InventoryStatus')
+    table_bytes = sum(item_size(item) for item in inventory.items.values())
+    low = sorted(product_id for product_id, status in statuses.items() if status == 'low')
+    print(f"InventoryStatus: {len(statuses):,} products ({len(low):,} low), {len(inventory.items):,} items, "
+          f"{table_bytes / 2 ** 20:.1f} MiB; built in {time.perf_counter() - start:.0f}s")
+    aws.latency = args.latency_ms / 1000.0
+
+    # What the dashboard and reports did: one Scan call, its first 1 MB page
+    response, seconds = timed(inventory.scan, FilterExpression=PRODUCTS_FILTER)
+    print(f"one Scan call:      {response['Count']:,} of {len(statuses):,} products, {seconds:.2f}s")
+
+    print(f"{'segments':>8} {'pages':>6} {'scanned':>9} {'returned':>9} {'RCU':>8} {'seconds':>8}  complete")
+    expected = sorted(statuses)
+    for segments in SEGMENT_COUNTS:
+        stats = ScanStats()
+        items, seconds = timed(lambda: list(scan_items(inventory, segments=segments, stats=stats,
+                                                       FilterExpression=PRODUCTS_FILTER)))
+        complete = sorted(item['product_id'] for item in items) == expected
+        print(f"{segments:>8} {stats.pages:>6} {stats.scanned:>9,} {stats.returned:>9,} {stats.capacity_units:>8,.0f} "
+              f"{seconds:>8.2f}  {complete}")
+    full_bytes = sum(item_size(item) for item in items)
+
+    stats = ScanStats()
+    items, seconds = timed(lambda: list(scan_items(inventory, segments=SEGMENT_COUNTS[-1], stats=stats,
+                                                   FilterExpression=PRODUCTS_FILTER,
+                                                   ProjectionExpression='product_id, category, inventory_status')))
+    projected_bytes = sum(item_size(item) for item in items)
+    print(f"projected to 3 attributes: {projected_bytes / 2 ** 20:.1f} MiB returned instead of "
+          f"{full_bytes / 2 ** 20:.1f} MiB, {stats.capacity_units:,.0f} RCU (capacity counts whole items), "
+          f"{seconds:.2f}s")
+
+    # The handlers that scan
+    reports = load_handler('report_generator')
+    dashboard = load_handler('dashboard_api')
+    with contextlib.redirect_stdout(io.StringIO()):
+        report, report_seconds = timed(reports.generate_inventory_report)
+        notifications, notification_seconds = timed(dashboard.get_notifications, limit=len(statuses))
+    notified = sorted(notification['id'][len('alert_'):] for notification in body(notifications)['notifications'])
+    summary = report['summary']
+    complete = summary['totalProducts'] == len(statuses) and summary['lowStockProducts'] == len(low)
+    print(f"inventory report:   {summary['totalProducts']:,} products, {summary['lowStockProducts']:,} low, "
+          f"{report_seconds:.2f}s; complete: {complete}")
+    print(f"notifications:      {len(notified):,} low stock alerts, {notification_seconds:.2f}s; "
+          f"complete: {notified == low}")
+
+    # Sales buckets are read by key instead of scanned
+    sales = aws.dynamodb.Table('SalesMetrics')
+    sales_bytes = sum(item_size(item) for item in sales.items.values())
+    print(f"SalesMetrics: {len(sales.items):,} items, {sales_bytes / 1024:.0f} KiB; a scan reads all of it")
+    for time_unit, period, days in (('day', 'last7', 7), ('day', 'last30', 30), ('month', 'last12', 365)):
+        first = today - timedelta(days=days)
+        wanted = {date_value(first + timedelta(days=n)) for n in range(days + 1)} if time_unit == 'day' else \
+            {month_value(first + timedelta(days=n)) for n in range(days + 1)}
+        aws.calls.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response, seconds = timed(dashboard.get_sales_metrics, time_unit, period)
+        data = body(response)['data']
+        # The month the period starts in begins before it, so it is left out
+        if time_unit == 'month':
+            wanted = {value for value in wanted if datetime.strptime(value, '%Y-%m') >= first}
+        calls = ', '.join(f"{count} {name.split('.')[1]}" for name, count in sorted(aws.calls.items()))
+        print(f"    /api/sales {time_unit}/{period}: {len(data)} items by {calls}, "
+              f"{sum(item_size(item) for item in data) / 1024:.1f} KiB, {seconds * 1000:.0f}ms; "
+              f"complete: {sorted(item['time_value'] for item in data) == sorted(wanted)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Decode and derive cost of transaction messages: raw dicts versus the typed model.
+
+The dict path is what the order, customer and inventory stages did before
+common.transaction_model: index the decoded JSON directly and recompute item
+counts, category sets and Decimal conversions where each one needs them. The
+model path validates into slotted Transaction/LineItem/Address objects once
+and reads memoized derived values. Reports time per 10k messages and the
+memory held by 10k decoded messages.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_transaction_model --messages 100000
+"""
+import argparse
+import time
+import tracemalloc
+from decimal import Decimal
+from benchmarks.bench_transaction_pipeline import sqs_batches, synthetic_transactions
+from benchmarks.local_aws import LocalAws
+from common.sqs_batch import sns_message
+from common.transaction_model import transaction_message
+
+PER = 10000
+
+def derive_dict(message):
+    """The values the three stages derived from the raw message"""
+    # order stage
+    item_count = sum(item["quantity"] for item in message["items"])
+    average = message["total_amount"] / item_count
+    state = message["shipping_address"]["state"]
+    # customer stage
+    last_amount = Decimal(str(message["total_amount"]))
+    spent = Decimal(str(message["total_amount"]))
+    average_order = Decimal(str(message["total_amount"]))
+    categories = list(set(item["category"] for item in message["items"]))
+    state = message["shipping_address"]["state"]
+    # inventory stage
+    for item in message["items"]:
+        item["product_id"], item["quantity"], item["product_name"], item.get("category", "unknown")
+    return item_count, average, state, last_amount, spent, average_order, categories
+
+def derive_model(transaction):
+    """The same values read from a validated Transaction"""
+    item_count = transaction.item_count
+    average = transaction.average_item_price
+    state = transaction.shipping_address.state
+    last_amount = transaction.total_amount
+    spent = transaction.total_amount
+    average_order = transaction.total_amount
+    categories = list(transaction.categories)
+    state = transaction.shipping_address.state
+    for item in transaction.items:
+        item.product_id, item.quantity, item.product_name, item.category
+    return item_count, average, state, last_amount, spent, average_order, categories
+
+def timed(label, records, func):
+    start = time.perf_counter()
+    for record in records:
+        func(record)
+    seconds = time.perf_counter() - start
+    print(f"{label:<34} {seconds / len(records) * PER * 1000:>8.1f}ms per 10k "
+          f"{len(records) / seconds:>12,.0f} msg/s")
+
+def retained(records, decode):
+    tracemalloc.start()
+    decoded = [decode(record) for record in records]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del decoded
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    # mock_data_generator creates an SNS client when imported
+    LocalAws().install()
+    transactions = synthetic_transactions(args.messages, 10000, args.seed)
+    records = [record for event in sqs_batches(transactions) for record in event['Records']]
+    print(f"{len(records):,} messages, "
+          f"{sum(len(t['items']) for t in transactions) / len(transactions):.1f} items per transaction")
+
+    timed("decode only, dict", records, sns_message)
+    timed("decode + validate, model", records, transaction_message)
+    timed("decode + derive, dict", records, lambda record: derive_dict(sns_message(record)))
+    timed("decode + derive, model", records, lambda record: derive_model(transaction_message(record)))
+
+    sample = records[:PER]
+    print(f"{'retained by 10k decoded, dict':<34} {retained(sample, sns_message) / 2**20:>8.1f}MiB")
+    print(f"{'retained by 10k decoded, model':<34} {retained(sample, transaction_message) / 2**20:>8.1f}MiB")
+
+    # Both paths must agree on what they derive (the dict path divides floats)
+    def comparable(values):
+        item_count, average, state, last_amount, spent, average_order, categories = values
+        return item_count, round(float(average), 6), state, last_amount, spent, average_order, sorted(categories)
+
+    mismatches = sum(
+        1 for record in sample
+        if comparable(derive_dict(sns_message(record))) != comparable(derive_model(transaction_message(record)))
+    )
+    print(f"derived value mismatches: {mismatches}")
+
+if __name__ == '__main__':
+    main()
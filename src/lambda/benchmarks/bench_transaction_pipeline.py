@@ -0,0 +1,118 @@
+"""Split versus unified transaction consumers over the local AWS stand-in.
+
+Split mode is the SNS fan-out to OrderProcessor, CustomerAnalytics and
+InventoryTracker, each decoding every transaction from its own queue and
+publishing its own events. Unified mode is TransactionPipeline, which decodes
+each transaction once and runs the three stages with one PutEvents flush.
+Reports wall time, AWS calls per operation, and checks that both modes leave
+the same customer and inventory state behind.
+
+Usage (from src/lambda):
+    python -m benchmarks.bench_transaction_pipeline --transactions 5000 --latency-ms 1
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from benchmarks.local_aws import LocalAws, LocalContext, load_handler
+from common.inventory_pool import COUNTS_KEY
+
+SPLIT_FUNCTIONS = ['order_processor', 'customer_analytics', 'inventory_tracker']
+UNIFIED_FUNCTIONS = ['transaction_pipeline']
+SQS_BATCH_SIZE = 100
+
+def synthetic_transactions(count, customers, seed):
+    """Transactions shaped like mock_data_generator's, from a fixed seed"""
+    import mock_data_generator
+
+    random.seed(seed)
+    start = datetime(2024, 1, 1)
+    transactions = []
+    for n in range(count):
+        items = mock_data_generator.generate_items()
+        transactions.append({
+            "transaction_id": str(uuid.UUID(int=random.getrandbits(128))),
+            "timestamp": (start + timedelta(minutes=n)).isoformat(),
+            "customer_id": f"cust_{random.randint(0, customers - 1)}",
+            "items": items,
+            "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "payment_method": random.choice(["credit_card", "paypal", "apple_pay"]),
+            "shipping_address": mock_data_generator.generate_address()
+        })
+    return transactions
+
+def sqs_batches(transactions):
+    """SQS events carrying the SNS notifications, as delivered by the event source mapping"""
+    for start in range(0, len(transactions), SQS_BATCH_SIZE):
+        yield {
+            'Records': [
+                {
+                    'messageId': transaction['transaction_id'],
+                    'body': json.dumps({'Type': 'Notification', 'Message': json.dumps(transaction)}),
+                    'attributes': {'ApproximateReceiveCount': '1'}
+                }
+                for transaction in transactions[start:start + SQS_BATCH_SIZE]
+            ]
+        }
+
+def run_mode(label, functions, transactions, latency_ms):
+    aws = LocalAws(latency_ms=latency_ms)
+    aws.install()
+    handlers = [(name, load_handler(name)) for name in functions]
+    aws.calls.clear()  # ignore anything done at import time
+
+    failures = 0
+    invocations = 0
+    start = time.perf_counter()
+    # Handler logging is part of the work, but not worth printing
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, module in handlers:
+            context = LocalContext(name)
+            for event in sqs_batches(transactions):
+                invocations += 1
+                failures += len(module.lambda_handler(event, context)['batchItemFailures'])
+    seconds = time.perf_counter() - start
+
+    total_calls = sum(aws.calls.values())
+    print(f"{label:<10} {seconds:>8.2f}s {len(transactions) / seconds:>10,.0f} tx/s "
+          f"{total_calls:>9,} AWS calls {total_calls / len(transactions):>6.2f}/tx  failures {failures}")
+    # Each consumer parses the SQS body and then the SNS message in it
+    print(f"    {'lambda invocations':<26} {invocations:>9,}")
+    print(f"    {'json decodes':<26} {2 * len(functions) * len(transactions):>9,}")
+    for operation, count in sorted(aws.calls.items()):
+        print(f"    {operation:<26} {count:>9,}")
+    return aws
+
+def final_state(aws):
+    customers = aws.dynamodb.Table('CustomerProfiles').items
+    inventory = aws.dynamodb.Table('InventoryStatus').items
+    return (
+        {key: (item['total_purchases'], item['total_spent']) for key, item in customers.items()},
+        {key: (item['stock_level'], item['units_sold_total']) for key, item in inventory.items() if key != COUNTS_KEY},
+        sorted(entry['DetailType'] for entry in aws.events.entries)
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=1.0, help="simulated round trip per AWS call")
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    # mock_data_generator creates an SNS client when imported
+    LocalAws().install()
+    transactions = synthetic_transactions(args.transactions, args.customers, args.seed)
+    print(f"{args.transactions:,} transactions, {args.customers:,} customers, "
+          f"{args.latency_ms}ms per AWS call")
+
+    split = run_mode("split", SPLIT_FUNCTIONS, transactions, args.latency_ms)
+    unified = run_mode("unified", UNIFIED_FUNCTIONS, transactions, args.latency_ms)
+    print(f"final state identical: {final_state(split) == final_state(unified)}")
+
+if __name__ == '__main__':
+    main()
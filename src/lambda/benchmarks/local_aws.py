@@ -0,0 +1,880 @@
+"""In-memory stand-ins for the AWS APIs the Lambda functions call, for local benchmarks.
+
+Covers the DynamoDB table operations and expression syntax used in this repo
+(conditions, SET/ADD/REMOVE updates, parallel scans, index queries, batch writes,
+TransactWriteItems and Scan through the resource's meta.client, optional streams),
+EventBridge PutEvents, SQS SendMessage, the S3 object calls and API Gateway
+PostToConnection. Items round-trip through the DynamoDB type serializer, so
+floats are rejected and numbers come back as Decimal, as with the real service.
+Scan and Query pages stop after 1 MB of items read and report the read
+capacity consumed when asked. Every call is counted per operation, and an
+optional per-call latency approximates network round trips.
+
+    aws = LocalAws(latency_ms=2)
+    aws.install()                       # boto3.client/resource now return stand-ins
+    handler = load_handler('order_processor')
+"""
+import bisect
+import functools
+import importlib.util
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+import zlib
+from collections import Counter
+from copy import deepcopy
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+LAMBDA_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (hash key, range key) of the tables in src/terraform/dynamodb.tf
+TABLE_KEYS = {
+    'CustomerProfiles': ('customer_id', None),
+    'InventoryStatus': ('product_id', None),
+    'SalesMetrics': ('metric_key', None),
+    'CustomerInsights': ('insight_key', None),
+    'Notifications': ('notification_id', None),
+    'IdempotencyLedger': ('idempotency_key', None),
+    'OrderLog': ('log_key', None),
+    'DashboardConnections': ('connection_id', None)
+}
+
+# Global secondary indexes: table -> index name -> (hash key, range key)
+TABLE_INDEXES = {
+    'InventoryStatus': {'CategoryIndex': ('category', 'product_id')}
+}
+
+# A Scan or Query call stops reading after 1 MB of items
+READ_PAGE_BYTES = 1024 * 1024
+
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+def client_error(code, operation, message='', **extra):
+    response = {'Error': {'Code': code, 'Message': message}}
+    response.update(extra)
+    return ClientError(response, operation)
+
+def round_trip(item):
+    """Copy an item the way DynamoDB would store and return it"""
+    return {name: deserializer.deserialize(serializer.serialize(value)) for name, value in item.items()}
+
+# --- Expressions ---------------------------------------------------------------
+
+TOKEN_PATTERN = re.compile(r"\s*(?:(\d+)|([#:]?[A-Za-z_][\w\-]*)|(<>|<=|>=|=|<|>|\(|\)|,|\.|\+|-|\[|\]))")
+KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'ADD', 'REMOVE', 'DELETE'}
+MISSING = object()
+KEY_EQUALITY_PATTERN = re.compile(r"^\s*(#?[A-Za-z_][\w\-]*)\s*=\s*(:[A-Za-z_][\w\-]*)\s*$")
+
+@functools.lru_cache(maxsize=256)
+def tokenize(expression):
+    """Tokens of an expression; cached, as scans evaluate the same filter on every item"""
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match or match.end() == position:
+            raise client_error('ValidationException', 'Expression', f"Cannot parse: {expression[position:]}")
+        tokens.append(match.group(1) or match.group(2) or match.group(3))
+        position = match.end()
+    return tuple(tokens)
+
+class Parser:
+    def __init__(self, expression, names, values):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if expected is not None and (token is None or token.upper() != expected):
+            raise client_error('ValidationException', 'Expression', f"Expected {expected}, got {token}")
+        self.position += 1
+        return token
+
+    def at_keyword(self, *keywords):
+        token = self.peek()
+        return token is not None and token.upper() in keywords
+
+    def path(self):
+        """Attribute path as a list of map keys and list indexes"""
+        parts = [self.name(self.take())]
+        while self.peek() in ('.', '['):
+            if self.take() == '.':
+                parts.append(self.name(self.take()))
+            else:
+                parts.append(int(self.take()))
+                self.take(']')
+        return parts
+
+    def name(self, token):
+        if token.startswith('#'):
+            return self.names[token]
+        return token
+
+    def value(self, token):
+        if token not in self.values:
+            raise client_error('ValidationException', 'Expression', f"Missing value for {token}")
+        return self.values[token]
+
+def resolve(item, path):
+    current = item
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(current, list) or part >= len(current):
+                return MISSING
+            current = current[part]
+        else:
+            if not isinstance(current, dict) or part not in current:
+                return MISSING
+            current = current[part]
+    return current
+
+def assign(item, path, value):
+    parent = resolve(item, path[:-1]) if len(path) > 1 else item
+    if parent is MISSING or not isinstance(parent, (dict, list)):
+        raise client_error('ValidationException', 'UpdateItem',
+                           'The document path provided in the update expression is invalid for update')
+    if isinstance(parent, list):
+        parent[path[-1]] = value
+    else:
+        parent[path[-1]] = value
+
+def remove(item, path):
+    parent = resolve(item, path[:-1]) if len(path) > 1 else item
+    if isinstance(parent, dict):
+        parent.pop(path[-1], None)
+    elif isinstance(parent, list) and path[-1] < len(parent):
+        parent.pop(path[-1])
+
+def compare(left, op, right):
+    if left is MISSING or right is MISSING:
+        return op == '<>'
+    try:
+        if op == '=':
+            return left == right
+        if op == '<>':
+            return left != right
+        if op == '<':
+            return left < right
+        if op == '<=':
+            return left <= right
+        if op == '>':
+            return left > right
+        return left >= right
+    except TypeError:
+        return False
+
+def evaluate_condition(expression, item, names=None, values=None):
+    """True if the item satisfies a condition or filter expression"""
+    if not expression:
+        return True
+    parser = Parser(expression, names, values)
+    result = condition_or(parser, item)
+    if parser.peek() is not None:
+        raise client_error('ValidationException', 'Expression', f"Unexpected token {parser.peek()}")
+    return result
+
+def condition_or(parser, item):
+    result = condition_and(parser, item)
+    while parser.at_keyword('OR'):
+        parser.take()
+        right = condition_and(parser, item)
+        result = result or right
+    return result
+
+def condition_and(parser, item):
+    result = condition_not(parser, item)
+    while parser.at_keyword('AND'):
+        parser.take()
+        right = condition_not(parser, item)
+        result = result and right
+    return result
+
+def condition_not(parser, item):
+    if parser.at_keyword('NOT'):
+        parser.take()
+        return not condition_not(parser, item)
+    return condition_primary(parser, item)
+
+def condition_primary(parser, item):
+    if parser.peek() == '(':
+        parser.take()
+        result = condition_or(parser, item)
+        parser.take(')')
+        return result
+
+    function = parser.peek()
+    if parser.peek(1) == '(' and function in ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains'):
+        parser.take()
+        parser.take('(')
+        path = parser.path()
+        argument = None
+        if parser.peek() == ',':
+            parser.take()
+            argument = operand(parser, item)
+        parser.take(')')
+        current = resolve(item, path)
+        if function == 'attribute_exists':
+            return current is not MISSING
+        if function == 'attribute_not_exists':
+            return current is MISSING
+        if current is MISSING:
+            return False
+        if function == 'begins_with':
+            return isinstance(current, str) and current.startswith(argument)
+        return argument in current
+
+    left = operand(parser, item)
+    if parser.at_keyword('BETWEEN'):
+        parser.take()
+        low = operand(parser, item)
+        parser.take('AND')
+        high = operand(parser, item)
+        return compare(left, '>=', low) and compare(left, '<=', high)
+    if parser.at_keyword('IN'):
+        parser.take()
+        parser.take('(')
+        candidates = [operand(parser, item)]
+        while parser.peek() == ',':
+            parser.take()
+            candidates.append(operand(parser, item))
+        parser.take(')')
+        return left in candidates
+    op = parser.take()
+    right = operand(parser, item)
+    return compare(left, op, right)
+
+def operand(parser, item):
+    token = parser.peek()
+    if token.startswith(':'):
+        return parser.value(parser.take())
+    if token == 'size' and parser.peek(1) == '(':
+        parser.take()
+        parser.take('(')
+        current = resolve(item, parser.path())
+        parser.take(')')
+        return MISSING if current is MISSING else len(current)
+    return resolve(item, parser.path())
+
+def apply_update(expression, item, names=None, values=None):
+    """Apply an update expression to an item in place"""
+    parser = Parser(expression, names, values)
+    while parser.peek() is not None:
+        clause = parser.take().upper()
+        while True:
+            if clause == 'SET':
+                path = parser.path()
+                parser.take('=')
+                assign(item, path, update_value(parser, item))
+            elif clause == 'ADD':
+                path = parser.path()
+                delta = parser.value(parser.take())
+                current = resolve(item, path)
+                if isinstance(delta, set):
+                    assign(item, path, (set() if current is MISSING else set(current)) | delta)
+                else:
+                    assign(item, path, (Decimal(0) if current is MISSING else current) + delta)
+            elif clause == 'REMOVE':
+                remove(item, parser.path())
+            elif clause == 'DELETE':
+                path = parser.path()
+                current = resolve(item, path)
+                if current is not MISSING:
+                    assign(item, path, set(current) - parser.value(parser.take()))
+            else:
+                raise client_error('ValidationException', 'UpdateItem', f"Unknown clause {clause}")
+            if parser.peek() != ',':
+                break
+            parser.take()
+
+def update_value(parser, item):
+    left = update_operand(parser, item)
+    if parser.peek() in ('+', '-'):
+        op = parser.take()
+        right = update_operand(parser, item)
+        return left + right if op == '+' else left - right
+    return left
+
+def update_operand(parser, item):
+    token = parser.peek()
+    if token in ('if_not_exists', 'list_append') and parser.peek(1) == '(':
+        parser.take()
+        parser.take('(')
+        if token == 'if_not_exists':
+            current = resolve(item, parser.path())
+            parser.take(',')
+            fallback = update_value(parser, item)
+            parser.take(')')
+            return fallback if current is MISSING else current
+        first = update_value(parser, item)
+        parser.take(',')
+        second = update_value(parser, item)
+        parser.take(')')
+        return list(first) + list(second)
+    if token.startswith(':'):
+        return parser.value(parser.take())
+    current = resolve(item, parser.path())
+    if current is MISSING:
+        raise client_error('ValidationException', 'UpdateItem',
+                           'The provided expression refers to an attribute that does not exist in the item')
+    return current
+
+def item_size(item):
+    """Approximate DynamoDB item size: the length of the item as JSON, binary values at their length"""
+    binary = []
+
+    def encode(value):
+        if isinstance(value, Binary):
+            binary.append(len(value.value))
+            return ''
+        return str(value)
+    return len(json.dumps(item, default=encode)) + sum(binary)
+
+def read_page(items, limit):
+    """The items one Scan or Query call reads: at most limit, stopping after 1 MB"""
+    page, size = [], 0
+    for item in items:
+        if (limit and len(page) == limit) or size >= READ_PAGE_BYTES:
+            break
+        page.append(item)
+        size += item_size(item)
+    return page, size
+
+def consumed_capacity(table_name, size, kwargs):
+    """ConsumedCapacity of a read of size bytes, if the call asked for it"""
+    if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+        return {}
+    units = math.ceil(size / 4096) * (1.0 if kwargs.get('ConsistentRead') else 0.5)
+    return {'ConsumedCapacity': {'TableName': table_name, 'CapacityUnits': units}}
+
+def project(item, expression, names=None):
+    if not expression:
+        return item
+    names = names or {}
+    projected = {}
+    for part in expression.split(','):
+        top = part.strip().split('.')[0].split('[')[0]
+        top = names.get(top, top)
+        if top in item:
+            projected[top] = item[top]
+    return projected
+
+# --- Services ------------------------------------------------------------------
+
+def operation(service, name):
+    """Count and delay an API call, then run it under the services' lock"""
+    def wrap(method):
+        @functools.wraps(method)
+        def call(self, *args, **kwargs):
+            self.aws.record(service, name)
+            with self.aws.lock:
+                return method(self, *args, **kwargs)
+        return call
+    return wrap
+
+class LocalTable:
+    def __init__(self, aws, name, hash_key, range_key=None):
+        self.aws = aws
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.items = {}
+        self.meta = aws.dynamodb.meta
+        self.stream = []
+        self.version = 0  # bumped on every change
+        self.segments = {}  # (Segment, TotalSegments) -> (version, sorted keys, their strings)
+
+    def _changed(self, key, old, new):
+        """Record a change on the table's stream, if it has one"""
+        self.version += 1
+        if self.name not in self.aws.streams or old == new:
+            return
+        self.aws.sequence += 1
+        image = old if new is None else new
+        change = {
+            'Keys': {name: serializer.serialize(image[name]) for name in (self.hash_key, self.range_key) if name},
+            'SequenceNumber': f"{self.aws.sequence:021d}",
+            'StreamViewType': 'NEW_AND_OLD_IMAGES'
+        }
+        if new is not None:
+            change['NewImage'] = {name: serializer.serialize(value) for name, value in new.items()}
+        if old is not None:
+            change['OldImage'] = {name: serializer.serialize(value) for name, value in old.items()}
+        self.stream.append({
+            'eventID': str(uuid.uuid4()),
+            'eventName': 'INSERT' if old is None else 'REMOVE' if new is None else 'MODIFY',
+            'eventSource': 'aws:dynamodb',
+            'dynamodb': change
+        })
+
+    def _key(self, key):
+        if self.range_key:
+            return (key[self.hash_key], key[self.range_key])
+        return key[self.hash_key]
+
+    def _condition(self, operation, current, kwargs):
+        expression = kwargs.get('ConditionExpression')
+        if expression and not evaluate_condition(expression, current or {}, kwargs.get('ExpressionAttributeNames'),
+                                                 kwargs.get('ExpressionAttributeValues')):
+            extra = {}
+            if current and kwargs.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD':
+                extra['Item'] = {name: serializer.serialize(value) for name, value in current.items()}
+            raise client_error('ConditionalCheckFailedException', operation, 'The conditional request failed', **extra)
+
+    @operation('dynamodb', 'GetItem')
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, ConsistentRead=False):
+        item = self.items.get(self._key(Key))
+        if item is None:
+            return {}
+        return {'Item': deepcopy(project(item, ProjectionExpression, ExpressionAttributeNames))}
+
+    @operation('dynamodb', 'PutItem')
+    def put_item(self, Item, ReturnValues='NONE', **kwargs):
+        key = self._key(Item)
+        self.aws.consume_write(self.name, key, 'PutItem')
+        current = self.items.get(key)
+        self._condition('PutItem', current, kwargs)
+        self.items[key] = round_trip(Item)
+        self._changed(key, current, self.items[key])
+        if ReturnValues == 'ALL_OLD' and current is not None:
+            return {'Attributes': deepcopy(current)}
+        return {}
+
+    @operation('dynamodb', 'UpdateItem')
+    def update_item(self, Key, UpdateExpression, ReturnValues='NONE', **kwargs):
+        key = self._key(Key)
+        self.aws.consume_write(self.name, key, 'UpdateItem')
+        current = self.items.get(key)
+        self._condition('UpdateItem', current, kwargs)
+        updated = deepcopy(current) if current is not None else dict(Key)
+        apply_update(UpdateExpression, updated, kwargs.get('ExpressionAttributeNames'),
+                     kwargs.get('ExpressionAttributeValues'))
+        self.items[key] = round_trip(updated)
+        self._changed(key, current, self.items[key])
+        if ReturnValues in ('ALL_NEW', 'UPDATED_NEW'):
+            return {'Attributes': deepcopy(self.items[key])}
+        if ReturnValues == 'ALL_OLD' and current is not None:
+            return {'Attributes': deepcopy(current)}
+        return {}
+
+    @operation('dynamodb', 'DeleteItem')
+    def delete_item(self, Key, ReturnValues='NONE', **kwargs):
+        key = self._key(Key)
+        self.aws.consume_write(self.name, key, 'DeleteItem')
+        current = self.items.get(key)
+        self._condition('DeleteItem', current, kwargs)
+        self.items.pop(key, None)
+        self._changed(key, current, None)
+        if ReturnValues == 'ALL_OLD' and current is not None:
+            return {'Attributes': current}
+        return {}
+
+    @operation('dynamodb', 'BatchWriteItem')
+    def batch_write(self, items):
+        """Unconditional puts of up to 25 items in one call, as the resource's batch_writer sends them"""
+        for item in items:
+            key = self._key(item)
+            self.aws.consume_write(self.name, key, 'BatchWriteItem')
+            current = self.items.get(key)
+            self.items[key] = round_trip(item)
+            self._changed(key, current, self.items[key])
+
+    def batch_writer(self):
+        return LocalBatchWriter(self)
+
+    @operation('dynamodb', 'Scan')
+    def scan(self, Segment=0, TotalSegments=1, Limit=None, ExclusiveStartKey=None, FilterExpression=None,
+             ProjectionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        """Parallel scan segments are stable hash ranges of the partition key"""
+        cached = self.segments.get((Segment, TotalSegments))
+        if not cached or cached[0] != self.version:
+            keys = sorted(
+                (key for key in self.items
+                 if zlib.crc32(str(key if not self.range_key else key[0]).encode('utf-8')) % TotalSegments == Segment),
+                key=str
+            )
+            cached = self.segments[(Segment, TotalSegments)] = (self.version, keys, [str(key) for key in keys])
+        _, keys, positions = cached
+        if ExclusiveStartKey:
+            keys = keys[bisect.bisect_right(positions, str(self._key(ExclusiveStartKey))):]
+        page, size = read_page((self.items[key] for key in keys), Limit)
+        items = [
+            deepcopy(project(item, ProjectionExpression, ExpressionAttributeNames))
+            for item in page
+            if evaluate_condition(FilterExpression, item, ExpressionAttributeNames, ExpressionAttributeValues)
+        ]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(page)}
+        response.update(consumed_capacity(self.name, size, kwargs))
+        if len(keys) > len(page):
+            response['LastEvaluatedKey'] = {
+                name: page[-1][name] for name in (self.hash_key, self.range_key) if name
+            }
+        return response
+
+    @operation('dynamodb', 'Query')
+    def query(self, KeyConditionExpression, IndexName=None, Limit=None, ExclusiveStartKey=None, ScanIndexForward=True,
+              FilterExpression=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+              ExpressionAttributeValues=None, **kwargs):
+        """Items matching a key condition in range key order, from the table or one of its indexes
+
+        An index only holds the items that have its key attributes. Limit
+        counts the items read, before the filter, as DynamoDB's does.
+        """
+        index_keys = TABLE_INDEXES[self.name][IndexName] if IndexName else (self.hash_key, self.range_key)
+        key_names = list(dict.fromkeys(name for name in index_keys + (self.hash_key, self.range_key) if name))
+
+        def position(item):
+            return tuple(item[name] for name in key_names)
+
+        equality = KEY_EQUALITY_PATTERN.match(KeyConditionExpression)
+        if equality:
+            # The common `hash_key = :value` condition, without parsing it per item
+            name = (ExpressionAttributeNames or {}).get(equality.group(1), equality.group(1))
+            value = ExpressionAttributeValues[equality.group(2)]
+            candidates = (item for item in self.items.values() if item.get(name, MISSING) == value)
+        else:
+            candidates = (item for item in self.items.values()
+                          if evaluate_condition(KeyConditionExpression, item, ExpressionAttributeNames,
+                                                ExpressionAttributeValues))
+        matches = sorted((item for item in candidates if all(name in item for name in index_keys if name)),
+                         key=position, reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = position(ExclusiveStartKey)
+            matches = [item for item in matches
+                       if (position(item) > start if ScanIndexForward else position(item) < start)]
+        page, size = read_page(matches, Limit)
+        items = [
+            deepcopy(project(item, ProjectionExpression, ExpressionAttributeNames))
+            for item in page
+            if evaluate_condition(FilterExpression, item, ExpressionAttributeNames, ExpressionAttributeValues)
+        ]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(page)}
+        response.update(consumed_capacity(self.name, size, kwargs))
+        if len(matches) > len(page):
+            response['LastEvaluatedKey'] = {name: page[-1][name] for name in key_names}
+        return response
+
+class LocalBatchWriter:
+    """Table.batch_writer() stand-in: buffers puts and sends them 25 at a time"""
+
+    def __init__(self, table):
+        self.table = table
+        self.pending = []
+
+    def put_item(self, Item):
+        self.pending.append(Item)
+        if len(self.pending) == 25:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.table.batch_write(self.pending)
+            self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+class LocalDynamoDBClient:
+    """boto3.resource('dynamodb').meta.client stand-in; like it, takes plain (untyped) values"""
+
+    def __init__(self, aws):
+        self.aws = aws
+
+    def scan(self, TableName, **kwargs):
+        return self.aws.dynamodb.Table(TableName).scan(**kwargs)
+
+    @operation('dynamodb', 'TransactWriteItems')
+    def transact_write_items(self, TransactItems, **kwargs):
+        if len(TransactItems) > 100:
+            raise client_error('ValidationException', 'TransactWriteItems', 'At most 100 actions per transaction')
+        actions = []
+        for action in TransactItems:
+            (kind, request), = action.items()
+            table = self.aws.dynamodb.Table(request['TableName'])
+            actions.append((kind, table, table._key(request.get('Key') or request.get('Item')), request))
+
+        # All or nothing: every action is checked before any is applied
+        reasons = []
+        for kind, table, key, request in actions:
+            reason = {'Code': 'None'}
+            try:
+                if kind != 'ConditionCheck':
+                    self.aws.consume_write(table.name, key, 'TransactWriteItems')
+                table._condition('TransactWriteItems', table.items.get(key), request)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                reason = {'Code': code[:-len('Exception')] if code.endswith('Exception') else code}
+            reasons.append(reason)
+        if any(reason['Code'] != 'None' for reason in reasons):
+            raise client_error('TransactionCanceledException', 'TransactWriteItems',
+                               'Transaction cancelled, please refer cancellation reasons for specific reasons',
+                               CancellationReasons=reasons)
+
+        for kind, table, key, request in actions:
+            current = table.items.get(key)
+            if kind == 'Put':
+                table.items[key] = round_trip(request['Item'])
+            elif kind == 'Delete':
+                table.items.pop(key, None)
+            elif kind == 'Update':
+                updated = deepcopy(current) if current is not None else dict(request['Key'])
+                apply_update(request['UpdateExpression'], updated, request.get('ExpressionAttributeNames'),
+                             request.get('ExpressionAttributeValues'))
+                table.items[key] = round_trip(updated)
+            table._changed(key, current, table.items.get(key))
+        return {}
+
+class LocalDynamoDB:
+    """boto3.resource('dynamodb') stand-in"""
+
+    def __init__(self, aws):
+        self.aws = aws
+        self.tables = {}
+        self.meta = types.SimpleNamespace(client=LocalDynamoDBClient(aws))
+
+    def Table(self, name):
+        if name not in self.tables:
+            if name not in TABLE_KEYS:
+                raise client_error('ResourceNotFoundException', 'DescribeTable', f"Unknown table {name}")
+            self.tables[name] = LocalTable(self.aws, name, *TABLE_KEYS[name])
+        return self.tables[name]
+
+    @operation('dynamodb', 'BatchGetItem')
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            found = []
+            for key in request['Keys']:
+                item = table.items.get(table._key(key))
+                if item is not None:
+                    found.append(project(deepcopy(item), request.get('ProjectionExpression'),
+                                         request.get('ExpressionAttributeNames')))
+            responses[name] = found
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+class LocalEvents:
+    def __init__(self, aws):
+        self.aws = aws
+        self.entries = []
+
+    @operation('events', 'PutEvents')
+    def put_events(self, Entries):
+        if len(Entries) > 10:
+            raise client_error('ValidationException', 'PutEvents', 'At most 10 entries per request')
+        self.entries.extend(Entries)
+        return {'FailedEntryCount': 0, 'Entries': [{'EventId': str(uuid.uuid4())} for _ in Entries]}
+
+class LocalSqs:
+    def __init__(self, aws):
+        self.aws = aws
+        self.messages = {}
+
+    @operation('sqs', 'SendMessage')
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.messages.setdefault(QueueUrl, []).append({'body': MessageBody, **kwargs})
+        return {'MessageId': str(uuid.uuid4())}
+
+class LocalConnections:
+    """boto3.client('apigatewaymanagementapi') stand-in: the messages posted to each open WebSocket connection"""
+
+    def __init__(self, aws):
+        self.aws = aws
+        self.messages = {}  # connection id -> messages posted to it while open
+
+    def open(self, connection_id):
+        self.messages[connection_id] = []
+
+    def close(self, connection_id):
+        self.messages.pop(connection_id, None)
+
+    @operation('apigatewaymanagementapi', 'PostToConnection')
+    def post_to_connection(self, ConnectionId, Data):
+        if ConnectionId not in self.messages:
+            raise client_error('GoneException', 'PostToConnection', f"Connection {ConnectionId} is gone")
+        self.messages[ConnectionId].append(Data)
+        return {}
+
+class LocalBody:
+    """The streaming body of a GetObject response"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+class LocalS3:
+    """Objects kept per bucket, in bytes"""
+
+    def __init__(self, aws):
+        self.aws = aws
+        self.buckets = {}
+
+    def objects(self, bucket):
+        return self.buckets.setdefault(bucket, {})
+
+    @operation('s3', 'PutObject')
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects(Bucket)[Key] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        return {}
+
+    @operation('s3', 'GetObject')
+    def get_object(self, Bucket, Key, **kwargs):
+        if Key not in self.objects(Bucket):
+            raise client_error('NoSuchKey', 'GetObject', 'The specified key does not exist.')
+        data = self.objects(Bucket)[Key]
+        return {'Body': LocalBody(data), 'ContentLength': len(data)}
+
+    @operation('s3', 'ListObjectsV2')
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', ContinuationToken=None, MaxKeys=1000):
+        keys = sorted(key for key in self.objects(Bucket) if key.startswith(Prefix) and key > StartAfter)
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {'KeyCount': len(page)}
+        if page:
+            response['Contents'] = [{'Key': key, 'Size': len(self.objects(Bucket)[key])} for key in page]
+        if start + MaxKeys < len(keys):
+            response.update(IsTruncated=True, NextContinuationToken=str(start + MaxKeys))
+        return response
+
+    @operation('s3', 'DeleteObjects')
+    def delete_objects(self, Bucket, Delete):
+        if len(Delete['Objects']) > 1000:
+            raise client_error('MalformedXML', 'DeleteObjects', 'At most 1000 keys per request')
+        for entry in Delete['Objects']:
+            self.objects(Bucket).pop(entry['Key'], None)
+        return {'Deleted': [{'Key': entry['Key']} for entry in Delete['Objects']]}
+
+    def get_paginator(self, operation_name):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(f"No local paginator for s3.{operation_name}")
+        return LocalListPaginator(self)
+
+class LocalListPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self.s3.list_objects_v2(**kwargs, **({'ContinuationToken': token} if token else {}))
+            yield page
+            if not page.get('IsTruncated'):
+                return
+            token = page['NextContinuationToken']
+
+class LocalAws:
+    """One set of in-memory services shared by every stand-in client
+
+    partition_write_limit, if set, caps writes per second to any one item
+    key, the way a DynamoDB partition caps WCU; writes beyond it fail with
+    ProvisionedThroughputExceededException. Changes to the tables named in
+    streams are recorded as DynamoDB Streams records (NEW_AND_OLD_IMAGES).
+    The services are safe to call from several threads.
+    """
+
+    def __init__(self, latency_ms=0.0, partition_write_limit=None, streams=()):
+        self.latency = latency_ms / 1000.0
+        self.partition_write_limit = partition_write_limit
+        self.streams = set(streams)  # tables whose changes are recorded in LocalTable.stream
+        self.sequence = 0
+        self.partitions = {}  # (table, key) -> [tokens, refilled_at]
+        self.lock = threading.RLock()
+        self.calls = Counter()
+        self.dynamodb = LocalDynamoDB(self)
+        self.events = LocalEvents(self)
+        self.sqs = LocalSqs(self)
+        self.s3 = LocalS3(self)
+        self.connections = LocalConnections(self)
+
+    def record(self, service, operation):
+        with self.lock:
+            self.calls[f"{service}.{operation}"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def consume_write(self, table_name, key, operation):
+        """Token bucket per partition key, refilled at partition_write_limit per second"""
+        if not self.partition_write_limit:
+            return
+        now = time.monotonic()
+        bucket = self.partitions.setdefault((table_name, key), [self.partition_write_limit, now])
+        bucket[0] = min(self.partition_write_limit, bucket[0] + (now - bucket[1]) * self.partition_write_limit)
+        bucket[1] = now
+        if bucket[0] < 1:
+            self.calls['dynamodb.Throttled'] += 1
+            raise client_error('ProvisionedThroughputExceededException', operation,
+                               'The level of configured provisioned throughput for the table was exceeded')
+        bucket[0] -= 1
+
+    def client(self, service, *args, **kwargs):
+        if service == 'events':
+            return self.events
+        if service == 'sqs':
+            return self.sqs
+        if service == 's3':
+            return self.s3
+        if service == 'apigatewaymanagementapi':
+            return self.connections
+        return UnusedClient(service)
+
+    def resource(self, service, *args, **kwargs):
+        if service != 'dynamodb':
+            raise ValueError(f"No local stand-in for the {service} resource")
+        return self.dynamodb
+
+    def install(self):
+        """Route boto3.client and boto3.resource to these stand-ins"""
+        boto3.client = self.client
+        boto3.resource = self.resource
+
+class UnusedClient:
+    """Placeholder for clients a handler creates but the benchmark never calls"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def __getattr__(self, name):
+        raise NotImplementedError(f"No local stand-in for {self.service}.{name}")
+
+def load_handler(function_name):
+    """Import src/lambda/<function_name>/lambda_handler.py under a unique module name"""
+    if LAMBDA_ROOT not in sys.path:
+        sys.path.insert(0, LAMBDA_ROOT)
+    path = os.path.join(LAMBDA_ROOT, function_name, 'lambda_handler.py')
+    spec = importlib.util.spec_from_file_location(f"{function_name}_handler", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class LocalContext:
+    """Minimal Lambda context object"""
+
+    def __init__(self, function_name, timeout_seconds=30):
+        self.function_name = function_name
+        self.invoked_function_arn = f"arn:aws:lambda:local:000000000000:function:{function_name}"
+        self.deadline = time.time() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.time()) * 1000)
@@ -3,37 +3,93 @@ import boto3
 import os
 from datetime import datetime, timedelta
 from decimal import Decimal  # Added import for Decimal
+from common.bucket_sketches import CUSTOMER_HLL, ORDER_VALUE_SKETCH, BucketSketchBuffer
+from common.heavy_hitters import LeaderboardBuffer
+from common.idempotency import LEDGER_TABLE, IdempotencyLedger
+from common.live_updates import ChangeLog
+from common.order_aggregates import fold_customer, fold_order
+from common.order_log import CUSTOMER_RECORD, ORDER_RECORD, stream_batch_id, stream_entries
+from common.ring_buffer import RINGS, record_sale
+from common.rollups import BUCKET_TIME_UNIT, date_value, metric_key, parse_timestamp, rollups_for_date
+from common.sharded_counters import SHARD_OF_ATTRIBUTE, ShardedCounters
+from common.sqs_batch import SqsBatchRunner, batch_envelope, eventbridge_message
+from common.transaction_stages import EventPublisher
 
 # Initialize DynamoDB client
 dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
+events = boto3.client('events')
 SALES_METRICS_TABLE = 'SalesMetrics'
 CUSTOMER_INSIGHTS_TABLE = 'CustomerInsights'
 INVENTORY_STATUS_TABLE = 'InventoryStatus'
 
+# Sketches (best sellers, distinct customers, order value quantiles) are
+# accumulated over an invocation and merged into the shared items at its end
+leaderboard = LeaderboardBuffer()
+bucket_sketches = BucketSketchBuffer()
+
+# Daily bucket counters are written to shard items; a key's shard count
+# doubles, up to COUNTER_MAX_SHARDS, whenever its writes are throttled
+COUNTER_MAX_SHARDS = int(os.environ.get('COUNTER_MAX_SHARDS', '32'))
+COUNTER_SHARDS_TTL_SECONDS = int(os.environ.get('COUNTER_SHARDS_TTL_SECONDS', '60'))
+counters = ShardedCounters(dynamodb.Table(SALES_METRICS_TABLE), max_shards=COUNTER_MAX_SHARDS,
+                           ttl_seconds=COUNTER_SHARDS_TTL_SECONDS)
+
+# EventBridge may deliver an event more than once, and upstream retries can
+# publish the same transaction again under a new event id
+ledger = IdempotencyLedger(dynamodb.Table(LEDGER_TABLE), 'business_logic')
+
+# With event_delivery = "batched", the events arrive buffered in SQS; poison
+# ones go to the dead-letter queue
+DEAD_LETTER_QUEUE_URL = os.environ.get('DEAD_LETTER_QUEUE_URL')
+runner = SqsBatchRunner('business_logic', sqs, DEAD_LETTER_QUEUE_URL, decode=eventbridge_message)
+
+# Counter writes are recorded as compact changes and published once per
+# invocation for the live dashboards (common.live_updates)
+changes = ChangeLog()
+publisher = EventPublisher(events)
+
 def lambda_handler(event, context):
-    """Handle various events from EventBridge and update business metrics"""
+    """Handle various events from EventBridge and update business metrics
+
+    In the "stream" aggregation mode it is invoked instead with batches of
+    OrderLog stream records, which it folds into the same metrics. With
+    batched event delivery, it receives the events in SQS batches.
+    """
     try:
+        batch = batch_envelope(event)
+        if batch is not None:
+            batch_events = EventBatch()
+            return runner.run(batch, batch_events.add, flush=batch_events.flush)
+        if 'Records' in event:
+            return process_order_log(event['Records'])
+        
         # Get event details
         event_source = event['source']
         detail_type = event['detail-type']
         detail = event['detail']
         
-        # Process based on event type
-        if event_source == 'com.ecommerce.orders' and detail_type == 'order_processed':
-            # Update sales metrics
-            update_sales_metrics(detail)
-            
-        elif event_source == 'com.ecommerce.customers' and detail_type == 'customer_analyzed':
-            # Update customer insights
-            update_customer_insights(detail)
-            
-        elif event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_updated':
-            # Update inventory metrics
-            update_inventory_metrics(detail)
-            
-        elif event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_alert':
-            # Handle inventory alerts
-            handle_inventory_alert(detail)
+        event_id = ledger_event_id(event)
+        if not ledger.claim(event_id):
+            print(f"Skipping already processed event: {event_id}")
+            return {
+                "statusCode": 200,
+                "body": json.dumps({
+                    "message": f"Skipped duplicate {event_source} - {detail_type} event"
+                })
+            }
+        
+        try:
+            process_event(event_source, detail_type, detail)
+        except Exception as e:
+            # Let EventBridge's retry process it again
+            ledger.release(event_id)
+            raise e
+        ledger.complete(event_id)
+        
+        # Merge locally accumulated sketches into the shared items
+        flush_sketches()
+        publish_changes()
         
         return {
             "statusCode": 200,
@@ -46,87 +102,357 @@ def lambda_handler(event, context):
         print(f"Error processing event: {str(e)}")
         raise e
 
+def ledger_event_id(event):
+    """Ledger id of an event: its type plus the transaction it is about, if any"""
+    detail = event['detail']
+    transaction_id = detail.get('transaction_id') or detail.get('last_transaction_id') or event.get('id')
+    return f"{event['detail-type']}#{transaction_id}"
+
+def process_event(event_source, detail_type, detail):
+    """Route an event to its handler"""
+    if event_source == 'com.ecommerce.orders' and detail_type == 'order_processed':
+        # Update sales metrics
+        update_sales_metrics(detail)
+        
+    elif event_source == 'com.ecommerce.customers' and detail_type == 'customer_analyzed':
+        # Update customer insights
+        update_customer_insights(detail)
+        
+    elif event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_updated':
+        # Update inventory metrics
+        update_inventory_metrics(detail)
+        
+    elif event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_alert':
+        # Handle inventory alerts
+        handle_inventory_alert(detail)
+
+class EventBatch:
+    """The events of one SQS batch, grouped by type and written once per aggregate key
+
+    Orders are folded into their daily bucket and ring slots, customers into
+    their cohort, and an alert keeps the latest one per product. An event
+    whose bucket, cohort or alert write fails is released and reported for
+    retry; the rest of the batch completes. Leaderboards and sketches are
+    folded per batch too, and only the days whose bucket was written are
+    merged into the shared buffers, so a retried order is counted once.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # date -> order totals
+        self.slots = {}  # (ring, period) -> order totals
+        self.cohorts = {}  # cohort -> customer counts
+        self.alerts = {}  # product_id -> latest alert detail
+        self.leaderboard = LeaderboardBuffer()
+        self.sketches = BucketSketchBuffer()
+        self.claims = {}  # message id -> (ledger event id, aggregate key)
+
+    def add(self, message):
+        message_id, event = message
+        event_source = event['source']
+        detail_type = event['detail-type']
+        detail = event['detail']
+        
+        event_id = ledger_event_id(event)
+        if not ledger.claim(event_id):
+            print(f"Skipping already processed event: {event_id}")
+            return
+        
+        try:
+            aggregate = None
+            # Every field is read before anything is folded, so a rejected
+            # event leaves nothing behind in the batch's totals
+            if event_source == 'com.ecommerce.orders' and detail_type == 'order_processed':
+                order = order_fields(detail)
+                date_str = date_value(parse_timestamp(order['timestamp']))
+                fold_order(order, self.buckets, self.slots, self.leaderboard, self.sketches)
+                # The bucket's shard is picked by its first transaction
+                self.buckets[date_str].setdefault('token', order['transaction_id'])
+                aggregate = ('bucket', date_str)
+            elif event_source == 'com.ecommerce.customers' and detail_type == 'customer_analyzed':
+                customer = dict(detail, total_spent=Decimal(str(detail.get('total_spent', 0))))
+                fold_customer(customer, self.cohorts)
+                aggregate = ('cohort', detail.get('year_month_cohort', 'unknown'))
+            elif event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_alert':
+                aggregate = ('alert', detail.get('product_id', 'unknown'))
+                self.alerts[aggregate[1]] = detail
+            elif event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_updated':
+                update_inventory_metrics(detail)
+        except Exception as e:
+            ledger.release(event_id)
+            raise e
+        self.claims[message_id] = (event_id, aggregate)
+
+    def flush(self):
+        """Write the batch's aggregates; returns the message ids to retry
+
+        Every claim is completed or released, whatever fails along the way.
+        """
+        failed = set()
+        
+        # Daily buckets - the metrics compactor derives the weekly and monthly rows
+        for date_str, totals in self.buckets.items():
+            try:
+                add_to_bucket(BUCKET_TIME_UNIT, date_str, totals['token'], totals['amount'], totals['items'],
+                              totals['orders'], totals['categories'])
+            except Exception as e:
+                print(f"Error updating daily bucket {date_str}: {str(e)}")
+                failed.add(('bucket', date_str))
+        
+        table = dynamodb.Table(SALES_METRICS_TABLE)
+        for (ring_name, period), totals in self.slots.items():
+            try:
+                record_sale(table, ring_name, totals['moment'], totals['amount'], totals['items'],
+                            orders=totals['orders'])
+            except Exception as e:
+                # Intraday series are best effort; the daily bucket is the source of truth
+                print(f"Error updating {ring_name} ring: {str(e)}")
+        
+        for cohort, counts in self.cohorts.items():
+            try:
+                add_to_cohort(cohort, counts)
+            except Exception as e:
+                print(f"Error updating cohort {cohort}: {str(e)}")
+                failed.add(('cohort', cohort))
+        
+        for product_id, detail in self.alerts.items():
+            try:
+                handle_inventory_alert(detail)
+            except Exception as e:
+                print(f"Error handling inventory alert for {product_id}: {str(e)}")
+                failed.add(('alert', product_id))
+        
+        # The orders of a failed bucket are retried, and counted again then
+        failed_dates = {value for kind, value in failed if kind == 'bucket'}
+        for slot in [slot for slot in self.leaderboard.pending if slot[1] in failed_dates]:
+            del self.leaderboard.pending[slot]
+        for date_str in failed_dates:
+            self.sketches.pending.pop(metric_key(BUCKET_TIME_UNIT, date_str), None)
+        leaderboard.merge(self.leaderboard)
+        bucket_sketches.merge(self.sketches)
+        try:
+            flush_sketches()
+        except Exception as e:
+            # Whatever was not written stays buffered for the next invocation
+            print(f"Error flushing sketches: {str(e)}")
+        publish_changes()
+        
+        retry = []
+        for message_id, (event_id, aggregate) in self.claims.items():
+            if aggregate in failed:
+                ledger.release(event_id)
+                retry.append(message_id)
+            else:
+                try:
+                    ledger.complete(event_id)
+                except Exception as e:
+                    # Written already; a duplicate delivery waits out the lease
+                    print(f"Error completing claim on {event_id}: {str(e)}")
+        return retry
+
+def order_fields(detail):
+    """The order_processed fields fold_order reads, checked and converted"""
+    return {
+        'transaction_id': detail['transaction_id'],
+        'timestamp': detail['timestamp'],
+        'customer_id': detail['customer_id'],
+        'total_amount': Decimal(str(detail['total_amount'])),
+        'items': [
+            {
+                'product_id': item['product_id'],
+                'product_name': item.get('product_name'),
+                'category': item.get('category', 'unknown'),
+                'quantity': int(item['quantity'])
+            }
+            for item in detail['items']
+        ]
+    }
+
+def process_order_log(records):
+    """Fold a batch of OrderLog stream records into the metrics, with one write per aggregate
+
+    Each aggregate write is claimed in the ledger under the batch, so when a
+    failed batch is retried, the writes that already went through are skipped.
+    The batch's leaderboard and sketch contributions are only merged into the
+    shared buffers once every write went through; a failed batch drops them
+    and its retry folds them again.
+    """
+    batch_id = stream_batch_id(records)
+    buckets = {}  # date -> order totals
+    slots = {}  # (ring, period) -> order totals
+    cohorts = {}  # cohort -> customer counts
+    batch_leaderboard = LeaderboardBuffer()
+    batch_sketches = BucketSketchBuffer()
+    
+    entries = stream_entries(records)
+    for entry in entries:
+        if entry['record_type'] == ORDER_RECORD:
+            fold_order(entry, buckets, slots, batch_leaderboard, batch_sketches)
+        elif entry['record_type'] == CUSTOMER_RECORD:
+            fold_customer(entry, cohorts)
+    
+    # Daily buckets - the metrics compactor derives the weekly and monthly rows
+    for date_str, totals in buckets.items():
+        apply_once(f"order_log#{batch_id}#{metric_key(BUCKET_TIME_UNIT, date_str)}", lambda: add_to_bucket(
+            BUCKET_TIME_UNIT, date_str, batch_id, totals['amount'], totals['items'], totals['orders'],
+            totals['categories']
+        ))
+    
+    table = dynamodb.Table(SALES_METRICS_TABLE)
+    for (ring_name, period), totals in slots.items():
+        try:
+            apply_once(f"order_log#{batch_id}#{ring_name}#{period}", lambda: record_sale(
+                table, ring_name, totals['moment'], totals['amount'], totals['items'], orders=totals['orders']
+            ))
+        except Exception as e:
+            # Intraday series are best effort; the daily bucket is the source of truth
+            print(f"Error updating {ring_name} ring: {str(e)}")
+    
+    for cohort, counts in cohorts.items():
+        apply_once(f"order_log#{batch_id}#cohort#{cohort}", lambda: add_to_cohort(cohort, counts))
+    
+    leaderboard.merge(batch_leaderboard)
+    bucket_sketches.merge(batch_sketches)
+    flush_sketches()
+    publish_changes()
+    
+    message = (f"Folded {len(entries)} order log records into {len(buckets)} buckets, "
+               f"{len(slots)} ring slots and {len(cohorts)} cohorts")
+    print(message)
+    return {
+        "statusCode": 200,
+        "body": json.dumps({"message": message})
+    }
+
+def apply_once(event_id, write):
+    """Run an aggregate write unless the ledger shows it already went through"""
+    if not ledger.claim(event_id):
+        print(f"Skipping already applied write: {event_id}")
+        return
+    try:
+        write()
+    except Exception as e:
+        ledger.release(event_id)
+        raise e
+    ledger.complete(event_id)
+
 def update_sales_metrics(detail):
-    """Update daily, weekly, and monthly sales metrics"""
+    """Update the daily sales bucket; week and month rollups are compacted from it"""
     # Get transaction details
     transaction_id = detail['transaction_id']
     timestamp = detail['timestamp']
     total_amount = detail['total_amount']
     
     # Parse timestamp
-    transaction_date = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-    date_str = transaction_date.strftime('%Y-%m-%d')
-    week_str = transaction_date.strftime('%Y-W%W')
-    month_str = transaction_date.strftime('%Y-%m')
+    transaction_date = parse_timestamp(timestamp)
+    date_str = date_value(transaction_date)
+    
+    # Update daily metrics - the metrics compactor derives the weekly and
+    # monthly rows from the changed daily buckets
+    update_time_based_metrics(SALES_METRICS_TABLE, BUCKET_TIME_UNIT, date_str, total_amount, detail)
     
-    # Update daily metrics
-    update_time_based_metrics(SALES_METRICS_TABLE, 'date', date_str, total_amount, detail)
+    # Update the intraday minute and hour ring buffers
+    update_intraday_metrics(SALES_METRICS_TABLE, transaction_date, total_amount, detail)
     
-    # Update weekly metrics
-    update_time_based_metrics(SALES_METRICS_TABLE, 'week', week_str, total_amount, detail)
+    # Count units sold per product and category for the leaderboards
+    for item in detail['items']:
+        leaderboard.offer('product', date_str, item['product_id'], item['quantity'], item.get('product_name'))
+        leaderboard.offer('category', date_str, item.get('category', 'unknown'), item['quantity'])
     
-    # Update monthly metrics
-    update_time_based_metrics(SALES_METRICS_TABLE, 'month', month_str, total_amount, detail)
+    # Track distinct customers and the order value distribution for the daily bucket
+    bucket_key = metric_key(BUCKET_TIME_UNIT, date_str)
+    bucket_sketches.add(bucket_key, CUSTOMER_HLL, detail['customer_id'])
+    bucket_sketches.add(bucket_key, ORDER_VALUE_SKETCH, total_amount)
     
     print(f"Updated sales metrics for transaction {transaction_id}")
 
 def update_time_based_metrics(table_name, time_unit, time_value, amount, detail):
-    """Update metrics for a specific time unit (day, week, month)"""
-    table = dynamodb.Table(table_name)
-    
-    # Convert float to Decimal for DynamoDB compatibility
-    decimal_amount = Decimal(str(amount))
-    
+    """Update metrics for a specific time bucket with a single atomic write to one of its shards"""
     # Compute item counts and categories
     item_count = sum(item['quantity'] for item in detail['items'])
     categories = set(item.get('category', 'unknown') for item in detail['items'])
     
+    # The shard is picked by transaction, so a retried order hits the same one
+    add_to_bucket(time_unit, time_value, detail['transaction_id'], amount, item_count, 1, categories)
+
+def add_to_bucket(time_unit, time_value, token, amount, item_count, transaction_count, categories):
+    """Add one or more orders' totals to a time bucket, on the shard picked by token"""
+    # Convert float to Decimal for DynamoDB compatibility
+    decimal_amount = Decimal(str(amount))
+    now = datetime.now().isoformat()
+    key = metric_key(time_unit, time_value)
+    
+    # ADD and if_not_exists create the shard on first write, so there is no
+    # separate put_item path that could overwrite concurrent updates
     try:
-        # Try to update existing record
-        response = table.update_item(
-            Key={
-                'metric_key': f"{time_unit}#{time_value}"
-            },
-            UpdateExpression="ADD total_sales :amount, item_count :items, transaction_count :one " +
+        counters.update(
+            key,
+            token,
+            {'time_unit': time_unit, 'time_value': time_value},
+            UpdateExpression="ADD total_sales :amount, item_count :items, transaction_count :orders " +
                             "SET categories = list_append(if_not_exists(categories, :empty_list), :cats), " +
-                            "last_updated = :now",
+                            f"{SHARD_OF_ATTRIBUTE} = :base, " +
+                            "created_at = if_not_exists(created_at, :now), last_updated = :now",
             ExpressionAttributeValues={
-                ':amount': decimal_amount,  # Now using Decimal
+                ':amount': decimal_amount,
                 ':items': item_count,
-                ':one': 1,
+                ':orders': transaction_count,
                 ':cats': list(categories),
                 ':empty_list': [],
-                ':now': datetime.now().isoformat()
-            },
-            ReturnValues="UPDATED_NEW"
+                ':base': key,
+                ':now': now
+            }
         )
-        
-        # If successful update, return
-        if 'Attributes' in response:
-            return
-    
     except Exception as e:
-        # Record may not exist, create a new one
         print(f"Error updating metrics for {time_unit}#{time_value}: {str(e)}")
+        raise e
     
-    # Create a new record
+    # The shard's new totals are not the bucket's, so only the deltas are sent
+    changes.record(key, 'total_sales', decimal_amount)
+    changes.record(key, 'item_count', item_count)
+    changes.record(key, 'transaction_count', transaction_count)
+
+def update_intraday_metrics(table_name, transaction_date, amount, detail):
+    """Update the fixed-size minute and hour ring buffers for live sales views"""
+    table = dynamodb.Table(table_name)
+    item_count = sum(item['quantity'] for item in detail['items'])
+    
+    for ring_name in RINGS:
+        try:
+            record_sale(table, ring_name, transaction_date, amount, item_count)
+        except Exception as e:
+            # Intraday series are best effort; the daily bucket is the source of truth
+            print(f"Error updating {ring_name} ring: {str(e)}")
+
+def flush_sketches():
+    """Flush the pending leaderboards and bucket sketches
+
+    Called at the end of every invocation, so no counts are left behind in a
+    container that goes idle; whatever fails to flush is retried by the next
+    invocation.
+    """
+    table = dynamodb.Table(SALES_METRICS_TABLE)
+    
+    if leaderboard.pending or leaderboard.unflushed:
+        flushed = leaderboard.flush(table, rollups_for_date)
+        print(f"Flushed {flushed} best-seller summaries, {len(leaderboard.unflushed)} left to retry")
+    
+    # Daily buckets only; the metrics compactor merges them into week/month
+    if bucket_sketches.pending:
+        flushed = bucket_sketches.flush(table)
+        print(f"Flushed sketches for {flushed} daily buckets, {len(bucket_sketches.pending)} left to retry")
+
+def publish_changes():
+    """Publish the metric changes recorded so far to the live dashboards
+
+    Best effort: the metrics themselves are written, and a dashboard that
+    misses changes catches up when it next loads a snapshot.
+    """
     try:
-        table.put_item(
-            Item={
-                'metric_key': f"{time_unit}#{time_value}",
-                'time_unit': time_unit,
-                'time_value': time_value,
-                'total_sales': decimal_amount,  # Now using Decimal
-                'item_count': item_count,
-                'transaction_count': 1,
-                'categories': list(categories),
-                'created_at': datetime.now().isoformat(),
-                'last_updated': datetime.now().isoformat()
-            }
-        )
+        published = changes.publish(publisher)
+        if published:
+            print(f"Published {published} metric changes")
     except Exception as e:
-        print(f"Error creating metrics for {time_unit}#{time_value}: {str(e)}")
-        raise e
+        print(f"Error publishing metric changes: {str(e)}")
 
 def update_customer_insights(detail):
     """Update customer insights based on analyzed customer data"""
@@ -142,44 +468,46 @@ def update_customer_insights(detail):
     avg_order_value = Decimal(str(detail.get('average_order_value', 0)))
     
     # Update cohort metrics
+    add_to_cohort(cohort, {
+        'customer_count': 1,
+        'total_revenue': total_spent,
+        'repeat_customers': 1 if customer_type == 'repeat' else 0,
+        'new_customers': 1 if customer_type == 'new' else 0
+    })
+    
+    print(f"Updated customer insights for customer {customer_id}")
+
+def add_to_cohort(cohort, counts):
+    """Add customer counts to a cohort record, creating it on first use"""
     table = dynamodb.Table(CUSTOMER_INSIGHTS_TABLE)
+    now = datetime.now().isoformat()
     
-    try:
-        # Try to update existing cohort record
-        response = table.update_item(
-            Key={
-                'insight_key': f"cohort#{cohort}"
-            },
-            UpdateExpression="ADD customer_count :one, total_revenue :amount, " +
-                            "repeat_customers :repeat, new_customers :new " +
-                            "SET last_updated = :now",
-            ExpressionAttributeValues={
-                ':one': 1,
-                ':amount': total_spent,  # Already converted to Decimal
-                ':repeat': 1 if customer_type == 'repeat' else 0,
-                ':new': 1 if customer_type == 'new' else 0,
-                ':now': datetime.now().isoformat()
-            },
-            ReturnValues="UPDATED_NEW"
-        )
-    except Exception as e:
-        # Create a new cohort record
-        print(f"Creating new cohort record for {cohort}")
-        table.put_item(
-            Item={
-                'insight_key': f"cohort#{cohort}",
-                'insight_type': 'cohort',
-                'cohort': cohort,
-                'customer_count': 1,
-                'total_revenue': total_spent,  # Already converted to Decimal
-                'repeat_customers': 1 if customer_type == 'repeat' else 0,
-                'new_customers': 1 if customer_type == 'new' else 0,
-                'created_at': datetime.now().isoformat(),
-                'last_updated': datetime.now().isoformat()
-            }
-        )
+    # ADD creates the record, so no put_item is needed (one would overwrite
+    # the counts of concurrent updates)
+    key = f"cohort#{cohort}"
+    response = table.update_item(
+        Key={
+            'insight_key': key
+        },
+        UpdateExpression="ADD customer_count :customers, total_revenue :revenue, " +
+                        "repeat_customers :repeat, new_customers :new " +
+                        "SET insight_type = :type, cohort = :cohort, " +
+                        "created_at = if_not_exists(created_at, :now), last_updated = :now",
+        ExpressionAttributeValues={
+            ':customers': counts['customer_count'],
+            ':revenue': counts['total_revenue'],
+            ':repeat': counts['repeat_customers'],
+            ':new': counts['new_customers'],
+            ':type': 'cohort',
+            ':cohort': cohort,
+            ':now': now
+        },
+        ReturnValues='UPDATED_NEW'
+    )
     
-    print(f"Updated customer insights for customer {customer_id}")
+    # A cohort is a single item, so its new counts go out with the deltas
+    for field in ('customer_count', 'total_revenue', 'repeat_customers', 'new_customers'):
+        changes.record(key, field, counts[field], response['Attributes'].get(field))
 
 def update_inventory_metrics(detail):
     """Update inventory-related metrics"""
@@ -215,15 +543,18 @@ def handle_inventory_alert(detail):
         if isinstance(stock_level, float):
             stock_level = Decimal(str(stock_level))
         
-        table.put_item(
-            Item={
-                'alert_id': alert_id,
-                'product_id': product_id,
-                'product_name': product_name,
-                'alert_type': 'low_inventory',
-                'stock_level': stock_level,
-                'status': 'open',
-                'created_at': datetime.now().isoformat()
+        # The alert is kept on the product's own item; a separate put_item
+        # keyed by product_id would replace the product's stock record
+        table.update_item(
+            Key={'product_id': product_id},
+            UpdateExpression="SET alert_id = :alert_id, alert_type = :alert_type, alert_stock_level = :stock_level, " +
+                            "alert_status = :status, alert_created_at = :created_at",
+            ExpressionAttributeValues={
+                ':alert_id': alert_id,
+                ':alert_type': 'low_inventory',
+                ':stock_level': stock_level,
+                ':status': 'open',
+                ':created_at': datetime.now().isoformat()
             }
         )
     except Exception as e:
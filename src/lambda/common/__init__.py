@@ -0,0 +1,5 @@
+"""Shared helpers for the e-commerce analytics Lambda functions.
+
+This package is deployed as a Lambda layer (see src/terraform/lambda.tf) so
+every function can import it as `common`.
+"""
@@ -0,0 +1,148 @@
+from botocore.exceptions import ClientError
+from common.ddsketch import DDSketch, DEFAULT_QUANTILES, merge_sketches
+from common.hyperloglog import HyperLogLog
+
+# Binary sketch attributes carried by SalesMetrics buckets and rollups:
+#   customer_hll        - HyperLogLog of customer_id (distinct customers)
+#   order_value_sketch  - DDSketch of order totals (percentiles)
+# All sketches of a bucket are flushed together under one version attribute,
+# so a flush costs a single conditional write per bucket.
+CUSTOMER_HLL = 'customer_hll'
+ORDER_VALUE_SKETCH = 'order_value_sketch'
+SKETCH_TYPES = {
+    CUSTOMER_HLL: HyperLogLog,
+    ORDER_VALUE_SKETCH: DDSketch
+}
+VERSION_ATTRIBUTE = 'sketch_version'
+MAX_FLUSH_ATTEMPTS = 5
+
+def decode_sketches(item):
+    """Decode the sketch attributes present on an item"""
+    return {
+        attribute: SKETCH_TYPES[attribute].from_bytes(item[attribute])
+        for attribute in SKETCH_TYPES
+        if item.get(attribute) is not None
+    }
+
+def merge_decoded(decoded):
+    """Merge many {attribute: sketch} dicts into one"""
+    merged = {}
+    customers = [sketches[CUSTOMER_HLL] for sketches in decoded if CUSTOMER_HLL in sketches]
+    if customers:
+        merged[CUSTOMER_HLL] = HyperLogLog(customers[0].precision, customers[0].registers)
+        for sketch in customers[1:]:
+            merged[CUSTOMER_HLL].merge(sketch)
+    order_values = [sketches[ORDER_VALUE_SKETCH] for sketches in decoded if ORDER_VALUE_SKETCH in sketches]
+    if order_values:
+        # One vectorised merge across all buckets
+        merged[ORDER_VALUE_SKETCH] = merge_sketches(order_values)
+    return merged
+
+def merge_bucket_sketches(items):
+    """Merge the sketches of many buckets, keyed by attribute"""
+    return merge_decoded([decode_sketches(item) for item in items])
+
+def summarize(sketches):
+    """API fields for a set of decoded sketches"""
+    summary = {}
+    if CUSTOMER_HLL in sketches:
+        summary['uniqueCustomers'] = sketches[CUSTOMER_HLL].count()
+    if ORDER_VALUE_SKETCH in sketches:
+        p50, p90, p99 = sketches[ORDER_VALUE_SKETCH].quantiles(DEFAULT_QUANTILES)
+        summary['orderValuePercentiles'] = {'p50': p50, 'p90': p90, 'p99': p99}
+    return summary
+
+def summarize_items(items):
+    """Replace binary sketch attributes on each item with API fields
+
+    Returns the summary for the whole set, merged across all items.
+    """
+    decoded = []
+    for item in items:
+        sketches = decode_sketches(item)
+        decoded.append(sketches)
+        for attribute in SKETCH_TYPES:
+            item.pop(attribute, None)
+        item.pop(VERSION_ATTRIBUTE, None)
+        item.update(summarize(sketches))
+    return summarize(merge_decoded(decoded))
+
+def flush_bucket(table, key, sketches):
+    """Merge local sketches into a bucket with one versioned conditional update
+
+    Returns False if every attempt lost the race, in which case nothing was written.
+    """
+    attributes = sorted(sketches)
+    for _ in range(MAX_FLUSH_ATTEMPTS):
+        stored = table.get_item(
+            Key={'metric_key': key},
+            ProjectionExpression=', '.join(attributes + [VERSION_ATTRIBUTE]),
+            ConsistentRead=True
+        ).get('Item', {})
+        version = int(stored.get(VERSION_ATTRIBUTE, 0))
+        merged = merge_decoded([decode_sketches(stored), sketches])
+
+        values = {f":{attribute}": merged[attribute].to_bytes() for attribute in attributes}
+        values.update({':next': version + 1, ':version': version})
+
+        # update_item rather than put_item so the bucket's counters are untouched
+        try:
+            table.update_item(
+                Key={'metric_key': key},
+                UpdateExpression="SET " + ', '.join(f"{a} = :{a}" for a in attributes) +
+                                f", {VERSION_ATTRIBUTE} = :next",
+                ConditionExpression=f"attribute_not_exists({VERSION_ATTRIBUTE}) OR {VERSION_ATTRIBUTE} = :version",
+                ExpressionAttributeValues=values
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+
+    print(f"Gave up flushing sketches for {key} after {MAX_FLUSH_ATTEMPTS} attempts")
+    return False
+
+class BucketSketchBuffer:
+    """Per-container bucket sketches, flushed at the end of each invocation"""
+
+    def __init__(self):
+        self.pending = {}  # metric_key -> {attribute: sketch}
+
+    def add(self, key, attribute, value):
+        sketches = self.pending.setdefault(key, {})
+        sketch = sketches.get(attribute)
+        if sketch is None:
+            sketch = sketches[attribute] = SKETCH_TYPES[attribute]()
+        sketch.add(value)
+
+    def keep(self, key, sketches):
+        """Add sketches to a bucket's pending ones"""
+        kept = self.pending.setdefault(key, {})
+        for attribute, sketch in sketches.items():
+            kept[attribute] = sketch if attribute not in kept else kept[attribute].merge(sketch)
+
+    def merge(self, other):
+        """Add the sketches pending in another buffer to this one"""
+        for key, sketches in other.pending.items():
+            self.keep(key, sketches)
+
+    def flush(self, table):
+        """Merge every bucket's pending sketches into it; returns the number of buckets written
+
+        A bucket whose write fails, or loses every version race, keeps its
+        sketches for the next flush. DynamoDB rejected the write rather than
+        applying it, so the retry does not count the order values twice.
+        """
+        pending, self.pending = self.pending, {}
+        written = 0
+        for key, sketches in pending.items():
+            try:
+                flushed = flush_bucket(table, key, sketches)
+            except Exception as e:
+                print(f"Error flushing sketches for {key}: {str(e)}")
+                flushed = False
+            if flushed:
+                written += 1
+            else:
+                self.keep(key, sketches)
+        return written
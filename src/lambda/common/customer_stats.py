@@ -0,0 +1,72 @@
+import math
+from decimal import Decimal
+from common.rollups import parse_timestamp
+
+# Per-customer sufficient statistics, updated in O(1) on every order so RFM
+# scores and lifetime value never need the customer's order history:
+#   gap_count / gap_mean_days / gap_m2  - Welford moments of days between orders
+#   recent_order_values                 - the last RECENT_ORDERS order totals
+#   decayed_spend / decayed_spend_at    - spend with a SPEND_HALF_LIFE_DAYS half-life
+RECENT_ORDERS = 10
+SPEND_HALF_LIFE_DAYS = 90
+
+# Predicted CLV = mean recent order value x expected orders over the horizon.
+# The expected gap between orders is shrunk towards PRIOR_GAP_DAYS, weighted
+# as PRIOR_WEIGHT observed gaps, so one- and two-order customers get a sane value.
+CLV_HORIZON_DAYS = 365
+PRIOR_GAP_DAYS = 90
+PRIOR_WEIGHT = 2
+
+def to_decimal(value, places=4):
+    """DynamoDB numbers must be Decimal, not float"""
+    return Decimal(str(round(value, places)))
+
+def days_between(earlier, later):
+    return (parse_timestamp(later).replace(tzinfo=None) - parse_timestamp(earlier).replace(tzinfo=None)).total_seconds() / 86400
+
+def update_purchase_stats(profile, timestamp, amount):
+    """Fold one order into a profile's statistics; returns the updated fields"""
+    amount = float(amount)
+
+    # Inter-purchase gap moments (Welford)
+    gap_count = int(profile.get('gap_count', 0))
+    gap_mean = float(profile.get('gap_mean_days', 0))
+    gap_m2 = float(profile.get('gap_m2', 0))
+    previous = profile.get('last_purchase_date')
+    if previous:
+        # Redelivered or out-of-order events count as a zero-day gap
+        gap = max(0.0, days_between(previous, timestamp))
+        gap_count += 1
+        delta = gap - gap_mean
+        gap_mean += delta / gap_count
+        gap_m2 += delta * (gap - gap_mean)
+
+    # Exponentially decayed spend, decayed to this order before adding it
+    decayed_spend = float(profile.get('decayed_spend', 0))
+    decayed_at = profile.get('decayed_spend_at')
+    if decayed_at and days_between(decayed_at, timestamp) < 0:
+        # A late order is decayed to the current reference time instead
+        decayed_spend += amount * 0.5 ** (days_between(timestamp, decayed_at) / SPEND_HALF_LIFE_DAYS)
+    else:
+        if decayed_at:
+            decayed_spend *= 0.5 ** (days_between(decayed_at, timestamp) / SPEND_HALF_LIFE_DAYS)
+        decayed_spend += amount
+        decayed_at = timestamp
+
+    # Fixed-size window of the most recent order values
+    recent = [float(value) for value in profile.get('recent_order_values', [])]
+    recent = (recent + [amount])[-RECENT_ORDERS:]
+
+    expected_gap = (gap_count * gap_mean + PRIOR_WEIGHT * PRIOR_GAP_DAYS) / (gap_count + PRIOR_WEIGHT)
+    predicted_clv = (sum(recent) / len(recent)) * CLV_HORIZON_DAYS / max(expected_gap, 1.0)
+
+    return {
+        'gap_count': gap_count,
+        'gap_mean_days': to_decimal(gap_mean),
+        'gap_m2': to_decimal(gap_m2),
+        'gap_stddev_days': to_decimal(math.sqrt(gap_m2 / (gap_count - 1)) if gap_count > 1 else 0.0),
+        'recent_order_values': [to_decimal(value, 2) for value in recent],
+        'decayed_spend': to_decimal(decayed_spend, 2),
+        'decayed_spend_at': decayed_at,
+        'predicted_clv': to_decimal(predicted_clv, 2)
+    }
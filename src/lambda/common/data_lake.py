@@ -0,0 +1,82 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Layout of the orders data lake that order_exporter writes and
+# dashboard_query reads: zstd-compressed Parquet, partitioned by the order's
+# UTC date and hour,
+#   orders/date=YYYY-MM-DD/hour=HH/<file>.parquet
+#   line_items/date=YYYY-MM-DD/hour=HH/<file>.parquet
+# pyarrow is not part of the layer; the functions importing this module
+# bundle it (see their requirements.txt).
+FILE_SUFFIX = '.parquet'
+
+CENT = Decimal('0.01')
+MONEY = pa.decimal128(18, 2)
+
+ORDERS_SCHEMA = pa.schema([
+    ('transaction_id', pa.string()),
+    ('order_timestamp', pa.timestamp('us')),
+    ('customer_id', pa.string()),
+    ('payment_method', pa.string()),
+    ('shipping_state', pa.string()),
+    ('fulfillment_center', pa.string()),
+    ('status', pa.string()),
+    ('item_count', pa.int32()),
+    ('total_amount', MONEY)
+])
+
+LINE_ITEMS_SCHEMA = pa.schema([
+    ('transaction_id', pa.string()),
+    ('line_number', pa.int16()),
+    ('order_timestamp', pa.timestamp('us')),
+    ('product_id', pa.string()),
+    ('product_name', pa.string()),
+    ('category', pa.string()),
+    ('quantity', pa.int32()),
+    ('price', MONEY),
+    ('amount', MONEY)
+])
+
+# Table name -> (schema, columns that identify a row for deduplication)
+TABLES = {
+    'orders': (ORDERS_SCHEMA, ('transaction_id',)),
+    'line_items': (LINE_ITEMS_SCHEMA, ('transaction_id', 'line_number'))
+}
+
+def money(value):
+    """Event amounts arrive as floats; Parquet keeps them as DECIMAL(18, 2)"""
+    try:
+        return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {value!r}")
+
+def partition_prefix(table_name, moment):
+    return f"{table_name}/date={moment.strftime('%Y-%m-%d')}/hour={moment.strftime('%H')}/"
+
+def partition_date(key):
+    """The YYYY-MM-DD of a key under a table's date partitions"""
+    return key.split('/date=', 1)[1][:10]
+
+def partition_keys(s3, bucket, table_name, first, last):
+    """The table's files dated first to last (YYYY-MM-DD, inclusive)
+
+    Keys sort by date, so the listing starts at the first date and stops
+    after the last one instead of walking the whole table.
+    """
+    keys = []
+    pages = s3.get_paginator('list_objects_v2').paginate(
+        Bucket=bucket, Prefix=f"{table_name}/", StartAfter=f"{table_name}/date={first}"
+    )
+    for page in pages:
+        for item in page.get('Contents', []):
+            if partition_date(item['Key']) > last:
+                return keys
+            if item['Key'].endswith(FILE_SUFFIX):
+                keys.append(item['Key'])
+    return keys
+
+def read_file(s3, bucket, key, columns=None):
+    """One Parquet file, optionally projected to columns"""
+    data = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    return pq.ParquetFile(pa.BufferReader(data)).read(columns=columns)
@@ -0,0 +1,193 @@
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+# Space-Saving keeps at most `capacity` counters. Every reported count is an
+# overestimate by at most its `error`, and every error is bounded by
+# total / capacity, so any item with true count above that bound is retained.
+DEFAULT_CAPACITY = 64
+MAX_FLUSH_ATTEMPTS = 5
+
+class SpaceSaving:
+    """Mergeable Space-Saving heavy-hitters summary"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.total = 0
+        self.counters = {}  # key -> [count, error]
+        self.labels = {}
+
+    def offer(self, key, weight=1, label=None):
+        """Count `weight` occurrences of `key`"""
+        self.total += weight
+        if label is not None:
+            self.labels[key] = label
+
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            return
+
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0]
+            return
+
+        # Replace the smallest counter; the newcomer inherits its count as error
+        victim = min(self.counters, key=lambda k: self.counters[k][0])
+        floor = self.counters.pop(victim)[0]
+        self.labels.pop(victim, None)
+        self.counters[key] = [floor + weight, floor]
+
+    def min_count(self):
+        """Smallest tracked count, or 0 while the summary has spare capacity"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        """Merge another summary into this one (Agarwal et al. mergeable summaries)"""
+        own_floor = self.min_count()
+        other_floor = other.min_count()
+
+        merged = {}
+        for key in set(self.counters) | set(other.counters):
+            own = self.counters.get(key, [own_floor, own_floor])
+            theirs = other.counters.get(key, [other_floor, other_floor])
+            merged[key] = [own[0] + theirs[0], own[1] + theirs[1]]
+
+        # Keep the `capacity` largest counters
+        kept = sorted(merged, key=lambda k: merged[k][0], reverse=True)[:self.capacity]
+        self.counters = {key: merged[key] for key in kept}
+        self.labels.update(other.labels)
+        self.labels = {key: label for key, label in self.labels.items() if key in self.counters}
+        self.total += other.total
+        return self
+
+    def top(self, n):
+        """Return the n heaviest keys with count, error and guaranteed lower bound"""
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)[:n]
+        return [
+            {
+                'key': key,
+                'label': self.labels.get(key, key),
+                'count': count,
+                'error': error,
+                'guaranteed': count - error
+            }
+            for key, (count, error) in ranked
+        ]
+
+    def error_bound(self):
+        """Upper bound on the overestimate of any reported count"""
+        return self.total / self.capacity if self.capacity else 0
+
+    def to_item(self):
+        """Serialize to DynamoDB attributes"""
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'entries': [
+                {'key': key, 'label': self.labels.get(key, key), 'count': count, 'error': error}
+                for key, (count, error) in self.counters.items()
+            ]
+        }
+
+    @classmethod
+    def from_item(cls, item, capacity=DEFAULT_CAPACITY):
+        """Rebuild a summary from DynamoDB attributes"""
+        summary = cls(int(item.get('capacity', capacity)))
+        summary.total = int(item.get('total', 0))
+        for entry in item.get('entries', []):
+            summary.counters[entry['key']] = [int(entry['count']), int(entry['error'])]
+            summary.labels[entry['key']] = entry.get('label', entry['key'])
+        return summary
+
+def top_key(by, time_unit, time_value):
+    """SalesMetrics partition key of a leaderboard item"""
+    return f"top#{by}#{time_unit}#{time_value}"
+
+def flush_summary(table, key, summary):
+    """Merge a local summary into its stored item with optimistic concurrency"""
+    for _ in range(MAX_FLUSH_ATTEMPTS):
+        stored = table.get_item(Key={'metric_key': key}, ConsistentRead=True).get('Item')
+        version = int(stored.get('version', 0)) if stored else 0
+        merged = SpaceSaving.from_item(stored, summary.capacity) if stored else SpaceSaving(summary.capacity)
+        merged.merge(summary)
+
+        item = merged.to_item()
+        item.update({
+            'metric_key': key,
+            'version': version + 1,
+            'last_updated': datetime.now().isoformat()
+        })
+        try:
+            table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(metric_key) OR version = :version",
+                ExpressionAttributeValues={':version': version}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            # Another container flushed first; merge again on top of its result
+
+    print(f"Gave up flushing {key} after {MAX_FLUSH_ATTEMPTS} attempts")
+    return False
+
+class LeaderboardBuffer:
+    """Per-container summaries, merged into the shared items at the end of each invocation"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.pending = {}  # (by, date) -> SpaceSaving
+        self.unflushed = {}  # leaderboard item key -> SpaceSaving whose write failed
+
+    def offer(self, by, date_str, key, weight, label=None):
+        summary = self.pending.get((by, date_str))
+        if summary is None:
+            summary = self.pending[(by, date_str)] = SpaceSaving(self.capacity)
+        summary.offer(key, weight, label)
+
+    def merge(self, other):
+        """Add the summaries pending in another buffer to this one"""
+        for slot, summary in other.pending.items():
+            if slot in self.pending:
+                self.pending[slot].merge(summary)
+            else:
+                self.pending[slot] = summary
+
+    def flush(self, table, rollups_for_date):
+        """Merge every pending summary into its day, week and month leaderboards
+
+        The summaries are combined per leaderboard item first, so days of the
+        same week or month cost one write to it. A summary whose write fails
+        was rejected, not applied, so it is kept and retried on the next flush
+        rather than lost. Returns the number of leaderboard items written.
+        """
+        targets, self.unflushed = self.unflushed, {}
+        for (by, date_str), summary in self.pending.items():
+            for time_unit, time_value in [('date', date_str)] + rollups_for_date(date_str):
+                key = top_key(by, time_unit, time_value)
+                # Copied, since the day's summary feeds several targets
+                targets.setdefault(key, SpaceSaving(self.capacity)).merge(summary)
+        self.pending = {}
+
+        for key, summary in targets.items():
+            try:
+                flushed = flush_summary(table, key, summary)
+            except Exception as e:
+                print(f"Error flushing leaderboard {key}: {str(e)}")
+                flushed = False
+            if not flushed:
+                self.unflushed[key] = summary
+        return len(targets) - len(self.unflushed)
+
+def read_top(table, by, time_unit, time_value, n):
+    """Read a leaderboard with one GetItem and return the top n entries"""
+    item = table.get_item(Key={'metric_key': top_key(by, time_unit, time_value)}).get('Item')
+    summary = SpaceSaving.from_item(item) if item else SpaceSaving()
+    return {
+        'total': summary.total,
+        'errorBound': round(summary.error_bound(), 2),
+        'top': summary.top(n)
+    }
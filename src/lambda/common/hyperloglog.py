@@ -0,0 +1,93 @@
+import hashlib
+import math
+import zlib
+
+# 2^12 one-byte registers: 4 KB uncompressed per bucket and a standard error
+# of 1.04 / sqrt(4096) ~= 1.6%, i.e. ~95% of estimates fall within +/-3.3%,
+# with no bias bump where a raw estimate would switch to linear counting
+# (benchmarks/bench_hyperloglog.py checks 5k-50k distinct values).
+# Registers are stored zlib-compressed, so sparse buckets take far less.
+DEFAULT_PRECISION = 12
+
+class HyperLogLog:
+    """Mergeable distinct counter with 2^precision registers"""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value):
+        """Add a value (hashed with a stable 64-bit hash, unlike the builtin hash())"""
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        remainder_bits = 64 - self.precision
+        remainder = hashed & ((1 << remainder_bits) - 1)
+        rank = remainder_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Register-wise max; the result counts the union of both inputs"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """Estimated number of distinct values
+
+        Ertl's improved estimator ("New cardinality estimation algorithms for
+        HyperLogLog sketches", 2017), computed from the register histogram.
+        Unlike the raw estimate with a switch to linear counting, it has no
+        bias bump around 2.5 * 2^precision values.
+        """
+        q = 64 - self.precision
+        histogram = [0] * (q + 2)
+        for register in self.registers:
+            histogram[register] += 1
+
+        m = self.size
+        z = m * _tau(1 - histogram[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + histogram[k])
+        z += m * _sigma(histogram[0] / m)
+        return int(round(m * m / (2 * math.log(2) * z)))
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, precision=DEFAULT_PRECISION):
+        # DynamoDB returns boto3 Binary wrappers for B attributes
+        raw = zlib.decompress(bytes(getattr(data, 'value', data)))
+        return cls(precision, raw)
+
+def _sigma(x):
+    """sigma(x) = x + sum 2^(k-1) x^(2^k), the correction for empty registers"""
+    if x == 1:
+        return math.inf
+    y = 1
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+def _tau(x):
+    """The correction for saturated registers"""
+    if x == 0 or x == 1:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
@@ -0,0 +1,165 @@
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+# Each consumer claims an event in the IdempotencyLedger table before acting on
+# it, keyed `<consumer>#<event id>` (normally the transaction_id). A claim is a
+# conditional put, so only one delivery of an event wins:
+#   in_progress - being processed; another delivery may take over once the
+#                 lease expires (the first one crashed or timed out). Until
+#                 then claim() raises ClaimInProgress, so the delivery is
+#                 retried rather than acknowledged and lost.
+#   completed   - done; claim() returns False and later deliveries are skipped
+# A completed claim can carry an `outbox`: the events the consumer still has to
+# publish for writes it already committed. The claim is never released once
+# those writes are made, so a redelivery publishes the outbox instead of
+# applying the writes again, and the outbox is cleared once it is published.
+# Items expire through the table's TTL on `expires_at`, after SQS would have
+# stopped redelivering. Recently completed keys are also remembered per
+# container, so hot retries skip the DynamoDB round trip altogether.
+LEDGER_TABLE = 'IdempotencyLedger'
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+DEFAULT_TTL_SECONDS = 14 * 24 * 3600  # maximum SQS retention period
+# Longer than the consumers' 30-second function timeout, and shorter than the
+# queues' 180-second visibility timeout, so a retried message finds the lease
+# of a crashed invocation expired
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_CACHE_SIZE = 10000
+
+class ClaimInProgress(Exception):
+    """Raised by claim() while another delivery holds an unexpired claim on the event"""
+
+class IdempotencyLedger:
+    """Claim, complete and release events for one consumer"""
+
+    def __init__(self, table, consumer, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, cache_size=DEFAULT_CACHE_SIZE):
+        self.table = table
+        self.consumer = consumer
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.cache_size = cache_size
+        self.recent = OrderedDict()  # completed keys, least recently seen first
+
+    def key(self, event_id):
+        return f"{self.consumer}#{event_id}"
+
+    def _remember(self, key):
+        self.recent[key] = True
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.cache_size:
+            self.recent.popitem(last=False)
+
+    def seen(self, event_id):
+        """True if this container already completed the event"""
+        key = self.key(event_id)
+        if key in self.recent:
+            self.recent.move_to_end(key)
+            return True
+        return False
+
+    def claim(self, event_id):
+        """Claim an event; returns False if it was already processed
+
+        Raises ClaimInProgress if another delivery is processing it, so the
+        caller retries later instead of skipping an event that may never complete.
+        """
+        if self.seen(event_id):
+            return False
+
+        key = self.key(event_id)
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={
+                    'idempotency_key': key,
+                    'consumer': self.consumer,
+                    'status': IN_PROGRESS,
+                    'claimed_at': datetime.now().isoformat(),
+                    'lease_expires_at': now + self.lease_seconds,
+                    'expires_at': now + self.ttl_seconds
+                },
+                ConditionExpression="attribute_not_exists(idempotency_key) OR "
+                                    "(#status = :in_progress AND lease_expires_at < :now)",
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':in_progress': IN_PROGRESS, ':now': now},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            current = e.response.get('Item', {})
+            if current.get('status', {}).get('S') != COMPLETED:
+                raise ClaimInProgress(f"{key} is being processed by another delivery")
+            # Remembered only once nothing is left to publish (see outbox())
+            if 'outbox' not in current:
+                self._remember(key)
+            return False
+
+    def complete(self, event_id, outbox=None):
+        """Mark a claimed event as processed, with the event entries still to publish for it"""
+        key = self.key(event_id)
+        values = {':completed': COMPLETED, ':now': datetime.now().isoformat()}
+        update = "SET #status = :completed, completed_at = :now"
+        if outbox:
+            update += ", outbox = :outbox"
+            values[':outbox'] = json.dumps(outbox)
+        self.table.update_item(
+            Key={'idempotency_key': key},
+            UpdateExpression=update,
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues=values
+        )
+        # Skipping a redelivery without a read would lose the outbox
+        if not outbox:
+            self._remember(key)
+
+    def outbox(self, event_id):
+        """The entries a completed event still has to publish, if any"""
+        if self.seen(event_id):
+            return []
+        key = self.key(event_id)
+        item = self.table.get_item(Key={'idempotency_key': key}, ConsistentRead=True).get('Item', {})
+        if item.get('status') != COMPLETED:
+            return []
+        if 'outbox' not in item:
+            self._remember(key)
+            return []
+        return json.loads(item['outbox'])
+
+    def clear_outboxes(self, event_ids):
+        """Drop the outboxes of published events, 25 events per BatchWriteItem call"""
+        now = int(time.time())
+        try:
+            with self.table.batch_writer() as batch:
+                for event_id in event_ids:
+                    batch.put_item(Item={
+                        'idempotency_key': self.key(event_id),
+                        'consumer': self.consumer,
+                        'status': COMPLETED,
+                        'completed_at': datetime.now().isoformat(),
+                        'expires_at': now + self.ttl_seconds
+                    })
+        except Exception as e:
+            # A redelivery publishes the outbox again; consumers of the events are idempotent
+            print(f"Error clearing outboxes for {self.consumer}: {str(e)}")
+            return
+        for event_id in event_ids:
+            self._remember(self.key(event_id))
+
+    def release(self, event_id):
+        """Give up a claim after a failure so a redelivery can process the event"""
+        try:
+            self.table.delete_item(
+                Key={'idempotency_key': self.key(event_id)},
+                ConditionExpression="#status = :in_progress",
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':in_progress': IN_PROGRESS}
+            )
+        except Exception as e:
+            # The lease expires on its own, so a failed release only delays the retry
+            print(f"Error releasing claim on {event_id} for {self.consumer}: {str(e)}")
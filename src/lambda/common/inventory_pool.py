@@ -0,0 +1,496 @@
+import random
+import time
+from datetime import datetime
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from common.sharded_counters import is_throttle
+
+# A product's stock normally lives on its InventoryStatus item and each order
+# line takes its units with one conditional update, so stock never goes
+# negative. That single item caps a product's sales rate at one partition's
+# throughput, so a hot product - one whose writes get throttled, or one listed
+# in the rebalancer's HOT_PRODUCT_IDS - is converted to a reservation pool:
+#   <product_id>          base item: pool_shards, reserve_units (stock the
+#                         rebalancer is moving between shards),
+#                         base_units_sold, and the aggregate view
+#                         (stock_level, inventory_status, units_sold_total)
+#                         refreshed by the inventory rebalancer
+#   <product_id>#pool<k>  sub-allocation: available, units_sold,
+#                         backordered_units
+# Consumers take a line from a random shard that can cover it, else from the
+# reserve, else piece by piece from whichever counters have units left. The
+# rebalancer evens the shards out through the reserve. Each sale is a
+# conditional decrement of one counter and each move between counters is one
+# transaction conditional on its source, so units are never lost or counted
+# twice and stock can never be oversold. Units a line cannot get are recorded
+# as backordered_units (on a shard, for a pooled product), which the
+# rebalancer adds up into backordered_units_total.
+#
+# Products per category and status are counted on one more item, so the
+# dashboard reads them without a scan:
+#   inventory#counts      count#<category>#<status> per pair; no category,
+#                         so it stays out of the CategoryIndex
+# Whichever writer changes a product's inventory_status (its first status
+# included) moves the product between counters with one atomic ADD. The
+# inventory report replaces the counters with exact counts from its scan.
+POOL_SEPARATOR = '#pool'
+POOL_SHARDS_ATTRIBUTE = 'pool_shards'
+POOL_OF_ATTRIBUTE = 'pool_of'
+DEFAULT_POOL_SHARDS = 8
+DEFAULT_TTL_SECONDS = 60
+INITIAL_STOCK = 100  # simulated stock of a product seen for the first time
+LOW_STOCK_THRESHOLD = 20
+BATCH_GET_LIMIT = 100
+CONVERT_ATTEMPTS = 3
+BUSY_ERROR_CODES = {'TransactionConflictException', 'TransactionCanceledException'}
+RESERVE_EMPTY_SECONDS = 1.0  # how long consumers skip a reserve found empty
+COUNTS_KEY = 'inventory#counts'
+COUNT_PREFIX = 'count#'
+COUNTS_ATTRIBUTE = 'counts_of'
+# Filter for scans that want products only, not pool shards or the counts item
+PRODUCTS_FILTER = f"attribute_not_exists({POOL_OF_ATTRIBUTE}) AND attribute_not_exists({COUNTS_ATTRIBUTE})"
+
+deserializer = TypeDeserializer()
+
+def pool_key(product_id, shard):
+    return f"{product_id}{POOL_SEPARATOR}{shard}"
+
+def stock_status(stock_level):
+    return 'low' if stock_level < LOW_STOCK_THRESHOLD else 'normal'
+
+def status_counter(category, status):
+    return f"{COUNT_PREFIX}{category}#{status}"
+
+def record_status_change(table, category, old_status, new_status):
+    """Move one product between its category's status counters with a single atomic ADD"""
+    if old_status == new_status:
+        return
+    deltas = {status_counter(category, new_status): 1}
+    if old_status:
+        deltas[status_counter(category, old_status)] = -1
+    names = {f"#c{i}": counter for i, counter in enumerate(deltas)}
+    try:
+        table.update_item(
+            Key={'product_id': COUNTS_KEY},
+            UpdateExpression="ADD " + ', '.join(f"#c{i} :d{i}" for i in range(len(deltas))) +
+                            f" SET {COUNTS_ATTRIBUTE} = :counts, last_updated = :now",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={
+                **{f":d{i}": delta for i, delta in enumerate(deltas.values())},
+                ':counts': 'inventory_status',
+                ':now': datetime.now().isoformat()
+            }
+        )
+    except ClientError as e:
+        # The stock itself is already updated, and the inventory report
+        # resets the counters, so don't fail the order
+        print(f"Error updating inventory status counts: {str(e)}")
+
+def save_status_counts(table, counts):
+    """Replace the counters with exact counts ({category: {status: products}}), e.g. from a full scan"""
+    item = {
+        'product_id': COUNTS_KEY,
+        COUNTS_ATTRIBUTE: 'inventory_status',
+        'last_updated': datetime.now().isoformat()
+    }
+    for category, statuses in counts.items():
+        item.update({status_counter(category, status): count for status, count in statuses.items()})
+    table.put_item(Item=item)
+
+def read_status_counts(table):
+    """Products per category and status from the counters item"""
+    item = table.get_item(Key={'product_id': COUNTS_KEY}).get('Item', {})
+    counts = {}
+    for attribute, value in item.items():
+        if attribute.startswith(COUNT_PREFIX) and int(value) > 0:
+            category, status = attribute[len(COUNT_PREFIX):].rsplit('#', 1)
+            counts.setdefault(category, {})[status] = int(value)
+    return counts
+
+def old_image(error):
+    """The item returned with a ConditionalCheckFailedException, as plain values"""
+    return {name: deserializer.deserialize(value) for name, value in error.response.get('Item', {}).items()}
+
+def is_condition_failure(error):
+    return error.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+def take_units(table, key, attribute, units, sold_attribute=None, now=None):
+    """Conditionally remove units from a counter; returns (taken, counter value)
+
+    The value is the counter after the take, or before it if the counter
+    could not cover the units.
+    """
+    update = f"ADD {attribute} :negative"
+    values = {':negative': -units, ':units': units}
+    if sold_attribute:
+        update += f", {sold_attribute} :units SET last_updated = :now"
+        values[':now'] = now or datetime.now().isoformat()
+    try:
+        response = table.update_item(
+            Key={'product_id': key},
+            UpdateExpression=update,
+            ConditionExpression=f"{attribute} >= :units",
+            ExpressionAttributeValues=values,
+            ReturnValues='UPDATED_NEW',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return True, int(response['Attributes'][attribute])
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise e
+        return False, int(old_image(e).get(attribute, 0))
+
+def is_busy(error):
+    """A throttled write, or one that collided with or was cancelled in a transaction"""
+    return is_throttle(error) or error.response.get('Error', {}).get('Code') in BUSY_ERROR_CODES
+
+def move_units(table, source, attribute, destinations):
+    """Move units from a counter to others, as one transaction
+
+    destinations is a list of (key, attribute, units). The source must cover
+    the total or nothing moves, so units are never lost or counted twice.
+    Returns False if the source no longer covers it; raises if the
+    transaction is cancelled for another reason (throttling, a conflict).
+    """
+    total = sum(units for _, _, units in destinations)
+    if not total:
+        return True
+    actions = [{
+        'Update': {
+            'TableName': table.name,
+            'Key': {'product_id': source},
+            'UpdateExpression': f"ADD {attribute} :negative",
+            'ConditionExpression': f"{attribute} >= :units",
+            'ExpressionAttributeValues': {':negative': -total, ':units': total}
+        }
+    }]
+    for key, counter, units in destinations:
+        update = {
+            'TableName': table.name,
+            'Key': {'product_id': key},
+            'UpdateExpression': f"ADD {counter} :units",
+            'ExpressionAttributeValues': {':units': units}
+        }
+        if POOL_SEPARATOR in key:
+            update['UpdateExpression'] += f" SET {POOL_OF_ATTRIBUTE} = :product_id"
+            update['ExpressionAttributeValues'][':product_id'] = key.split(POOL_SEPARATOR, 1)[0]
+        actions.append({'Update': update})
+    try:
+        table.meta.client.transact_write_items(TransactItems=actions)
+        return True
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons', [])
+        if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return False
+        raise e
+
+def try_move(table, source, attribute, destinations):
+    """move_units that leaves a busy source or destination for the next rebalance"""
+    try:
+        return move_units(table, source, attribute, destinations)
+    except ClientError as e:
+        if not is_busy(e):
+            raise e
+        print(f"Skipped moving units from {source}: {str(e)}")
+        return False
+
+def even_shares(total, pool_shards):
+    """Split units as evenly as possible over shards"""
+    return [total // pool_shards + (1 if shard < total % pool_shards else 0) for shard in range(pool_shards)]
+
+def convert_to_pool(table, product_id, pool_shards=DEFAULT_POOL_SHARDS):
+    """Turn a product's stock into a reservation pool, allocated evenly to its shards
+
+    One transaction moves the stock read from the base item to the shards,
+    conditional on it not having changed since, so a product's stock is
+    never unallocated behind its busy base item. Returns False if the
+    product is already pooled.
+    """
+    for _ in range(CONVERT_ATTEMPTS):
+        base = table.get_item(Key={'product_id': product_id}, ConsistentRead=True).get('Item', {})
+        if POOL_SHARDS_ATTRIBUTE in base:
+            return False
+        values = {':shards': pool_shards, ':zero': 0, ':sold': int(base.get('units_sold_total', 0))}
+        if 'stock_level' in base:
+            stock = values[':stock'] = int(base['stock_level'])
+            unchanged = "stock_level = :stock"
+        else:
+            stock = INITIAL_STOCK
+            unchanged = "attribute_not_exists(stock_level)"
+        actions = [{
+            'Update': {
+                'TableName': table.name,
+                'Key': {'product_id': product_id},
+                'UpdateExpression': f"SET {POOL_SHARDS_ATTRIBUTE} = :shards, reserve_units = :zero, " +
+                                    "base_units_sold = :sold",
+                'ConditionExpression': f"attribute_not_exists({POOL_SHARDS_ATTRIBUTE}) AND {unchanged}",
+                'ExpressionAttributeValues': values
+            }
+        }]
+        for shard, units in enumerate(even_shares(max(0, stock), pool_shards)):
+            actions.append({
+                'Update': {
+                    'TableName': table.name,
+                    'Key': {'product_id': pool_key(product_id, shard)},
+                    'UpdateExpression': f"ADD available :units SET {POOL_OF_ATTRIBUTE} = :product_id",
+                    'ExpressionAttributeValues': {':units': units, ':product_id': product_id}
+                }
+            })
+        try:
+            table.meta.client.transact_write_items(TransactItems=actions)
+            print(f"Converted {product_id} to a {pool_shards}-shard reservation pool of {stock} units")
+            return True
+        except ClientError as e:
+            reasons = e.response.get('CancellationReasons', [])
+            if not reasons or reasons[0].get('Code') != 'ConditionalCheckFailed':
+                raise e
+            # Sold (or pooled) since it was read; read it again
+    print(f"Stock of {product_id} kept changing; left unpooled for now")
+    return False
+
+class InventoryPool:
+    """Takes order lines from stock, single-item or pooled as each product requires"""
+
+    def __init__(self, table, pool_shards=DEFAULT_POOL_SHARDS, ttl_seconds=DEFAULT_TTL_SECONDS, rng=None):
+        self.table = table
+        self.pool_shards = pool_shards
+        self.ttl_seconds = ttl_seconds
+        self.rng = rng or random.Random()
+        self.pooled = {}  # product_id -> (pool_shards, seen_at)
+        self.reserve_empty = {}  # product_id -> when its reserve was last seen empty
+
+    def reserve(self, item):
+        """Take an order line's units; returns the inventory record for events"""
+        cached = self.pooled.get(item.product_id)
+        if cached and time.monotonic() - cached[1] < self.ttl_seconds:
+            return self.reserve_pooled(item, cached[0])
+        return self.reserve_single(item, item.quantity)
+
+    def reserve_single(self, item, units):
+        now = datetime.now().isoformat()
+        try:
+            response = self.table.update_item(
+                Key={'product_id': item.product_id},
+                UpdateExpression="SET stock_level = if_not_exists(stock_level, :initial) - :units, " +
+                                "units_sold_total = if_not_exists(units_sold_total, :zero) + :units, " +
+                                "backordered_units = if_not_exists(backordered_units, :zero) + :short, " +
+                                "initial_stock = if_not_exists(initial_stock, :initial), " +
+                                "product_name = :name, category = :category, last_updated = :now",
+                ConditionExpression=f"attribute_not_exists({POOL_SHARDS_ATTRIBUTE}) AND " +
+                                   "(attribute_not_exists(stock_level) OR stock_level >= :units)",
+                ExpressionAttributeValues={
+                    ':units': units,
+                    ':short': item.quantity - units,
+                    ':initial': INITIAL_STOCK,
+                    ':zero': 0,
+                    ':name': item.product_name,
+                    ':category': item.category,
+                    ':now': now
+                },
+                ReturnValues='ALL_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            if is_throttle(e):
+                # The product has outgrown its single item; the retry uses the pool
+                self.convert(item.product_id)
+                raise e
+            if not is_condition_failure(e):
+                raise e
+            current = old_image(e)
+            if POOL_SHARDS_ATTRIBUTE in current:
+                return self.reserve_pooled(item, int(current[POOL_SHARDS_ATTRIBUTE]))
+            # Not enough left for the whole line: sell what remains, backorder the rest
+            return self.reserve_single(item, min(units, max(0, int(current.get('stock_level', 0)))))
+        return self.refresh_status(response['Attributes'])
+
+    def convert(self, product_id):
+        try:
+            convert_to_pool(self.table, product_id, self.pool_shards)
+        except ClientError as e:
+            if not is_busy(e):
+                raise e
+            # Left for the next throttled writer
+            print(f"Throttled converting {product_id} to a reservation pool")
+
+    def refresh_status(self, record):
+        """Store inventory_status when a single-item product crosses the low-stock threshold"""
+        status = stock_status(record['stock_level'])
+        if record.get('inventory_status') != status:
+            response = self.table.update_item(
+                Key={'product_id': record['product_id']},
+                UpdateExpression="SET inventory_status = :status",
+                ExpressionAttributeValues={':status': status},
+                ReturnValues='ALL_OLD'
+            )
+            # Counted against the status actually replaced, in case another
+            # consumer changed it first
+            previous = response.get('Attributes', {}).get('inventory_status')
+            record_status_change(self.table, record.get('category', 'unknown'), previous, status)
+            record['inventory_status'] = status
+        return record
+
+    def reserve_pooled(self, item, pool_shards):
+        self.pooled[item.product_id] = (pool_shards, time.monotonic())
+        now = datetime.now().isoformat()
+        remaining = item.quantity
+        partial = []
+        busy = None
+
+        # One conditional write in the common case: a random shard covers the line
+        shards = self.rng.sample(range(pool_shards), pool_shards)
+        for shard in shards:
+            key = pool_key(item.product_id, shard)
+            try:
+                taken, available = take_units(self.table, key, 'available', remaining, 'units_sold', now)
+            except ClientError as e:
+                if not is_busy(e):
+                    raise e
+                busy = e
+                continue
+            if taken:
+                remaining = 0
+                break
+            if available > 0:
+                partial.append((key, 'available', 'units_sold', available))
+
+        # Then the reserve, which holds stock not yet allocated to the shards
+        if remaining and time.monotonic() - self.reserve_empty.get(item.product_id, 0) > RESERVE_EMPTY_SECONDS:
+            try:
+                taken, reserve = take_units(self.table, item.product_id, 'reserve_units', remaining,
+                                            'base_units_sold', now)
+                if taken:
+                    remaining = 0
+                elif reserve > 0:
+                    partial.append((item.product_id, 'reserve_units', 'base_units_sold', reserve))
+                else:
+                    self.reserve_empty[item.product_id] = time.monotonic()
+            except ClientError as e:
+                if not is_busy(e):
+                    raise e
+                busy = e
+        if remaining and busy:
+            # Nothing was taken and a busy counter may hold stock; retry the
+            # line rather than backorder it
+            raise busy
+
+        # A line bigger than any one counter is gathered from several
+        for key, attribute, sold_attribute, available in partial:
+            units = min(available, remaining)
+            if units and self.try_take(key, attribute, units, sold_attribute, now):
+                remaining -= units
+        if remaining:
+            self.backorder(item.product_id, shards, remaining)
+
+        # Stock level and status come from the rebalancer's aggregate view
+        return {
+            'product_id': item.product_id,
+            'product_name': item.product_name,
+            'category': item.category,
+            'pooled': True,
+            'units_reserved': item.quantity - remaining,
+            'backordered_units': remaining,
+            'last_updated': now
+        }
+
+    def try_take(self, key, attribute, units, sold_attribute, now):
+        """take_units for a partial take; a busy or short counter is skipped"""
+        try:
+            return take_units(self.table, key, attribute, units, sold_attribute, now)[0]
+        except ClientError as e:
+            if not is_busy(e):
+                raise e
+            return False
+
+    def backorder(self, product_id, shards, units):
+        """Record units a line could not get on a shard, not the busy base item"""
+        for shard in shards:
+            try:
+                self.table.update_item(
+                    Key={'product_id': pool_key(product_id, shard)},
+                    UpdateExpression=f"ADD backordered_units :units SET {POOL_OF_ATTRIBUTE} = :product_id",
+                    ExpressionAttributeValues={':units': units, ':product_id': product_id}
+                )
+                return
+            except ClientError as e:
+                if not is_busy(e):
+                    raise e
+                busy = e
+        raise busy
+
+def batch_get_products(dynamodb, table_name, keys):
+    """Fetch InventoryStatus items by product_id with consistent BatchGetItem reads"""
+    items = []
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {
+            table_name: {
+                'Keys': [{'product_id': key} for key in keys[start:start + BATCH_GET_LIMIT]],
+                'ConsistentRead': True
+            }
+        }
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys') or None
+    return items
+
+def read_pool(dynamodb, table_name, product_id, pool_shards):
+    """Base item and per-shard available units of a pooled product"""
+    keys = [product_id] + [pool_key(product_id, shard) for shard in range(pool_shards)]
+    items = {item['product_id']: item for item in batch_get_products(dynamodb, table_name, keys)}
+    return items.get(product_id, {}), [items.get(key, {}) for key in keys[1:]]
+
+def rebalance(dynamodb, table_name, product_id, pool_shards):
+    """Even out a pooled product's shards through its reserve and refresh its aggregate view
+
+    Returns the aggregate record and whether it just became low on stock.
+    """
+    table = dynamodb.Table(table_name)
+    base, shards = read_pool(dynamodb, table_name, product_id, pool_shards)
+    available = [int(shard.get('available', 0)) for shard in shards]
+    targets = even_shares(max(0, int(base.get('reserve_units', 0))) + sum(available), pool_shards)
+
+    # Drain shards above their target into the reserve, then fill the ones
+    # below it. Consumers keep selling meanwhile, so every move is
+    # conditional on its source and one that no longer fits is left for the
+    # next run.
+    for shard, (units, target) in enumerate(zip(available, targets)):
+        if units > target:
+            try_move(table, pool_key(product_id, shard), 'available', [(product_id, 'reserve_units', units - target)])
+    try_move(table, product_id, 'reserve_units', [
+        (pool_key(product_id, shard), 'available', target - units)
+        for shard, (units, target) in enumerate(zip(available, targets)) if units < target
+    ])
+
+    base, shards = read_pool(dynamodb, table_name, product_id, pool_shards)
+    stock_level = int(base.get('reserve_units', 0)) + sum(int(shard.get('available', 0)) for shard in shards)
+    units_sold = int(base.get('base_units_sold', 0)) + sum(int(shard.get('units_sold', 0)) for shard in shards)
+    backordered = int(base.get('backordered_units', 0)) + sum(int(shard.get('backordered_units', 0)) for shard in shards)
+    status = stock_status(stock_level)
+    now = datetime.now().isoformat()
+    response = table.update_item(
+        Key={'product_id': product_id},
+        UpdateExpression="SET stock_level = :stock, units_sold_total = :sold, backordered_units_total = :backordered, " +
+                        "inventory_status = :status, shard_available = :shards, last_updated = :now",
+        ExpressionAttributeValues={
+            ':stock': stock_level,
+            ':sold': units_sold,
+            ':backordered': backordered,
+            ':status': status,
+            ':shards': [int(shard.get('available', 0)) for shard in shards],
+            ':now': now
+        },
+        ReturnValues='ALL_OLD'
+    )
+    previous = response.get('Attributes', {}).get('inventory_status')
+    record_status_change(table, base.get('category', 'unknown'), previous, status)
+    record = {
+        'product_id': product_id,
+        'product_name': base.get('product_name'),
+        'category': base.get('category', 'unknown'),
+        'stock_level': stock_level,
+        'inventory_status': status,
+        'units_sold_total': units_sold,
+        'last_updated': now
+    }
+    return record, status == 'low' and previous != 'low'
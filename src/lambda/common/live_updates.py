@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from botocore.exceptions import ClientError
+from common.transaction_stages import event_entry
+
+# Live dashboard updates. Open dashboards used to re-read the whole summary
+# every 30 seconds each. Now business_logic records a compact change for every
+# counter it adds to: the metric key, the field, the amount added and, when
+# the write returns it, the new value. At the end of each invocation it
+# publishes the changes, summed per key and field, as a metrics_changed event.
+# EventBridge fans the event out. Its rule invokes DashboardAPI, which posts
+# the changes to every dashboard connected to the live WebSocket API. A
+# dashboard loads the summary once as a snapshot and applies the changes to
+# it, so the metric tables are read once per dashboard opened, however long
+# it stays open.
+#
+# Daily bucket changes carry no value: the bucket is spread over counter
+# shards, and a writer only learns the total of its own shard.
+LIVE_SOURCE = 'com.ecommerce.metrics'
+LIVE_DETAIL_TYPE = 'metrics_changed'
+MAX_CHANGES_PER_EVENT = 500  # about 40 KB, well under EventBridge's 256 KB per entry
+BROADCAST_THREADS = 16
+GONE_ERROR_CODE = 'GoneException'
+
+class ChangeLog:
+    """Changes to metric counters, summed per key and field until they are published"""
+
+    def __init__(self):
+        self.changes = {}  # (key, field) -> [delta, value]
+
+    def record(self, key, field, delta, value=None):
+        change = self.changes.setdefault((key, field), [0, None])
+        change[0] += delta
+        if value is not None:
+            change[1] = value
+
+    def records(self):
+        """The pending changes as compact records: key, field, delta and, when known, value"""
+        records = []
+        for (key, field), (delta, value) in self.changes.items():
+            record = {'key': key, 'field': field, 'delta': delta}
+            if value is not None:
+                record['value'] = value
+            records.append(record)
+        return records
+
+    def publish(self, publisher):
+        """Publish the pending changes with an EventPublisher and clear them; returns how many there were
+
+        The changes are cleared even if publishing fails.
+        """
+        records = self.records()
+        self.changes = {}
+        if not records:
+            return 0
+        published_at = datetime.now().isoformat()
+        publisher.publish([
+            event_entry(LIVE_SOURCE, LIVE_DETAIL_TYPE, {
+                'changes': records[start:start + MAX_CHANGES_PER_EVENT],
+                'published_at': published_at
+            })
+            for start in range(0, len(records), MAX_CHANGES_PER_EVENT)
+        ])
+        return len(records)
+
+def broadcast(client, connection_ids, message, threads=BROADCAST_THREADS):
+    """Post message to every WebSocket connection; returns the ids of the connections that are gone
+
+    client is an apigatewaymanagementapi client for the live API's stage.
+    A connection that fails in any other way is skipped; it is sent the next
+    message as usual.
+    """
+    def post(connection_id):
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=message)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == GONE_ERROR_CODE:
+                return connection_id
+            print(f"Error posting to connection {connection_id}: {str(e)}")
+        return None
+
+    if not connection_ids:
+        return []
+    with ThreadPoolExecutor(min(threads, len(connection_ids))) as pool:
+        return [connection_id for connection_id in pool.map(post, connection_ids) if connection_id]
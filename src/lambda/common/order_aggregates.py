@@ -0,0 +1,51 @@
+from decimal import Decimal
+from common.bucket_sketches import CUSTOMER_HLL, ORDER_VALUE_SKETCH
+from common.ring_buffer import RINGS, period_index
+from common.rollups import BUCKET_TIME_UNIT, date_value, metric_key, parse_timestamp
+
+# Folds of order and customer records into in-memory aggregates, shared by
+# business_logic's batched consumers (OrderLog stream, SQS event batches) and
+# the rebuild from the order archive (tools/rebuild_metrics.py), so every path
+# counts an order the same way.
+
+def fold_order(order, buckets, slots, leaderboard, bucket_sketches):
+    """Add an order to its bucket and ring slot totals, leaderboards and sketches"""
+    transaction_date = parse_timestamp(order['timestamp'])
+    date_str = date_value(transaction_date)
+    amount = order['total_amount']
+    item_count = sum(int(item['quantity']) for item in order['items'])
+    
+    bucket = buckets.setdefault(date_str, {'amount': Decimal(0), 'items': 0, 'orders': 0, 'categories': set()})
+    bucket['amount'] += amount
+    bucket['items'] += item_count
+    bucket['orders'] += 1
+    bucket['categories'].update(item.get('category', 'unknown') for item in order['items'])
+    
+    for ring_name in RINGS:
+        slot = slots.setdefault((ring_name, period_index(ring_name, transaction_date)),
+                                {'moment': transaction_date, 'amount': Decimal(0), 'items': 0, 'orders': 0})
+        slot['amount'] += amount
+        slot['items'] += item_count
+        slot['orders'] += 1
+    
+    for item in order['items']:
+        leaderboard.offer('product', date_str, item['product_id'], int(item['quantity']), item.get('product_name'))
+        leaderboard.offer('category', date_str, item.get('category', 'unknown'), int(item['quantity']))
+    
+    bucket_key = metric_key(BUCKET_TIME_UNIT, date_str)
+    bucket_sketches.add(bucket_key, CUSTOMER_HLL, order['customer_id'])
+    bucket_sketches.add(bucket_key, ORDER_VALUE_SKETCH, float(amount))
+
+def fold_customer(customer, cohorts):
+    """Add an analyzed customer to their cohort's counts"""
+    customer_type = customer.get('customer_type', 'unknown')
+    counts = cohorts.setdefault(customer.get('year_month_cohort', 'unknown'), {
+        'customer_count': 0,
+        'total_revenue': Decimal(0),
+        'repeat_customers': 0,
+        'new_customers': 0
+    })
+    counts['customer_count'] += 1
+    counts['total_revenue'] += Decimal(str(customer.get('total_spent', 0)))
+    counts['repeat_customers'] += 1 if customer_type == 'repeat' else 0
+    counts['new_customers'] += 1 if customer_type == 'new' else 0
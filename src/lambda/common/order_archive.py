@@ -0,0 +1,153 @@
+import gzip
+import json
+import os
+import time
+import uuid
+from decimal import Decimal
+import boto3
+from common.rollups import date_value, parse_timestamp
+
+# An append-only log of processed orders, kept outside DynamoDB so that the
+# SalesMetrics aggregates can be rebuilt from it (tools/rebuild_metrics.py).
+# The order stage appends each SQS batch's orders as one gzip-compressed JSON
+# lines file per order date:
+#   order-log/date=YYYY-MM-DD/batch-<ms>-<id>.jsonl.gz
+# Compaction merges a day's files into one compacted-<ms>.jsonl.gz holding one
+# record per transaction, so the redeliveries that an at-least-once consumer
+# appends twice drop out, and a day is read with a single GET. Readers
+# deduplicate by transaction_id as well, so a day is consistent at any point
+# of a compaction.
+ARCHIVE_PREFIX = 'order-log'
+FILE_SUFFIX = '.jsonl.gz'
+BATCH_FILE = 'batch'
+COMPACTED_FILE = 'compacted'
+DELETE_OBJECTS_LIMIT = 1000
+
+def decimal_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
+
+def partition_prefix(date_str):
+    return f"{ARCHIVE_PREFIX}/date={date_str}/"
+
+def encode_records(records):
+    """gzip-compressed JSON lines"""
+    lines = (json.dumps(record, default=decimal_default, separators=(',', ':')) for record in records)
+    return gzip.compress('\n'.join(lines).encode('utf-8'))
+
+def decode_records(data):
+    return [json.loads(line, parse_float=Decimal) for line in gzip.decompress(data).splitlines() if line]
+
+class S3Store:
+    """Archive files in an S3 bucket"""
+
+    def __init__(self, s3, bucket):
+        self.s3 = s3
+        self.bucket = bucket
+
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType='application/x-ndjson',
+                           ContentEncoding='gzip')
+
+    def get(self, key):
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def keys(self, prefix):
+        return [
+            item['Key']
+            for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix)
+            for item in page.get('Contents', [])
+        ]
+
+    def delete(self, keys):
+        for start in range(0, len(keys), DELETE_OBJECTS_LIMIT):
+            self.s3.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + DELETE_OBJECTS_LIMIT]]}
+            )
+
+class DirectoryStore:
+    """Archive files under a local directory, laid out like the S3 keys"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers never see a partial file
+        partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+
+    def get(self, key):
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+    def keys(self, prefix):
+        keys = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if key.startswith(prefix) and key.endswith(FILE_SUFFIX):
+                    keys.append(key)
+        return sorted(keys)
+
+    def delete(self, keys):
+        for key in keys:
+            os.remove(os.path.join(self.root, key))
+
+def open_store(location, s3=None):
+    """An S3Store for s3://bucket, otherwise a DirectoryStore"""
+    if location.startswith('s3://'):
+        return S3Store(s3 or boto3.client('s3'), location[len('s3://'):].strip('/'))
+    return DirectoryStore(location)
+
+class OrderArchive:
+    """Appends, reads and compacts the daily order log partitions"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def append(self, orders):
+        """Write a batch of orders, one file per order date; returns the keys written"""
+        by_date = {}
+        for order in orders:
+            by_date.setdefault(date_value(parse_timestamp(order['timestamp'])), []).append(order)
+        keys = []
+        for date_str, records in by_date.items():
+            key = f"{partition_prefix(date_str)}{BATCH_FILE}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}{FILE_SUFFIX}"
+            self.store.put(key, encode_records(records))
+            keys.append(key)
+        return keys
+
+    def dates(self):
+        """The order dates that have a partition"""
+        marker = f"{ARCHIVE_PREFIX}/date="
+        return sorted({key[len(marker):].split('/', 1)[0] for key in self.store.keys(marker)})
+
+    def read_day(self, date_str):
+        """The day's orders, one per transaction, oldest first"""
+        return self._read(self.store.keys(partition_prefix(date_str)))
+
+    def _read(self, keys):
+        orders = {}
+        for key in keys:
+            for record in decode_records(self.store.get(key)):
+                orders[record['transaction_id']] = record
+        return sorted(orders.values(), key=lambda order: order['timestamp'])
+
+    def compact_day(self, date_str):
+        """Merge a day's files into one; returns the number of files merged"""
+        keys = self.store.keys(partition_prefix(date_str))
+        if len(keys) < 2:
+            return 0
+        orders = self._read(keys)
+        # The new file lands before the old ones go, and files appended
+        # meanwhile were not listed, so no order is ever missing from the day
+        self.store.put(f"{partition_prefix(date_str)}{COMPACTED_FILE}-{int(time.time() * 1000)}{FILE_SUFFIX}",
+                       encode_records(orders))
+        self.store.delete(keys)
+        return len(keys)
@@ -0,0 +1,53 @@
+import time
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+# With aggregation_mode = "stream", the order and customer stages also append
+# what business_logic aggregates to the OrderLog table: one item per
+# transaction and record type, keyed `<transaction_id>#<record_type>`.
+# business_logic consumes the table's stream in batches of up to 1000 records
+# and folds each batch into one write per SalesMetrics bucket, ring slot and
+# CustomerInsights cohort, instead of being invoked once per EventBridge event
+# (the events are still published for notifications and the marketing export).
+# The append is conditional, so a transaction retried by its consumer reaches
+# the stream once. Items expire through the table's TTL on `expires_at`.
+ORDER_LOG_TABLE = 'OrderLog'
+ORDER_RECORD = 'order'
+CUSTOMER_RECORD = 'customer'
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600  # well past the stream's 24-hour retention
+
+deserializer = TypeDeserializer()
+
+class OrderLog:
+    """Appends records for business_logic's stream aggregation"""
+
+    def __init__(self, table, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+
+    def append(self, record_type, transaction_id, data):
+        item = dict(data)
+        item.update({
+            'log_key': f"{transaction_id}#{record_type}",
+            'record_type': record_type,
+            'transaction_id': transaction_id,
+            'expires_at': int(time.time()) + self.ttl_seconds
+        })
+        try:
+            self.table.put_item(Item=item, ConditionExpression="attribute_not_exists(log_key)")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+            print(f"Order log already has {item['log_key']}")
+
+def stream_entries(records):
+    """The items inserted by a batch of OrderLog stream records, as plain values"""
+    return [
+        {name: deserializer.deserialize(value) for name, value in record['dynamodb']['NewImage'].items()}
+        for record in records
+        if record.get('eventName') == 'INSERT'
+    ]
+
+def stream_batch_id(records):
+    """Identifies a stream batch; a retried batch starts and ends at the same records"""
+    return f"{records[0]['dynamodb']['SequenceNumber']}-{records[-1]['dynamodb']['SequenceNumber']}"
@@ -0,0 +1,34 @@
+# Lean reads for the dashboard and reports: each endpoint asks DynamoDB only
+# for the attributes it returns (plus those it needs to compute its
+# response) instead of whole items, and the API's fields= parameter narrows
+# a response further. Attribute names always go through placeholders, since
+# several (name, status, count, ...) are DynamoDB reserved words.
+
+def projection(attributes):
+    """ProjectionExpression and ExpressionAttributeNames reading only attributes"""
+    names = {f"#a{n}": attribute for n, attribute in enumerate(attributes)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+def parse_fields(value, allowed):
+    """The fields= query parameter as a list, or None to return every allowed field
+
+    Raises ValueError for an empty list or fields the endpoint does not return.
+    """
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if not fields or unknown:
+        raise ValueError(f"fields must be a comma-separated list of: {', '.join(allowed)}")
+    return fields
+
+def attributes_to_read(fields, required=()):
+    """The attributes a read needs: those it computes from, then the fields returned"""
+    return list(dict.fromkeys(list(required) + list(fields)))
+
+def sparse(items, fields):
+    """Trim each item to fields, in place"""
+    for item in items:
+        for attribute in [attribute for attribute in item if attribute not in fields]:
+            del item[attribute]
+    return items
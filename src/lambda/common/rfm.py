@@ -0,0 +1,94 @@
+import time
+import numpy as np
+from datetime import datetime
+from decimal import Decimal
+
+# Recency/frequency/monetary scores run from 1 (worst) to 5 (best). Each list
+# holds the four boundaries between scores: a value above n boundaries scores
+# 1 + n, except recency, where fewer days since the last purchase is better.
+# These defaults apply until quintile boundaries have been computed from a
+# sample of profiles and stored under BOUNDARIES_KEY in CustomerInsights.
+BOUNDARIES_KEY = 'rfm#boundaries'
+QUINTILES = (0.2, 0.4, 0.6, 0.8)
+RFM_BOUNDARIES = {
+    'recency': [30, 60, 120, 240],   # days since last purchase
+    'frequency': [1, 2, 4, 8],       # total purchases
+    'monetary': [50, 150, 300, 600]  # total spent
+}
+# Recency of a profile with no purchase date: older than any real purchase,
+# so it scores 1 and is never mistaken for a recent customer
+NO_PURCHASE_DAYS = 36500
+
+def score(values, boundaries, lower_is_better=False):
+    """Score an array of values 1-5 against four ascending boundaries"""
+    above = np.searchsorted(np.asarray(boundaries, dtype=np.float64), values, side='left')
+    return (5 - above) if lower_is_better else (1 + above)
+
+def days_since(timestamps, now):
+    """Whole days from each ISO timestamp to now; missing timestamps count as NO_PURCHASE_DAYS"""
+    parsed = np.array([value[:19] if value else 'NaT' for value in timestamps], dtype='datetime64[s]')
+    reference = np.datetime64(now.replace(tzinfo=None).isoformat(timespec='seconds'), 's')
+    days = (reference - parsed) / np.timedelta64(1, 'D')
+    return np.floor(np.nan_to_num(days, nan=NO_PURCHASE_DAYS)).clip(min=0)
+
+def rfm_scores(recency_days, frequency, monetary, boundaries=None):
+    """Recency, frequency and monetary score arrays for a batch of customers"""
+    boundaries = boundaries or RFM_BOUNDARIES
+    return {
+        'recency_score': score(recency_days, boundaries['recency'], lower_is_better=True),
+        'frequency_score': score(frequency, boundaries['frequency']),
+        'monetary_score': score(monetary, boundaries['monetary'])
+    }
+
+def rfm_label(scores):
+    """Combined three-digit RFM code per customer, e.g. "545" """
+    combined = scores['recency_score'] * 100 + scores['frequency_score'] * 10 + scores['monetary_score']
+    return combined.astype(str)
+
+def quintile_boundaries(recency_days, frequency, monetary):
+    """Quintile boundaries of a sample of profiles"""
+    return {
+        name: [float(value) for value in np.quantile(np.asarray(values, dtype=np.float64), QUINTILES)]
+        for name, values in (('recency', recency_days), ('frequency', frequency), ('monetary', monetary))
+    }
+
+def save_boundaries(table, boundaries, sample_size):
+    table.put_item(
+        Item={
+            'insight_key': BOUNDARIES_KEY,
+            'insight_type': 'rfm',
+            'boundaries': {
+                name: [Decimal(str(round(value, 2))) for value in values]
+                for name, values in boundaries.items()
+            },
+            'sample_size': sample_size,
+            'last_updated': datetime.now().isoformat()
+        }
+    )
+
+def load_boundaries(table):
+    """Stored quintile boundaries, or the defaults if none have been computed yet"""
+    item = table.get_item(Key={'insight_key': BOUNDARIES_KEY}).get('Item')
+    if not item:
+        return RFM_BOUNDARIES
+    return {name: [float(value) for value in values] for name, values in item['boundaries'].items()}
+
+class BoundaryCache:
+    """Per-container copy of the stored boundaries, reloaded every ttl_seconds"""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.boundaries = None
+        self.loaded_at = 0.0
+
+    def get(self, table):
+        if self.boundaries is None or time.monotonic() - self.loaded_at >= self.ttl_seconds:
+            try:
+                self.boundaries = load_boundaries(table)
+            except Exception as e:
+                # Keep scoring with what we have rather than failing the order
+                print(f"Error loading RFM boundaries: {str(e)}")
+                if self.boundaries is None:
+                    self.boundaries = RFM_BOUNDARIES
+            self.loaded_at = time.monotonic()
+        return self.boundaries
@@ -0,0 +1,100 @@
+from datetime import datetime
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+# Fixed-size intraday series. Each ring is a single SalesMetrics item with one
+# numeric attribute per slot and metric (e.g. sales_07, orders_07, items_07)
+# plus a stamp_NN holding the absolute period the slot currently belongs to.
+# A slot is reused once the ring wraps around, so item size never grows.
+RINGS = {
+    'minute': {'slots': 60, 'seconds': 60, 'format': '%Y-%m-%dT%H:%M'},
+    'hour': {'slots': 24, 'seconds': 3600, 'format': '%Y-%m-%dT%H:00'}
+}
+RING_METRICS = ('sales', 'orders', 'items')
+
+def ring_key(ring_name):
+    """SalesMetrics partition key of a ring item"""
+    return f"ring#{ring_name}"
+
+def period_index(ring_name, moment):
+    """Absolute period number (minutes or hours since the epoch) for a datetime"""
+    return int(moment.timestamp() // RINGS[ring_name]['seconds'])
+
+def slot_attributes(slot):
+    """Attribute names used by one slot"""
+    names = {metric: f"{metric}_{slot:02d}" for metric in RING_METRICS}
+    names['stamp'] = f"stamp_{slot:02d}"
+    return names
+
+def record_sale(table, ring_name, moment, amount, item_count, now=None, orders=1):
+    """Add orders to their ring slot with atomic ADD, resetting the slot on wrap-around
+
+    Several orders of the same period can be added at once, with their
+    summed amount and item count. Returns False when they are older than the
+    ring window and were dropped.
+    """
+    ring = RINGS[ring_name]
+    index = period_index(ring_name, moment)
+    current = period_index(ring_name, now or datetime.now(moment.tzinfo))
+    if index <= current - ring['slots']:
+        return False
+
+    attrs = slot_attributes(index % ring['slots'])
+    values = {
+        ':amount': Decimal(str(amount)),
+        ':orders': orders,
+        ':items': item_count,
+        ':stamp': index
+    }
+
+    # Two rounds are enough: the reset only loses to a concurrent reset of the
+    # same period, after which the ADD succeeds
+    for _ in range(2):
+        try:
+            table.update_item(
+                Key={'metric_key': ring_key(ring_name)},
+                UpdateExpression=f"ADD {attrs['sales']} :amount, {attrs['orders']} :orders, {attrs['items']} :items",
+                ConditionExpression=f"{attrs['stamp']} = :stamp",
+                ExpressionAttributeValues=values
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+
+        # The slot still holds an older period (or was never written)
+        try:
+            table.update_item(
+                Key={'metric_key': ring_key(ring_name)},
+                UpdateExpression=f"SET {attrs['sales']} = :amount, {attrs['orders']} = :orders, " +
+                                f"{attrs['items']} = :items, {attrs['stamp']} = :stamp",
+                ConditionExpression=f"attribute_not_exists({attrs['stamp']}) OR {attrs['stamp']} < :stamp",
+                ExpressionAttributeValues=values
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+
+    print(f"Dropped stale {ring_name} ring update for period {index}")
+    return False
+
+def read_window(table, ring_name, now=None):
+    """Read a ring with one GetItem and return the trailing window, oldest first"""
+    ring = RINGS[ring_name]
+    item = table.get_item(Key={'metric_key': ring_key(ring_name)}).get('Item', {})
+    current = period_index(ring_name, now or datetime.now())
+
+    series = []
+    for index in range(current - ring['slots'] + 1, current + 1):
+        attrs = slot_attributes(index % ring['slots'])
+        # Slots still holding an older period count as empty
+        live = item.get(attrs['stamp']) == index
+        series.append({
+            'time_unit': ring_name,
+            'time_value': datetime.fromtimestamp(index * ring['seconds']).strftime(ring['format']),
+            'total_sales': item.get(attrs['sales'], 0) if live else 0,
+            'transaction_count': item.get(attrs['orders'], 0) if live else 0,
+            'item_count': item.get(attrs['items'], 0) if live else 0
+        })
+    return series
@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from common.bucket_sketches import merge_bucket_sketches
+from common.projections import projection
+from common.sharded_counters import SHARD_COUNT_ATTRIBUTE, base_key, shard_key
+
+# Daily buckets are the only rows written on the order path. Week and month
+# rows are derived from them by the metrics compactor.
+BUCKET_TIME_UNIT = 'date'
+ROLLUP_TIME_UNITS = ('week', 'month')
+
+# BatchGetItem accepts at most 100 keys per request
+BATCH_GET_LIMIT = 100
+
+# Attributes counter shards carry and fan_in_shards adds onto their bucket
+SHARD_ATTRIBUTES = ('total_sales', 'item_count', 'transaction_count', 'categories')
+
+def parse_timestamp(timestamp):
+    """Parse an ISO-8601 transaction timestamp"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+def date_value(moment):
+    """Daily bucket value (YYYY-MM-DD) for a datetime"""
+    return moment.strftime('%Y-%m-%d')
+
+def week_value(moment):
+    """Weekly rollup value (YYYY-WNN, Monday based) for a datetime"""
+    return moment.strftime('%Y-W%W')
+
+def month_value(moment):
+    """Monthly rollup value (YYYY-MM) for a datetime"""
+    return moment.strftime('%Y-%m')
+
+def metric_key(time_unit, time_value):
+    """SalesMetrics partition key for a bucket or rollup"""
+    return f"{time_unit}#{time_value}"
+
+def metric_keys_between(time_unit, first, last):
+    """SalesMetrics keys of the time_unit buckets or rollups covering the days first to last"""
+    time_values = {BUCKET_TIME_UNIT: date_value, 'week': week_value, 'month': month_value}[time_unit]
+    keys = []
+    day = first
+    while day <= last:
+        key = metric_key(time_unit, time_values(day))
+        if key not in keys:
+            keys.append(key)
+        day += timedelta(days=1)
+    return keys
+
+def rollups_for_date(date_str):
+    """Return the (time_unit, time_value) rollups a daily bucket contributes to"""
+    day = datetime.strptime(date_str, '%Y-%m-%d')
+    return [('week', week_value(day)), ('month', month_value(day))]
+
+def dates_in_rollup(time_unit, time_value):
+    """List the daily bucket values that make up a week or month rollup"""
+    if time_unit == 'week':
+        year, week = time_value.split('-W')
+        # Week 00 starts on the Monday before January 1st, so keep only the
+        # days that actually map back to this key
+        start = datetime.strptime(f"{year}-{week}-1", '%Y-%W-%w')
+        days = [start + timedelta(days=offset) for offset in range(7)]
+        return [date_value(day) for day in days if week_value(day) == time_value]
+
+    if time_unit == 'month':
+        first = datetime.strptime(time_value, '%Y-%m')
+        days = []
+        day = first
+        while day.month == first.month:
+            days.append(date_value(day))
+            day += timedelta(days=1)
+        return days
+
+    raise ValueError(f"Unsupported rollup time unit: {time_unit}")
+
+def batch_get_buckets(dynamodb, table_name, keys, attributes=None):
+    """Fetch SalesMetrics items by metric_key with BatchGetItem, retrying unprocessed keys
+
+    attributes, if given, limits the attributes read.
+    """
+    items = []
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {
+            table_name: {
+                'Keys': [{'metric_key': key} for key in keys[start:start + BATCH_GET_LIMIT]],
+                **(projection(attributes) if attributes else {})
+            }
+        }
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys') or None
+    return items
+
+def fan_in_shards(dynamodb, table_name, buckets, attributes=None):
+    """Add each bucket's counter shards onto it in place, fetched in one BatchGetItem round
+
+    Buckets without a shard_count keep their own counters. The base item's own
+    counters (written before sharding) are kept and added to. attributes, if
+    given, limits the shard attributes read and added to those listed; a
+    shard's categories list grows with every order, so leave it out when the
+    caller does not return it.
+    """
+    added = [name for name in SHARD_ATTRIBUTES if attributes is None or name in attributes]
+    keys = [
+        shard_key(bucket['metric_key'], shard)
+        for bucket in buckets
+        for shard in range(int(bucket.get(SHARD_COUNT_ATTRIBUTE, 0)))
+    ]
+    if not keys:
+        return buckets
+
+    shards = {}
+    for item in batch_get_buckets(dynamodb, table_name, keys, ['metric_key'] + added if attributes else None):
+        shards.setdefault(base_key(item['metric_key']), []).append(item)
+    for bucket in buckets:
+        if bucket['metric_key'] in shards:
+            totals = fold_buckets([bucket] + shards[bucket['metric_key']])
+            totals['categories'] = sorted(totals['categories'])
+            for name in added:
+                bucket[name] = totals[name]
+    return buckets
+
+def fold_buckets(buckets):
+    """Sum the additive counters of a set of daily buckets"""
+    totals = {
+        'total_sales': Decimal('0'),
+        'item_count': 0,
+        'transaction_count': 0,
+        'categories': set()
+    }
+    for bucket in buckets:
+        totals['total_sales'] += Decimal(str(bucket.get('total_sales', 0)))
+        totals['item_count'] += int(bucket.get('item_count', 0))
+        totals['transaction_count'] += int(bucket.get('transaction_count', 0))
+        totals['categories'].update(bucket.get('categories', []))
+    return totals
+
+def compact_rollup(dynamodb, table_name, time_unit, time_value):
+    """Recompute one week or month rollup from its daily buckets and store it"""
+    dates = dates_in_rollup(time_unit, time_value)
+    buckets = batch_get_buckets(
+        dynamodb, table_name, [metric_key(BUCKET_TIME_UNIT, date) for date in dates]
+    )
+    # Daily counters live on shard items
+    fan_in_shards(dynamodb, table_name, buckets)
+    totals = fold_buckets(buckets)
+    sketches = merge_bucket_sketches(buckets)
+    now = datetime.now().isoformat()
+
+    # The rollup is rebuilt from scratch every time, so replaying the same
+    # change records (stream retries, overlapping schedules) is harmless
+    item = {
+        'metric_key': metric_key(time_unit, time_value),
+        'time_unit': time_unit,
+        'time_value': time_value,
+        'total_sales': totals['total_sales'],
+        'item_count': totals['item_count'],
+        'transaction_count': totals['transaction_count'],
+        'categories': sorted(totals['categories']),
+        'source_buckets': len(buckets),
+        'compacted_at': now,
+        'last_updated': now
+    }
+    # Distinct customers and order value distribution over the whole period,
+    # merged from the daily sketches
+    for attribute, sketch in sketches.items():
+        item[attribute] = sketch.to_bytes()
+    dynamodb.Table(table_name).put_item(Item=item)
+    return item
@@ -0,0 +1,281 @@
+import json
+import os
+import numpy as np
+from datetime import datetime
+
+# Segment, recommendation and campaign rules are data, not code. Each rule has
+# a `when` list of conditions that must all hold; an empty list always matches.
+# Segments are first-match-wins in order; recommendations and campaigns
+# accumulate in rule order. Conditions compare a customer field:
+#   numeric:  >, >=, <, <=          e.g. total_spent > 500
+#   label:    ==, !=, in            e.g. customer_type == "repeat"
+#   set:      contains              e.g. purchase_categories contains "electronics"
+# `segment` can be used as a label field by recommendation and campaign rules.
+# Missing numeric fields count as 0, so rules on derived fields such as
+# `recency_days` or `frequency_score` (see common/rfm.py) never match on the
+# order event path, which does not compute them.
+RULES_PATH = os.path.join(os.path.dirname(__file__), 'segmentation_rules.json')
+NUMERIC_OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal
+}
+LABEL_OPS = ('==', '!=', 'in')
+SET_OPS = ('contains',)
+# Rule matches are packed into one int64 bit field per customer
+MAX_RULES = 63
+
+# Customers per segment, kept in one CustomerInsights item as `segment#<name>`
+# counters so the dashboard never scans profiles. Profiles adjust them as their
+# segment changes, and each nightly re-segmentation run resets them to exact counts.
+DISTRIBUTION_KEY = 'segments#distribution'
+COUNT_PREFIX = 'segment#'
+
+def load_rules(path=RULES_PATH):
+    with open(path) as rules_file:
+        return json.load(rules_file)
+
+class CustomerColumns:
+    """Columnar view of a batch of customers
+
+    numeric: field -> float64 array
+    labels:  field -> unicode array
+    sets:    field -> {member: bool array}
+    """
+
+    def __init__(self, size, numeric=None, labels=None, sets=None):
+        self.size = size
+        self.numeric = numeric or {}
+        self.labels = labels or {}
+        self.sets = sets or {}
+
+class SegmentationEngine:
+    """Evaluates segmentation rules over one customer or a whole batch at once"""
+
+    def __init__(self, rules=None):
+        self.rules = rules if rules is not None else load_rules()
+        for section in ('recommendations', 'campaigns', 'segments'):
+            if len(self.rules.get(section, [])) > MAX_RULES:
+                raise ValueError(f"At most {MAX_RULES} {section} rules are supported")
+
+        # Work out which fields are needed and how each must be stored
+        self.numeric_fields = set()
+        self.label_fields = set()
+        self.set_members = {}
+        for section in ('segments', 'recommendations', 'campaigns'):
+            for rule in self.rules.get(section, []):
+                for condition in rule['when']:
+                    field, op = condition['field'], condition['op']
+                    if op in NUMERIC_OPS:
+                        self.numeric_fields.add(field)
+                    elif op in LABEL_OPS:
+                        if field != 'segment':
+                            self.label_fields.add(field)
+                    elif op in SET_OPS:
+                        self.set_members.setdefault(field, set()).add(condition['value'])
+                    else:
+                        raise ValueError(f"Unsupported rule operator: {op}")
+
+        # Customer dicts are evaluated by the rules compiled to plain Python;
+        # building columns from dicts costs more than the comparisons
+        self.evaluate_dict = compile_rules(self.rules)
+
+    def columns_from_records(self, records):
+        """Build the columns the rules need from a list of customer dicts"""
+        size = len(records)
+        numeric = {
+            field: np.fromiter((float(record.get(field) or 0) for record in records), dtype=np.float64, count=size)
+            for field in self.numeric_fields
+        }
+        labels = {
+            field: np.array([str(record.get(field, '')) for record in records], dtype=str)
+            for field in self.label_fields
+        }
+        sets = {}
+        for field, members in self.set_members.items():
+            values = [set(record.get(field) or ()) for record in records]
+            sets[field] = {
+                member: np.fromiter((member in value for value in values), dtype=bool, count=size)
+                for member in members
+            }
+        return CustomerColumns(size, numeric, labels, sets)
+
+    def _mask(self, condition, columns, segments):
+        field, op, value = condition['field'], condition['op'], condition['value']
+        if op in NUMERIC_OPS:
+            # Columns built without a field behave like records without it
+            values = columns.numeric.get(field)
+            if values is None:
+                values = np.zeros(columns.size)
+            return NUMERIC_OPS[op](values, value)
+        if op in SET_OPS:
+            return columns.sets[field].get(value, np.zeros(columns.size, dtype=bool))
+
+        labels = segments if field == 'segment' else columns.labels[field]
+        if op == '==':
+            return labels == value
+        if op == '!=':
+            return labels != value
+        return np.isin(labels, value)
+
+    def _rule_mask(self, rule, columns, segments=None):
+        mask = np.ones(columns.size, dtype=bool)
+        for condition in rule['when']:
+            mask &= self._mask(condition, columns, segments)
+        return mask
+
+    def _accumulate(self, rules, outputs, columns, segments):
+        """Per-customer lists of the outputs of every matching rule, in rule order"""
+        flags = np.zeros(columns.size, dtype=np.int64)
+        for bit, rule in enumerate(rules):
+            flags |= self._rule_mask(rule, columns, segments).astype(np.int64) << bit
+
+        # Only a handful of rule combinations occur, so build each list once
+        combinations, inverse = np.unique(flags, return_inverse=True)
+        lists = np.empty(len(combinations), dtype=object)
+        for position, combination in enumerate(combinations):
+            lists[position] = tuple(
+                output
+                for bit, rule_outputs in enumerate(outputs) if (int(combination) >> bit) & 1
+                for output in rule_outputs
+            )
+        return lists[inverse.reshape(-1)]
+
+    def evaluate(self, columns):
+        """Evaluate all rules over a batch; returns arrays aligned with the input rows"""
+        segment_rules = self.rules.get('segments', [])
+        masks = [self._rule_mask(rule, columns) for rule in segment_rules]
+        names = [rule['name'] for rule in segment_rules]
+        width = max((len(name) for name in names), default=1)
+        segments = np.select(masks, names, default='') if masks else np.full(columns.size, '')
+        segments = segments.astype(f"<U{width}")
+
+        recommendation_rules = self.rules.get('recommendations', [])
+        campaign_rules = self.rules.get('campaigns', [])
+        return {
+            'segment': segments,
+            'recommended_products': self._accumulate(
+                recommendation_rules, [rule['products'] for rule in recommendation_rules], columns, segments
+            ),
+            'eligible_campaigns': self._accumulate(
+                campaign_rules, [[rule['name']] for rule in campaign_rules], columns, segments
+            )
+        }
+
+    def evaluate_records(self, records):
+        """Evaluate a list of customer dicts; returns one result dict per customer"""
+        evaluate_dict = self.evaluate_dict
+        return [evaluate_dict(record) for record in records]
+
+    def evaluate_one(self, record):
+        return self.evaluate_dict(record)
+
+def compile_rules(rules):
+    """Compile the rules into one function of a customer dict, returning its result dict
+
+    The function is the if-chain the rules describe: each field is read once,
+    segments are an if/elif chain, and every recommendation and campaign rule
+    is an if. It gives the same results as evaluating columns. Rule fields and
+    values are bound as names rather than written into the source.
+    """
+    constants = {}
+    loads = {}  # (field, expression) -> (variable, expression reading the field)
+
+    def constant(value):
+        name = f"c{len(constants)}"
+        constants[name] = value
+        return name
+
+    def variable(field, expression):
+        """A variable holding the field, read once at the top as expression reads it"""
+        if (field, expression) not in loads:
+            loads[(field, expression)] = (f"v{len(loads)}", expression.format(field=constant(field)))
+        return loads[(field, expression)][0]
+
+    def test(rule):
+        terms = []
+        for condition in rule['when']:
+            field, op, value = condition['field'], condition['op'], condition['value']
+            if op in NUMERIC_OPS:
+                terms.append(f"{variable(field, 'float(get({field}) or 0)')} {op} {constant(value)}")
+            elif op in SET_OPS:
+                terms.append(f"{constant(value)} in {variable(field, '(get({field}) or ())')}")
+            else:
+                label = 'segment' if field == 'segment' else variable(field, "str(get({field}, ''))")
+                if op == 'in':
+                    terms.append(f"{label} in {constant(frozenset(value))}")
+                else:
+                    terms.append(f"{label} {op} {constant(value)}")
+        return ' and '.join(f"({term})" for term in terms) or 'True'
+
+    body = ["    segment = ''"]
+    for position, rule in enumerate(rules.get('segments', [])):
+        body.append(f"    {'if' if position == 0 else 'elif'} {test(rule)}:\n        segment = {constant(rule['name'])}")
+    body.append("    products = []")
+    for rule in rules.get('recommendations', []):
+        body.append(f"    if {test(rule)}:\n        products.extend({constant(rule['products'])})")
+    body.append("    campaigns = []")
+    for rule in rules.get('campaigns', []):
+        body.append(f"    if {test(rule)}:\n        campaigns.append({constant(rule['name'])})")
+    body.append("    return {'segment': segment, 'recommended_products': products, 'eligible_campaigns': campaigns}")
+
+    source = "def evaluate(record):\n    get = record.get\n"
+    source += ''.join(f"    {name} = {expression}\n" for name, expression in loads.values())
+    source += '\n'.join(body) + '\n'
+    namespace = dict(constants)
+    exec(compile(source, '<segmentation rules>', 'exec'), namespace)
+    return namespace['evaluate']
+
+def marketing_record(customer, result, updated_at):
+    """The AppFlow marketing record for one customer and its segmentation result"""
+    return {
+        "customer_id": customer.get('customer_id', 'unknown'),
+        "customer_type": customer.get('customer_type', 'unknown'),
+        "segment": str(result['segment']),
+        "total_spent": customer.get('total_spent', 0),
+        "total_purchases": customer.get('total_purchases', 0),
+        "purchase_categories": customer.get('purchase_categories', []),
+        "recommended_products": list(result['recommended_products']),
+        "eligible_campaigns": list(result['eligible_campaigns']),
+        "last_updated": updated_at
+    }
+
+def record_segment_change(table, old_segment, new_segment):
+    """Move one customer between segment counters with a single atomic ADD"""
+    if old_segment == new_segment:
+        return
+    deltas = {new_segment: 1}
+    if old_segment:
+        deltas[old_segment] = -1
+    names = {f"#c{i}": f"{COUNT_PREFIX}{segment}" for i, segment in enumerate(deltas)}
+    table.update_item(
+        Key={'insight_key': DISTRIBUTION_KEY},
+        UpdateExpression="ADD " + ', '.join(f"#c{i} :d{i}" for i in range(len(deltas))) +
+                        " SET insight_type = :type, last_updated = :now",
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues={
+            **{f":d{i}": delta for i, delta in enumerate(deltas.values())},
+            ':type': 'segments',
+            ':now': datetime.now().isoformat()
+        }
+    )
+
+def save_segment_distribution(table, counts):
+    """Replace the counters with exact counts, e.g. at the end of a full re-segmentation"""
+    item = {
+        'insight_key': DISTRIBUTION_KEY,
+        'insight_type': 'segments',
+        'last_updated': datetime.now().isoformat()
+    }
+    item.update({f"{COUNT_PREFIX}{segment}": count for segment, count in counts.items()})
+    table.put_item(Item=item)
+
+def read_segment_distribution(table):
+    """Customers per segment from the counters item"""
+    item = table.get_item(Key={'insight_key': DISTRIBUTION_KEY}).get('Item', {})
+    return {
+        attribute[len(COUNT_PREFIX):]: int(value)
+        for attribute, value in item.items()
+        if attribute.startswith(COUNT_PREFIX)
+    }
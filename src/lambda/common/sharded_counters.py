@@ -0,0 +1,117 @@
+import time
+import zlib
+from botocore.exceptions import ClientError
+
+# A daily SalesMetrics bucket takes a write from every order, so on busy days
+# its partition throttles (about 1000 WCU per key). Its counters are spread
+# over shard items `<metric_key>#shard<k>`, with k = crc32(transaction_id) %
+# shard_count, so a redelivered order always lands on the same shard. Shard
+# items carry `shard_of` (the base key) and no time_unit, so prefix scans for
+# buckets skip them.
+#
+# The base item keeps everything that is not a per-order counter - time_unit,
+# time_value, the bucket sketches - plus `shard_count`, which readers use to
+# fan in (common.rollups.fan_in_shards). Keys start at default_shards, and a
+# writer whose shard write is throttled doubles the key's count, up to
+# max_shards. The count is raised in the table before any writer uses it and
+# never shrinks, so readers always cover every shard that has been written.
+SHARD_SEPARATOR = '#shard'
+SHARD_COUNT_ATTRIBUTE = 'shard_count'
+SHARD_OF_ATTRIBUTE = 'shard_of'
+THROTTLE_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded'
+}
+DEFAULT_SHARDS = 1
+MAX_SHARDS = 32
+DEFAULT_TTL_SECONDS = 60
+
+def shard_key(key, shard):
+    return f"{key}{SHARD_SEPARATOR}{shard}"
+
+def base_key(key):
+    """The base key of a shard key; other keys are returned unchanged"""
+    return key.split(SHARD_SEPARATOR, 1)[0]
+
+def pick_shard(token, shard_count):
+    return zlib.crc32(token.encode('utf-8')) % shard_count
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES
+
+class ShardedCounters:
+    """Writes counter updates to a key's shards, growing the shard count under throttling"""
+
+    def __init__(self, table, key_name='metric_key', default_shards=DEFAULT_SHARDS, max_shards=MAX_SHARDS,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.table = table
+        self.key_name = key_name
+        self.default_shards = default_shards
+        self.max_shards = max_shards
+        self.ttl_seconds = ttl_seconds
+        self.counts = {}  # key -> (shard_count, loaded_at)
+
+    def shard_count(self, key, attributes=None):
+        """Current shard count of a key, registering the base item on first use
+
+        attributes (e.g. time_unit and time_value) are set on the base item
+        when it is registered. The count is cached for ttl_seconds per
+        container, which bounds the base item's write rate.
+        """
+        cached = self.counts.get(key)
+        if cached and time.monotonic() - cached[1] < self.ttl_seconds:
+            return cached[0]
+
+        assignments = [f"{SHARD_COUNT_ATTRIBUTE} = if_not_exists({SHARD_COUNT_ATTRIBUTE}, :default)"]
+        kwargs = {'ExpressionAttributeValues': {':default': self.default_shards}}
+        for i, (name, value) in enumerate((attributes or {}).items()):
+            assignments.append(f"#a{i} = :a{i}")
+            kwargs.setdefault('ExpressionAttributeNames', {})[f"#a{i}"] = name
+            kwargs['ExpressionAttributeValues'][f":a{i}"] = value
+        response = self.table.update_item(
+            Key={self.key_name: key},
+            UpdateExpression="SET " + ', '.join(assignments),
+            ReturnValues='UPDATED_NEW',
+            **kwargs
+        )
+        count = int(response['Attributes'][SHARD_COUNT_ATTRIBUTE])
+        self.counts[key] = (count, time.monotonic())
+        return count
+
+    def update(self, key, token, attributes=None, **update_kwargs):
+        """update_item on the shard of key picked by token; returns the shard key written"""
+        shard = shard_key(key, pick_shard(token, self.shard_count(key, attributes)))
+        try:
+            self.table.update_item(Key={self.key_name: shard}, **update_kwargs)
+        except ClientError as e:
+            if is_throttle(e):
+                self.grow(key)
+            raise e
+        return shard
+
+    def grow(self, key):
+        """Double a key's shard count after a throttled write; returns the new count"""
+        current = self.counts.get(key, (self.default_shards, 0))[0]
+        target = min(self.max_shards, current * 2)
+        if target <= current:
+            return current
+        try:
+            self.table.update_item(
+                Key={self.key_name: key},
+                UpdateExpression=f"SET {SHARD_COUNT_ATTRIBUTE} = :target",
+                ConditionExpression=f"{SHARD_COUNT_ATTRIBUTE} < :target",
+                ExpressionAttributeValues={':target': target}
+            )
+            print(f"Raised {key} to {target} counter shards after throttling")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException' and not is_throttle(e):
+                raise e
+            # Another writer raised it first (or the base item is busy too); reload
+            target = int(self.table.get_item(
+                Key={self.key_name: key},
+                ProjectionExpression=SHARD_COUNT_ATTRIBUTE,
+                ConsistentRead=True
+            ).get('Item', {}).get(SHARD_COUNT_ATTRIBUTE, current))
+        self.counts[key] = (target, time.monotonic())
+        return target
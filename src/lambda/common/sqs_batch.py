@@ -0,0 +1,147 @@
+import json
+from botocore.exceptions import ClientError
+
+# SQS consumers hand each record to a handler and report only the records that
+# failed (`batchItemFailures`, which requires ReportBatchItemFailures on the
+# event source mapping), so one bad record no longer redrives its whole batch.
+# Failures are classified:
+#   retryable - throttling and other transient errors; SQS redelivers the record
+#   poison    - the record can never succeed (malformed JSON, missing fields,
+#               rejected input); it is sent to the dead-letter queue with the
+#               reason and acknowledged
+# A retryable record that has been received max_receive_count times is
+# treated as poison too, so it stops cycling through the queue.
+RETRYABLE = 'retryable'
+POISON = 'poison'
+DEFAULT_MAX_RECEIVE_COUNT = 5
+
+RETRYABLE_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'ThrottlingException',
+    'Throttling',
+    'TransactionConflictException',
+    'InternalServerError',
+    'InternalFailure',
+    'ServiceUnavailable'
+}
+POISON_EXCEPTIONS = (KeyError, TypeError, ValueError, ZeroDivisionError)
+
+class PoisonMessage(Exception):
+    """Raised by a handler for a record that must not be retried"""
+
+def classify(error):
+    """Whether a handler error is worth retrying"""
+    if isinstance(error, PoisonMessage):
+        return POISON
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code', '')
+        if code in RETRYABLE_ERROR_CODES:
+            return RETRYABLE
+        # Validation and other request errors repeat on every attempt
+        return POISON if code.endswith('ValidationException') or code == 'ValidationError' else RETRYABLE
+    # json.JSONDecodeError is a ValueError
+    if isinstance(error, POISON_EXCEPTIONS):
+        return POISON
+    return RETRYABLE
+
+def sns_message(record):
+    """Decode the SNS notification carried in an SQS record"""
+    body = json.loads(record['body'])
+    return json.loads(body['Message'])
+
+def eventbridge_message(record):
+    """Decode the EventBridge event an SQS rule target carries, with its message id"""
+    return record['messageId'], json.loads(record['body'])
+
+def batch_envelope(event):
+    """The SQS batch in a Lambda event, or None for a single EventBridge event
+
+    Accepts an SQS event source mapping's event, or the list of SQS records
+    an EventBridge Pipe delivers.
+    """
+    if isinstance(event, list):
+        return {'Records': event}
+    records = event.get('Records')
+    if records and records[0].get('eventSource') == 'aws:sqs':
+        return event
+    return None
+
+def receive_count(record):
+    return int(record.get('attributes', {}).get('ApproximateReceiveCount', 1))
+
+class SqsBatchRunner:
+    """Runs a per-record handler over an SQS batch with partial failure reporting"""
+
+    def __init__(self, consumer, sqs, dead_letter_queue_url, max_receive_count=DEFAULT_MAX_RECEIVE_COUNT,
+                 decode=sns_message):
+        self.consumer = consumer
+        self.sqs = sqs
+        self.dead_letter_queue_url = dead_letter_queue_url
+        self.max_receive_count = max_receive_count
+        self.decode = decode
+
+    def run(self, event, handler, flush=None):
+        """Call handler(message) for every record; returns the Lambda batch response
+
+        flush(), if given, is called once after the records, for work the
+        handler buffers across the batch. It may return the message ids of
+        records whose buffered work failed, and only those are retried; if it
+        raises, every record that had been processed is retried.
+        """
+        failures = []
+        processed = []
+        dead_lettered = 0
+
+        for record in event['Records']:
+            try:
+                handler(self.decode(record))
+                processed.append(record['messageId'])
+            except Exception as e:
+                kind = classify(e)
+                attempts = receive_count(record)
+                reason = f"{type(e).__name__}: {str(e)}"
+                if kind == RETRYABLE and attempts >= self.max_receive_count:
+                    kind = POISON
+                    reason = f"Retries exhausted after {attempts} receives - {reason}"
+                print(f"{kind.capitalize()} failure for message {record['messageId']} "
+                      f"(receive {attempts}): {reason}")
+
+                if kind == POISON and self.dead_letter(record, reason, attempts):
+                    dead_lettered += 1
+                else:
+                    failures.append({'itemIdentifier': record['messageId']})
+
+        if flush is not None and processed:
+            try:
+                failed = set(flush() or ())
+            except Exception as e:
+                print(f"Error flushing batch of {len(processed)} records: {type(e).__name__}: {str(e)}")
+                failed = set(processed)
+            failures.extend({'itemIdentifier': message_id} for message_id in processed if message_id in failed)
+            processed = [message_id for message_id in processed if message_id not in failed]
+
+        print(f"{self.consumer}: {len(processed)} processed, {len(failures)} to retry, "
+              f"{dead_lettered} dead-lettered of {len(event['Records'])} records")
+        return {'batchItemFailures': failures}
+
+    def dead_letter(self, record, reason, attempts):
+        """Park a poison record on the dead-letter queue; returns False if it must be retried instead"""
+        if not self.dead_letter_queue_url:
+            print(f"No dead-letter queue configured; dropping message {record['messageId']}")
+            return True
+        try:
+            self.sqs.send_message(
+                QueueUrl=self.dead_letter_queue_url,
+                MessageBody=record['body'],
+                MessageAttributes={
+                    'consumer': {'DataType': 'String', 'StringValue': self.consumer},
+                    'failure_reason': {'DataType': 'String', 'StringValue': reason[:1024]},
+                    'source_message_id': {'DataType': 'String', 'StringValue': record['messageId']},
+                    'receive_count': {'DataType': 'Number', 'StringValue': str(attempts)}
+                }
+            )
+            return True
+        except Exception as e:
+            print(f"Error dead-lettering message {record['messageId']}: {str(e)}")
+            return False
@@ -0,0 +1,97 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Full-table scans that have to stay (reports, customer cohorts) go through
+# scan_items, which follows LastEvaluatedKey to the end instead of stopping at
+# the first 1 MB page. With segments > 1 it runs a DynamoDB parallel scan, one
+# thread per segment. The threads share the table resource's meta.client,
+# which, unlike the resource itself, is safe to use from several threads and,
+# like it, takes and returns plain (untyped) values.
+PAGES_IN_FLIGHT = 2  # pages buffered per segment ahead of the consumer
+
+class ScanStats:
+    """Pages read, items scanned and returned, and read capacity consumed by a scan"""
+
+    def __init__(self):
+        self.pages = 0
+        self.scanned = 0
+        self.returned = 0
+        self.capacity_units = 0.0
+
+    def add(self, response):
+        self.pages += 1
+        self.scanned += response.get('ScannedCount', 0)
+        self.returned += response.get('Count', 0)
+        self.capacity_units += float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+
+    def __str__(self):
+        return (f"{self.returned} of {self.scanned} items scanned in {self.pages} pages, "
+                f"{self.capacity_units:g} read capacity units")
+
+def scan_items(table, segments=1, stats=None, **params):
+    """Yield every item of a scan of table, a page at a time
+
+    params are Scan parameters as the resource takes them; Limit sets the
+    page size. Pass a ScanStats to have the scan's counts and
+    consumed capacity added to it. With segments > 1, items arrive in no
+    particular order.
+    """
+    client = table.meta.client
+    request = dict(params, TableName=table.name, ReturnConsumedCapacity='TOTAL')
+    if segments <= 1:
+        for response in scan_segment(client, request, threading.Event()):
+            yield from page_items(response, stats)
+        return
+
+    pages = queue.Queue(maxsize=PAGES_IN_FLIGHT * segments)
+    stop = threading.Event()
+
+    def run(segment):
+        try:
+            for response in scan_segment(client, dict(request, Segment=segment, TotalSegments=segments), stop):
+                put(pages, response, stop)
+        except Exception as e:
+            put(pages, e, stop)
+        finally:
+            put(pages, None, stop)
+
+    with ThreadPoolExecutor(segments) as pool:
+        try:
+            for segment in range(segments):
+                pool.submit(run, segment)
+            running = segments
+            while running:
+                response = pages.get()
+                if response is None:
+                    running -= 1
+                elif isinstance(response, Exception):
+                    raise response
+                else:
+                    yield from page_items(response, stats)
+        finally:
+            # The consumer stopped early or a segment failed; let the others finish
+            stop.set()
+
+def scan_segment(client, request, stop):
+    """Responses of one scan (or parallel scan segment), page by page"""
+    while not stop.is_set():
+        response = client.scan(**request)
+        yield response
+        if 'LastEvaluatedKey' not in response:
+            return
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def put(pages, item, stop):
+    """Queue a page for the consumer unless the scan has been stopped"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def page_items(response, stats):
+    if stats is not None:
+        stats.add(response)
+    yield from response.get('Items', [])
@@ -0,0 +1,167 @@
+import json
+from decimal import Decimal
+from common.rollups import parse_timestamp
+from common.sqs_batch import PoisonMessage
+
+# Transactions are validated once, when the SQS record is decoded, so a
+# malformed message is dead-lettered before any stage has written anything.
+# The types are slotted rather than dataclasses (slots=True needs Python
+# 3.10; the functions run on 3.9) to keep a batch of decoded transactions
+# small. Money is decoded straight to Decimal from the JSON text of the number
+# (parse_float), so it is converted exactly once, and derived values are
+# computed on first use and memoized.
+NOT_COMPUTED = object()
+
+class InvalidTransaction(PoisonMessage):
+    """A transaction message that fails validation"""
+
+def _string(data, field, where):
+    value = data.get(field)
+    if type(value) is not str or not value:
+        raise InvalidTransaction(f"{where} field '{field}' is missing or not a string")
+    return value
+
+def _money(data, field, where):
+    # Messages are decoded with parse_float=Decimal; NaN and Infinity stay floats
+    value = data.get(field)
+    if type(value) is int:
+        value = Decimal(value)
+    elif type(value) is not Decimal:
+        raise InvalidTransaction(f"{where} field '{field}' is missing or not a number")
+    if value < 0:
+        raise InvalidTransaction(f"{where} field '{field}' must not be negative")
+    return value
+
+class Address:
+    __slots__ = ('street', 'city', 'state', 'zip')
+
+    def __init__(self, street, city, state, zip):
+        self.street = street
+        self.city = city
+        self.state = state
+        self.zip = zip
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data.get('street'),
+            data.get('city'),
+            _string(data, 'state', 'shipping_address'),
+            data.get('zip')
+        )
+
+    def to_dict(self):
+        return {'street': self.street, 'city': self.city, 'state': self.state, 'zip': self.zip}
+
+class LineItem:
+    __slots__ = ('product_id', 'product_name', 'category', 'price', 'quantity')
+
+    def __init__(self, product_id, product_name, category, price, quantity):
+        self.product_id = product_id
+        self.product_name = product_name
+        self.category = category
+        self.price = price
+        self.quantity = quantity
+
+    @classmethod
+    def from_dict(cls, data):
+        if type(data) is not dict:
+            raise InvalidTransaction("item is not an object")
+        quantity = data.get('quantity')
+        if type(quantity) is not int or quantity <= 0:
+            raise InvalidTransaction("item field 'quantity' is missing or not a positive integer")
+        return cls(
+            _string(data, 'product_id', 'item'),
+            data.get('product_name', ''),
+            data.get('category') or 'unknown',
+            _money(data, 'price', 'item'),
+            quantity
+        )
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+    def to_dict(self):
+        return {
+            'product_id': self.product_id,
+            'product_name': self.product_name,
+            'category': self.category,
+            'price': self.price,
+            'quantity': self.quantity
+        }
+
+class Transaction:
+    """A validated transaction with memoized derived values"""
+
+    __slots__ = ('transaction_id', 'timestamp', 'customer_id', 'items', 'total_amount', 'payment_method',
+                 'shipping_address', '_item_count', '_categories')
+
+    def __init__(self, transaction_id, timestamp, customer_id, items, total_amount, payment_method,
+                 shipping_address):
+        self.transaction_id = transaction_id
+        self.timestamp = timestamp
+        self.customer_id = customer_id
+        self.items = items
+        self.total_amount = total_amount
+        self.payment_method = payment_method
+        self.shipping_address = shipping_address
+        self._item_count = NOT_COMPUTED
+        self._categories = NOT_COMPUTED
+
+    @classmethod
+    def from_message(cls, message):
+        """Validate a decoded transaction message; raises InvalidTransaction"""
+        if type(message) is not dict:
+            raise InvalidTransaction("transaction message is not an object")
+        timestamp = _string(message, 'timestamp', 'transaction')
+        try:
+            parse_timestamp(timestamp)
+        except ValueError:
+            raise InvalidTransaction(f"transaction timestamp '{timestamp}' is not ISO-8601")
+        items = message.get('items')
+        if type(items) is not list or not items:
+            raise InvalidTransaction("transaction field 'items' is missing or empty")
+        address = message.get('shipping_address')
+        if type(address) is not dict:
+            raise InvalidTransaction("transaction field 'shipping_address' is missing or not an object")
+
+        return cls(
+            _string(message, 'transaction_id', 'transaction'),
+            timestamp,
+            _string(message, 'customer_id', 'transaction'),
+            [LineItem.from_dict(item) for item in items],
+            _money(message, 'total_amount', 'transaction'),
+            message.get('payment_method'),
+            Address.from_dict(address)
+        )
+
+    @property
+    def item_count(self):
+        """Total units ordered"""
+        if self._item_count is NOT_COMPUTED:
+            self._item_count = sum(item.quantity for item in self.items)
+        return self._item_count
+
+    @property
+    def average_item_price(self):
+        return self.total_amount / self.item_count
+
+    @property
+    def categories(self):
+        """Distinct item categories, in order of first appearance"""
+        if self._categories is NOT_COMPUTED:
+            self._categories = list(dict.fromkeys(item.category for item in self.items))
+        return self._categories
+
+    def items_as_dicts(self):
+        return [item.to_dict() for item in self.items]
+
+def transaction_message(record):
+    """Decode and validate the transaction carried in an SQS record (SqsBatchRunner decode)"""
+    try:
+        body = json.loads(record['body'])
+        message = json.loads(body['Message'], parse_float=Decimal)
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidTransaction(f"undecodable SNS message: {str(e)}")
+    return Transaction.from_message(message)
@@ -0,0 +1,396 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from common.customer_stats import update_purchase_stats
+from common.idempotency import LEDGER_TABLE, IdempotencyLedger
+from common.inventory_pool import InventoryPool
+from common.order_log import CUSTOMER_RECORD, ORDER_RECORD
+from common.rfm import BoundaryCache, rfm_label, rfm_scores
+from common.segmentation import SegmentationEngine, record_segment_change
+
+# The per-transaction work of the order, customer and inventory consumers.
+# Each stage writes its own state and returns the EventBridge entries it wants
+# published. The stages run either one per Lambda (OrderProcessor,
+# CustomerAnalytics and InventoryTracker, each behind its own SQS queue) or all
+# together in TransactionPipeline, over a single decode of each transaction
+# and with a single PutEvents flush.
+EVENT_BUS_NAME = 'default'  # Use the default event bus or specify a custom one
+MAX_PUT_EVENTS_ENTRIES = 10
+CUSTOMER_TABLE_NAME = 'CustomerProfiles'
+CUSTOMER_INSIGHTS_TABLE = 'CustomerInsights'
+INVENTORY_TABLE_NAME = 'InventoryStatus'
+
+def decimal_default(obj):
+    """Helper function to convert Decimal to float for JSON serialization"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
+
+def event_entry(source, detail_type, data):
+    """A PutEvents entry; Decimal values are sent as floats"""
+    return {
+        'Source': source,
+        'DetailType': detail_type,
+        'Detail': json.dumps(data, default=decimal_default),
+        'EventBusName': EVENT_BUS_NAME
+    }
+
+class EventPublisher:
+    """Publishes event entries with as few PutEvents calls as possible"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def publish(self, entries):
+        for start in range(0, len(entries), MAX_PUT_EVENTS_ENTRIES):
+            response = self.events.put_events(Entries=entries[start:start + MAX_PUT_EVENTS_ENTRIES])
+            if response.get('FailedEntryCount', 0):
+                # Retried as a whole; consumers of these events are idempotent
+                raise RuntimeError(f"EventBridge rejected {response['FailedEntryCount']} of "
+                                   f"{len(entries[start:start + MAX_PUT_EVENTS_ENTRIES])} entries")
+
+class TransactionBatch:
+    """Runs stages over the decoded transactions of one SQS batch and publishes their events together
+
+    Each stage claims the transaction in the idempotency ledger under its own
+    consumer name, so switching between the split and unified layouts never
+    reprocesses a transaction; one that another delivery is still processing
+    raises ClaimInProgress and is retried. A stage's claim is completed as
+    soon as its writes are durable, with its events as the claim's outbox:
+    right after process() for most stages, and after flush() for a stage that
+    buffers writes over the batch (deferred_writes, the order archive). The
+    outboxes are then sent in as few PutEvents calls as possible and cleared,
+    with those of any claims a stage makes per part of the transaction
+    (outbox_ids, the inventory lines).
+    If publishing fails, the batch is retried and each redelivery publishes
+    the outbox it finds instead of writing again. Only claims whose writes
+    never happened are released.
+    """
+
+    def __init__(self, stages, publisher, context=None):
+        self.stages = stages
+        self.publisher = publisher
+        self.context = context
+        self.unflushed = []  # (stage, transaction, entries) awaiting the stage's flush
+        self.outbox = []  # (stage, ledger ids to clear, entries) of completed claims, awaiting publishing
+
+    def process(self, transaction):
+        """Run the stages over a validated Transaction (common.transaction_model)"""
+        transaction_id = transaction.transaction_id
+
+        for stage in self.stages:
+            if not stage.ledger.claim(transaction_id):
+                # Completed, but its events may not have gone out
+                entries = stage.ledger.outbox(transaction_id)
+                if entries:
+                    self.outbox.append((stage, stage.outbox_ids(transaction), entries))
+                else:
+                    print(f"Skipping transaction already processed by {stage.consumer}: {transaction_id}")
+                continue
+            try:
+                entries = stage.process(transaction, self.context)
+            except Exception as e:
+                stage.ledger.release(transaction_id)
+                raise e
+            if stage.deferred_writes:
+                self.unflushed.append((stage, transaction, entries))
+            else:
+                stage.ledger.complete(transaction_id, entries)
+                self.outbox.append((stage, stage.outbox_ids(transaction), entries))
+
+    def flush(self):
+        unflushed, self.unflushed = self.unflushed, []
+        for stage in self.stages:
+            if not stage.deferred_writes:
+                continue
+            claims = [(transaction, entries) for owner, transaction, entries in unflushed if owner is stage]
+            try:
+                stage.flush()
+            except Exception as e:
+                # Nothing of these transactions was written, so redeliveries process them again
+                for transaction, _ in claims:
+                    stage.ledger.release(transaction.transaction_id)
+                raise e
+            for transaction, entries in claims:
+                stage.ledger.complete(transaction.transaction_id, entries)
+                self.outbox.append((stage, stage.outbox_ids(transaction), entries))
+
+        outbox, self.outbox = self.outbox, []
+        # On failure the outboxes stay on the claims for the redeliveries
+        self.publisher.publish([entry for _, _, entries in outbox for entry in entries])
+        for stage in self.stages:
+            stage.ledger.clear_outboxes([ledger_id for owner, ledger_ids, _ in outbox if owner is stage
+                                         for ledger_id in ledger_ids])
+
+class OrderStage:
+    """Prepares the order_processed event"""
+
+    consumer = 'order_processor'
+    # The archive is written once per batch, in flush()
+    deferred_writes = True
+
+    def __init__(self, dynamodb, order_log=None, archive=None):
+        # Redelivered transactions are skipped rather than published twice
+        self.ledger = IdempotencyLedger(dynamodb.Table(LEDGER_TABLE), self.consumer)
+        # Set in the "stream" aggregation mode (common.order_log)
+        self.order_log = order_log
+        # Append-only order history for metric rebuilds (common.order_archive)
+        self.archive = archive
+        self.unarchived = []
+
+    def process(self, transaction, context=None):
+        print(f"Processing transaction: {transaction.transaction_id}")
+
+        # Extract order information
+        order_data = {
+            "transaction_id": transaction.transaction_id,
+            "timestamp": transaction.timestamp,
+            "customer_id": transaction.customer_id,
+            "items": transaction.items_as_dicts(),
+            "total_amount": transaction.total_amount,
+            "payment_method": transaction.payment_method
+        }
+
+        # Add order processing details
+        order_data["processing_timestamp"] = context.invoked_function_arn if context else None
+        order_data["status"] = "processed"
+        order_data["shipping_state"] = transaction.shipping_address.state
+        order_data["fulfillment_center"] = assign_fulfillment_center(transaction.shipping_address.state)
+
+        # Calculate metrics
+        order_data["item_count"] = transaction.item_count
+        order_data["avg_item_price"] = transaction.average_item_price
+
+        # Sales metrics are aggregated by business_logic, from either the
+        # order_processed event or the order log, so no metrics write happens here
+        if self.order_log:
+            self.order_log.append(ORDER_RECORD, transaction.transaction_id, order_data)
+        if self.archive:
+            self.unarchived.append(order_data)
+        return [event_entry('com.ecommerce.orders', 'order_processed', order_data)]
+
+    def outbox_ids(self, transaction):
+        """Ledger ids whose outboxes are published with the transaction's events"""
+        return [transaction.transaction_id]
+
+    def flush(self):
+        """Append the batch's orders to the archive, one file per order date"""
+        orders, self.unarchived = self.unarchived, []
+        if orders:
+            # A failure retries the batch; the archive's readers drop the duplicates
+            self.archive.append(orders)
+
+def assign_fulfillment_center(state):
+    """Assign an order to a fulfillment center based on the shipping state"""
+    # East coast states
+    east_coast = ["NY", "NJ", "PA", "MA", "CT", "RI", "NH", "ME", "VT", "DE", "MD", "VA", "NC", "SC", "GA", "FL"]
+    # West coast states
+    west_coast = ["CA", "OR", "WA", "NV", "AZ"]
+
+    if state in east_coast:
+        return "fc_east_001"
+    elif state in west_coast:
+        return "fc_west_001"
+    else:  # central or any other
+        return "fc_central_001"
+
+class CustomerStage:
+    """Updates the customer profile and prepares the customer_analyzed event"""
+
+    consumer = 'customer_analytics'
+    deferred_writes = False
+
+    def __init__(self, dynamodb, rfm_boundaries_ttl_seconds, order_log=None):
+        self.dynamodb = dynamodb
+        # Redelivered transactions must not be counted into the profile twice
+        self.ledger = IdempotencyLedger(dynamodb.Table(LEDGER_TABLE), self.consumer)
+        # Set in the "stream" aggregation mode (common.order_log)
+        self.order_log = order_log
+        # Segment, recommendation and campaign rules (common/segmentation_rules.json)
+        self.segmentation = SegmentationEngine()
+        # RFM quintile boundaries, refreshed nightly by the re-segmentation job
+        self.rfm_boundaries = BoundaryCache(rfm_boundaries_ttl_seconds)
+
+    def flush(self):
+        """Nothing is buffered over a batch"""
+
+    def outbox_ids(self, transaction):
+        """Ledger ids whose outboxes are published with the transaction's events"""
+        return [transaction.transaction_id]
+
+    def process(self, transaction, context=None):
+        # Analyze customer data
+        customer_data = self.analyze_customer(transaction.customer_id, transaction)
+
+        # The conditional log append goes first: once the profile is written
+        # the claim must not be released, or a retry would count it twice
+        if self.order_log:
+            self.order_log.append(CUSTOMER_RECORD, transaction.transaction_id, customer_data)
+
+        # Update customer profile in DynamoDB
+        self.update_customer_profile(customer_data)
+        return [event_entry('com.ecommerce.customers', 'customer_analyzed', customer_data)]
+
+    def analyze_customer(self, customer_id, transaction):
+        """Analyze customer data from transaction"""
+        # Get current date for cohort analysis
+        current_date = datetime.now()
+        year_month = f"{current_date.year}-{current_date.month:02d}"
+
+        # Extract customer data from transaction
+        customer_data = {
+            "customer_id": customer_id,
+            "last_purchase_date": transaction.timestamp,
+            "last_purchase_amount": transaction.total_amount,
+            "last_transaction_id": transaction.transaction_id,
+            "payment_method": transaction.payment_method,
+            "shipping_state": transaction.shipping_address.state,
+            "purchase_categories": list(transaction.categories),
+            "year_month_cohort": year_month
+        }
+
+        # Get the existing customer profile. Treating the customer as new on a
+        # read error would overwrite their profile, so errors propagate and the
+        # record is retried.
+        table = self.dynamodb.Table(CUSTOMER_TABLE_NAME)
+        existing_customer = table.get_item(Key={'customer_id': customer_id}).get('Item', {})
+        if existing_customer:
+            # Update analytics data - using Decimal for monetary values
+            customer_data["total_purchases"] = existing_customer.get("total_purchases", 0) + 1
+            customer_data["total_spent"] = Decimal(str(existing_customer.get("total_spent", 0))) + transaction.total_amount
+            customer_data["average_order_value"] = Decimal(str(customer_data["total_spent"] / customer_data["total_purchases"]))
+
+            # Calculate days since first purchase for customer lifetime
+            customer_data["first_purchase_date"] = existing_customer.get("first_purchase_date", transaction.timestamp)
+
+            # Combine categories
+            existing_categories = existing_customer.get("purchase_categories", [])
+            customer_data["purchase_categories"] = list(dict.fromkeys(existing_categories + customer_data["purchase_categories"]))
+
+            # Keep the latest purchase date if events arrive out of order
+            customer_data["last_purchase_date"] = max(existing_customer.get("last_purchase_date", ""), transaction.timestamp)
+
+            # Determine if this is a repeat customer
+            customer_data["customer_type"] = "repeat"
+        else:
+            # New customer
+            customer_data["total_purchases"] = 1
+            customer_data["total_spent"] = transaction.total_amount
+            customer_data["average_order_value"] = transaction.total_amount
+            customer_data["first_purchase_date"] = transaction.timestamp
+            customer_data["customer_type"] = "new"
+
+        # Running statistics for RFM and lifetime value, updated in O(1) per order
+        customer_data.update(update_purchase_stats(existing_customer, transaction.timestamp, transaction.total_amount))
+        self.score_customer(customer_data)
+
+        return customer_data
+
+    def score_customer(self, customer_data):
+        """Set RFM scores, segment and campaign eligibility as of this order"""
+        boundaries = self.rfm_boundaries.get(self.dynamodb.Table(CUSTOMER_INSIGHTS_TABLE))
+        # The customer has just ordered, so recency is zero days
+        scores = rfm_scores([0], [float(customer_data["total_purchases"])], [float(customer_data["total_spent"])], boundaries)
+        values = {name: int(score[0]) for name, score in scores.items()}
+
+        result = self.segmentation.evaluate_one(dict(customer_data, recency_days=0, **values))
+        customer_data.update(values)
+        customer_data["rfm_score"] = str(rfm_label(scores)[0])
+        customer_data["segment"] = result["segment"]
+        customer_data["recommended_products"] = result["recommended_products"]
+        customer_data["eligible_campaigns"] = result["eligible_campaigns"]
+
+    def update_customer_profile(self, customer_data):
+        """Update customer profile in DynamoDB"""
+        table = self.dynamodb.Table(CUSTOMER_TABLE_NAME)
+
+        # Add timestamp for the update
+        customer_data["last_updated"] = datetime.now().isoformat()
+
+        # Put the item in the table; the old image tells us the previous segment
+        response = table.put_item(Item=customer_data, ReturnValues='ALL_OLD')
+        print(f"Updated customer profile: {customer_data['customer_id']}")
+
+        try:
+            previous_segment = response.get('Attributes', {}).get('segment')
+            record_segment_change(self.dynamodb.Table(CUSTOMER_INSIGHTS_TABLE), previous_segment, customer_data['segment'])
+        except Exception as e:
+            # The nightly re-segmentation resets the counters, so don't fail the order
+            print(f"Error updating segment distribution: {str(e)}")
+        return response
+
+class InventoryStage:
+    """Decrements stock and prepares inventory_alert and inventory_updated events"""
+
+    consumer = 'inventory_tracker'
+    deferred_writes = False
+
+    def __init__(self, dynamodb):
+        self.dynamodb = dynamodb
+        # Redelivered transactions must not decrement stock twice
+        self.ledger = IdempotencyLedger(dynamodb.Table(LEDGER_TABLE), self.consumer)
+        self.pool = InventoryPool(dynamodb.Table(INVENTORY_TABLE_NAME))
+
+    def flush(self):
+        """Nothing is buffered over a batch"""
+
+    def outbox_ids(self, transaction):
+        """Ledger ids whose outboxes are published with the transaction's events: its own and its lines'"""
+        return [transaction.transaction_id] + [
+            line_id(transaction.transaction_id, position) for position in range(len(transaction.items) - 1)
+        ]
+
+    def process(self, transaction, context=None):
+        entries = []
+        # Process each item in the order. A retried line (a throttled product
+        # is converted to a pool and retried) must not take the lines before
+        # it twice, so each of them is claimed on its own; the transaction's
+        # claim covers the last line.
+        last = len(transaction.items) - 1
+        for position, item in enumerate(transaction.items):
+            if position == last:
+                entries.extend(line_entries(self.update_inventory(item)))
+            else:
+                entries.extend(self.reserve_line(line_id(transaction.transaction_id, position), item))
+
+        # Send a summary event
+        summary = {
+            "transaction_id": transaction.transaction_id,
+            "timestamp": transaction.timestamp,
+            "items_processed": len(transaction.items),
+            "inventory_updated": True
+        }
+        entries.append(event_entry('com.ecommerce.inventory', 'inventory_updated', summary))
+        return entries
+
+    def reserve_line(self, line_id, item):
+        """Take a line's units once per line; returns its event entries"""
+        if not self.ledger.claim(line_id):
+            # Taken by an earlier delivery, which stored the line's entries
+            return self.ledger.outbox(line_id)
+        try:
+            entries = line_entries(self.update_inventory(item))
+        except Exception as e:
+            self.ledger.release(line_id)
+            raise e
+        self.ledger.complete(line_id, entries)
+        return entries
+
+    def update_inventory(self, item):
+        """Take an order line's units from a product's stock in DynamoDB"""
+        try:
+            return self.pool.reserve(item)
+        except Exception as e:
+            print(f"Error updating inventory for product {item.product_id}: {str(e)}")
+            raise e
+
+def line_id(transaction_id, position):
+    """Ledger id of an order line's own claim"""
+    return f"{transaction_id}#line{position}"
+
+def line_entries(inventory_status):
+    """The alert event for a line that left its product low on stock"""
+    # Pooled products are alerted on by the inventory rebalancer, from their aggregate
+    if inventory_status.get('inventory_status') == 'low':
+        return [event_entry('com.ecommerce.inventory', 'inventory_alert', inventory_status)]
+    return []
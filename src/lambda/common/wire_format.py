@@ -0,0 +1,96 @@
+import base64
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# What the dashboard endpoints put on the wire. A response body of at least
+# COMPRESSION_MIN_BYTES is compressed with the best content coding the
+# client's Accept-Encoding allows and returned base64 encoded with
+# isBase64Encoded set; API Gateway, which lists */* as a binary media type,
+# sends it on as binary. Smaller bodies fit in a packet or two and go out as
+# they are. br needs the brotli package (common/requirements.txt); where it
+# is missing only gzip is offered.
+#
+# Since API Gateway treats every media type as binary, it also passes request
+# bodies base64 encoded; request_body undoes that.
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # the higher qualities are meant for static assets, not per-request bodies
+
+ENCODERS = {'gzip': lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL)}
+if brotli is not None:
+    ENCODERS['br'] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+PREFERENCE = ('br', 'gzip')  # for encodings the client weights equally
+
+def header(headers, name):
+    """A request header's value; API Gateway keeps the client's capitalization"""
+    name = name.lower()
+    return next((value for key, value in (headers or {}).items() if key.lower() == name), None)
+
+def accepted_encodings(headers):
+    """Content codings of the Accept-Encoding header mapped to their q-values"""
+    encodings = {}
+    for part in (header(headers, 'Accept-Encoding') or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        encodings[coding] = weight
+    return encodings
+
+def choose_encoding(headers):
+    """The content coding to compress a response with, or None to send it as is"""
+    accepted = accepted_encodings(headers)
+    weights = {coding: accepted.get(coding, accepted.get('*', 0.0)) for coding in PREFERENCE if coding in ENCODERS}
+    weights = {coding: weight for coding, weight in weights.items() if weight > 0}
+    if not weights:
+        return None
+    return max(weights, key=lambda coding: (weights[coding], -PREFERENCE.index(coding)))
+
+def encode_response(response, headers, min_bytes=COMPRESSION_MIN_BYTES):
+    """Compress a proxy integration response for the client that sent headers
+
+    Responses whose body is under min_bytes are returned unchanged. Larger
+    ones vary with Accept-Encoding, so they say so to caches even when sent
+    uncompressed.
+    """
+    body = response.get('body')
+    if not isinstance(body, str) or response.get('isBase64Encoded'):
+        return response
+    data = body.encode('utf-8')
+    if len(data) < min_bytes:
+        return response
+
+    encoded = dict(response, headers=dict(response.get('headers') or {}, Vary='Accept-Encoding'))
+    coding = choose_encoding(headers)
+    if coding is not None:
+        encoded['headers']['Content-Encoding'] = coding
+        encoded['body'] = base64.b64encode(ENCODERS[coding](data)).decode('ascii')
+        encoded['isBase64Encoded'] = True
+    return encoded
+
+def columnar(items):
+    """A list of items as one list per field, fields in the order they first appear
+
+    An item without a field has None in its place.
+    """
+    fields = dict.fromkeys(field for item in items for field in item)
+    return {field: [item.get(field) for item in items] for field in fields}
+
+def request_body(event):
+    """A proxy integration request's body as text, base64 decoded if need be"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
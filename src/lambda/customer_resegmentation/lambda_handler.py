@@ -0,0 +1,488 @@
+import json
+import boto3
+import gzip
+import os
+import random
+import time
+import numpy as np
+from datetime import datetime
+from decimal import Decimal
+from multiprocessing import Pipe, Process
+from botocore.exceptions import ClientError
+from common.rfm import days_since, load_boundaries, quintile_boundaries, rfm_label, rfm_scores, save_boundaries
+from common.segmentation import SegmentationEngine, marketing_record, save_segment_distribution
+
+# Initialize clients (worker processes create their own after the fork)
+dynamodb = boto3.resource('dynamodb')
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+CUSTOMER_TABLE_NAME = os.environ.get('CUSTOMER_TABLE', 'CustomerProfiles')
+INSIGHTS_TABLE_NAME = os.environ.get('INSIGHTS_TABLE', 'CustomerInsights')
+
+# AppFlow export location
+S3_BUCKET = os.environ.get('APPFLOW_BUCKET', 'lukebowm-appflow-data')
+SOURCE_PREFIX = "source-data/"
+MANIFEST_PREFIX = "manifests/"
+STAGING_PREFIX = "staging/resegmentation/"
+
+# Parallel scan layout: TOTAL_SEGMENTS scan segments shared by PARALLELISM processes
+TOTAL_SEGMENTS = int(os.environ.get('TOTAL_SEGMENTS', '16'))
+PARALLELISM = int(os.environ.get('PARALLELISM', '4'))
+SCAN_PAGE_LIMIT = int(os.environ.get('SCAN_PAGE_LIMIT', '1000'))
+# Workers stop starting new pages this long before the Lambda times out
+DEADLINE_MARGIN_SECONDS = int(os.environ.get('DEADLINE_MARGIN_SECONDS', '60'))
+
+# RFM quintiles are refreshed at the start of each run from a sample of
+# RFM_SAMPLE_SEGMENTS random scan segments out of RFM_SAMPLE_TOTAL_SEGMENTS
+RFM_SAMPLE_TOTAL_SEGMENTS = int(os.environ.get('RFM_SAMPLE_TOTAL_SEGMENTS', '100'))
+RFM_SAMPLE_SEGMENTS = int(os.environ.get('RFM_SAMPLE_SEGMENTS', '2'))
+RFM_SAMPLE_SIZE = int(os.environ.get('RFM_SAMPLE_SIZE', '20000'))
+# Below this many profiles the previous boundaries are kept
+RFM_MIN_SAMPLE = 100
+
+# Run state and per-segment LastEvaluatedKey checkpoints live in one CustomerInsights item
+CHECKPOINT_KEY = 'job#resegmentation'
+# S3 multipart parts must be at least 5 MB, except the last
+MULTIPART_CHUNK_BYTES = 8 * 1024 * 1024
+
+PROFILE_FIELDS = [
+    'customer_id', 'customer_type', 'total_spent', 'total_purchases', 'purchase_categories',
+    'last_purchase_date', 'segment', 'rfm_score', 'eligible_campaigns'
+]
+
+# Segment, recommendation and campaign rules (common/segmentation_rules.json)
+segmentation = SegmentationEngine()
+
+def lambda_handler(event, context):
+    """
+    Nightly re-segmentation of every customer profile:
+    1. Reads CustomerProfiles with a parallel scan, spreading the scan segments over worker processes
+    2. Recomputes RFM scores, segments and campaign eligibility page by page
+    3. Writes back only the profiles whose results changed, and stages them for export
+    4. Once every segment is done, concatenates the staged pages into one file for AppFlow
+
+    Each worker checkpoints its segment's LastEvaluatedKey after every page.
+    If the invocation runs out of time, it re-invokes itself to resume the run,
+    and a scheduled invocation also resumes an unfinished run.
+    """
+    try:
+        state = load_or_start_run()
+        pending = [int(segment) for segment, progress in state['segments'].items() if not progress['done']]
+        deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS
+
+        totals = run_workers(state, sorted(pending), deadline)
+        print(f"Run {state['run_id']}: scanned {totals['scanned']} profiles, "
+              f"{totals['changed']} changed, over {totals['pages']} pages")
+
+        state = load_run()
+        remaining = [segment for segment, progress in state['segments'].items() if not progress['done']]
+        if remaining:
+            if totals['pages'] == 0:
+                raise RuntimeError("No scan progress before the deadline; increase the timeout or lower the margin")
+            continue_run(context, state['run_id'])
+            return {
+                "statusCode": 202,
+                "body": json.dumps({
+                    "message": f"Run {state['run_id']} continuing, {len(remaining)} segments remaining"
+                })
+            }
+
+        manifest = export_compacted(state)
+        save_segment_distribution(dynamodb.Table(INSIGHTS_TABLE_NAME), total_segment_counts(state))
+        complete_run(state['run_id'], manifest)
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "message": f"Run {state['run_id']} complete, exported {manifest['record_count']} changed customers",
+                "manifest": manifest['manifest_key']
+            })
+        }
+
+    except Exception as e:
+        print(f"Error re-segmenting customers: {str(e)}")
+        raise e
+
+def load_run():
+    insights = dynamodb.Table(INSIGHTS_TABLE_NAME)
+    return insights.get_item(Key={'insight_key': CHECKPOINT_KEY}, ConsistentRead=True).get('Item')
+
+def load_or_start_run():
+    """Resume the unfinished run if there is one, otherwise start a new run"""
+    state = load_run()
+    if state and state.get('status') == 'running':
+        print(f"Resuming run {state['run_id']}")
+        return state
+
+    started_at = datetime.now()
+    boundaries = refresh_rfm_boundaries(started_at)
+    state = {
+        'insight_key': CHECKPOINT_KEY,
+        'insight_type': 'job',
+        'run_id': started_at.strftime('%Y%m%dT%H%M%S'),
+        'status': 'running',
+        'started_at': started_at.isoformat(),
+        # Fixed for the whole run: parallel scan segments depend on it
+        'total_segments': TOTAL_SEGMENTS,
+        'rfm_boundaries': {
+            name: [Decimal(str(round(value, 2))) for value in values]
+            for name, values in boundaries.items()
+        },
+        'segments': {
+            str(segment): {'done': False, 'last_key': None, 'pages': 0, 'scanned': 0, 'changed': 0, 'segment_counts': {}}
+            for segment in range(TOTAL_SEGMENTS)
+        }
+    }
+    dynamodb.Table(INSIGHTS_TABLE_NAME).put_item(Item=state)
+    print(f"Started run {state['run_id']} over {TOTAL_SEGMENTS} scan segments")
+    return state
+
+def refresh_rfm_boundaries(now):
+    """Recompute RFM quintile boundaries from a sample of profiles
+
+    A parallel scan segment is a hash range of the table, so a few random
+    segments out of many make a cheap, roughly uniform sample.
+    """
+    customers = dynamodb.Table(CUSTOMER_TABLE_NAME)
+    insights = dynamodb.Table(INSIGHTS_TABLE_NAME)
+    items = []
+    for segment in random.sample(range(RFM_SAMPLE_TOTAL_SEGMENTS), RFM_SAMPLE_SEGMENTS):
+        params = {
+            'Segment': segment,
+            'TotalSegments': RFM_SAMPLE_TOTAL_SEGMENTS,
+            'ProjectionExpression': 'last_purchase_date, total_purchases, total_spent'
+        }
+        while len(items) < RFM_SAMPLE_SIZE:
+            response = customers.scan(**params)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    if len(items) < RFM_MIN_SAMPLE:
+        print(f"Only {len(items)} profiles sampled; keeping the current RFM boundaries")
+        return load_boundaries(insights)
+
+    items = items[:RFM_SAMPLE_SIZE]
+    boundaries = quintile_boundaries(
+        days_since([item.get('last_purchase_date') for item in items], now),
+        [float(item.get('total_purchases') or 0) for item in items],
+        [float(item.get('total_spent') or 0) for item in items]
+    )
+    save_boundaries(insights, boundaries, len(items))
+    print(f"Refreshed RFM boundaries from {len(items)} sampled profiles: {boundaries}")
+    return boundaries
+
+def run_workers(state, pending, deadline):
+    """Scan the pending segments with up to PARALLELISM processes; returns combined totals"""
+    workers = max(1, min(PARALLELISM, len(pending)))
+    assignments = [pending[i::workers] for i in range(workers)]
+    if workers == 1:
+        return scan_segments(state, assignments[0], deadline)
+
+    # Lambda has no /dev/shm, so multiprocessing.Pool and its queues are not
+    # available; plain processes reporting back over pipes are
+    processes = []
+    for segments in assignments:
+        parent_conn, child_conn = Pipe(duplex=False)
+        process = Process(target=worker_main, args=(child_conn, state, segments, deadline))
+        process.start()
+        child_conn.close()
+        processes.append((process, parent_conn))
+
+    totals = {'pages': 0, 'scanned': 0, 'changed': 0}
+    errors = []
+    for process, parent_conn in processes:
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            result = {'error': 'worker exited without reporting'}
+        process.join()
+        if 'error' in result:
+            errors.append(result['error'])
+            continue
+        for field in totals:
+            totals[field] += result[field]
+
+    if errors:
+        raise RuntimeError(f"{len(errors)} scan workers failed: {'; '.join(errors)}")
+    return totals
+
+def worker_main(conn, state, segments, deadline):
+    """Entry point of a worker process"""
+    global dynamodb, s3
+    # boto3 sessions are not safe to share across a fork
+    session = boto3.session.Session()
+    dynamodb = session.resource('dynamodb')
+    s3 = session.client('s3')
+    try:
+        conn.send(scan_segments(state, segments, deadline))
+    except Exception as e:
+        conn.send({'error': f"segments {segments}: {str(e)}"})
+    finally:
+        conn.close()
+
+def scan_segments(state, segments, deadline):
+    totals = {'pages': 0, 'scanned': 0, 'changed': 0}
+    for segment in segments:
+        if time.time() >= deadline:
+            break
+        progress = scan_segment(state, segment, deadline)
+        for field in totals:
+            totals[field] += progress['run_' + field]
+    return totals
+
+def scan_segment(state, segment, deadline):
+    """Scan one segment page by page from its checkpoint until it is done or time runs out"""
+    customers = dynamodb.Table(CUSTOMER_TABLE_NAME)
+    now = datetime.fromisoformat(state['started_at'])
+    boundaries = {name: [float(value) for value in values] for name, values in state['rfm_boundaries'].items()}
+    progress = dict(state['segments'][str(segment)])
+    segment_counts = {name: int(count) for name, count in progress.get('segment_counts', {}).items()}
+    run_totals = {'run_pages': 0, 'run_scanned': 0, 'run_changed': 0}
+    names = {f"#{field}": field for field in PROFILE_FIELDS}
+
+    while not progress['done'] and time.time() < deadline:
+        params = {
+            'Segment': segment,
+            'TotalSegments': int(state['total_segments']),
+            'Limit': SCAN_PAGE_LIMIT,
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }
+        if progress['last_key']:
+            params['ExclusiveStartKey'] = progress['last_key']
+        response = customers.scan(**params)
+        items = response.get('Items', [])
+
+        segments, changed = resegment_page(items, now, boundaries)
+        if changed:
+            # Staged under a key fixed by the page number, so a page repeated
+            # after a crash overwrites its earlier copy
+            stage_records(state['run_id'], segment, int(progress['pages']), [record for _, _, record in changed])
+            write_profiles(customers, changed)
+
+        progress['last_key'] = response.get('LastEvaluatedKey')
+        progress['done'] = progress['last_key'] is None
+        progress['pages'] = int(progress['pages']) + 1
+        progress['scanned'] = int(progress['scanned']) + len(items)
+        progress['changed'] = int(progress['changed']) + len(changed)
+        for name in segments:
+            segment_counts[name] = segment_counts.get(name, 0) + 1
+        progress['segment_counts'] = dict(segment_counts)
+        save_progress(segment, progress)
+
+        run_totals['run_pages'] += 1
+        run_totals['run_scanned'] += len(items)
+        run_totals['run_changed'] += len(changed)
+
+    progress.update(run_totals)
+    return progress
+
+def resegment_page(items, now, boundaries):
+    """Recompute RFM scores and segments for a page
+
+    Returns the new segment of every profile, and (item, updates, export record)
+    for the profiles that changed.
+    """
+    if not items:
+        return [], []
+    columns = segmentation.columns_from_records(items)
+    recency_days = days_since([item.get('last_purchase_date') for item in items], now)
+    frequency = np.fromiter((float(item.get('total_purchases') or 0) for item in items), dtype=np.float64, count=len(items))
+    monetary = np.fromiter((float(item.get('total_spent') or 0) for item in items), dtype=np.float64, count=len(items))
+    scores = rfm_scores(recency_days, frequency, monetary, boundaries)
+
+    # Derived fields are available to the rules alongside the stored ones
+    columns.numeric['recency_days'] = recency_days
+    for name, values in scores.items():
+        columns.numeric[name] = values.astype(np.float64)
+    results = segmentation.evaluate(columns)
+    labels = rfm_label(scores)
+
+    updated_at = now.isoformat()
+    changed = []
+    for row, item in enumerate(items):
+        segment = str(results['segment'][row])
+        campaigns = list(results['eligible_campaigns'][row])
+        rfm_score = str(labels[row])
+        if (item.get('segment') == segment and item.get('rfm_score') == rfm_score
+                and list(item.get('eligible_campaigns') or []) == campaigns):
+            continue
+
+        updates = {
+            'segment': segment,
+            'rfm_score': rfm_score,
+            'recency_score': int(scores['recency_score'][row]),
+            'frequency_score': int(scores['frequency_score'][row]),
+            'monetary_score': int(scores['monetary_score'][row]),
+            'recommended_products': list(results['recommended_products'][row]),
+            'eligible_campaigns': campaigns,
+            'segmented_at': updated_at
+        }
+        result = {field: results[field][row] for field in results}
+        record = marketing_record(item, result, updated_at)
+        record['rfm_score'] = rfm_score
+        changed.append((item, updates, record))
+    return [str(segment) for segment in results['segment']], changed
+
+def write_profiles(customers, changed):
+    """Set the recomputed fields on changed profiles, leaving everything else untouched"""
+    for item, updates, _ in changed:
+        names = {f"#{field}": field for field in updates}
+        try:
+            customers.update_item(
+                Key={'customer_id': item['customer_id']},
+                UpdateExpression="SET " + ', '.join(f"#{field} = :{field}" for field in updates),
+                # Don't resurrect profiles deleted since the scan
+                ConditionExpression="attribute_exists(customer_id)",
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={f":{field}": value for field, value in updates.items()}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise e
+
+def save_progress(segment, progress):
+    """Checkpoint one segment; each worker only ever writes its own segments' entries"""
+    dynamodb.Table(INSIGHTS_TABLE_NAME).update_item(
+        Key={'insight_key': CHECKPOINT_KEY},
+        UpdateExpression="SET segments.#segment = :progress, updated_at = :now",
+        ExpressionAttributeNames={'#segment': str(segment)},
+        ExpressionAttributeValues={
+            ':progress': {
+                field: progress[field]
+                for field in ('done', 'last_key', 'pages', 'scanned', 'changed', 'segment_counts')
+            },
+            ':now': datetime.now().isoformat()
+        }
+    )
+
+def stage_records(run_id, segment, page, records):
+    """Write one page of changed customers as a gzip JSON Lines staging object"""
+    body = gzip.compress("".join(json.dumps(record, default=decimal_default) + "\n" for record in records).encode('utf-8'))
+    s3.put_object(
+        Bucket=S3_BUCKET,
+        Key=f"{STAGING_PREFIX}{run_id}/segment-{segment:04d}-page-{page:06d}.jsonl.gz",
+        Body=body,
+        ContentType='application/x-ndjson',
+        ContentEncoding='gzip'
+    )
+
+def export_compacted(state):
+    """Concatenate the staged pages into one gzip JSON Lines file for AppFlow, plus a manifest
+
+    Concatenated gzip members form a valid gzip stream, so the staged objects
+    are joined without decompressing them.
+    """
+    run_id = state['run_id']
+    staging = f"{STAGING_PREFIX}{run_id}/"
+    record_count = sum(int(progress['changed']) for progress in state['segments'].values())
+    keys = [
+        obj['Key']
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=S3_BUCKET, Prefix=staging)
+        for obj in page.get('Contents', [])
+    ]
+    manifest = {
+        "batch_id": f"resegmentation-{run_id}",
+        "created_at": datetime.now().isoformat(),
+        "record_count": record_count,
+        "parts": [],
+        "manifest_key": f"{MANIFEST_PREFIX}resegmentation-{run_id}.manifest.json"
+    }
+
+    if keys:
+        export_key = f"{SOURCE_PREFIX}resegmentation-{run_id}.jsonl.gz"
+        upload = s3.create_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=export_key,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip'
+        )
+        try:
+            parts = []
+            size = 0
+            buffer = bytearray()
+            for key in sorted(keys):
+                buffer += s3.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read()
+                if len(buffer) >= MULTIPART_CHUNK_BYTES:
+                    parts.append(upload_chunk(export_key, upload['UploadId'], len(parts) + 1, buffer))
+                    size += len(buffer)
+                    buffer = bytearray()
+            if buffer or not parts:
+                parts.append(upload_chunk(export_key, upload['UploadId'], len(parts) + 1, buffer))
+                size += len(buffer)
+            s3.complete_multipart_upload(
+                Bucket=S3_BUCKET,
+                Key=export_key,
+                UploadId=upload['UploadId'],
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception as e:
+            s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=export_key, UploadId=upload['UploadId'])
+            raise e
+
+        print(f"Exported {record_count} changed customers to s3://{S3_BUCKET}/{export_key}")
+        manifest['parts'].append({"key": export_key, "records": record_count, "bytes": size})
+
+        # Staging objects are only needed until the compacted file exists
+        for start in range(0, len(keys), 1000):
+            s3.delete_objects(
+                Bucket=S3_BUCKET,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+
+    # The manifest lives outside the AppFlow source prefix so it is not imported
+    s3.put_object(
+        Bucket=S3_BUCKET,
+        Key=manifest['manifest_key'],
+        Body=json.dumps(manifest),
+        ContentType='application/json'
+    )
+    return manifest
+
+def upload_chunk(key, upload_id, part_number, body):
+    response = s3.upload_part(
+        Bucket=S3_BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=bytes(body)
+    )
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+def total_segment_counts(state):
+    """Exact customers per segment over the whole run"""
+    counts = {}
+    for progress in state['segments'].values():
+        for name, count in progress.get('segment_counts', {}).items():
+            counts[name] = counts.get(name, 0) + int(count)
+    return counts
+
+def complete_run(run_id, manifest):
+    dynamodb.Table(INSIGHTS_TABLE_NAME).update_item(
+        Key={'insight_key': CHECKPOINT_KEY},
+        UpdateExpression="SET #status = :complete, completed_at = :now, manifest_key = :manifest",
+        ConditionExpression="run_id = :run_id",
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':complete': 'complete',
+            ':now': datetime.now().isoformat(),
+            ':manifest': manifest['manifest_key'],
+            ':run_id': run_id
+        }
+    )
+
+def continue_run(context, run_id):
+    """Re-invoke this function asynchronously to pick up from the checkpoints"""
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'run_id': run_id})
+    )
+    print(f"Run {run_id} out of time; re-invoked {context.function_name} to continue")
+
+def decimal_default(obj):
+    """Helper function to convert Decimal to float for JSON serialization"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
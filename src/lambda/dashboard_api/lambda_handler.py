@@ -1,8 +1,22 @@
+import base64
+import binascii
 import json
 import boto3
 import os
 from datetime import datetime, timedelta
 from decimal import Decimal
+from common.heavy_hitters import read_top
+from common.inventory_pool import PRODUCTS_FILTER, read_status_counts
+from common.live_updates import LIVE_SOURCE, broadcast
+from common.bucket_sketches import SKETCH_TYPES, summarize_items
+from common.projections import attributes_to_read, parse_fields, projection, sparse
+from common.rfm import load_boundaries
+from common.ring_buffer import RINGS, read_window
+from common.rollups import batch_get_buckets, date_value, fan_in_shards, metric_keys_between, month_value, week_value
+from common.segmentation import read_segment_distribution
+from common.sharded_counters import SHARD_COUNT_ATTRIBUTE
+from common.table_scan import ScanStats, scan_items
+from common.wire_format import columnar, encode_response, request_body
 
 # Initialize DynamoDB client
 dynamodb = boto3.resource('dynamodb')
@@ -11,8 +25,96 @@ CUSTOMER_INSIGHTS_TABLE = 'CustomerInsights'
 INVENTORY_STATUS_TABLE = 'InventoryStatus'
 NOTIFICATIONS_TABLE = 'Notifications'
 
+# Live dashboards hold a WebSocket connection to the live API, registered in
+# CONNECTIONS_TABLE until they disconnect. API Gateway closes a connection
+# after two hours at most, so a record left by a missed disconnect expires.
+CONNECTIONS_TABLE = 'DashboardConnections'
+CONNECTION_TTL_SECONDS = 2 * 60 * 60
+live_api = boto3.client('apigatewaymanagementapi', endpoint_url=os.environ.get('LIVE_UPDATES_ENDPOINT'))
+
+# /api/inventory pages through a category with the CategoryIndex (category,
+# product_id) instead of scanning the catalogue. A status filter can leave a
+# read short, so a page takes up to INVENTORY_MAX_READS reads to fill.
+INVENTORY_CATEGORY_INDEX = 'CategoryIndex'
+INVENTORY_PAGE_SIZE = 50
+INVENTORY_MAX_PAGE_SIZE = 500
+INVENTORY_MAX_READS = 10
+
+# Notifications scan the whole catalogue for low stock, in parallel segments
+NOTIFICATION_SCAN_SEGMENTS = 4
+# Inventory reports list the whole catalogue, not a page of it
+REPORT_SCAN_SEGMENTS = 4
+
+# Fields each endpoint returns per item, read with a ProjectionExpression;
+# fields= narrows a response to some of them. The sales summary fields are
+# computed from the buckets' sketches, which are only read when one of them
+# is returned.
+SALES_FIELDS = ('metric_key', 'time_unit', 'time_value', 'total_sales', 'transaction_count', 'item_count',
+                'categories', 'uniqueCustomers', 'orderValuePercentiles', 'last_updated')
+SALES_SUMMARY_FIELDS = ('uniqueCustomers', 'orderValuePercentiles')
+COHORT_FIELDS = ('cohort', 'customer_count', 'total_revenue', 'new_customers', 'repeat_customers', 'last_updated')
+INVENTORY_FIELDS = ('product_id', 'product_name', 'category', 'stock_level', 'inventory_status', 'last_updated')
+NOTIFICATION_ATTRIBUTES = ('product_id', 'product_name', 'stock_level', 'last_updated')
+
+# The dashboard homepage charts daily totals only
+SUMMARY_SALES_FIELDS = ('time_value', 'total_sales', 'transaction_count', 'item_count')
+
+# Shapes of a sales series: a list of items, or one list per field
+# ({"time_value": [...], "total_sales": [...]}), which names each field once
+SALES_FORMATS = ('rows', 'columnar')
+
 def lambda_handler(event, context):
-    """Handler for Dashboard API Gateway requests"""
+    """Handler for Dashboard API Gateway requests, live API connections and metric changes"""
+    # Metric changes published by business_logic, for the live dashboards
+    if event.get('source') == LIVE_SOURCE:
+        return broadcast_changes(event['detail'])
+    
+    # Live API connects and disconnects
+    if 'connectionId' in (event.get('requestContext') or {}):
+        return handle_connection(event['requestContext'])
+    
+    # Large bodies go out compressed when the client accepts it
+    return encode_response(route_request(event), event.get('headers'))
+
+def handle_connection(request_context):
+    """Register or forget a live dashboard's connection"""
+    table = dynamodb.Table(CONNECTIONS_TABLE)
+    connection_id = request_context['connectionId']
+    route = request_context.get('routeKey')
+    
+    if route == '$connect':
+        now = datetime.now()
+        table.put_item(Item={
+            'connection_id': connection_id,
+            'connected_at': now.isoformat(),
+            'expires_at': int(now.timestamp()) + CONNECTION_TTL_SECONDS
+        })
+    elif route == '$disconnect':
+        table.delete_item(Key={'connection_id': connection_id})
+    
+    # The channel only pushes; messages from dashboards are ignored
+    return {'statusCode': 200}
+
+def broadcast_changes(detail):
+    """Post a metrics_changed event's changes to every connected dashboard"""
+    table = dynamodb.Table(CONNECTIONS_TABLE)
+    connections = [item['connection_id'] for item in scan_items(table, **projection(['connection_id']))]
+    message = json.dumps({
+        'type': 'changes',
+        'changes': detail.get('changes', []),
+        'publishedAt': detail.get('published_at')
+    }, separators=(',', ':')).encode('utf-8')
+    
+    gone = broadcast(live_api, connections, message)
+    for connection_id in gone:
+        table.delete_item(Key={'connection_id': connection_id})
+    
+    print(f"Sent {len(detail.get('changes', []))} metric changes to {len(connections) - len(gone)} dashboards; "
+          f"removed {len(gone)} closed connections")
+    return {'connections': len(connections) - len(gone), 'removed': len(gone)}
+
+def route_request(event):
+    """Response to a Dashboard API request, before content encoding"""
     try:
         # Get the HTTP method and path
         http_method = event.get('httpMethod', 'GET')
@@ -27,18 +129,33 @@ def lambda_handler(event, context):
                 # Get sales metrics
                 time_unit = query_params.get('timeUnit', 'day')
                 period = query_params.get('period', 'last7')
-                return get_sales_metrics(time_unit, period)
+                fields = parse_fields(query_params.get('fields'), SALES_FIELDS)
+                shape = query_params.get('format', 'rows')
+                if shape not in SALES_FORMATS:
+                    raise ValueError(f"format must be one of: {', '.join(SALES_FORMATS)}")
+                return get_sales_metrics(time_unit, period, fields, shape)
+                
+            elif path == '/api/sales/top':
+                # Get approximate best sellers
+                by = query_params.get('by', 'product')
+                period = query_params.get('period', 'today')
+                limit = int(query_params.get('limit', 10))
+                return get_top_sellers(by, period, limit)
                 
             elif path == '/api/customers':
                 # Get customer insights
                 cohort = query_params.get('cohort', None)
-                return get_customer_insights(cohort)
+                fields = parse_fields(query_params.get('fields'), COHORT_FIELDS)
+                return get_customer_insights(cohort, fields)
                 
             elif path == '/api/inventory':
-                # Get inventory status
+                # Get a page of inventory status
                 status = query_params.get('status', None)
                 category = query_params.get('category', None)
-                return get_inventory_status(status, category)
+                limit = int(query_params.get('limit', INVENTORY_PAGE_SIZE))
+                next_token = query_params.get('nextToken', None)
+                fields = parse_fields(query_params.get('fields'), INVENTORY_FIELDS)
+                return get_inventory_status(status, category, limit, next_token, fields)
                 
             elif path == '/api/notifications':
                 # Get recent notifications
@@ -67,7 +184,7 @@ def lambda_handler(event, context):
         elif http_method == 'POST' and path == '/api/reports':
             # Generate report
             try:
-                body = json.loads(event.get('body', '{}'))
+                body = json.loads(request_body(event) or '{}')
                 return generate_report(body)
             except Exception as e:
                 print(f"Error parsing request body: {str(e)}")
@@ -94,6 +211,19 @@ def lambda_handler(event, context):
             })
         }
         
+    except ValueError as e:
+        # Malformed query parameters (limit, fields, format)
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': f"Invalid query parameters: {str(e)}"
+            })
+        }
+        
     except Exception as e:
         print(f"Error processing API request: {str(e)}")
         return {
@@ -107,9 +237,17 @@ def lambda_handler(event, context):
             })
         }
 
-def get_sales_metrics(time_unit, period):
-    """Get sales metrics for the specified time period"""
+def get_sales_metrics(time_unit, period, fields=None, shape='rows'):
+    """Get sales metrics for the specified time period, optionally only some fields of each item
+
+    shape is 'rows' for a list of items or 'columnar' for one list per field.
+    """
     table = dynamodb.Table(SALES_METRICS_TABLE)
+    fields = fields or SALES_FIELDS
+    
+    # Intraday series are served from the ring buffer items
+    if time_unit in RINGS:
+        return get_intraday_sales(table, time_unit, period, fields, shape)
     
     # Define the time range based on the period
     today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -133,27 +271,26 @@ def get_sales_metrics(time_unit, period):
     
     print(f"Querying sales data from {start_date_str} to today")
     
-    # Map time_unit to the correct prefix
-    prefix_map = {
-        'day': 'date#',
-        'week': 'week#',
-        'month': 'month#'
+    # Map time_unit to the SalesMetrics time unit
+    time_unit_map = {
+        'day': 'date',
+        'week': 'week',
+        'month': 'month'
     }
     
-    prefix = prefix_map.get(time_unit, 'date#')
+    # Read what the date filter and shard fan-in need, the fields returned
+    # and, for the summary fields, the sketches
+    required = ['metric_key', 'time_value', SHARD_COUNT_ATTRIBUTE]
+    if any(field in SALES_SUMMARY_FIELDS for field in fields):
+        required.extend(SKETCH_TYPES)
+    attributes = attributes_to_read([field for field in fields if field not in SALES_SUMMARY_FIELDS], required)
     
-    # Scan the table for items with the correct prefix and time_unit
+    # The period's buckets have known keys, so fetch them directly instead of
+    # scanning the table
     try:
-        response = table.scan(
-            FilterExpression="begins_with(metric_key, :prefix) AND time_unit = :time_unit_val",
-            ExpressionAttributeValues={
-                ':prefix': prefix,
-                ':time_unit_val': 'date' if time_unit == 'day' else time_unit
-            }
-        )
-        
-        items = response.get('Items', [])
-        print(f"Found {len(items)} items with prefix {prefix}")
+        keys = metric_keys_between(time_unit_map[time_unit], start_date, today) if time_unit in time_unit_map else []
+        items = batch_get_buckets(dynamodb, SALES_METRICS_TABLE, keys, attributes)
+        print(f"Found {len(items)} of {len(keys)} {time_unit} items")
         
         # Filter by date range and sort
         filtered_items = []
@@ -195,17 +332,27 @@ def get_sales_metrics(time_unit, period):
         # Sort by time value
         filtered_items.sort(key=lambda x: x.get('time_value', ''))
         
+        # Daily counters are spread over shard items; add them up
+        fan_in_shards(dynamodb, SALES_METRICS_TABLE, filtered_items, attributes)
+        
         # Add debug data to check what's happening
         for item in filtered_items:
             print(f"Including item: time_value={item.get('time_value', 'N/A')}, "
                   f"metric_key={item.get('metric_key', 'N/A')}, "
                   f"total_sales={item.get('total_sales', 'N/A')}")
         
+        # Replace the binary sketches with distinct-customer and percentile
+        # estimates, and merge them for the whole period
+        period_summary = summarize_items(filtered_items)
+        sparse(filtered_items, fields)
+        
         # Format response
         result = {
             'period': period,
             'timeUnit': time_unit,
-            'data': filtered_items
+            'uniqueCustomers': period_summary.get('uniqueCustomers'),
+            'orderValuePercentiles': period_summary.get('orderValuePercentiles'),
+            'data': columnar(filtered_items) if shape == 'columnar' else filtered_items
         }
         
         return {
@@ -230,9 +377,109 @@ def get_sales_metrics(time_unit, period):
             })
         }
 
-def get_customer_insights(cohort=None):
-    """Get customer insights, optionally filtered by cohort"""
+def get_intraday_sales(table, time_unit, period, fields=SALES_FIELDS, shape='rows'):
+    """Get today's sales by hour or the last 60 minutes by minute with a single read"""
+    try:
+        now = datetime.now()
+        series = read_window(table, time_unit, now)
+        
+        # The hour ring covers a rolling 24 hours; the live view only shows today
+        if time_unit == 'hour':
+            today_str = now.strftime('%Y-%m-%d')
+            series = [slot for slot in series if slot['time_value'].startswith(today_str)]
+        sparse(series, fields)
+        
+        result = {
+            'period': period,
+            'timeUnit': time_unit,
+            'data': columnar(series) if shape == 'columnar' else series
+        }
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(result, default=decimal_default)
+        }
+        
+    except Exception as e:
+        print(f"Error getting intraday sales: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': f"Error getting intraday sales: {str(e)}"
+            })
+        }
+
+def get_top_sellers(by, period, limit=10):
+    """Get approximate best-selling products or categories from one leaderboard item"""
+    # Map the period to the leaderboard bucket it is stored under
+    now = datetime.now()
+    period_map = {
+        'today': ('date', date_value(now)),
+        'week': ('week', week_value(now)),
+        'month': ('month', month_value(now))
+    }
+    
+    if by not in ('product', 'category') or period not in period_map:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': "by must be product or category and period must be today, week or month"
+            })
+        }
+    
+    try:
+        time_unit, time_value = period_map[period]
+        leaderboard = read_top(dynamodb.Table(SALES_METRICS_TABLE), by, time_unit, time_value, limit)
+        
+        # Counts are units sold. Each count overestimates the true value by at
+        # most its error, and no error exceeds errorBound.
+        result = {
+            'by': by,
+            'period': period,
+            'timeValue': time_value,
+            'totalUnits': leaderboard['total'],
+            'errorBound': leaderboard['errorBound'],
+            'data': leaderboard['top']
+        }
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(result, default=decimal_default)
+        }
+        
+    except Exception as e:
+        print(f"Error getting top sellers: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': f"Error getting top sellers: {str(e)}"
+            })
+        }
+
+def get_customer_insights(cohort=None, fields=None):
+    """Get customer insights, optionally filtered by cohort or to some fields of each cohort"""
     table = dynamodb.Table(CUSTOMER_INSIGHTS_TABLE)
+    read_fields = projection(fields or COHORT_FIELDS)
     
     try:
         if cohort:
@@ -240,7 +487,8 @@ def get_customer_insights(cohort=None):
             response = table.get_item(
                 Key={
                     'insight_key': f"cohort#{cohort}"
-                }
+                },
+                **read_fields
             )
             
             item = response.get('Item', {})
@@ -250,21 +498,27 @@ def get_customer_insights(cohort=None):
                 'data': item
             }
         else:
-            # Get all cohorts
-            response = table.scan(
+            # Get all cohorts, every page of them
+            stats = ScanStats()
+            items = list(scan_items(
+                table,
+                stats=stats,
                 FilterExpression="begins_with(insight_key, :prefix)",
                 ExpressionAttributeValues={
                     ':prefix': 'cohort#'
-                }
-            )
-            
-            items = response.get('Items', [])
+                },
+                **read_fields
+            ))
+            print(f"Scanned cohorts: {stats}")
             
             # Sort by cohort
             items.sort(key=lambda x: x.get('cohort', ''))
             
+            # Segment counters and RFM boundaries are single items, so no profile scan
             result = {
-                'cohorts': items
+                'cohorts': items,
+                'segmentDistribution': read_segment_distribution(table),
+                'rfmBoundaries': load_boundaries(table)
             }
         
         return {
@@ -289,46 +543,84 @@ def get_customer_insights(cohort=None):
             })
         }
 
-def get_inventory_status(status=None, category=None):
-    """Get inventory status, optionally filtered by status or category"""
+def get_inventory_status(status=None, category=None, limit=INVENTORY_PAGE_SIZE, next_token=None, fields=None):
+    """Get a page of inventory status, optionally filtered by status or category
+
+    A category is read from the CategoryIndex in product_id order; without
+    one, the table is scanned a page at a time. nextToken continues from
+    the previous page. Only the fields returned are read. Product counts
+    per category and status come from the counters item, not from the
+    items read.
+    """
     table = dynamodb.Table(INVENTORY_STATUS_TABLE)
     
     try:
-        filter_expression = None
-        expression_values = {}
-        
-        if status:
-            filter_expression = "inventory_status = :status"
-            expression_values[':status'] = status
+        try:
+            start_key = decode_page_token(next_token) if next_token else None
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': json.dumps({
+                    'error': 'Invalid nextToken'
+                })
+            }
+        limit = max(1, min(limit, INVENTORY_MAX_PAGE_SIZE))
         
+        kwargs = projection(fields or INVENTORY_FIELDS)
+        expression_values = {}
+        filters = []
         if category:
-            if filter_expression:
-                filter_expression += " AND category = :category"
-            else:
-                filter_expression = "category = :category"
+            # Pool shards and the counters item have no category, so the
+            # index holds products only
+            read = table.query
+            kwargs['IndexName'] = INVENTORY_CATEGORY_INDEX
+            kwargs['KeyConditionExpression'] = "category = :category"
             expression_values[':category'] = category
-        
-        if filter_expression:
-            response = table.scan(
-                FilterExpression=filter_expression,
-                ExpressionAttributeValues=expression_values
-            )
         else:
-            response = table.scan()
+            read = table.scan
+            filters.append(PRODUCTS_FILTER)
         
-        items = response.get('Items', [])
+        if status:
+            filters.append("inventory_status = :status")
+            expression_values[':status'] = status
         
-        # Group by category
-        categories = {}
-        for item in items:
-            item_category = item.get('category', 'unknown')
-            if item_category not in categories:
-                categories[item_category] = []
-            categories[item_category].append(item)
+        if filters:
+            kwargs['FilterExpression'] = " AND ".join(filters)
+        if expression_values:
+            kwargs['ExpressionAttributeValues'] = expression_values
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        
+        items = []
+        last_key = None
+        for _ in range(INVENTORY_MAX_READS):
+            kwargs['Limit'] = limit - len(items)
+            response = read(**kwargs)
+            items.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if last_key is None or len(items) >= limit:
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+        
+        counts = read_status_counts(table)
+        matching = {category: counts.get(category, {})} if category else counts
+        total_items = sum(
+            count
+            for statuses in matching.values()
+            for item_status, count in statuses.items()
+            if not status or item_status == status
+        )
         
         result = {
-            'categories': categories,
-            'totalItems': len(items)
+            'items': items,
+            'count': len(items),
+            'nextToken': encode_page_token(last_key) if last_key else None,
+            'totalItems': total_items,
+            'statusCounts': counts
         }
         
         return {
@@ -353,21 +645,39 @@ def get_inventory_status(status=None, category=None):
             })
         }
 
+def encode_page_token(key):
+    """An opaque nextToken for a LastEvaluatedKey"""
+    return base64.urlsafe_b64encode(json.dumps(key, default=decimal_default).encode('utf-8')).decode('ascii')
+
+def decode_page_token(token):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError):
+        raise ValueError("invalid page token")
+    if not isinstance(key, dict) or not all(isinstance(value, str) for value in key.values()):
+        raise ValueError("invalid page token")
+    return key
+
 def get_notifications(notification_type=None, limit=10):
     """Get recent notifications, optionally filtered by type"""
     # For this demo, we'll create mock notifications from inventory alerts
     table = dynamodb.Table(INVENTORY_STATUS_TABLE)
     
     try:
-        # Get items with low stock
-        response = table.scan(
+        # Get items with low stock, every page of them, with just the
+        # attributes a notification shows
+        stats = ScanStats()
+        low_stock_items = list(scan_items(
+            table,
+            segments=NOTIFICATION_SCAN_SEGMENTS,
+            stats=stats,
             FilterExpression="inventory_status = :status",
             ExpressionAttributeValues={
                 ':status': 'low'
-            }
-        )
-        
-        low_stock_items = response.get('Items', [])
+            },
+            **projection(NOTIFICATION_ATTRIBUTES)
+        ))
+        print(f"Scanned inventory for low stock: {stats}")
         
         # Convert to notifications
         notifications = []
@@ -415,16 +725,15 @@ def get_dashboard_summary():
     """Get a summary of data for the dashboard homepage"""
     try:
         # Get recent sales data (last 7 days)
-        sales_response = get_sales_metrics('day', 'last7')
+        sales_response = get_sales_metrics('day', 'last7', SUMMARY_SALES_FIELDS)
         sales_data = json.loads(sales_response['body']) if sales_response['statusCode'] == 200 else {}
         
         # Get customer insights
         customer_response = get_customer_insights()
         customer_data = json.loads(customer_response['body']) if customer_response['statusCode'] == 200 else {}
         
-        # Get inventory status
-        inventory_response = get_inventory_status('low')
-        inventory_data = json.loads(inventory_response['body']) if inventory_response['statusCode'] == 200 else {}
+        # Low stock products are counted on the counters item
+        inventory_counts = read_status_counts(dynamodb.Table(INVENTORY_STATUS_TABLE))
         
         # Get recent notifications
         notification_response = get_notifications(limit=5)
@@ -434,7 +743,7 @@ def get_dashboard_summary():
         summary = {
             'recentSales': sales_data.get('data', []),
             'customerCohorts': customer_data.get('cohorts', []),
-            'lowInventoryItems': inventory_data.get('totalItems', 0),
+            'lowInventoryItems': sum(statuses.get('low', 0) for statuses in inventory_counts.values()),
             'recentNotifications': notification_data.get('notifications', [])
         }
         
@@ -460,6 +769,20 @@ def get_dashboard_summary():
             })
         }
 
+def inventory_report():
+    """Every product's inventory status, read with a full scan rather than one page"""
+    table = dynamodb.Table(INVENTORY_STATUS_TABLE)
+    stats = ScanStats()
+    items = list(scan_items(table, segments=REPORT_SCAN_SEGMENTS, stats=stats, FilterExpression=PRODUCTS_FILTER,
+                            **projection(INVENTORY_FIELDS)))
+    print(f"Scanned inventory for report: {stats}")
+    items.sort(key=lambda item: item['product_id'])
+    return {
+        'items': items,
+        'count': len(items),
+        'statusCounts': read_status_counts(table)
+    }
+
 def generate_report(request_body):
     """Generate a report based on the request parameters"""
     try:
@@ -483,11 +806,7 @@ def generate_report(request_body):
             report_data = json.loads(customer_response['body'])
             
         elif report_type == 'inventory':
-            inventory_response = get_inventory_status()
-            if inventory_response['statusCode'] != 200:
-                return inventory_response
-            
-            report_data = json.loads(inventory_response['body'])
+            report_data = inventory_report()
             
         else:
             return {
@@ -536,7 +855,10 @@ def generate_report(request_body):
         }
 
 def decimal_default(obj):
-    """Helper function to convert Decimal to float for JSON serialization"""
+    """Helper function to convert Decimal to int or float for JSON serialization
+
+    Whole numbers (counts, stock levels) are written without a trailing .0.
+    """
     if isinstance(obj, Decimal):
-        return float(obj)
+        return float(obj) if obj % 1 else int(obj)
     raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
\ No newline at end of file
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import boto3
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import pyarrow as pa
+import pyarrow.compute as pc
+from common.data_lake import TABLES, money, partition_keys, read_file
+from common.wire_format import encode_response, request_body
+
+# Initialize S3 client
+s3 = boto3.client('s3')
+
+# Serves POST /api/query: a constrained group-by/filter/aggregate spec over
+# the orders data lake (common.data_lake), run with Arrow compute. Only the
+# date partitions in the spec's range are listed and read, and of those only
+# the columns the spec uses.
+DATA_LAKE_BUCKET = os.environ.get('DATA_LAKE_BUCKET', '')
+READ_THREADS = int(os.environ.get('QUERY_READ_THREADS', '16'))
+MAX_DAYS = int(os.environ.get('QUERY_MAX_DAYS', '400'))
+MAX_ROWS = int(os.environ.get('QUERY_MAX_ROWS', '1000'))
+
+# Results are cached by spec hash, in the container and in the bucket under
+# query-cache/. Ranges reaching yesterday still change as late orders arrive
+# and hours are compacted, so they expire sooner than closed ranges.
+CACHE_PREFIX = 'query-cache/'
+CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', '300'))
+CLOSED_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CLOSED_CACHE_TTL_SECONDS', '86400'))
+CACHE_ENTRIES = int(os.environ.get('QUERY_CACHE_ENTRIES', '256'))
+
+# Dimensions derived from order_timestamp, next to the tables' own columns.
+# Rows are grouped on dates, which are cheap to compute; only the grouped
+# keys are formatted (strftime over every row costs seconds per million).
+DERIVED = {
+    'date': lambda timestamps: pc.cast(timestamps, pa.date32()),
+    'month': lambda timestamps: pc.cast(pc.floor_temporal(timestamps, unit='month'), pa.date32()),
+    'hour': lambda timestamps: pc.hour(timestamps)
+}
+DERIVED_FORMATS = {
+    'date': lambda dates: pc.strftime(dates, format='%Y-%m-%d'),
+    'month': lambda dates: pc.strftime(dates, format='%Y-%m')
+}
+FUNCTIONS = {'count', 'count_distinct', 'sum', 'avg', 'min', 'max'}
+# Arrow only has sum and mean kernels for numbers; the others take any column
+NUMERIC_FUNCTIONS = {'sum', 'avg'}
+ARROW_FUNCTIONS = {'avg': 'mean'}
+OPERATORS = {
+    '=': lambda field, value: field == value,
+    '!=': lambda field, value: field != value,
+    '<': lambda field, value: field < value,
+    '<=': lambda field, value: field <= value,
+    '>': lambda field, value: field > value,
+    '>=': lambda field, value: field >= value
+}
+
+class QueryError(ValueError):
+    """A spec the endpoint does not accept"""
+
+def lambda_handler(event, context):
+    """Handler for POST /api/query"""
+    try:
+        try:
+            spec = parse_spec(json.loads(request_body(event) or '{}'))
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            return response(400, {'error': f"Invalid query spec: {str(e)}"})
+        return encode_response(response(200, cached_query(spec)), event.get('headers'))
+
+    except Exception as e:
+        print(f"Error running query: {str(e)}")
+        return response(500, {'error': f"Internal server error: {str(e)}"})
+
+def response(status_code, body):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(body, default=json_default)
+    }
+
+def json_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
+
+def parse_spec(body):
+    """Validate a query spec and fill in its defaults, so equal queries hash the same
+
+    {
+      "table": "orders" | "line_items",
+      "from": "YYYY-MM-DD", "to": "YYYY-MM-DD",           (order dates, inclusive)
+      "filters": [{"column": "shipping_state", "op": "in", "value": ["CA", "NY"]}],
+      "groupBy": ["shipping_state", "date"],
+      "aggregates": [{"fn": "sum", "column": "total_amount", "as": "revenue"}],
+      "orderBy": [{"column": "revenue", "desc": true}],
+      "limit": 100
+    }
+    """
+    if not isinstance(body, dict):
+        raise QueryError("the spec must be a JSON object")
+    table_name = body.get('table', 'orders')
+    if table_name not in TABLES:
+        raise QueryError(f"table must be one of {', '.join(TABLES)}")
+    schema = TABLES[table_name][0]
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    first, last = body.get('from'), body.get('to', today)
+    try:
+        span = (datetime.strptime(last, '%Y-%m-%d') - datetime.strptime(first, '%Y-%m-%d')).days
+    except (TypeError, ValueError):
+        raise QueryError("from and to must be dates (YYYY-MM-DD)")
+    if not 0 <= span < MAX_DAYS:
+        raise QueryError(f"from must not be after to, and the range must cover fewer than {MAX_DAYS} days")
+
+    filters = []
+    for condition in body.get('filters', []):
+        column, op, value = condition.get('column'), condition.get('op', '='), condition.get('value')
+        if column not in schema.names:
+            raise QueryError(f"unknown filter column: {column}")
+        if op == 'in':
+            if not isinstance(value, list) or not value:
+                raise QueryError(f"{column} in needs a non-empty list of values")
+            value = [typed_value(schema.field(column), item) for item in value]
+        elif op in OPERATORS:
+            value = typed_value(schema.field(column), value)
+        else:
+            raise QueryError(f"unknown operator: {op}")
+        filters.append({'column': column, 'op': op, 'value': value})
+
+    group_by = list(body.get('groupBy', []))
+    for column in group_by:
+        if column not in schema.names and column not in DERIVED:
+            raise QueryError(f"unknown groupBy column: {column}")
+
+    aggregates = []
+    for aggregate in body.get('aggregates') or [{'fn': 'count'}]:
+        fn, column = aggregate.get('fn'), aggregate.get('column')
+        if fn not in FUNCTIONS:
+            raise QueryError(f"unknown aggregate: {fn}")
+        if column is None and fn != 'count':
+            raise QueryError(f"{fn} needs a column")
+        if column is not None and column not in schema.names:
+            raise QueryError(f"unknown aggregate column: {column}")
+        if fn in NUMERIC_FUNCTIONS and not is_numeric(schema.field(column).type):
+            raise QueryError(f"{fn} needs a numeric column, not {column} ({schema.field(column).type})")
+        aggregates.append({'fn': fn, 'column': column,
+                           'as': aggregate.get('as') or (f"{fn}_{column}" if column else fn)})
+
+    outputs = group_by + [aggregate['as'] for aggregate in aggregates]
+    if len(set(outputs)) != len(outputs):
+        raise QueryError("groupBy columns and aggregate names must be distinct")
+    order_by = [{'column': order['column'], 'desc': bool(order.get('desc', False))}
+                for order in body.get('orderBy', [])]
+    for order in order_by:
+        if order['column'] not in outputs:
+            raise QueryError(f"orderBy must name a groupBy column or an aggregate: {order['column']}")
+
+    limit = int(body.get('limit', 100))
+    if not 0 < limit <= MAX_ROWS:
+        raise QueryError(f"limit must be between 1 and {MAX_ROWS}")
+
+    return {
+        'table': table_name, 'from': first, 'to': last, 'filters': filters, 'groupBy': group_by,
+        'aggregates': aggregates, 'orderBy': order_by, 'limit': limit
+    }
+
+def is_numeric(data_type):
+    return pa.types.is_integer(data_type) or pa.types.is_decimal(data_type) or pa.types.is_floating(data_type)
+
+def typed_value(field, value):
+    """A filter value as the column's type, so it also hashes the same however it was written"""
+    try:
+        if pa.types.is_decimal(field.type):
+            return money(value)
+        if pa.types.is_integer(field.type):
+            return int(value)
+        if pa.types.is_timestamp(field.type):
+            return datetime.fromisoformat(value).isoformat()
+        return str(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"invalid value for {field.name}: {value!r}")
+
+def spec_hash(spec):
+    canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'), default=json_default)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class QueryCache:
+    """Query results by spec hash: in this container, then shared through the bucket"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = {}  # spec hash -> (expires_at, result)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            try:
+                body = s3.get_object(Bucket=DATA_LAKE_BUCKET, Key=f"{CACHE_PREFIX}{key}.json")['Body'].read()
+                cached = json.loads(body, parse_float=Decimal)
+                entry = (cached['expiresAt'], cached['result'])
+            except Exception:
+                return None
+        if entry[0] <= time.time():
+            self.entries.pop(key, None)
+            return None
+        self.entries[key] = entry
+        return entry[1]
+
+    def put(self, key, result, ttl_seconds):
+        expires_at = time.time() + ttl_seconds
+        if len(self.entries) >= self.max_entries:
+            # Drop the entry closest to expiry
+            self.entries.pop(min(self.entries, key=lambda cached: self.entries[cached][0]))
+        self.entries[key] = (expires_at, result)
+        try:
+            s3.put_object(
+                Bucket=DATA_LAKE_BUCKET,
+                Key=f"{CACHE_PREFIX}{key}.json",
+                Body=json.dumps({'expiresAt': expires_at, 'result': result}, default=json_default),
+                ContentType='application/json'
+            )
+        except Exception as e:
+            # The container's copy still serves repeats
+            print(f"Error caching query {key}: {str(e)}")
+
+cache = QueryCache(CACHE_ENTRIES)
+
+def cached_query(spec):
+    key = spec_hash(spec)
+    result = cache.get(key)
+    if result is not None:
+        return dict(result, cached=True)
+
+    result = run_query(spec)
+    result['specHash'] = key
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    cache.put(key, result, CACHE_TTL_SECONDS if spec['to'] >= yesterday else CLOSED_CACHE_TTL_SECONDS)
+    return dict(result, cached=False)
+
+def filter_expression(schema, filters):
+    expression = None
+    for condition in filters:
+        field = schema.field(condition['column'])
+        if condition['op'] == 'in':
+            term = pc.field(field.name).isin(pa.array([arrow_value(field, value) for value in condition['value']],
+                                                      type=field.type))
+        else:
+            term = OPERATORS[condition['op']](pc.field(field.name),
+                                              pa.scalar(arrow_value(field, condition['value']), type=field.type))
+        expression = term if expression is None else expression & term
+    return expression
+
+def arrow_value(field, value):
+    return datetime.fromisoformat(value) if pa.types.is_timestamp(field.type) else value
+
+def run_query(spec):
+    """Read the spec's partitions and columns, then filter, group, aggregate, sort and limit"""
+    start = time.perf_counter()
+    schema = TABLES[spec['table']][0]
+    derived = [column for column in spec['groupBy'] if column in DERIVED]
+    columns = {column for column in spec['groupBy'] if column not in DERIVED}
+    columns.update(condition['column'] for condition in spec['filters'])
+    columns.update(aggregate['column'] for aggregate in spec['aggregates'] if aggregate['column'])
+    if derived or not columns:
+        columns.add('order_timestamp')
+    columns = [name for name in schema.names if name in columns]
+
+    keys = partition_keys(s3, DATA_LAKE_BUCKET, spec['table'], spec['from'], spec['to'])
+    expression = filter_expression(schema, spec['filters'])
+    with ThreadPoolExecutor(READ_THREADS) as pool:
+        parts = list(pool.map(lambda key: read_file(s3, DATA_LAKE_BUCKET, key, columns), keys))
+    table = pa.concat_tables(parts) if parts else schema.empty_table().select(columns)
+    rows_scanned = table.num_rows
+    # Filtering the concatenated columns once is cheaper than per small file
+    if expression is not None:
+        table = table.filter(expression)
+
+    for column in derived:
+        table = table.append_column(column, DERIVED[column](table.column('order_timestamp')))
+    aggregations = []
+    for aggregate in spec['aggregates']:
+        if aggregate['column'] is None:
+            # count without a column counts rows
+            aggregation = ([], 'count_all')
+        else:
+            aggregation = (aggregate['column'], ARROW_FUNCTIONS.get(aggregate['fn'], aggregate['fn']))
+        if aggregation not in aggregations:
+            aggregations.append(aggregation)
+    result = table.group_by(spec['groupBy']).aggregate(aggregations)
+
+    # Arrow names the outputs <column>_<function>, or count_all
+    outputs = {}
+    for aggregate in spec['aggregates']:
+        function = ARROW_FUNCTIONS.get(aggregate['fn'], aggregate['fn'])
+        outputs[aggregate['as']] = 'count_all' if aggregate['column'] is None else f"{aggregate['column']}_{function}"
+    result = pa.table({
+        **{column: DERIVED_FORMATS.get(column, lambda keys: keys)(result.column(column)) for column in spec['groupBy']},
+        **{name: result.column(output) for name, output in outputs.items()}
+    })
+
+    sort_keys = [(order['column'], 'descending' if order['desc'] else 'ascending') for order in spec['orderBy']]
+    sort_keys += [(column, 'ascending') for column in spec['groupBy'] if column not in dict(sort_keys)]
+    if sort_keys:
+        result = result.sort_by(sort_keys)
+    groups = result.num_rows
+    return {
+        'spec': spec,
+        'columns': result.column_names,
+        'data': result.slice(0, spec['limit']).to_pylist(),
+        'groups': groups,
+        'filesScanned': len(keys),
+        'rowsScanned': rows_scanned,
+        'elapsedMs': round((time.perf_counter() - start) * 1000)
+    }
@@ -0,0 +1,69 @@
+import json
+import boto3
+import os
+from botocore.exceptions import ClientError
+from common.inventory_pool import DEFAULT_POOL_SHARDS, POOL_SHARDS_ATTRIBUTE, convert_to_pool, is_busy, rebalance
+from common.table_scan import scan_items
+from common.transaction_stages import EventPublisher, event_entry
+
+# Initialize clients
+events = boto3.client('events')
+dynamodb = boto3.resource('dynamodb')
+publisher = EventPublisher(events)
+
+INVENTORY_STATUS_TABLE = os.environ.get('INVENTORY_STATUS_TABLE', 'InventoryStatus')
+# Products expected to sell fast (e.g. a planned flash sale) are pooled up
+# front instead of after their first throttled write
+HOT_PRODUCT_IDS = [product_id for product_id in os.environ.get('HOT_PRODUCT_IDS', '').split(',') if product_id]
+POOL_SHARDS = int(os.environ.get('POOL_SHARDS', str(DEFAULT_POOL_SHARDS)))
+
+def lambda_handler(event, context):
+    """Rebalance the reservation pools of hot products and refresh their aggregate stock
+
+    Invoked by a scheduled EventBridge rule. Publishes an inventory_alert for
+    each pooled product whose aggregate stock has just become low.
+    """
+    try:
+        table = dynamodb.Table(INVENTORY_STATUS_TABLE)
+        for product_id in HOT_PRODUCT_IDS:
+            try:
+                convert_to_pool(table, product_id, POOL_SHARDS)
+            except ClientError as e:
+                if not is_busy(e):
+                    raise e
+                print(f"Throttled converting {product_id}; retrying next run")
+
+        entries = []
+        pooled = pooled_products(table)
+        for item in pooled:
+            try:
+                record, became_low = rebalance(dynamodb, INVENTORY_STATUS_TABLE, item['product_id'],
+                                               int(item[POOL_SHARDS_ATTRIBUTE]))
+            except ClientError as e:
+                if not is_busy(e):
+                    raise e
+                print(f"Throttled rebalancing {item['product_id']}; retrying next run")
+                continue
+            print(f"Rebalanced {record['product_id']}: {record['stock_level']} units ({record['inventory_status']})")
+            if became_low:
+                entries.append(event_entry('com.ecommerce.inventory', 'inventory_alert', record))
+        publisher.publish(entries)
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "message": f"Rebalanced {len(pooled)} pooled products, {len(entries)} low stock alerts"
+            })
+        }
+
+    except Exception as e:
+        print(f"Error rebalancing inventory pools: {str(e)}")
+        raise e
+
+def pooled_products(table):
+    """Base items of every pooled product"""
+    return list(scan_items(
+        table,
+        FilterExpression=f"attribute_exists({POOL_SHARDS_ATTRIBUTE})",
+        ProjectionExpression=f"product_id, {POOL_SHARDS_ATTRIBUTE}"
+    ))
@@ -0,0 +1,68 @@
+import json
+import boto3
+import os
+from datetime import datetime, timedelta
+from common.rollups import (
+    BUCKET_TIME_UNIT,
+    compact_rollup,
+    date_value,
+    rollups_for_date
+)
+from common.sharded_counters import base_key
+
+# Initialize DynamoDB client
+dynamodb = boto3.resource('dynamodb')
+SALES_METRICS_TABLE = os.environ.get('SALES_METRICS_TABLE', 'SalesMetrics')
+
+# How many past days a scheduled run re-compacts, to pick up late orders
+SCHEDULED_LOOKBACK_DAYS = int(os.environ.get('SCHEDULED_LOOKBACK_DAYS', '1'))
+
+def lambda_handler(event, context):
+    """Derive week and month SalesMetrics rollups from changed daily buckets
+
+    Invoked either by the SalesMetrics DynamoDB stream (a batch of changed
+    daily buckets) or by a scheduled EventBridge rule as a safety net.
+    """
+    try:
+        if 'Records' in event:
+            changed_dates = changed_dates_from_stream(event['Records'])
+        else:
+            changed_dates = recent_dates(SCHEDULED_LOOKBACK_DAYS)
+
+        # Many buckets in one batch usually map to the same week and month,
+        # so each rollup is only recomputed once per invocation
+        rollups = set()
+        for date_str in changed_dates:
+            rollups.update(rollups_for_date(date_str))
+
+        for time_unit, time_value in sorted(rollups):
+            item = compact_rollup(dynamodb, SALES_METRICS_TABLE, time_unit, time_value)
+            print(f"Compacted {item['metric_key']} from {item['source_buckets']} daily buckets")
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "message": f"Compacted {len(rollups)} rollups from {len(changed_dates)} daily buckets"
+            })
+        }
+
+    except Exception as e:
+        print(f"Error compacting sales metrics: {str(e)}")
+        raise e
+
+def changed_dates_from_stream(records):
+    """Extract the daily bucket dates touched by a batch of stream records"""
+    prefix = f"{BUCKET_TIME_UNIT}#"
+    dates = set()
+    for record in records:
+        key = record.get('dynamodb', {}).get('Keys', {}).get('metric_key', {}).get('S', '')
+        # Rollup rows written by this function also appear on the stream;
+        # counter shards stand for their daily bucket
+        if key.startswith(prefix):
+            dates.add(base_key(key)[len(prefix):])
+    return dates
+
+def recent_dates(lookback_days):
+    """Today's date plus the previous lookback_days dates"""
+    today = datetime.now()
+    return {date_value(today - timedelta(days=offset)) for offset in range(lookback_days + 1)}
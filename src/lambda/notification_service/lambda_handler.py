@@ -2,10 +2,23 @@ import json
 import boto3
 import os
 from datetime import datetime
+from common.sqs_batch import SqsBatchRunner, batch_envelope, eventbridge_message
+
+sqs = boto3.client('sqs')
+
+# With event_delivery = "batched", the events arrive buffered in SQS; poison
+# ones go to the dead-letter queue
+DEAD_LETTER_QUEUE_URL = os.environ.get('DEAD_LETTER_QUEUE_URL')
+runner = SqsBatchRunner('notification_service', sqs, DEAD_LETTER_QUEUE_URL, decode=eventbridge_message)
 
 def lambda_handler(event, context):
-    """Handle various notification events from EventBridge"""
+    """Handle various notification events from EventBridge, one at a time or in SQS batches"""
     try:
+        batch = batch_envelope(event)
+        if batch is not None:
+            notifications = NotificationBatch()
+            return runner.run(batch, notifications.add, flush=notifications.flush)
+        
         # Get event details
         event_source = event['source']
         detail_type = event['detail-type']
@@ -36,8 +49,62 @@ def lambda_handler(event, context):
         print(f"Error processing notification event: {str(e)}")
         raise e
 
+class NotificationBatch:
+    """The notifications of one SQS batch, with one record per recipient and subject
+
+    An inventory alert keeps the latest stock level per product, order
+    confirmations are combined per customer, and a loyalty message keeps the
+    latest totals per customer. The records are written together at flush.
+    """
+
+    def __init__(self):
+        self.alerts = {}  # product_id -> latest alert detail
+        self.orders = {}  # customer_id -> order details
+        self.loyalty = {}  # customer_id -> latest customer detail
+
+    def add(self, message):
+        _, event = message
+        event_source = event['source']
+        detail_type = event['detail-type']
+        detail = event['detail']
+        
+        if event_source == 'com.ecommerce.inventory' and detail_type == 'inventory_alert':
+            self.alerts[detail.get('product_id', 'unknown')] = detail
+        elif event_source == 'com.ecommerce.orders' and detail_type == 'order_processed':
+            self.orders.setdefault(detail.get('customer_id', 'unknown'), []).append(detail)
+        elif event_source == 'com.ecommerce.customers' and detail_type == 'customer_analyzed':
+            if detail.get('customer_type') == 'repeat' and detail.get('total_purchases', 0) > 3:
+                self.loyalty[detail.get('customer_id', 'unknown')] = detail
+
+    def flush(self):
+        notifications = [(product_id, inventory_alert_notification(detail))
+                         for product_id, detail in self.alerts.items()]
+        notifications += [(customer_id, order_confirmation_notification(customer_id, details))
+                          for customer_id, details in self.orders.items()]
+        notifications += [(customer_id, customer_loyalty_notification(detail))
+                          for customer_id, detail in self.loyalty.items()]
+        
+        # A failed write raises, so the whole batch is retried
+        table = boto3.resource('dynamodb').Table('Notifications')
+        with table.batch_writer() as writer:
+            for key, notification in notifications:
+                writer.put_item(Item=notification_item(key=key, **notification))
+        print(f"Logged {len(notifications)} notifications")
+
 def send_inventory_alert(detail):
     """Send notification about low inventory"""
+    log_notification(**inventory_alert_notification(detail))
+
+def send_order_confirmation(detail):
+    """Send order confirmation notification"""
+    log_notification(**order_confirmation_notification(detail.get('customer_id', 'unknown'), [detail]))
+
+def send_customer_loyalty_message(detail):
+    """Send loyalty program message to repeat customers"""
+    log_notification(**customer_loyalty_notification(detail))
+
+def inventory_alert_notification(detail):
+    """Notification about low inventory"""
     product_id = detail.get('product_id', 'unknown')
     product_name = detail.get('product_name', 'unknown')
     stock_level = detail.get('stock_level', 0)
@@ -47,34 +114,34 @@ def send_inventory_alert(detail):
     message = f"INVENTORY ALERT: Product {product_name} (ID: {product_id}) has low stock: {stock_level}. Please reorder."
     print(message)
     
-    # Log the notification to DynamoDB for demonstration
-    log_notification(
-        notification_type="inventory_alert",
-        subject=f"Low Inventory: {product_name}",
-        message=message,
-        recipient="inventory@example.com"
-    )
+    return {
+        'notification_type': "inventory_alert",
+        'subject': f"Low Inventory: {product_name}",
+        'message': message,
+        'recipient': "inventory@example.com"
+    }
 
-def send_order_confirmation(detail):
-    """Send order confirmation notification"""
-    transaction_id = detail.get('transaction_id', 'unknown')
-    customer_id = detail.get('customer_id', 'unknown')
-    total_amount = detail.get('total_amount', 0)
+def order_confirmation_notification(customer_id, details):
+    """Order confirmation for one or more of a customer's orders"""
+    orders = ', '.join(f"#{detail.get('transaction_id', 'unknown')}" for detail in details)
+    total_amount = sum(detail.get('total_amount', 0) for detail in details)
     
     # In a real application, we would send this to the customer via email or SMS
-    message = f"Thank you for your order #{transaction_id}! Your total is ${total_amount:.2f}."
+    if len(details) == 1:
+        message = f"Thank you for your order {orders}! Your total is ${total_amount:.2f}."
+    else:
+        message = f"Thank you for your orders {orders}! Your total is ${total_amount:.2f}."
     print(f"Order confirmation for customer {customer_id}: {message}")
     
-    # Log the notification
-    log_notification(
-        notification_type="order_confirmation",
-        subject=f"Order Confirmation #{transaction_id}",
-        message=message,
-        recipient=f"customer_{customer_id}@example.com"
-    )
+    return {
+        'notification_type': "order_confirmation",
+        'subject': f"Order Confirmation {orders}",
+        'message': message,
+        'recipient': f"customer_{customer_id}@example.com"
+    }
 
-def send_customer_loyalty_message(detail):
-    """Send loyalty program message to repeat customers"""
+def customer_loyalty_notification(detail):
+    """Loyalty program message for a repeat customer"""
     customer_id = detail.get('customer_id', 'unknown')
     total_purchases = detail.get('total_purchases', 0)
     total_spent = detail.get('total_spent', 0)
@@ -87,13 +154,26 @@ def send_customer_loyalty_message(detail):
     )
     print(f"Loyalty message for customer {customer_id}: {message}")
     
-    # Log the notification
-    log_notification(
-        notification_type="customer_loyalty",
-        subject="Thank You for Your Loyalty!",
-        message=message,
-        recipient=f"customer_{customer_id}@example.com"
-    )
+    return {
+        'notification_type': "customer_loyalty",
+        'subject': "Thank You for Your Loyalty!",
+        'message': message,
+        'recipient': f"customer_{customer_id}@example.com"
+    }
+
+def notification_item(notification_type, subject, message, recipient, key=None):
+    """A Notifications record; key tells apart the records of one batch"""
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    notification_id = f"{notification_type}_{key}_{timestamp}" if key else f"{notification_type}_{timestamp}"
+    return {
+        'notification_id': notification_id,
+        'notification_type': notification_type,
+        'subject': subject,
+        'message': message,
+        'recipient': recipient,
+        'status': 'sent',
+        'created_at': datetime.now().isoformat()
+    }
 
 def log_notification(notification_type, subject, message, recipient):
     """Log notification to DynamoDB for demonstration purposes"""
@@ -103,18 +183,6 @@ def log_notification(notification_type, subject, message, recipient):
     
     try:
         # Create a notification record
-        notification_id = f"{notification_type}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        table.put_item(
-            Item={
-                'notification_id': notification_id,
-                'notification_type': notification_type,
-                'subject': subject,
-                'message': message,
-                'recipient': recipient,
-                'status': 'sent',
-                'created_at': datetime.now().isoformat()
-            }
-        )
+        table.put_item(Item=notification_item(notification_type, subject, message, recipient))
     except Exception as e:
         print(f"Error logging notification: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,218 @@
+import io
+import json
+import boto3
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from common.data_lake import FILE_SUFFIX, TABLES, money, partition_prefix, read_file
+from common.rollups import parse_timestamp
+from common.sqs_batch import PoisonMessage, SqsBatchRunner, batch_envelope, eventbridge_message
+
+# Initialize clients
+s3 = boto3.client('s3')
+sqs = boto3.client('sqs')
+
+# Orders and their line items are exported to the data lake bucket in the
+# layout of common.data_lake. Each SQS batch of order_processed events adds a
+# part-<ms>-<batch>-<n>.parquet file per table and hour. The hourly scheduled
+# run compacts an hour's files into compacted-<ms>-<n>.parquet files, sorted
+# by order time, dropping the orders that were delivered more than once.
+DATA_LAKE_BUCKET = os.environ.get('DATA_LAKE_BUCKET', '')
+DEAD_LETTER_QUEUE_URL = os.environ.get('DEAD_LETTER_QUEUE_URL')
+PART_FILE = 'part'
+COMPACTED_FILE = 'compacted'
+COMPRESSION = 'zstd'
+DELETE_OBJECTS_LIMIT = 1000
+
+# A file rolls over once its compressed size reaches EXPORT_TARGET_FILE_BYTES;
+# rows are written in row groups of up to EXPORT_ROW_GROUP_ROWS
+TARGET_FILE_BYTES = int(os.environ.get('EXPORT_TARGET_FILE_BYTES', str(64 * 1024 * 1024)))
+ROW_GROUP_ROWS = int(os.environ.get('EXPORT_ROW_GROUP_ROWS', '100000'))
+
+# How many complete hours a scheduled run compacts, to pick up late orders
+COMPACTION_LOOKBACK_HOURS = int(os.environ.get('EXPORT_COMPACTION_LOOKBACK_HOURS', '24'))
+
+runner = SqsBatchRunner('order_exporter', sqs, DEAD_LETTER_QUEUE_URL, decode=eventbridge_message)
+
+def lambda_handler(event, context):
+    """Export order_processed events to the data lake, or compact recent hours
+
+    Invoked with batches of events from the order export SQS queue, or by the
+    hourly scheduled rule, which may pass lookback_hours to reach further back.
+    """
+    try:
+        batch = batch_envelope(event)
+        if batch is not None:
+            export = OrderExport()
+            return runner.run(batch, export.add, flush=export.flush)
+
+        hours = recent_hours(datetime.now(timezone.utc), int(event.get('lookback_hours', COMPACTION_LOOKBACK_HOURS)))
+        merged = compact_hours(hours)
+        return {
+            "statusCode": 200,
+            "body": json.dumps({
+                "message": f"Compacted {merged} files over the last {len(hours)} hours"
+            })
+        }
+
+    except Exception as e:
+        print(f"Error exporting orders: {str(e)}")
+        raise e
+
+def order_time(timestamp):
+    """The order timestamp as naive UTC"""
+    moment = parse_timestamp(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+class OrderExport:
+    """Collects a batch's order and line item rows by hour, then writes each hour's part files"""
+
+    def __init__(self):
+        self.hours = {}  # hour -> transaction_id -> (message_id, order row, line item rows)
+        self.batch_id = uuid.uuid4().hex[:8]
+
+    def add(self, message):
+        message_id, event = message
+        if event.get('detail-type') != 'order_processed':
+            print(f"Ignoring {event.get('detail-type')} event")
+            return
+        order, lines = export_rows(event['detail'])
+        hour = order['order_timestamp'].replace(minute=0, second=0, microsecond=0)
+        # An event delivered twice in one batch is exported once
+        self.hours.setdefault(hour, {})[order['transaction_id']] = (message_id, order, lines)
+
+    def flush(self):
+        """Write each hour's files; returns the message ids of the hours that failed"""
+        failed = []
+        for hour, orders in sorted(self.hours.items()):
+            tables = {
+                'orders': [order for _, order, _ in orders.values()],
+                'line_items': [line for _, _, lines in orders.values() for line in lines]
+            }
+            try:
+                for table_name, rows in tables.items():
+                    table = pa.Table.from_pylist(rows, schema=TABLES[table_name][0]).sort_by('order_timestamp')
+                    prefix = partition_prefix(table_name, hour)
+                    keys = write_files(table, prefix, f"{PART_FILE}-{int(time.time() * 1000)}-{self.batch_id}")
+                    print(f"Exported {table.num_rows} {table_name} rows to {len(keys)} files in {prefix}")
+            except Exception as e:
+                # Files already written for the hour are exported again on
+                # retry; compaction drops the duplicates
+                print(f"Error exporting {len(orders)} orders for {hour.isoformat()}: {str(e)}")
+                failed.extend(message_id for message_id, _, _ in orders.values())
+        return failed
+
+def export_rows(order):
+    """The orders row and line_items rows of an order_processed event's detail"""
+    try:
+        moment = order_time(order['timestamp'])
+    except ValueError as e:
+        raise PoisonMessage(f"invalid order timestamp: {str(e)}")
+    lines = []
+    for line_number, item in enumerate(order['items']):
+        price = money(item['price'])
+        quantity = int(item['quantity'])
+        lines.append({
+            'transaction_id': order['transaction_id'],
+            'line_number': line_number,
+            'order_timestamp': moment,
+            'product_id': item['product_id'],
+            'product_name': item.get('product_name'),
+            'category': item.get('category'),
+            'quantity': quantity,
+            'price': price,
+            'amount': price * quantity
+        })
+    row = {
+        'transaction_id': order['transaction_id'],
+        'order_timestamp': moment,
+        'customer_id': order.get('customer_id'),
+        'payment_method': order.get('payment_method'),
+        'shipping_state': order.get('shipping_state'),
+        'fulfillment_center': order.get('fulfillment_center'),
+        'status': order.get('status'),
+        'item_count': sum(line['quantity'] for line in lines),
+        'total_amount': money(order['total_amount'])
+    }
+    return row, lines
+
+def write_files(table, prefix, name):
+    """Write table under prefix as one or more Parquet files, rolling over by size; returns the keys"""
+    keys = []
+    sink = writer = None
+    for batch in table.to_batches(max_chunksize=ROW_GROUP_ROWS):
+        if writer is None:
+            sink = io.BytesIO()
+            writer = pq.ParquetWriter(sink, table.schema, compression=COMPRESSION)
+        writer.write_table(pa.Table.from_batches([batch], schema=table.schema))
+        if sink.tell() >= TARGET_FILE_BYTES:
+            writer.close()
+            keys.append(put_file(f"{prefix}{name}-{len(keys):04d}{FILE_SUFFIX}", sink))
+            writer = None
+    if writer is not None:
+        writer.close()
+        keys.append(put_file(f"{prefix}{name}-{len(keys):04d}{FILE_SUFFIX}", sink))
+    return keys
+
+def put_file(key, sink):
+    s3.put_object(Bucket=DATA_LAKE_BUCKET, Key=key, Body=sink.getvalue(),
+                  ContentType='application/vnd.apache.parquet')
+    return key
+
+def list_keys(prefix):
+    return [
+        item['Key']
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=DATA_LAKE_BUCKET, Prefix=prefix)
+        for item in page.get('Contents', [])
+        if item['Key'].endswith(FILE_SUFFIX)
+    ]
+
+def recent_hours(now, lookback_hours):
+    """The last lookback_hours complete hours; the current one is still being written"""
+    current = now.astimezone(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    return [current - timedelta(hours=n) for n in range(lookback_hours, 0, -1)]
+
+def compact_hours(hours):
+    """Compact each table's partition of each hour; returns the number of files merged"""
+    merged = 0
+    for hour in hours:
+        for table_name in TABLES:
+            merged += compact_partition(table_name, partition_prefix(table_name, hour))
+    return merged
+
+def compact_partition(table_name, prefix):
+    """Merge a partition's files into files of about TARGET_FILE_BYTES, one row per key"""
+    keys = list_keys(prefix)
+    if len(keys) < 2:
+        return 0
+    schema, key_columns = TABLES[table_name]
+
+    # Earlier compactions first, so their rows win over late duplicates
+    keys.sort(key=lambda key: (not key[len(prefix):].startswith(COMPACTED_FILE), key))
+    seen = set()
+    tables = []
+    for key in keys:
+        table = read_file(s3, DATA_LAKE_BUCKET, key).select(schema.names).cast(schema)
+        identities = zip(*(table.column(column).to_pylist() for column in key_columns))
+        keep = []
+        for identity in identities:
+            keep.append(identity not in seen)
+            seen.add(identity)
+        tables.append(table.filter(pa.array(keep, type=pa.bool_())))
+
+    merged = pa.concat_tables(tables).sort_by('order_timestamp')
+    # The new files land before the old ones go, and files exported meanwhile
+    # were not listed, so no row is ever missing from the hour
+    written = write_files(merged, prefix, f"{COMPACTED_FILE}-{int(time.time() * 1000)}")
+    for start in range(0, len(keys), DELETE_OBJECTS_LIMIT):
+        s3.delete_objects(
+            Bucket=DATA_LAKE_BUCKET,
+            Delete={'Objects': [{'Key': key} for key in keys[start:start + DELETE_OBJECTS_LIMIT]]}
+        )
+    print(f"Compacted {len(keys)} files into {len(written)} in {prefix} ({merged.num_rows} rows)")
+    return len(keys)
@@ -5,6 +5,12 @@ from datetime import datetime, timedelta
 import decimal
 import csv
 import io
+from common.bucket_sketches import SKETCH_TYPES, summarize_items
+from common.inventory_pool import PRODUCTS_FILTER, save_status_counts
+from common.projections import projection
+from common.rollups import batch_get_buckets, fan_in_shards, metric_keys_between
+from common.sharded_counters import SHARD_COUNT_ATTRIBUTE
+from common.table_scan import ScanStats, scan_items
 
 # Initialize DynamoDB client
 dynamodb = boto3.resource('dynamodb')
@@ -18,6 +24,17 @@ INVENTORY_STATUS_TABLE = 'InventoryStatus'
 # S3 bucket for reports
 REPORTS_BUCKET = 'lukebowm-serverless-ecommerce-reports'
 
+# Parallel scan segments for the full inventory report
+INVENTORY_SCAN_SEGMENTS = int(os.environ.get('INVENTORY_SCAN_SEGMENTS', '4'))
+
+# Attributes each report reads, rather than whole items: what its JSON and
+# CSV output show, plus what it computes from (shard counts, sketches)
+SALES_ATTRIBUTES = ['metric_key', 'time_value', 'total_sales', 'transaction_count', 'item_count', 'categories',
+                    SHARD_COUNT_ATTRIBUTE] + list(SKETCH_TYPES)
+COHORT_ATTRIBUTES = ['cohort', 'customer_count', 'total_revenue', 'new_customers', 'repeat_customers']
+INVENTORY_ATTRIBUTES = ['product_id', 'product_name', 'category', 'stock_level', 'inventory_status',
+                        'units_sold_total', 'last_updated']
+
 # Helper class to convert Decimal to float for JSON serialization
 class DecimalEncoder(json.JSONEncoder):
     def default(self, o):
@@ -89,7 +106,6 @@ def lambda_handler(event, context):
 
 def generate_sales_report(time_period):
     """Generate a sales report for the specified time period"""
-    table = dynamodb.Table(SALES_METRICS_TABLE)
     
     # Define the time range based on the period
     today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -108,15 +124,10 @@ def generate_sales_report(time_period):
         start_date = today - timedelta(days=30)
         prefix = 'date#'
     
-    # Scan the table for items with the correct prefix
-    response = table.scan(
-        FilterExpression="begins_with(metric_key, :prefix)",
-        ExpressionAttributeValues={
-            ':prefix': prefix
-        }
-    )
-    
-    items = response.get('Items', [])
+    # The period's buckets have known keys, so fetch them directly instead of
+    # scanning the table; counter shards are added to their buckets below
+    keys = metric_keys_between(prefix[:-1], start_date, today)
+    items = batch_get_buckets(dynamodb, SALES_METRICS_TABLE, keys, SALES_ATTRIBUTES)
     
     # Filter by date range and sort
     filtered_items = []
@@ -144,6 +155,11 @@ def generate_sales_report(time_period):
     
     # Sort by time value
     filtered_items.sort(key=lambda x: x.get('time_value', ''))
+    fan_in_shards(dynamodb, SALES_METRICS_TABLE, filtered_items, SALES_ATTRIBUTES)
+    
+    # Distinct customers and order value percentiles over the period, merged
+    # from the per-bucket sketches
+    period_summary = summarize_items(filtered_items)
     
     # Calculate summary statistics
     total_sales = sum(item.get('total_sales', 0) for item in filtered_items)
@@ -162,8 +178,10 @@ def generate_sales_report(time_period):
             'totalSales': total_sales,
             'totalTransactions': total_transactions,
             'totalItems': total_items,
+            'uniqueCustomers': period_summary.get('uniqueCustomers'),
             'avgTransactionValue': avg_transaction_value,
-            'avgItemsPerTransaction': avg_items_per_transaction
+            'avgItemsPerTransaction': avg_items_per_transaction,
+            'orderValuePercentiles': period_summary.get('orderValuePercentiles')
         },
         'details': filtered_items
     }
@@ -174,15 +192,18 @@ def generate_customer_report():
     """Generate a customer insights report"""
     table = dynamodb.Table(CUSTOMER_INSIGHTS_TABLE)
     
-    # Get all cohorts
-    response = table.scan(
+    # Get all cohorts, every page of them
+    stats = ScanStats()
+    cohorts = list(scan_items(
+        table,
+        stats=stats,
         FilterExpression="begins_with(insight_key, :prefix)",
         ExpressionAttributeValues={
             ':prefix': 'cohort#'
-        }
-    )
-    
-    cohorts = response.get('Items', [])
+        },
+        **projection(COHORT_ATTRIBUTES)
+    ))
+    print(f"Scanned cohorts: {stats}")
     
     # Sort by cohort
     cohorts.sort(key=lambda x: x.get('cohort', ''))
@@ -213,9 +234,13 @@ def generate_inventory_report():
     """Generate an inventory status report"""
     table = dynamodb.Table(INVENTORY_STATUS_TABLE)
     
-    # Get all inventory items
-    response = table.scan()
-    items = response.get('Items', [])
+    # Get all inventory items (not the reservation pool shards of hot products
+    # or the counters item), every page of them, in parallel segments
+    stats = ScanStats()
+    items = list(scan_items(table, segments=INVENTORY_SCAN_SEGMENTS, stats=stats, FilterExpression=PRODUCTS_FILTER,
+                            **projection(INVENTORY_ATTRIBUTES)))
+    items.sort(key=lambda x: x.get('product_id', ''))
+    print(f"Scanned inventory: {stats}")
     
     # Group by category and status
     categories = {}
@@ -223,6 +248,7 @@ def generate_inventory_report():
         'normal': 0,
         'low': 0
     }
+    category_status_counts = {}
     
     for item in items:
         category = item.get('category', 'unknown')
@@ -236,6 +262,12 @@ def generate_inventory_report():
         # Update status counts
         if status in status_counts:
             status_counts[status] += 1
+        if 'inventory_status' in item:
+            counts = category_status_counts.setdefault(category, {})
+            counts[status] = counts.get(status, 0) + 1
+    
+    # The full scan also corrects the counters the dashboard reads
+    save_status_counts(table, category_status_counts)
     
     # Create report
     report = {
@@ -293,15 +325,21 @@ def save_report_csv(report_data, filename):
         
         if report_type == 'sales':
             # Write headers
-            writer.writerow(['Date', 'Total Sales', 'Transactions', 'Items', 'Categories'])
+            writer.writerow(['Date', 'Total Sales', 'Transactions', 'Items', 'Unique Customers',
+                             'P50 Order Value', 'P90 Order Value', 'P99 Order Value', 'Categories'])
             
             # Write data rows
             for item in report_data.get('details', []):
+                percentiles = item.get('orderValuePercentiles', {})
                 writer.writerow([
                     item.get('time_value', ''),
                     item.get('total_sales', 0),
                     item.get('transaction_count', 0),
                     item.get('item_count', 0),
+                    item.get('uniqueCustomers', ''),
+                    percentiles.get('p50', ''),
+                    percentiles.get('p90', ''),
+                    percentiles.get('p99', ''),
                     ', '.join(item.get('categories', []))
                 ])
                 
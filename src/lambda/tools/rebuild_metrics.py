@@ -0,0 +1,211 @@
+"""Rebuild SalesMetrics daily buckets and leaderboards from the order archive.
+
+Replays the archived orders (common.order_archive) through the same fold
+business_logic uses (common.order_aggregates.fold_order), one day per worker
+process, then swaps the rebuilt aggregates in:
+
+- each daily bucket is replaced together with its counter shards in one
+  TransactWriteItems call, so a reader sees either the old bucket or the
+  rebuilt one, never a mix of the two;
+- the day's product and category leaderboards are replaced, and the week and
+  month leaderboards are merged again from their days' leaderboards (stored
+  ones for days outside the rebuild);
+- the week and month rollups of the rebuilt days are recompacted.
+
+Days still taking orders should not be rebuilt, as orders counted live while
+the rebuild runs would be lost in the swap; the default range ends yesterday.
+Intraday rings and CustomerInsights cohorts are not rebuilt: the rings only
+cover the last day, and cohorts depend on customer profile state the archive
+does not hold.
+
+Usage (from src/lambda):
+    python -m tools.rebuild_metrics compact --archive s3://my-order-archive
+    python -m tools.rebuild_metrics rebuild --archive s3://my-order-archive --from 2024-01-01 --dry-run
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+import boto3
+from common.bucket_sketches import VERSION_ATTRIBUTE, BucketSketchBuffer
+from common.heavy_hitters import LeaderboardBuffer, SpaceSaving, top_key
+from common.order_aggregates import fold_order
+from common.order_archive import OrderArchive, open_store
+from common.rollups import (BUCKET_TIME_UNIT, batch_get_buckets, compact_rollup, dates_in_rollup, fan_in_shards,
+                            metric_key, rollups_for_date)
+from common.sharded_counters import SHARD_COUNT_ATTRIBUTE, shard_key
+
+SALES_METRICS_TABLE = 'SalesMetrics'
+LEADERBOARDS = ('product', 'category')
+
+def fold_day(task):
+    """Map: fold one day's archived orders into its bucket totals, sketches and leaderboards"""
+    location, date_str = task
+    orders = OrderArchive(open_store(location)).read_day(date_str)
+    buckets, slots = {}, {}
+    leaderboard = LeaderboardBuffer()
+    sketches = BucketSketchBuffer()
+    for order in orders:
+        fold_order(order, buckets, slots, leaderboard, sketches)
+    # A day's partition only holds orders of that day, so there is one bucket
+    return {
+        'date': date_str,
+        'totals': buckets.get(date_str),
+        'sketches': sketches.pending.get(metric_key(BUCKET_TIME_UNIT, date_str), {}),
+        'leaderboards': {by: summary for (by, _), summary in leaderboard.pending.items()}
+    }
+
+def bucket_item(day, version):
+    """The rebuilt daily bucket, with its counters on the base item and no shards"""
+    totals = day['totals']
+    now = datetime.now().isoformat()
+    item = {
+        'metric_key': metric_key(BUCKET_TIME_UNIT, day['date']),
+        'time_unit': BUCKET_TIME_UNIT,
+        'time_value': day['date'],
+        'total_sales': totals['amount'],
+        'item_count': totals['items'],
+        'transaction_count': totals['orders'],
+        'categories': sorted(totals['categories']),
+        VERSION_ATTRIBUTE: version + 1,
+        'created_at': now,
+        'last_updated': now,
+        'rebuilt_at': now
+    }
+    for attribute, sketch in day['sketches'].items():
+        item[attribute] = sketch.to_bytes()
+    return item
+
+def swap_bucket(dynamodb, table_name, day):
+    """Replace a daily bucket and delete its counter shards in one transaction"""
+    table = dynamodb.Table(table_name)
+    key = metric_key(BUCKET_TIME_UNIT, day['date'])
+    current = table.get_item(Key={'metric_key': key}, ConsistentRead=True).get('Item', {})
+    shard_count = int(current.get(SHARD_COUNT_ATTRIBUTE, 0))
+
+    put = {'TableName': table_name, 'Item': bucket_item(day, int(current.get(VERSION_ATTRIBUTE, 0)))}
+    # Fails if a writer added shards since the read, instead of leaving them behind
+    if shard_count:
+        put['ConditionExpression'] = f"{SHARD_COUNT_ATTRIBUTE} = :count"
+        put['ExpressionAttributeValues'] = {':count': shard_count}
+    else:
+        put['ConditionExpression'] = f"attribute_not_exists({SHARD_COUNT_ATTRIBUTE})"
+    actions = [{'Put': put}] + [
+        {'Delete': {'TableName': table_name, 'Key': {'metric_key': shard_key(key, shard)}}}
+        for shard in range(shard_count)
+    ]
+    table.meta.client.transact_write_items(TransactItems=actions)
+
+def replace_summary(table, key, summary):
+    """Overwrite a leaderboard, keeping its version sequence for live flushes"""
+    stored = table.get_item(Key={'metric_key': key}, ProjectionExpression='version', ConsistentRead=True)
+    version = int(stored.get('Item', {}).get('version', 0))
+    item = summary.to_item()
+    item.update({'metric_key': key, 'version': version + 1, 'last_updated': datetime.now().isoformat()})
+    table.put_item(
+        Item=item,
+        ConditionExpression="attribute_not_exists(metric_key) OR version = :version",
+        ExpressionAttributeValues={':version': version}
+    )
+
+def rollup_leaderboards(dynamodb, table_name, days, rollups):
+    """Merge each week and month leaderboard from its days, rebuilt or stored"""
+    summaries = {}
+    for time_unit, time_value in rollups:
+        dates = dates_in_rollup(time_unit, time_value)
+        stored_keys = [top_key(by, BUCKET_TIME_UNIT, date) for by in LEADERBOARDS for date in dates
+                       if date not in days]
+        stored = {item['metric_key']: SpaceSaving.from_item(item)
+                  for item in batch_get_buckets(dynamodb, table_name, stored_keys)}
+        for by in LEADERBOARDS:
+            merged = SpaceSaving()
+            for date in dates:
+                daily = (days[date]['leaderboards'].get(by) if date in days
+                         else stored.get(top_key(by, BUCKET_TIME_UNIT, date)))
+                if daily is not None:
+                    merged.merge(daily)
+            summaries[top_key(by, time_unit, time_value)] = merged
+    return summaries
+
+def current_totals(dynamodb, table_name, dates):
+    """Live bucket counters, fanned in from their shards"""
+    buckets = batch_get_buckets(dynamodb, table_name, [metric_key(BUCKET_TIME_UNIT, date) for date in dates])
+    fan_in_shards(dynamodb, table_name, buckets)
+    return {bucket['time_value']: bucket for bucket in buckets}
+
+def rebuild(location, dates, processes, dynamodb, table_name=SALES_METRICS_TABLE, dry_run=False):
+    """Replay the archive for dates and swap the results in; returns the rebuilt days"""
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        days = {day['date']: day for day in pool.imap_unordered(fold_day, [(location, date) for date in dates])
+                if day['totals']}
+    orders = sum(day['totals']['orders'] for day in days.values())
+    print(f"Folded {orders:,} orders over {len(days)} days in {time.perf_counter() - start:.1f}s "
+          f"with {processes} processes")
+
+    current = current_totals(dynamodb, table_name, sorted(days))
+    changed = 0
+    for date in sorted(days):
+        rebuilt = days[date]['totals']
+        live = current.get(date, {})
+        if int(live.get('transaction_count', 0)) != rebuilt['orders'] or \
+                live.get('total_sales', 0) != rebuilt['amount']:
+            changed += 1
+            print(f"  {date}: {live.get('transaction_count', 0)} orders / {live.get('total_sales', 0)} live, "
+                  f"{rebuilt['orders']} orders / {rebuilt['amount']} rebuilt")
+    print(f"{changed} of {len(days)} daily buckets differ from the live counters")
+    if dry_run:
+        return days
+
+    start = time.perf_counter()
+    table = dynamodb.Table(table_name)
+    for date in sorted(days):
+        swap_bucket(dynamodb, table_name, days[date])
+        for by, summary in days[date]['leaderboards'].items():
+            replace_summary(table, top_key(by, BUCKET_TIME_UNIT, date), summary)
+
+    rollups = sorted({rollup for date in days for rollup in rollups_for_date(date)})
+    for key, summary in rollup_leaderboards(dynamodb, table_name, days, rollups).items():
+        replace_summary(table, key, summary)
+    for time_unit, time_value in rollups:
+        compact_rollup(dynamodb, table_name, time_unit, time_value)
+    print(f"Swapped in {len(days)} buckets and recompacted {len(rollups)} rollups "
+          f"in {time.perf_counter() - start:.1f}s")
+    return days
+
+def compact(location, dates, processes):
+    """Merge each day's archive files into one"""
+    with multiprocessing.Pool(processes) as pool:
+        merged = pool.map(compact_day, [(location, date) for date in dates])
+    print(f"Compacted {sum(merged):,} files over {sum(1 for count in merged if count)} days")
+
+def compact_day(task):
+    location, date_str = task
+    return OrderArchive(open_store(location)).compact_day(date_str)
+
+def select_dates(archive, first, last):
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    last = last or yesterday
+    return [date for date in archive.dates() if (not first or date >= first) and date <= last]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['compact', 'rebuild'])
+    parser.add_argument('--archive', required=True, help="s3://bucket or a local directory")
+    parser.add_argument('--from', dest='first', help="first order date (YYYY-MM-DD); default: the oldest")
+    parser.add_argument('--to', dest='last', help="last order date (YYYY-MM-DD); default: yesterday")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--table', default=SALES_METRICS_TABLE)
+    parser.add_argument('--dry-run', action='store_true', help="report the differences without swapping")
+    args = parser.parse_args()
+
+    dates = select_dates(OrderArchive(open_store(args.archive)), args.first, args.last)
+    print(f"{len(dates)} archived days from {dates[0] if dates else '-'} to {dates[-1] if dates else '-'}")
+    if args.command == 'compact':
+        compact(args.archive, dates, args.processes)
+    else:
+        rebuild(args.archive, dates, args.processes, boto3.resource('dynamodb'), args.table, args.dry_run)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import boto3
+import os
+from common.order_archive import OrderArchive, S3Store
+from common.order_log import ORDER_LOG_TABLE, OrderLog
+from common.sqs_batch import SqsBatchRunner
+from common.transaction_model import transaction_message
+from common.transaction_stages import CustomerStage, EventPublisher, InventoryStage, OrderStage, TransactionBatch
+
+# One set of clients shared by every stage
+events = boto3.client('events')
+dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
+s3 = boto3.client('s3')
+publisher = EventPublisher(events)
+
+# In the "stream" aggregation mode, orders and customers are also appended to the order log
+AGGREGATION_MODE = os.environ.get('AGGREGATION_MODE', 'events')
+order_log = OrderLog(dynamodb.Table(ORDER_LOG_TABLE)) if AGGREGATION_MODE == 'stream' else None
+
+# Orders are archived to S3 for metric rebuilds when a bucket is configured
+ORDER_ARCHIVE_BUCKET = os.environ.get('ORDER_ARCHIVE_BUCKET')
+archive = OrderArchive(S3Store(s3, ORDER_ARCHIVE_BUCKET)) if ORDER_ARCHIVE_BUCKET else None
+
+RFM_BOUNDARIES_TTL_SECONDS = int(os.environ.get('RFM_BOUNDARIES_TTL_SECONDS', '3600'))
+stages = [
+    OrderStage(dynamodb, order_log, archive),
+    CustomerStage(dynamodb, RFM_BOUNDARIES_TTL_SECONDS, order_log),
+    InventoryStage(dynamodb)
+]
+
+DEAD_LETTER_QUEUE_URL = os.environ.get('DEAD_LETTER_QUEUE_URL')
+# Records are validated as they are decoded, so malformed ones never reach a stage
+runner = SqsBatchRunner('transaction_pipeline', sqs, DEAD_LETTER_QUEUE_URL, decode=transaction_message)
+
+def lambda_handler(event, context):
+    """Unified transaction consumer, used when pipeline_mode is "unified"
+
+    Decodes each transaction once and runs the order, customer and inventory
+    stages over it in-process, publishing the events of the whole batch
+    together, instead of three consumers each decoding it separately.
+    """
+    # Failed records are reported individually; poison ones go to the dead-letter queue
+    batch = TransactionBatch(stages, publisher, context)
+    return runner.run(event, batch.process, flush=batch.flush)
@@ -112,9 +112,13 @@ resource "aws_lambda_permission" "api_gateway_lambda_permission" {
 }
 
 # Dashboard API Gateway
+# The dashboard functions compress large responses themselves and return them
+# base64 encoded; listing every media type as binary has API Gateway decode
+# them (and pass request bodies to the functions base64 encoded)
 resource "aws_api_gateway_rest_api" "dashboard_api" {
-  name        = "Dashboard-API"
-  description = "API for E-commerce Analytics Dashboard"
+  name               = "Dashboard-API"
+  description        = "API for E-commerce Analytics Dashboard"
+  binary_media_types = ["*/*"]
 }
 
 # /api resource
@@ -157,6 +161,8 @@ resource "aws_api_gateway_integration" "api_options_integration" {
   http_method = aws_api_gateway_method.api_options.http_method
   
   type = "MOCK"
+  # The mock's template only applies to a text body
+  content_handling = "CONVERT_TO_TEXT"
   request_templates = {
     "application/json" = "{\"statusCode\": 200}"
   }
@@ -188,11 +194,86 @@ resource "aws_api_gateway_integration_response" "api_options_integration_respons
   }
 }
 
+# /api/query resource, ad-hoc slices over the data lake
+resource "aws_api_gateway_resource" "api_query_resource" {
+  rest_api_id = aws_api_gateway_rest_api.dashboard_api.id
+  parent_id   = aws_api_gateway_resource.api_resource.id
+  path_part   = "query"
+}
+
+# POST method for /api/query
+resource "aws_api_gateway_method" "api_query_post" {
+  rest_api_id   = aws_api_gateway_rest_api.dashboard_api.id
+  resource_id   = aws_api_gateway_resource.api_query_resource.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+# Integration with Lambda
+resource "aws_api_gateway_integration" "api_query_lambda_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dashboard_api.id
+  resource_id = aws_api_gateway_resource.api_query_resource.id
+  http_method = aws_api_gateway_method.api_query_post.http_method
+  
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.dashboard_query.invoke_arn
+}
+
+# CORS configuration for /api/query
+resource "aws_api_gateway_method" "api_query_options" {
+  rest_api_id   = aws_api_gateway_rest_api.dashboard_api.id
+  resource_id   = aws_api_gateway_resource.api_query_resource.id
+  http_method   = "OPTIONS"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "api_query_options_integration" {
+  rest_api_id = aws_api_gateway_rest_api.dashboard_api.id
+  resource_id = aws_api_gateway_resource.api_query_resource.id
+  http_method = aws_api_gateway_method.api_query_options.http_method
+  
+  type = "MOCK"
+  # The mock's template only applies to a text body
+  content_handling = "CONVERT_TO_TEXT"
+  request_templates = {
+    "application/json" = "{\"statusCode\": 200}"
+  }
+}
+
+resource "aws_api_gateway_method_response" "api_query_options_response_200" {
+  rest_api_id = aws_api_gateway_rest_api.dashboard_api.id
+  resource_id = aws_api_gateway_resource.api_query_resource.id
+  http_method = aws_api_gateway_method.api_query_options.http_method
+  status_code = "200"
+  
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = true,
+    "method.response.header.Access-Control-Allow-Methods" = true,
+    "method.response.header.Access-Control-Allow-Origin" = true
+  }
+}
+
+resource "aws_api_gateway_integration_response" "api_query_options_integration_response" {
+  rest_api_id = aws_api_gateway_rest_api.dashboard_api.id
+  resource_id = aws_api_gateway_resource.api_query_resource.id
+  http_method = aws_api_gateway_method.api_query_options.http_method
+  status_code = aws_api_gateway_method_response.api_query_options_response_200.status_code
+  
+  response_parameters = {
+    "method.response.header.Access-Control-Allow-Headers" = "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
+    "method.response.header.Access-Control-Allow-Methods" = "'POST,OPTIONS'",
+    "method.response.header.Access-Control-Allow-Origin" = "'*'"
+  }
+}
+
 # Dashboard API deployment
 resource "aws_api_gateway_deployment" "dashboard_api_deployment" {
   depends_on = [
     aws_api_gateway_integration.api_lambda_integration,
-    aws_api_gateway_integration.api_options_integration
+    aws_api_gateway_integration.api_options_integration,
+    aws_api_gateway_integration.api_query_lambda_integration,
+    aws_api_gateway_integration.api_query_options_integration
   ]
   
   rest_api_id = aws_api_gateway_rest_api.dashboard_api.id
@@ -208,3 +289,51 @@ resource "aws_lambda_permission" "dashboard_api_lambda_permission" {
   
   source_arn = "${aws_api_gateway_rest_api.dashboard_api.execution_arn}/*/*"
 }
+
+# Live updates WebSocket API - dashboards connect here to be sent metric
+# changes; DashboardAPI registers connects and disconnects and posts the
+# changes (src/lambda/common/live_updates.py)
+resource "aws_apigatewayv2_api" "dashboard_live" {
+  name                       = "Dashboard-Live"
+  description                = "Live metric updates for the E-commerce Analytics Dashboard"
+  protocol_type              = "WEBSOCKET"
+  route_selection_expression = "$request.body.action"
+}
+
+resource "aws_apigatewayv2_integration" "dashboard_live_integration" {
+  api_id           = aws_apigatewayv2_api.dashboard_live.id
+  integration_type = "AWS_PROXY"
+  integration_uri  = aws_lambda_function.dashboard_api.invoke_arn
+}
+
+resource "aws_apigatewayv2_route" "dashboard_live_routes" {
+  for_each  = toset(["$connect", "$disconnect", "$default"])
+  api_id    = aws_apigatewayv2_api.dashboard_live.id
+  route_key = each.value
+  target    = "integrations/${aws_apigatewayv2_integration.dashboard_live_integration.id}"
+}
+
+resource "aws_apigatewayv2_stage" "dashboard_live_stage" {
+  api_id      = aws_apigatewayv2_api.dashboard_live.id
+  name        = "prod"
+  auto_deploy = true
+}
+
+resource "aws_lambda_permission" "dashboard_live_lambda_permission" {
+  statement_id  = "AllowExecutionFromLiveAPI"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.dashboard_api.function_name
+  principal     = "apigateway.amazonaws.com"
+  
+  source_arn = "${aws_apigatewayv2_api.dashboard_live.execution_arn}/*/*"
+}
+
+# Permission for API Gateway to invoke Dashboard Query Lambda
+resource "aws_lambda_permission" "dashboard_query_lambda_permission" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.dashboard_query.function_name
+  principal     = "apigateway.amazonaws.com"
+  
+  source_arn = "${aws_api_gateway_rest_api.dashboard_api.execution_arn}/*/*"
+}
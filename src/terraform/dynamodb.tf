@@ -19,6 +19,20 @@ resource "aws_dynamodb_table" "inventory_status" {
     name = "product_id"
     type = "S"
   }
+
+  attribute {
+    name = "category"
+    type = "S"
+  }
+
+  # Products by category for the paginated /api/inventory; pool shards and
+  # the counters item have no category, so they stay out of it
+  global_secondary_index {
+    name            = "CategoryIndex"
+    hash_key        = "category"
+    range_key       = "product_id"
+    projection_type = "ALL"
+  }
 }
 
 resource "aws_dynamodb_table" "sales_metrics" {
@@ -26,6 +40,10 @@ resource "aws_dynamodb_table" "sales_metrics" {
   billing_mode = "PAY_PER_REQUEST"
   hash_key     = "metric_key"
 
+  # Daily bucket changes drive the metrics compactor
+  stream_enabled   = true
+  stream_view_type = "KEYS_ONLY"
+
   attribute {
     name = "metric_key"
     type = "S"
@@ -53,3 +71,60 @@ resource "aws_dynamodb_table" "notifications" {
     type = "S"
   }
 }
+
+# Dashboards connected to the live updates WebSocket API; a record left by a
+# missed disconnect expires after API Gateway's two-hour connection limit
+resource "aws_dynamodb_table" "dashboard_connections" {
+  name         = "DashboardConnections"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "connection_id"
+
+  attribute {
+    name = "connection_id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Per-consumer claims on processed events (src/lambda/common/idempotency.py)
+resource "aws_dynamodb_table" "idempotency_ledger" {
+  name         = "IdempotencyLedger"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Orders and customer records appended by the transaction consumers when
+# aggregation_mode is "stream" (src/lambda/common/order_log.py). Its stream
+# feeds BusinessLogic in batches; items expire once the stream has moved on.
+resource "aws_dynamodb_table" "order_log" {
+  name         = "OrderLog"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "log_key"
+
+  stream_enabled   = true
+  stream_view_type = "NEW_IMAGE"
+
+  attribute {
+    name = "log_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
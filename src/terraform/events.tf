@@ -49,39 +49,151 @@ resource "aws_cloudwatch_event_rule" "customer_to_appflow_rule" {
   })
 }
 
+resource "aws_cloudwatch_event_rule" "metrics_changed_rule" {
+  name        = "MetricsChangedRule"
+  description = "Rule for metric changes sent to the live dashboards"
+
+  event_pattern = jsonencode({
+    source      = ["com.ecommerce.metrics"]
+    detail-type = ["metrics_changed"]
+  })
+}
+
+resource "aws_cloudwatch_event_rule" "metrics_compaction_schedule" {
+  name                = "MetricsCompactionSchedule"
+  description         = "Periodic re-compaction of week/month sales rollups"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_rule" "customer_resegmentation_schedule" {
+  name                = "CustomerResegmentationSchedule"
+  description         = "Nightly re-segmentation of all customer profiles"
+  schedule_expression = "cron(0 3 * * ? *)"
+}
+
+resource "aws_cloudwatch_event_rule" "inventory_rebalance_schedule" {
+  name                = "InventoryRebalanceSchedule"
+  description         = "Rebalance hot products' reservation pools and refresh their stock"
+  schedule_expression = "rate(1 minute)"
+}
+
+# Ten minutes past the hour, once the export queue's batching window has
+# flushed the previous hour's orders
+resource "aws_cloudwatch_event_rule" "order_export_compaction_schedule" {
+  name                = "OrderExportCompactionSchedule"
+  description         = "Hourly compaction of the data lake's order files"
+  schedule_expression = "cron(10 * * * ? *)"
+}
+
 # EventBridge Targets
+# With aggregation_mode = "stream", BusinessLogic reads orders and customers
+# from the OrderLog stream instead of these two rules. event_delivery picks
+# between invoking BusinessLogic and NotificationService directly and
+# buffering their events in SQS; both queues stay deployed, so switching only
+# moves the targets.
 resource "aws_cloudwatch_event_target" "business_logic_order_target" {
+  count     = var.aggregation_mode == "events" && var.event_delivery == "direct" ? 1 : 0
   rule      = aws_cloudwatch_event_rule.order_processed_rule.name
   target_id = "BusinessLogicTarget"
   arn       = aws_lambda_function.business_logic.arn
 }
 
 resource "aws_cloudwatch_event_target" "business_logic_customer_target" {
+  count     = var.aggregation_mode == "events" && var.event_delivery == "direct" ? 1 : 0
   rule      = aws_cloudwatch_event_rule.customer_analyzed_rule.name
   target_id = "BusinessLogicTarget"
   arn       = aws_lambda_function.business_logic.arn
 }
 
 resource "aws_cloudwatch_event_target" "business_logic_inventory_target" {
+  count     = var.event_delivery == "direct" ? 1 : 0
   rule      = aws_cloudwatch_event_rule.inventory_updated_rule.name
   target_id = "BusinessLogicTarget"
   arn       = aws_lambda_function.business_logic.arn
 }
 
 resource "aws_cloudwatch_event_target" "notification_target" {
+  count     = var.event_delivery == "direct" ? 1 : 0
   rule      = aws_cloudwatch_event_rule.notification_rule.name
   target_id = "NotificationTarget"
   arn       = aws_lambda_function.notification_service.arn
 }
 
+resource "aws_cloudwatch_event_target" "business_logic_order_queue_target" {
+  count     = var.aggregation_mode == "events" && var.event_delivery == "batched" ? 1 : 0
+  rule      = aws_cloudwatch_event_rule.order_processed_rule.name
+  target_id = "BusinessLogicEventQueueTarget"
+  arn       = aws_sqs_queue.business_logic_event_queue.arn
+}
+
+resource "aws_cloudwatch_event_target" "business_logic_customer_queue_target" {
+  count     = var.aggregation_mode == "events" && var.event_delivery == "batched" ? 1 : 0
+  rule      = aws_cloudwatch_event_rule.customer_analyzed_rule.name
+  target_id = "BusinessLogicEventQueueTarget"
+  arn       = aws_sqs_queue.business_logic_event_queue.arn
+}
+
+resource "aws_cloudwatch_event_target" "business_logic_inventory_queue_target" {
+  count     = var.event_delivery == "batched" ? 1 : 0
+  rule      = aws_cloudwatch_event_rule.inventory_updated_rule.name
+  target_id = "BusinessLogicEventQueueTarget"
+  arn       = aws_sqs_queue.business_logic_event_queue.arn
+}
+
+resource "aws_cloudwatch_event_target" "notification_queue_target" {
+  count     = var.event_delivery == "batched" ? 1 : 0
+  rule      = aws_cloudwatch_event_rule.notification_rule.name
+  target_id = "NotificationEventQueueTarget"
+  arn       = aws_sqs_queue.notification_event_queue.arn
+}
+
+# Customer events are buffered in SQS so AppFlowTrigger exports them in batches
 resource "aws_cloudwatch_event_target" "appflow_trigger_target" {
   rule      = aws_cloudwatch_event_rule.customer_to_appflow_rule.name
-  target_id = "AppFlowTriggerTarget"
-  arn       = aws_lambda_function.appflow_trigger.arn
+  target_id = "MarketingExportQueueTarget"
+  arn       = aws_sqs_queue.marketing_export_queue.arn
+}
+
+# Orders are buffered in SQS so OrderExporter writes them in batches
+resource "aws_cloudwatch_event_target" "order_exporter_target" {
+  rule      = aws_cloudwatch_event_rule.order_processed_rule.name
+  target_id = "OrderExportQueueTarget"
+  arn       = aws_sqs_queue.order_export_queue.arn
+}
+
+resource "aws_cloudwatch_event_target" "order_export_compaction_target" {
+  rule      = aws_cloudwatch_event_rule.order_export_compaction_schedule.name
+  target_id = "OrderExportCompactionTarget"
+  arn       = aws_lambda_function.order_exporter.arn
+}
+
+resource "aws_cloudwatch_event_target" "dashboard_live_target" {
+  rule      = aws_cloudwatch_event_rule.metrics_changed_rule.name
+  target_id = "DashboardLiveTarget"
+  arn       = aws_lambda_function.dashboard_api.arn
+}
+
+resource "aws_cloudwatch_event_target" "metrics_compactor_target" {
+  rule      = aws_cloudwatch_event_rule.metrics_compaction_schedule.name
+  target_id = "MetricsCompactorTarget"
+  arn       = aws_lambda_function.metrics_compactor.arn
+}
+
+resource "aws_cloudwatch_event_target" "customer_resegmentation_target" {
+  rule      = aws_cloudwatch_event_rule.customer_resegmentation_schedule.name
+  target_id = "CustomerResegmentationTarget"
+  arn       = aws_lambda_function.customer_resegmentation.arn
+}
+
+resource "aws_cloudwatch_event_target" "inventory_rebalancer_target" {
+  rule      = aws_cloudwatch_event_rule.inventory_rebalance_schedule.name
+  target_id = "InventoryRebalancerTarget"
+  arn       = aws_lambda_function.inventory_rebalancer.arn
 }
 
 # Lambda permissions for EventBridge
 resource "aws_lambda_permission" "business_logic_orders_permission" {
+  count         = var.aggregation_mode == "events" && var.event_delivery == "direct" ? 1 : 0
   action        = "lambda:InvokeFunction"
   function_name = aws_lambda_function.business_logic.function_name
   principal     = "events.amazonaws.com"
@@ -89,6 +201,7 @@ resource "aws_lambda_permission" "business_logic_orders_permission" {
 }
 
 resource "aws_lambda_permission" "business_logic_customers_permission" {
+  count         = var.aggregation_mode == "events" && var.event_delivery == "direct" ? 1 : 0
   action        = "lambda:InvokeFunction"
   function_name = aws_lambda_function.business_logic.function_name
   principal     = "events.amazonaws.com"
@@ -96,6 +209,7 @@ resource "aws_lambda_permission" "business_logic_customers_permission" {
 }
 
 resource "aws_lambda_permission" "business_logic_inventory_permission" {
+  count         = var.event_delivery == "direct" ? 1 : 0
   action        = "lambda:InvokeFunction"
   function_name = aws_lambda_function.business_logic.function_name
   principal     = "events.amazonaws.com"
@@ -103,17 +217,46 @@ resource "aws_lambda_permission" "business_logic_inventory_permission" {
 }
 
 resource "aws_lambda_permission" "notification_permission" {
+  count         = var.event_delivery == "direct" ? 1 : 0
   action        = "lambda:InvokeFunction"
   function_name = aws_lambda_function.notification_service.function_name
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.notification_rule.arn
 }
 
-resource "aws_lambda_permission" "appflow_trigger_permission" {
+resource "aws_lambda_permission" "dashboard_live_permission" {
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.dashboard_api.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.metrics_changed_rule.arn
+}
+
+resource "aws_lambda_permission" "metrics_compactor_permission" {
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.metrics_compactor.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.metrics_compaction_schedule.arn
+}
+
+resource "aws_lambda_permission" "order_export_compaction_permission" {
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.order_exporter.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.order_export_compaction_schedule.arn
+}
+
+resource "aws_lambda_permission" "customer_resegmentation_permission" {
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.customer_resegmentation.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.customer_resegmentation_schedule.arn
+}
+
+resource "aws_lambda_permission" "inventory_rebalancer_permission" {
   action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.appflow_trigger.function_name
+  function_name = aws_lambda_function.inventory_rebalancer.function_name
   principal     = "events.amazonaws.com"
-  source_arn    = aws_cloudwatch_event_rule.customer_to_appflow_rule.arn
+  source_arn    = aws_cloudwatch_event_rule.inventory_rebalance_schedule.arn
 }
 
 # S3 bucket for AppFlow data
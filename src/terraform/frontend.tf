@@ -3,6 +3,53 @@ resource "aws_s3_bucket" "reports_bucket" {
   bucket = "${var.username}-serverless-ecommerce-reports"
 }
 
+# S3 bucket for the order archive the SalesMetrics rebuild replays
+# (src/lambda/tools/rebuild_metrics.py)
+resource "aws_s3_bucket" "order_archive_bucket" {
+  bucket = "${var.username}-serverless-ecommerce-order-log"
+}
+
+resource "aws_s3_bucket_public_access_block" "order_archive_bucket_access" {
+  bucket = aws_s3_bucket.order_archive_bucket.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+# S3 bucket for the orders data lake, Parquet files written by OrderExporter
+resource "aws_s3_bucket" "data_lake_bucket" {
+  bucket = "${var.username}-serverless-ecommerce-data-lake"
+}
+
+resource "aws_s3_bucket_public_access_block" "data_lake_bucket_access" {
+  bucket = aws_s3_bucket.data_lake_bucket.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+# DashboardQuery's shared result cache; entries outlive their TTL by at most a day
+resource "aws_s3_bucket_lifecycle_configuration" "data_lake_bucket_lifecycle" {
+  bucket = aws_s3_bucket.data_lake_bucket.id
+
+  rule {
+    id     = "expire-query-cache"
+    status = "Enabled"
+
+    filter {
+      prefix = "query-cache/"
+    }
+
+    expiration {
+      days = 2
+    }
+  }
+}
+
 # S3 bucket for frontend
 resource "aws_s3_bucket" "frontend_bucket" {
   bucket = "${var.username}-serverless-ecommerce-frontend"
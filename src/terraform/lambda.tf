@@ -40,8 +40,15 @@ resource "aws_iam_policy" "lambda_policy" {
           "dynamodb:GetItem",
           "dynamodb:PutItem",
           "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem",
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:Query",
           "dynamodb:Scan",
+          "dynamodb:DescribeStream",
+          "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator",
+          "dynamodb:ListStreams",
           "sqs:SendMessage",
           "sqs:ReceiveMessage",
           "sqs:DeleteMessage",
@@ -49,7 +56,11 @@ resource "aws_iam_policy" "lambda_policy" {
           "events:PutEvents",
           "s3:GetObject",
           "s3:PutObject",
-          "s3:ListBucket"
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload",
+          "s3:ListBucket",
+          "lambda:InvokeFunction",
+          "execute-api:ManageConnections"
         ]
         Resource = "*"
       }
@@ -63,6 +74,14 @@ resource "aws_iam_role_policy_attachment" "lambda_policy_attachment" {
   policy_arn = aws_iam_policy.lambda_policy.arn
 }
 
+# Shared helpers layer (src/lambda/common), importable as `common`
+resource "aws_lambda_layer_version" "common_layer" {
+  layer_name          = "EcommerceCommon"
+  filename            = "../lambda/common_layer.zip"
+  source_code_hash    = filebase64sha256("../lambda/common_layer.zip")
+  compatible_runtimes = ["python3.9"]
+}
+
 # Mock Data Generator Lambda
 resource "aws_lambda_function" "mock_data_generator" {
   function_name = "MockDataGenerator"
@@ -91,6 +110,15 @@ resource "aws_lambda_function" "order_processor" {
   source_code_hash = filebase64sha256("../lambda/order_processor.zip")
   timeout       = 30
   memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.transaction_dead_letter_queue.url
+      AGGREGATION_MODE      = var.aggregation_mode
+      ORDER_ARCHIVE_BUCKET  = aws_s3_bucket.order_archive_bucket.bucket
+    }
+  }
 }
 
 # Customer Analytics Lambda
@@ -102,7 +130,15 @@ resource "aws_lambda_function" "customer_analytics" {
   filename      = "../lambda/customer_analytics.zip"
   source_code_hash = filebase64sha256("../lambda/customer_analytics.zip")
   timeout       = 30
-  memory_size   = 128
+  memory_size   = 256
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.transaction_dead_letter_queue.url
+      AGGREGATION_MODE      = var.aggregation_mode
+    }
+  }
 }
 
 # Inventory Tracker Lambda
@@ -115,6 +151,35 @@ resource "aws_lambda_function" "inventory_tracker" {
   source_code_hash = filebase64sha256("../lambda/inventory_tracker.zip")
   timeout       = 30
   memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.transaction_dead_letter_queue.url
+    }
+  }
+}
+
+# Transaction Pipeline Lambda: the order, customer and inventory stages in one
+# consumer, subscribed instead of the three above when pipeline_mode is "unified"
+resource "aws_lambda_function" "transaction_pipeline" {
+  function_name = "TransactionPipeline"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "lambda_handler.lambda_handler"
+  runtime       = "python3.9"
+  filename      = "../lambda/transaction_pipeline.zip"
+  source_code_hash = filebase64sha256("../lambda/transaction_pipeline.zip")
+  timeout       = 30
+  memory_size   = 256
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.transaction_dead_letter_queue.url
+      AGGREGATION_MODE      = var.aggregation_mode
+      ORDER_ARCHIVE_BUCKET  = aws_s3_bucket.order_archive_bucket.bucket
+    }
+  }
 }
 
 # Business Logic Lambda
@@ -127,6 +192,100 @@ resource "aws_lambda_function" "business_logic" {
   source_code_hash = filebase64sha256("../lambda/business_logic.zip")
   timeout       = 30
   memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.event_dead_letter_queue.url
+    }
+  }
+}
+
+# Fold OrderLog inserts into sales metrics and cohorts. The batching window
+# lets one invocation aggregate up to 1000 orders and customer updates.
+resource "aws_lambda_event_source_mapping" "business_logic_order_log_mapping" {
+  count                              = var.aggregation_mode == "stream" ? 1 : 0
+  event_source_arn                   = aws_dynamodb_table.order_log.stream_arn
+  function_name                      = aws_lambda_function.business_logic.function_name
+  starting_position                  = "TRIM_HORIZON"
+  batch_size                         = 1000
+  maximum_batching_window_in_seconds = 10
+
+  filter_criteria {
+    filter {
+      pattern = jsonencode({
+        eventName = ["INSERT"]
+      })
+    }
+  }
+}
+
+# Metrics Compactor Lambda - derives week/month rollups from daily buckets
+resource "aws_lambda_function" "metrics_compactor" {
+  function_name = "MetricsCompactor"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "lambda_handler.lambda_handler"
+  runtime       = "python3.9"
+  filename      = "../lambda/metrics_compactor.zip"
+  source_code_hash = filebase64sha256("../lambda/metrics_compactor.zip")
+  timeout       = 60
+  memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      SALES_METRICS_TABLE = aws_dynamodb_table.sales_metrics.name
+    }
+  }
+}
+
+# Customer Re-segmentation Lambda - nightly parallel scan of CustomerProfiles
+resource "aws_lambda_function" "customer_resegmentation" {
+  function_name = "CustomerResegmentation"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "lambda_handler.lambda_handler"
+  runtime       = "python3.9"
+  filename      = "../lambda/customer_resegmentation.zip"
+  source_code_hash = filebase64sha256("../lambda/customer_resegmentation.zip")
+  timeout       = 900
+  # Lambda allocates one vCPU per 1,769 MB; keep PARALLELISM in line with it
+  memory_size   = 3538
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+  # One run at a time: a scheduled start and a self re-invoke must not resume
+  # the same checkpoints concurrently. Throttled async invokes are retried.
+  reserved_concurrent_executions = 1
+
+  environment {
+    variables = {
+      CUSTOMER_TABLE = aws_dynamodb_table.customer_profiles.name
+      INSIGHTS_TABLE = aws_dynamodb_table.customer_insights.name
+      APPFLOW_BUCKET = aws_s3_bucket.appflow_bucket.bucket
+      TOTAL_SEGMENTS = "16"
+      PARALLELISM    = "2"
+    }
+  }
+}
+
+# Inventory Rebalancer Lambda - evens out hot products' reservation pools
+resource "aws_lambda_function" "inventory_rebalancer" {
+  function_name = "InventoryRebalancer"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "lambda_handler.lambda_handler"
+  runtime       = "python3.9"
+  filename      = "../lambda/inventory_rebalancer.zip"
+  source_code_hash = filebase64sha256("../lambda/inventory_rebalancer.zip")
+  timeout       = 60
+  memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      INVENTORY_STATUS_TABLE = aws_dynamodb_table.inventory_status.name
+      # Comma-separated products to pool ahead of a planned sale
+      HOT_PRODUCT_IDS        = ""
+      POOL_SHARDS            = "8"
+    }
+  }
 }
 
 # Notification Service Lambda
@@ -139,6 +298,13 @@ resource "aws_lambda_function" "notification_service" {
   source_code_hash = filebase64sha256("../lambda/notification_service.zip")
   timeout       = 30
   memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.event_dead_letter_queue.url
+    }
+  }
 }
 
 # AppFlow Trigger Lambda
@@ -149,8 +315,37 @@ resource "aws_lambda_function" "appflow_trigger" {
   runtime       = "python3.9"
   filename      = "../lambda/appflow_trigger.zip"
   source_code_hash = filebase64sha256("../lambda/appflow_trigger.zip")
-  timeout       = 30
-  memory_size   = 128
+  timeout       = 120
+  memory_size   = 256
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.event_dead_letter_queue.url
+    }
+  }
+}
+
+# Order Exporter Lambda - writes orders to the data lake as Parquet and
+# compacts each hour's files. Its package bundles pyarrow
+# (order_exporter/requirements.txt), which the shared layer does not carry.
+resource "aws_lambda_function" "order_exporter" {
+  function_name = "OrderExporter"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "lambda_handler.lambda_handler"
+  runtime       = "python3.9"
+  filename      = "../lambda/order_exporter.zip"
+  source_code_hash = filebase64sha256("../lambda/order_exporter.zip")
+  timeout       = 120
+  memory_size   = 1024
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DATA_LAKE_BUCKET      = aws_s3_bucket.data_lake_bucket.bucket
+      DEAD_LETTER_QUEUE_URL = aws_sqs_queue.event_dead_letter_queue.url
+    }
+  }
 }
 
 # Dashboard API Lambda
@@ -163,6 +358,34 @@ resource "aws_lambda_function" "dashboard_api" {
   source_code_hash = filebase64sha256("../lambda/dashboard_api.zip")
   timeout       = 30
   memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      # Where metric changes are posted to the live dashboards' connections
+      LIVE_UPDATES_ENDPOINT = "https://${aws_apigatewayv2_api.dashboard_live.id}.execute-api.${var.aws_region}.amazonaws.com/${aws_apigatewayv2_stage.dashboard_live_stage.name}"
+    }
+  }
+}
+
+# Dashboard Query Lambda - serves POST /api/query over the data lake. Like
+# OrderExporter, its package bundles pyarrow (dashboard_query/requirements.txt).
+resource "aws_lambda_function" "dashboard_query" {
+  function_name = "DashboardQuery"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "lambda_handler.lambda_handler"
+  runtime       = "python3.9"
+  filename      = "../lambda/dashboard_query.zip"
+  source_code_hash = filebase64sha256("../lambda/dashboard_query.zip")
+  timeout       = 30
+  memory_size   = 2048
+  layers        = [aws_lambda_layer_version.common_layer.arn]
+
+  environment {
+    variables = {
+      DATA_LAKE_BUCKET = aws_s3_bucket.data_lake_bucket.bucket
+    }
+  }
 }
 
 # Report Generator Lambda
@@ -175,23 +398,100 @@ resource "aws_lambda_function" "report_generator" {
   source_code_hash = filebase64sha256("../lambda/report_generator.zip")
   timeout       = 30
   memory_size   = 128
+  layers        = [aws_lambda_layer_version.common_layer.arn]
 }
 
 # Lambda Event Source Mappings for SQS
+# Consumers report failed records individually, so large batches are safe
 resource "aws_lambda_event_source_mapping" "order_processor_mapping" {
-  event_source_arn = aws_sqs_queue.order_queue.arn
-  function_name    = aws_lambda_function.order_processor.function_name
-  batch_size       = 10
+  event_source_arn                   = aws_sqs_queue.order_queue.arn
+  function_name                      = aws_lambda_function.order_processor.function_name
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
 }
 
 resource "aws_lambda_event_source_mapping" "customer_analytics_mapping" {
-  event_source_arn = aws_sqs_queue.customer_queue.arn
-  function_name    = aws_lambda_function.customer_analytics.function_name
-  batch_size       = 10
+  event_source_arn                   = aws_sqs_queue.customer_queue.arn
+  function_name                      = aws_lambda_function.customer_analytics.function_name
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
 }
 
 resource "aws_lambda_event_source_mapping" "inventory_tracker_mapping" {
-  event_source_arn = aws_sqs_queue.inventory_queue.arn
-  function_name    = aws_lambda_function.inventory_tracker.function_name
-  batch_size       = 10
+  event_source_arn                   = aws_sqs_queue.inventory_queue.arn
+  function_name                      = aws_lambda_function.inventory_tracker.function_name
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+resource "aws_lambda_event_source_mapping" "transaction_pipeline_mapping" {
+  event_source_arn                   = aws_sqs_queue.transaction_queue.arn
+  function_name                      = aws_lambda_function.transaction_pipeline.function_name
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+resource "aws_lambda_event_source_mapping" "business_logic_event_mapping" {
+  event_source_arn                   = aws_sqs_queue.business_logic_event_queue.arn
+  function_name                      = aws_lambda_function.business_logic.function_name
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+resource "aws_lambda_event_source_mapping" "notification_event_mapping" {
+  event_source_arn                   = aws_sqs_queue.notification_event_queue.arn
+  function_name                      = aws_lambda_function.notification_service.function_name
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+# Up to 5 minutes or 2,000 customer events per marketing export part batch.
+# A customer_analyzed event is about 1.2 KB and its SQS record about 2 KB, so
+# 2,000 records stay near 4 MB, under Lambda's 6 MB invocation payload.
+resource "aws_lambda_event_source_mapping" "appflow_trigger_mapping" {
+  event_source_arn                   = aws_sqs_queue.marketing_export_queue.arn
+  function_name                      = aws_lambda_function.appflow_trigger.function_name
+  batch_size                         = 2000
+  maximum_batching_window_in_seconds = 300
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+# Up to 5 minutes of orders per data lake part file (Lambda caps the batch at
+# 6 MB of payload, a few thousand events)
+resource "aws_lambda_event_source_mapping" "order_exporter_mapping" {
+  event_source_arn                   = aws_sqs_queue.order_export_queue.arn
+  function_name                      = aws_lambda_function.order_exporter.function_name
+  batch_size                         = 10000
+  maximum_batching_window_in_seconds = 300
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+# Compact rollups from changed daily buckets. The batching window coalesces
+# many order updates into one recompute per week/month.
+resource "aws_lambda_event_source_mapping" "metrics_compactor_mapping" {
+  event_source_arn                   = aws_dynamodb_table.sales_metrics.stream_arn
+  function_name                      = aws_lambda_function.metrics_compactor.function_name
+  starting_position                  = "LATEST"
+  batch_size                         = 1000
+  maximum_batching_window_in_seconds = 60
+
+  filter_criteria {
+    filter {
+      pattern = jsonencode({
+        dynamodb = {
+          Keys = {
+            metric_key = {
+              S = [{ prefix = "date#" }]
+            }
+          }
+        }
+      })
+    }
+  }
 }
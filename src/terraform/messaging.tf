@@ -4,19 +4,108 @@ resource "aws_sns_topic" "raw_transaction_data" {
 }
 
 # SQS Queues
+# Poison transaction messages, with the consumer and failure reason as message attributes
+resource "aws_sqs_queue" "transaction_dead_letter_queue" {
+  name                      = "TransactionDeadLetterQueue"
+  message_retention_seconds = 1209600
+}
+
 resource "aws_sqs_queue" "order_queue" {
   name                      = "OrderQueue"
-  visibility_timeout_seconds = 60
+  visibility_timeout_seconds = 180
+
+  # Safety net: consumers dead-letter records themselves after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.transaction_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
 }
 
 resource "aws_sqs_queue" "customer_queue" {
   name                      = "CustomerQueue"
-  visibility_timeout_seconds = 60
+  visibility_timeout_seconds = 180
+
+  # Safety net: consumers dead-letter records themselves after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.transaction_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
 }
 
 resource "aws_sqs_queue" "inventory_queue" {
   name                      = "InventoryQueue"
-  visibility_timeout_seconds = 60
+  visibility_timeout_seconds = 180
+
+  # Safety net: consumers dead-letter records themselves after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.transaction_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
+}
+
+# Single queue for the unified TransactionPipeline consumer
+resource "aws_sqs_queue" "transaction_queue" {
+  name                      = "TransactionQueue"
+  visibility_timeout_seconds = 180
+
+  # Safety net: consumers dead-letter records themselves after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.transaction_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
+}
+
+# With event_delivery = "batched", EventBridge buffers the events of
+# BusinessLogic and NotificationService here, so each invocation handles a batch
+resource "aws_sqs_queue" "event_dead_letter_queue" {
+  name                      = "EventDeadLetterQueue"
+  message_retention_seconds = 1209600
+}
+
+resource "aws_sqs_queue" "business_logic_event_queue" {
+  name                      = "BusinessLogicEventQueue"
+  visibility_timeout_seconds = 180
+
+  # Safety net: consumers dead-letter records themselves after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.event_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
+}
+
+resource "aws_sqs_queue" "notification_event_queue" {
+  name                      = "NotificationEventQueue"
+  visibility_timeout_seconds = 180
+
+  # Safety net: consumers dead-letter records themselves after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.event_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
+}
+
+# Buffer for order_processed events exported to the data lake in batches
+resource "aws_sqs_queue" "order_export_queue" {
+  name                      = "OrderExportQueue"
+  visibility_timeout_seconds = 720
+
+  # Safety net: the exporter dead-letters records itself after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.event_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
+}
+
+# Buffer for customer_analyzed events exported to AppFlow in batches
+resource "aws_sqs_queue" "marketing_export_queue" {
+  name                      = "MarketingExportQueue"
+  visibility_timeout_seconds = 720
+
+  # Safety net: AppFlowTrigger dead-letters records itself after 5 receives
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.event_dead_letter_queue.arn
+    maxReceiveCount     = 10
+  })
 }
 
 # SQS Queue Policies
@@ -89,21 +178,153 @@ resource "aws_sqs_queue_policy" "inventory_queue_policy" {
   })
 }
 
+resource "aws_sqs_queue_policy" "transaction_queue_policy" {
+  queue_url = aws_sqs_queue.transaction_queue.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "sns.amazonaws.com"
+        }
+        Action = "sqs:SendMessage"
+        Resource = aws_sqs_queue.transaction_queue.arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = aws_sns_topic.raw_transaction_data.arn
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_sqs_queue_policy" "marketing_export_queue_policy" {
+  queue_url = aws_sqs_queue.marketing_export_queue.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "events.amazonaws.com"
+        }
+        Action = "sqs:SendMessage"
+        Resource = aws_sqs_queue.marketing_export_queue.arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = aws_cloudwatch_event_rule.customer_to_appflow_rule.arn
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_sqs_queue_policy" "order_export_queue_policy" {
+  queue_url = aws_sqs_queue.order_export_queue.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "events.amazonaws.com"
+        }
+        Action = "sqs:SendMessage"
+        Resource = aws_sqs_queue.order_export_queue.arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = aws_cloudwatch_event_rule.order_processed_rule.arn
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_sqs_queue_policy" "business_logic_event_queue_policy" {
+  queue_url = aws_sqs_queue.business_logic_event_queue.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "events.amazonaws.com"
+        }
+        Action = "sqs:SendMessage"
+        Resource = aws_sqs_queue.business_logic_event_queue.arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = [
+              aws_cloudwatch_event_rule.order_processed_rule.arn,
+              aws_cloudwatch_event_rule.customer_analyzed_rule.arn,
+              aws_cloudwatch_event_rule.inventory_updated_rule.arn
+            ]
+          }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_sqs_queue_policy" "notification_event_queue_policy" {
+  queue_url = aws_sqs_queue.notification_event_queue.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Principal = {
+          Service = "events.amazonaws.com"
+        }
+        Action = "sqs:SendMessage"
+        Resource = aws_sqs_queue.notification_event_queue.arn
+        Condition = {
+          ArnEquals = {
+            "aws:SourceArn" = aws_cloudwatch_event_rule.notification_rule.arn
+          }
+        }
+      }
+    ]
+  })
+}
+
 # SNS Subscriptions
+# pipeline_mode picks the consumer layout. The queues and functions of both
+# layouts stay deployed, so switching only moves the subscriptions and the
+# unsubscribed queues drain through their existing consumers.
 resource "aws_sns_topic_subscription" "order_subscription" {
+  count     = var.pipeline_mode == "split" ? 1 : 0
   topic_arn = aws_sns_topic.raw_transaction_data.arn
   protocol  = "sqs"
   endpoint  = aws_sqs_queue.order_queue.arn
 }
 
 resource "aws_sns_topic_subscription" "customer_subscription" {
+  count     = var.pipeline_mode == "split" ? 1 : 0
   topic_arn = aws_sns_topic.raw_transaction_data.arn
   protocol  = "sqs"
   endpoint  = aws_sqs_queue.customer_queue.arn
 }
 
 resource "aws_sns_topic_subscription" "inventory_subscription" {
+  count     = var.pipeline_mode == "split" ? 1 : 0
   topic_arn = aws_sns_topic.raw_transaction_data.arn
   protocol  = "sqs"
   endpoint  = aws_sqs_queue.inventory_queue.arn
 }
+
+resource "aws_sns_topic_subscription" "transaction_subscription" {
+  count     = var.pipeline_mode == "unified" ? 1 : 0
+  topic_arn = aws_sns_topic.raw_transaction_data.arn
+  protocol  = "sqs"
+  endpoint  = aws_sqs_queue.transaction_queue.arn
+}
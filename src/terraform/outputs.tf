@@ -18,6 +18,11 @@ output "dashboard_api_url" {
   description = "Dashboard API URL"
 }
 
+output "dashboard_live_url" {
+  value = aws_apigatewayv2_stage.dashboard_live_stage.invoke_url
+  description = "Dashboard live updates WebSocket URL"
+}
+
 output "frontend_url" {
   value = "https://${aws_cloudfront_distribution.frontend_distribution.domain_name}"
   description = "Frontend URL"
@@ -32,3 +37,8 @@ output "appflow_bucket" {
   value = aws_s3_bucket.appflow_bucket.bucket
   description = "S3 Bucket for AppFlow data"
 }
+
+output "data_lake_bucket" {
+  value = aws_s3_bucket.data_lake_bucket.bucket
+  description = "S3 Bucket for the orders data lake"
+}
@@ -15,3 +15,36 @@ variable "environment" {
   type        = string
   default     = "dev"
 }
+
+variable "pipeline_mode" {
+  description = "Transaction consumers: \"split\" (OrderProcessor, CustomerAnalytics and InventoryTracker on their own queues) or \"unified\" (TransactionPipeline)"
+  type        = string
+  default     = "split"
+
+  validation {
+    condition     = contains(["split", "unified"], var.pipeline_mode)
+    error_message = "pipeline_mode must be \"split\" or \"unified\"."
+  }
+}
+
+variable "aggregation_mode" {
+  description = "How BusinessLogic aggregates orders and customers: \"events\" (one invocation per EventBridge event) or \"stream\" (batches of the OrderLog table's stream)"
+  type        = string
+  default     = "events"
+
+  validation {
+    condition     = contains(["events", "stream"], var.aggregation_mode)
+    error_message = "aggregation_mode must be \"events\" or \"stream\"."
+  }
+}
+
+variable "event_delivery" {
+  description = "How EventBridge delivers events to BusinessLogic and NotificationService: \"direct\" (one invocation per event) or \"batched\" (through SQS queues, in batches)"
+  type        = string
+  default     = "direct"
+
+  validation {
+    condition     = contains(["direct", "batched"], var.event_delivery)
+    error_message = "event_delivery must be \"direct\" or \"batched\"."
+  }
+}